@@ -0,0 +1,211 @@
+"""
+生パケットのキャプチャと再生
+
+記録は復号・解析後の JSON ラップだけなので、復号や派生値の変更を実トラフィックで
+再確認できず、ライブ経路のプロファイルにも PS5 が必要だった。ここでは
+受信した暗号化データグラムをそのまま(到着時刻・送信元付きで)追記するバイナリ形式と、
+それを GT7TelemetryClient と同じ API で流し直す ReplayTelemetryClient を提供する。
+
+ファイル形式(リトルエンディアン):
+    ヘッダ: MAGIC(8B)
+    レコード: arrival_ns(i64, time.monotonic_ns) | 送信元 IPv4(4B) | 送信元ポート(u16) |
+              length(u16) | 暗号化データグラム(length バイト)
+到着時刻はキャプチャしたプロセスの monotonic 時計なので、再生では先頭からの相対値だけを使う。
+
+API:
+    writer = CaptureWriter(path)            # GT7TelemetryClient(capture_path=...) が内部で使う
+    writer.write(data, addr, arrival_ns)
+    writer.close()
+    for arrival_ns, data, addr in iter_capture(path): ...
+
+    client = ReplayTelemetryClient(path, speed=1.0)   # speed=0 で最大速度
+    await client.connect()
+    batch = await client.receive_batch(64)  # GT7TelemetryClient と同じ
+    await client.done.wait()                # 最後まで再生した
+    client.close()
+"""
+
+import asyncio
+import logging
+import os
+import socket
+import struct
+import time
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'GT7RAW01'
+_RECORD_HEADER = struct.Struct('<q4sHH')
+_NO_HOST = b'\x00' * 4
+
+# キャプチャファイルの拡張子(main.py の raw_capture_dir で作るファイル名に使う)
+CAPTURE_SUFFIX = '.gt7raw'
+
+
+class CaptureWriter:
+    """暗号化データグラムをキャプチャファイルへ追記する。
+
+    受信の起床ごとに呼ばれるため、書き込みは組み込みのバッファ付きファイルに任せ、
+    ディスクへの書き出しはバッファが埋まったときと close() 時だけにする。
+    """
+
+    BUFFER_SIZE = 1 << 16
+
+    def __init__(self, path):
+        self.path = path
+        new_file = not os.path.exists(path) or os.path.getsize(path) == 0
+        if not new_file:
+            with open(path, 'rb') as f:
+                if f.read(len(MAGIC)) != MAGIC:
+                    raise ValueError(f"not a GT7 capture file: {path}")
+        self._file = open(path, 'ab', buffering=self.BUFFER_SIZE)
+        if new_file:
+            self._file.write(MAGIC)
+        self.records = 0
+
+    def write(self, data, addr, arrival_ns):
+        try:
+            host, port = socket.inet_aton(addr[0]), addr[1]
+        except (TypeError, OSError, IndexError):
+            host, port = _NO_HOST, 0
+        self._file.write(_RECORD_HEADER.pack(arrival_ns, host, port, len(data)))
+        self._file.write(data)
+        self.records += 1
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def iter_capture(path):
+    """キャプチャファイルのレコードを (arrival_ns, data, addr) で順に返す。
+
+    末尾の書きかけのレコード(キャプチャ中のプロセス停止)は黙って打ち切る。
+    """
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"not a GT7 capture file: {path}")
+        header_size = _RECORD_HEADER.size
+        while True:
+            header = f.read(header_size)
+            if len(header) < header_size:
+                return
+            arrival_ns, host, port, length = _RECORD_HEADER.unpack(header)
+            data = f.read(length)
+            if len(data) < length:
+                return
+            addr = (socket.inet_ntoa(host), port) if port else None
+            yield arrival_ns, data, addr
+
+
+class ReplayTelemetryClient:
+    """キャプチャファイルを GT7TelemetryClient と同じ API で再生するクライアント。
+
+    telemetry_background_task を変更せずに差し替えられる(config.json の replay_capture)。
+    パケットはキャプチャ時の到着間隔を speed 倍速で再現して返す。speed=0 は待ち時間なし
+    (最大速度)。ハートビートは送らない。最後まで再生すると done がセットされ、
+    以後の receive_batch() は close() まで待機し続ける(ライブで受信が途絶えた状態と同じ)。
+    """
+
+    def __init__(self, path, speed=1.0, ip=None):
+        self.path = path
+        self.speed = speed
+        # main.py のログ・マルチコンソール設定との互換用(再生では使わない)
+        self.ips = [ip] if isinstance(ip, str) else list(ip or [])
+        self.ip = self.ips[0] if self.ips else None
+        self.heartbeat_interval = 10
+        self.packets_received = 0
+        self.rcvbuf_bytes = None
+        # 受信ヘルス(health.ReceiveHealth)・遅延トレース(latency.LatencyTracer)。
+        # 設定されていれば再生時刻を到着時刻として記録する
+        self.health = None
+        self.tracer = None
+        self.done = None
+        self._records = None
+        self._next = None
+        self._origin_ns = None
+        self._start_ns = None
+        self._closed = None
+
+    async def connect(self):
+        self._records = iter_capture(self.path)
+        self._next = next(self._records, None)
+        self.done = asyncio.Event()
+        self._closed = asyncio.Event()
+        if self._next is None:
+            self.done.set()
+        logger.info(
+            f"Replaying capture {self.path} "
+            f"({'max speed' if not self.speed else f'{self.speed:g}x'})"
+        )
+
+    async def send_heartbeat(self):
+        """再生ではハートビートを送らない(heartbeat_loop との互換用)"""
+
+    @property
+    def queue_depth(self):
+        return 0
+
+    def _due_ns(self, arrival_ns):
+        """キャプチャ上の到着時刻 arrival_ns を再生する monotonic 時刻"""
+        return self._start_ns + int((arrival_ns - self._origin_ns) / self.speed)
+
+    async def receive(self):
+        packet = await self.receive_from()
+        return packet[0] if packet else None
+
+    async def receive_from(self):
+        batch = await self.receive_batch(1)
+        return batch[0] if batch else None
+
+    async def receive_batch(self, max_n=256, with_arrival=False):
+        """再生時刻に達したパケットを最大 max_n 件 [(data, addr), ...] で返す
+
+        with_arrival=True なら [(data, addr, arrival_ns), ...]。arrival_ns は再生開始時刻に
+        キャプチャ上の到着間隔(等倍)を足した monotonic ns で、再生速度によらず記録フレームの
+        時刻差(ラップ所要時間・加速度)がキャプチャ時と一致する。
+        """
+        if self._records is None or self._closed.is_set():
+            return []
+        if self._next is None:
+            # 再生終了: close() まで待つ(呼び出し側の受信ループを空回りさせない)
+            await self._closed.wait()
+            return []
+
+        if self._origin_ns is None:
+            self._origin_ns = self._next[0]
+            self._start_ns = time.monotonic_ns()
+        if self.speed:
+            wait_ns = self._due_ns(self._next[0]) - time.monotonic_ns()
+            if wait_ns > 0:
+                await asyncio.sleep(wait_ns / 1e9)
+        else:
+            await asyncio.sleep(0)  # 最大速度でも他のタスクへ制御を渡す
+
+        now_ns = time.monotonic_ns()
+        batch = []
+        while self._next is not None and len(batch) < max_n:
+            arrival_ns, data, addr = self._next
+            if self.speed and self._due_ns(arrival_ns) > now_ns:
+                break
+            if self.health is not None:
+                self.health.record_arrival(addr, now_ns)
+            if self.tracer is not None:
+                self.tracer.on_arrival(data, now_ns)
+            if with_arrival:
+                batch.append((data, addr, self._start_ns + arrival_ns - self._origin_ns))
+            else:
+                batch.append((data, addr))
+            self._next = next(self._records, None)
+        if self._next is None:
+            self.done.set()
+        self.packets_received += len(batch)
+        return batch
+
+    def close(self):
+        if self._records is not None:
+            self._records.close()
+        if self._closed is not None:
+            self._closed.set()
+        logger.info(f"Replay closed ({self.packets_received} packets)")
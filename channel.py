@@ -0,0 +1,118 @@
+"""
+合体(coalescing)チャンネル: 「全フレーム」消費者と「最新のみ」消費者を1つの書き込み口で扱う
+
+受信キュー(telemetry.py)と配信キュー(main.py)はどちらも asyncio.Queue の
+get_nowait/put_nowait を組み合わせて「満杯なら最古を捨てる」を手書きしていた。
+この方式では消費側が遅れるとキュー長ぶん(受信キュー 256 件 = 60Hz で約4秒)古い
+データを表示し続けることになる。CoalescingChannel は用途ごとに2つの読み口を持つ:
+
+  - リング(ring_size > 0): 記録・解析のように全フレームが必要な消費者用。上限付きで、
+    溢れた分は最古から捨て、その件数を dropped に正確に数える。
+  - 最新スロット: ライブ表示のように最新だけが必要な消費者用。publish のたびに
+    上書きされ、seq(通し番号)で読み手が「前回から何件飛ばしたか」を知れる。
+    飛ばされた件数は coalesced に正確に数える。消費側がどれだけ遅れても、
+    次に読むのは常に最新の1件(表示遅延は1フレーム)。
+
+API:
+    ch = CoalescingChannel(ring_size=256)   # ring_size=0 なら最新スロットのみ
+    ch.publish(item)                        # 同期(コールバック内からも呼べる)
+    evicted = ch.extend(items)              # まとめて書き込み(リングから捨てた件数を返す)
+    batch = await ch.get_batch(64)          # リングから最大 64 件(全フレーム消費者)
+    seq, item = await ch.get_latest(seq)    # seq より新しい最新の1件(最新のみ消費者)
+    ch.close()                              # 待機中の読み手を起こして終了させる
+"""
+
+import asyncio
+import collections
+
+
+class CoalescingChannel:
+    """上限付きリングと「最新」スロットを併せ持つ単一書き手のチャンネル。
+
+    イベントループ上の単一スレッドから使う前提(ロックなし)。書き込みは同期メソッドで、
+    待機中の読み手は asyncio.Event で起こす。
+    """
+
+    def __init__(self, ring_size=0):
+        self.ring_size = ring_size
+        self._ring = collections.deque()
+        self._latest = None
+        self._event = asyncio.Event()
+        self._closed = False
+        # 通し番号(最後に publish したフレームの seq。0 = 未書き込み)
+        self.seq = 0
+        # リングから読まれずに捨てられた累計件数
+        self.dropped = 0
+        # 最新スロットで読まれずに上書きされた累計件数(get_latest の読み飛ばし分)
+        self.coalesced = 0
+
+    def __len__(self):
+        """リングに溜まっている件数"""
+        return len(self._ring)
+
+    @property
+    def closed(self):
+        return self._closed
+
+    @property
+    def latest(self):
+        """最新のフレーム(未書き込みなら None)"""
+        return self._latest
+
+    def publish(self, item):
+        """1件書き込む。リングから捨てた件数(0 または 1)を返す"""
+        return self.extend((item,))
+
+    def extend(self, items):
+        """複数件をまとめて書き込み、リングから捨てた件数を返す"""
+        n = 0
+        ring = self._ring
+        for item in items:
+            self._latest = item
+            if self.ring_size:
+                ring.append(item)
+            n += 1
+        if not n:
+            return 0
+        self.seq += n
+        evicted = max(0, len(ring) - self.ring_size) if self.ring_size else 0
+        for _ in range(evicted):
+            ring.popleft()
+        self.dropped += evicted
+        self._event.set()
+        return evicted
+
+    async def _wait(self, ready):
+        # Event.set() は待機中の全読み手を起こすため、リング側と最新側の読み手が
+        # 同じ Event を共有しても取りこぼさない(各自が条件を確認し直す)
+        while not ready():
+            if self._closed:
+                return False
+            self._event.clear()
+            await self._event.wait()
+        return True
+
+    async def get_batch(self, max_n):
+        """リングから最大 max_n 件を古い順に返す。空なら書き込みまで待機、close 後は空リスト"""
+        ring = self._ring
+        if not await self._wait(lambda: ring):
+            return []
+        n = min(max_n, len(ring))
+        return [ring.popleft() for _ in range(n)]
+
+    async def get_latest(self, after_seq=0):
+        """after_seq より新しい最新フレームを (seq, item) で返す。close 後は None
+
+        after_seq には前回受け取った seq を渡す(途中から読み始める読み手は現在の seq)。
+        間に上書きされた件数は coalesced に加算する。
+        """
+        if not await self._wait(lambda: self.seq > after_seq):
+            return None
+        seq = self.seq
+        self.coalesced += seq - after_seq - 1
+        return seq, self._latest
+
+    def close(self):
+        """チャンネルを閉じ、待機中の読み手を起こす(以後の get_* は空/None を返す)"""
+        self._closed = True
+        self._event.set()
@@ -97,6 +97,86 @@ const WEBSOCKET_CONFIG = Object.freeze({
     reconnectDelayMultiplier: 1.5
 });
 
+/* ================================================================
+ *  マルチコンソール
+ * ================================================================ */
+/** ページURLの ?console=<id>（未指定は null = サーバ既定のコンソール） */
+const CONSOLE_ID = new URLSearchParams(window.location.search).get('console');
+
+/**
+ * /ws・/api/laps の URL にページのコンソール指定を引き継ぐ（未指定ならそのまま）
+ * @param {string} url
+ * @returns {string}
+ */
+function withConsole(url) {
+    if (!CONSOLE_ID) {
+        return url;
+    }
+    return url + (url.indexOf('?') >= 0 ? '&' : '?') + 'console=' + encodeURIComponent(CONSOLE_ID);
+}
+
+/**
+ * ページURLの ?rate=<Hz>（未指定は null = 全フレーム）。Wi-Fi のスマートフォン等で
+ * 受信するテレメトリを減らすときに使う（例: /?rate=20）。サーバが rate ごとに間引く
+ */
+const WS_RATE = (function() {
+    const raw = new URLSearchParams(window.location.search).get('rate');
+    const rate = raw === null ? NaN : parseInt(raw, 10);
+    return isNaN(rate) ? null : rate;
+})();
+
+/**
+ * ページURLの ?profile=<名前>（drive / engineer / analysis。未指定は null = 全フィールド）。
+ * サーバは指定プロファイルのフィールドだけを送る（含まれないフィールドのカードは更新されない）
+ */
+const WS_PROFILE = new URLSearchParams(window.location.search).get('profile');
+
+/**
+ * ページURLの ?delta=1（差分配信）。サーバは keyframe と、前回から変わったフィールドだけの
+ * delta を送る。リモートの閲覧端末で帯域と JSON.parse のコストを減らすときに使う
+ */
+const WS_DELTA = new URLSearchParams(window.location.search).get('delta') === '1';
+
+/**
+ * ページURLの ?format=binary（バイナリ形式）。サーバはスキーマを送ったあと、フレームを固定長の
+ * レコード（ArrayBuffer）で送り、DataView で読む。JSON より小さく JSON.parse も要らない
+ */
+const WS_BINARY = new URLSearchParams(window.location.search).get('format') === 'binary';
+
+/**
+ * ページURLの ?batch=<ms>（未指定は null = バッチしない）。サーバはフレームを <ms> ごとに
+ * 1つのメッセージにまとめて送る。別室・VPN 越しの閲覧端末でパケット数を減らすときに使う
+ * （例: /?batch=100&compress=1&profile=engineer）
+ */
+const WS_BATCH_MS = (function() {
+    const raw = new URLSearchParams(window.location.search).get('batch');
+    const ms = raw === null ? NaN : parseInt(raw, 10);
+    return isNaN(ms) ? null : ms;
+})();
+
+/**
+ * ページURLの ?compress=1（permessage-deflate）。この接続だけメッセージを圧縮する。
+ * 帯域の細い遠隔の閲覧端末向け（ローカルでは圧縮の CPU と遅延のほうが高くつく）
+ */
+const WS_COMPRESS = new URLSearchParams(window.location.search).get('compress') === '1';
+
+/* ================================================================
+ *  フレーム時刻
+ * ================================================================ */
+/**
+ * フレーム/サンプルの受信時刻(ms)。v3 は整数の arrival_ns(monotonic ns)、
+ * v1/v2 は ISO 文字列の timestamp から求める。差分(経過時間)にだけ使うこと
+ * (arrival_ns は壁時計ではない)。どちらも無ければ NaN。
+ * @param {Object} f
+ * @returns {number}
+ */
+function frameTimeMs(f) {
+    if (typeof f.arrival_ns === 'number') {
+        return f.arrival_ns / 1e6;
+    }
+    return f.timestamp ? Date.parse(f.timestamp) : NaN;
+}
+
 /* ================================================================
  *  テストモード設定
  * ================================================================ */
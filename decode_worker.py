@@ -0,0 +1,371 @@
+"""
+デコードワーカー(別プロセス)と共有メモリのフレームリング
+
+config.json の "decode_worker": true で有効になるオプトイン構成。
+UDP 受信(GT7TelemetryClient)・ハートビート送信・Salsa20 復号を専用プロセスに移し、
+復号済みパケットを multiprocessing.shared_memory 上の固定長スロットのリング
+(FrameRing)へ書き込む。aiohttp 側のプロセスはフレームを読み出して解析・配信する
+だけになり、/api/laps の大きなエクスポートや多数の WebSocket 配信でイベントループが
+混んでも、受信・復号のタイミングはもう1つのコア上で一定に保たれる。
+
+フレームの形式(固定長スロット):
+    seq(u64) | arrival_ns(i64, time.monotonic_ns) | 送信元 IPv4(4B) | 送信元ポート(u16) |
+    length(u16) | 復号済みパケット(最大 0x158)
+復号済みパケットは packet_def.json の定義そのもの(固定レイアウト)なので、読み出し側は
+GT7Decoder.view()/parse() をそのまま使える。
+
+API(main.py からの使用順序。GT7TelemetryClient と同じ connect/close):
+    worker = DecodeWorkerClient(ip, send_port, receive_port, heartbeat_interval)
+    await worker.connect()               # ワーカープロセス起動・リング作成
+    data = await worker.receive()        # 復号済みパケット(到着まで await)
+    data, addr = await worker.receive_from()  # 送信元アドレス付き(マルチコンソール振り分け用)
+    batch = await worker.receive_batch(64)    # 溜まっている分をまとめて [(data, addr), ...]
+    batch = await worker.receive_batch(64, with_arrival=True)  # [(data, addr, arrival_ns), ...]
+    lost = worker.take_rejected()        # 前回以降にワーカー/リングで失われた件数
+    worker.close()
+"""
+
+import asyncio
+import collections
+import logging
+import multiprocessing
+import signal
+import socket
+import struct
+from multiprocessing import shared_memory
+
+from decoder import GT7Decoder, _PACKET_LAYOUTS
+from telemetry import GT7TelemetryClient, heartbeat_loop
+
+logger = logging.getLogger(__name__)
+
+# リング先頭のヘッダ: 最新の書き込み済み seq / ワーカー側で破棄した累計件数
+_RING_HEADER = struct.Struct('<QQ')
+# スロット先頭のヘッダ: seq(0=書き込み中) / 到着時刻 ns / 送信元 IPv4・ポート / パケット長
+_SLOT_HEADER = struct.Struct('<Qq4sHH')
+_NO_ADDR = (b'\x00' * 4, 0)
+# 復号済みパケットの最大長(最大バリアント ~ = 0x158)
+FRAME_SIZE = _PACKET_LAYOUTS[0].size
+
+
+def _align8(n):
+    return (n + 7) & ~7
+
+
+class FrameRing:
+    """共有メモリ上の単一書き手・単一読み手のフレームリング。
+
+    書き手は「スロット seq を 0 にする → 本体とヘッダを書く → スロット seq を確定 →
+    リング先頭の write_seq を更新」の順に書く。読み手はスロット seq が期待値と一致する
+    ときだけコピーし、コピー後に seq を読み直して上書き(周回遅れ)を検出する。
+    """
+
+    SLOT_SIZE = _align8(_SLOT_HEADER.size + FRAME_SIZE)
+
+    def __init__(self, shm, slots):
+        self._shm = shm
+        self.slots = slots
+        self._buf = shm.buf
+        self._base = _align8(_RING_HEADER.size)
+
+    @classmethod
+    def create(cls, slots=256):
+        size = _align8(_RING_HEADER.size) + cls.SLOT_SIZE * slots
+        ring = cls(shared_memory.SharedMemory(create=True, size=size), slots)
+        _RING_HEADER.pack_into(ring._buf, 0, 0, 0)
+        return ring
+
+    @classmethod
+    def attach(cls, name, slots):
+        return cls(shared_memory.SharedMemory(name=name), slots)
+
+    @property
+    def name(self):
+        return self._shm.name
+
+    def _slot_offset(self, seq):
+        return self._base + ((seq - 1) % self.slots) * self.SLOT_SIZE
+
+    # ── 書き手(ワーカープロセス) ──
+
+    def publish(self, data, arrival_ns, addr=None):
+        """復号済みパケット1件を書き込み、その seq を返す(addr は IPv4 の (host, port))"""
+        write_seq, rejected = _RING_HEADER.unpack_from(self._buf, 0)
+        seq = write_seq + 1
+        offset = self._slot_offset(seq)
+        length = min(len(data), FRAME_SIZE)
+        try:
+            host, port = socket.inet_aton(addr[0]), addr[1]
+        except (TypeError, OSError, IndexError):
+            host, port = _NO_ADDR
+        _SLOT_HEADER.pack_into(self._buf, offset, 0, 0, *_NO_ADDR, 0)
+        body = offset + _SLOT_HEADER.size
+        self._buf[body:body + length] = data[:length]
+        _SLOT_HEADER.pack_into(self._buf, offset, seq, arrival_ns, host, port, length)
+        _RING_HEADER.pack_into(self._buf, 0, seq, rejected)
+        return seq
+
+    def add_rejected(self, count=1):
+        write_seq, rejected = _RING_HEADER.unpack_from(self._buf, 0)
+        _RING_HEADER.pack_into(self._buf, 0, write_seq, rejected + count)
+
+    # ── 読み手(aiohttp プロセス) ──
+
+    def counters(self):
+        """(write_seq, rejected) を返す"""
+        return _RING_HEADER.unpack_from(self._buf, 0)
+
+    def read(self, seq):
+        """seq のフレームを (bytes, arrival_ns, addr) で返す。上書き済みなら None"""
+        offset = self._slot_offset(seq)
+        if _SLOT_HEADER.unpack_from(self._buf, offset)[0] != seq:
+            return None
+        _, arrival_ns, host, port, length = _SLOT_HEADER.unpack_from(self._buf, offset)
+        body = offset + _SLOT_HEADER.size
+        data = bytes(self._buf[body:body + length])
+        if _SLOT_HEADER.unpack_from(self._buf, offset)[0] != seq:
+            return None  # コピー中に書き手が周回して上書きした
+        addr = (socket.inet_ntoa(host), port) if port else None
+        return data, arrival_ns, addr
+
+    def close(self, unlink=False):
+        self._buf = None
+        self._shm.close()
+        if unlink:
+            self._shm.unlink()
+
+
+# ─────────────────────────────────────────────────────────────────────
+# ワーカープロセス側
+# ─────────────────────────────────────────────────────────────────────
+
+def _worker_main(ip, send_port, receive_port, heartbeat_interval, ring_name, slots, notify,
+                 rcvbuf=None, capture_path=None):
+    """ワーカープロセスのエントリーポイント(spawn で起動される)"""
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    # terminate()(SIGTERM)でも受信ループの finally を通し、キャプチャのバッファを書き出す
+    signal.signal(signal.SIGTERM, _raise_keyboard_interrupt)
+    ring = FrameRing.attach(ring_name, slots)
+    try:
+        asyncio.run(_worker_loop(ip, send_port, receive_port, heartbeat_interval, ring, notify,
+                                 rcvbuf, capture_path))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        ring.close()
+
+
+def _raise_keyboard_interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+
+async def _worker_loop(ip, send_port, receive_port, heartbeat_interval, ring, notify,
+                       rcvbuf=None, capture_path=None):
+    client = GT7TelemetryClient(ip, send_port, receive_port, heartbeat_interval,
+                                rcvbuf=rcvbuf, capture_path=capture_path)
+    decoder = GT7Decoder()
+    await client.connect()
+    heartbeat_task = asyncio.create_task(heartbeat_loop(client))
+    logger.info(f"Decode worker ready (ring={ring.name})")
+    try:
+        while True:
+            batch = await client.receive_batch(with_arrival=True)
+            published = False
+            for raw_data, addr, arrival_ns in batch:
+                decrypted = decoder.decrypt(raw_data, addr)
+                if not decrypted:
+                    ring.add_rejected()
+                    continue
+                ring.publish(decrypted, arrival_ns, addr)
+                published = True
+            # 読み手を起こす(バッチごとに1バイト)。読み手は起床時に write_seq まで
+            # 一括で読むため、通知の数とフレーム数は一致しなくてよい。
+            if published:
+                notify.send_bytes(b'\x01')
+    finally:
+        heartbeat_task.cancel()
+        client.close()
+
+
+# ─────────────────────────────────────────────────────────────────────
+# aiohttp プロセス側
+# ─────────────────────────────────────────────────────────────────────
+
+class DecodeWorkerClient:
+    """デコードワーカーを起動し、復号済みフレームを受け取るクライアント。
+
+    GT7TelemetryClient の代わりに telemetry_background_task が使う。受信・復号・
+    ハートビートはワーカープロセスが担うため、receive() は復号済みパケットを返す。
+    """
+
+    # リングのスロット数。60Hz で約4秒分。読み手がこれ以上遅れた分は失われ、
+    # take_rejected() に計上される(受信キューの「最新優先」と同じ方針)。
+    RING_SLOTS = 256
+
+    def __init__(self, ip, send_port=33739, receive_port=33740, heartbeat_interval=10, rcvbuf=None,
+                 capture_path=None):
+        # ip は GT7TelemetryClient と同じく1台分の文字列または IP のリスト
+        self.ips = [ip] if isinstance(ip, str) else list(ip)
+        self.ip = self.ips[0]
+        self.send_port = send_port
+        self.receive_port = receive_port
+        self.heartbeat_interval = heartbeat_interval
+        self.rcvbuf = rcvbuf
+        # 生パケットのキャプチャ先(ワーカープロセスの GT7TelemetryClient が書く)
+        self.capture_path = capture_path
+        # 受信ヘルス(health.ReceiveHealth)。設定されていればリングのフレームごとに到着を記録する
+        self.health = None
+        # 遅延トレース(latency.LatencyTracer)。設定されていればフレームの到着時刻でトレースを開始する
+        self.tracer = None
+        self.packets_received = 0
+        self._ring = None
+        self._process = None
+        self._notify = None
+        self._ready = None
+        self._next_seq = 1
+        self._pending = collections.deque()
+        self._rejected_seen = 0
+        self._overrun = 0
+
+    async def connect(self):
+        """リングを作成してワーカープロセスを起動する"""
+        ctx = multiprocessing.get_context('spawn')
+        self._ring = FrameRing.create(self.RING_SLOTS)
+        self._notify, child_conn = ctx.Pipe(duplex=False)
+        self._process = ctx.Process(
+            target=_worker_main,
+            args=(self.ips, self.send_port, self.receive_port, self.heartbeat_interval,
+                  self._ring.name, self.RING_SLOTS, child_conn, self.rcvbuf, self.capture_path),
+            name='gt7-decode-worker',
+            daemon=True,
+        )
+        self._process.start()
+        child_conn.close()
+
+        self._ready = asyncio.Event()
+        asyncio.get_running_loop().add_reader(self._notify.fileno(), self._on_notify)
+        logger.info(
+            f"Decode worker process started (pid={self._process.pid}, "
+            f"listening :{self.receive_port}, heartbeat -> {', '.join(self.ips)}:{self.send_port})"
+        )
+
+    def _on_notify(self):
+        # 溜まった通知をまとめて読み捨て、待機中の receive() を起こす
+        try:
+            while self._notify.poll():
+                self._notify.recv_bytes()
+        except (EOFError, OSError):
+            asyncio.get_running_loop().remove_reader(self._notify.fileno())
+            logger.error("Decode worker exited unexpectedly")
+        self._ready.set()
+
+    @property
+    def queue_depth(self):
+        """リング上の未読フレーム数 + 読み出し済み・未消費のフレーム数"""
+        if self._ring is None:
+            return 0
+        write_seq, _ = self._ring.counters()
+        return max(0, write_seq - self._next_seq + 1) + len(self._pending)
+
+    def _drain(self):
+        write_seq, _ = self._ring.counters()
+        if write_seq - self._next_seq + 1 > self._ring.slots:
+            skipped = write_seq - self._ring.slots + 1 - self._next_seq
+            self._overrun += skipped
+            self._next_seq += skipped
+        while self._next_seq <= write_seq:
+            frame = self._ring.read(self._next_seq)
+            if frame is None:
+                self._overrun += 1
+            else:
+                if self.health is not None:
+                    self.health.record_arrival(frame[2], frame[1])
+                if self.tracer is not None:
+                    # 到着時刻はワーカー側の monotonic_ns(同じホストの時計)。decrypt 段はリング転送を含む
+                    self.tracer.on_arrival(frame[0], frame[1])
+                self._pending.append((frame[0], frame[2], frame[1]))
+            self._next_seq += 1
+
+    async def receive(self):
+        """復号済みパケットを1つ返す(到着まで await)。未接続時は None"""
+        frame = await self.receive_from()
+        return frame[0] if frame else None
+
+    async def receive_from(self):
+        """receive() と同じく1件待ち、(復号済みパケット, 送信元 addr) を返す"""
+        batch = await self.receive_batch(1)
+        return batch[0] if batch else None
+
+    async def receive_batch(self, max_n=RING_SLOTS, with_arrival=False):
+        """読み出し済みのフレームを最大 max_n 件まとめて [(復号済みパケット, addr), ...] で返す
+
+        1件も無ければ到着まで待機する(GT7TelemetryClient.receive_batch と同じ)。未接続時は空リスト。
+        with_arrival=True なら [(復号済みパケット, addr, arrival_ns), ...](ワーカー側の到着時刻)。
+        """
+        if self._ring is None:
+            return []
+        while not self._pending:
+            self._ready.clear()
+            self._drain()
+            if self._pending:
+                break
+            if not self._process.is_alive():
+                raise RuntimeError(f"Decode worker exited (code={self._process.exitcode})")
+            await self._ready.wait()
+        n = min(max_n, len(self._pending))
+        self.packets_received += n
+        batch = [self._pending.popleft() for _ in range(n)]
+        if with_arrival:
+            return batch
+        return [(data, addr) for data, addr, _ in batch]
+
+    def take_rejected(self):
+        """前回呼び出し以降に失われた件数(ワーカーでの復号失敗・破棄 + リング周回遅れ)"""
+        rejected, overrun = self.take_losses()
+        return rejected + overrun
+
+    def take_losses(self):
+        """前回呼び出し以降に失われた件数を (ワーカーでの復号失敗・破棄, リング周回遅れ) で返す"""
+        if self._ring is None:
+            return 0, 0
+        _, rejected = self._ring.counters()
+        losses = (rejected - self._rejected_seen, self._overrun)
+        self._rejected_seen = rejected
+        self._overrun = 0
+        return losses
+
+    def close(self):
+        """ワーカープロセスを停止し、共有メモリを解放する(終了を最大5秒待つ。ループ外から使う)"""
+        process = self._terminate()
+        if process is not None:
+            process.join(timeout=5)
+        self._release()
+
+    async def aclose(self):
+        """close() と同じだが、プロセスの終了はスレッドで待ち、イベントループを止めない"""
+        process = self._terminate()
+        try:
+            if process is not None:
+                await asyncio.get_running_loop().run_in_executor(None, process.join, 5)
+        finally:
+            self._release()
+
+    def _terminate(self):
+        """通知の監視を外してワーカープロセスへ終了を送り、そのプロセスを返す"""
+        if self._notify is not None:
+            try:
+                asyncio.get_running_loop().remove_reader(self._notify.fileno())
+            except (RuntimeError, ValueError, OSError):
+                pass
+            self._notify.close()
+            self._notify = None
+        process, self._process = self._process, None
+        if process is not None:
+            process.terminate()
+        return process
+
+    def _release(self):
+        if self._ring is not None:
+            self._ring.close(unlink=True)
+            self._ring = None
+        logger.info("Decode worker stopped")
@@ -5,11 +5,14 @@ PS5からの暗号化テレメトリーパケットを復号し、解析しま
 gt7dashboardの実装を参考にしています。
 """
 
+import collections
 import struct
 import json
 import math
+import operator
 import os
 import logging
+from collections.abc import Mapping
 
 # NOTE: Crypto (pycryptodome) は GT7Decoder の復号処理でのみ必要。
 # CourseEstimator は Crypto に非依存なため、トップレベル import を避け
@@ -18,11 +21,15 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+# 連続する2点の距離がこれを超えたら瞬間移動(pit/respawn/コース切替)とみなす。
+# train_laptime_model.py / review-view.js 等の DISCONTINUITY_M と同じ値・同じ意味。
+DISCONTINUITY_M = 120
+
 
 class CourseEstimator:
     """位置座標からコースを推定するクラス。
 
-    main.py が全テレメトリパケットで estimate_course() を呼び、
+    main.py は CourseTracker 経由で estimate_course() を呼び(確定後は間引く)、
     結果を course フィールドとして WebSocket クライアントへ配信している。
     """
 
@@ -89,6 +96,26 @@ class CourseEstimator:
 
         return {"id": "unknown", "name": "Unknown Track", "confidence": 0}
 
+    def bounds_for(self, result):
+        """estimate_course() の戻り値が指すコースの bounds を返す(unknown 等は None)"""
+        source = result.get('source')
+        if source == 'known':
+            course_lists = (self.known_courses,)
+        elif source == 'auto':
+            course_lists = (self.courses,)
+        else:
+            course_lists = (self.known_courses, self.courses)
+        for course_list in course_lists:
+            for course in course_list:
+                if course.get('id') != result.get('id'):
+                    continue
+                if source == 'fallback' and course.get('fallback') is not True:
+                    continue
+                bounds = course.get('bounds', {})
+                if self._bounds_valid(bounds):
+                    return bounds
+        return None
+
     @staticmethod
     def _build_result(course, origin, area, is_fallback):
         """選択されたコースから戻り値 dict を構築し confidence を導出"""
@@ -137,6 +164,97 @@ class CourseEstimator:
         return (bounds['max_x'] - bounds['min_x']) * (bounds['max_z'] - bounds['min_z'])
 
 
+class CourseTracker:
+    """1台分のコース推定状態(ラップ単位の多数決ロックイン)を持つクラス。
+
+    lap_count が変わる(増減とも)たびに状態を捨て、先頭 vote_window 件の生推定値を
+    多数決してそのラップのコースを確定する(#436 B4フォローアップ)。確定後は
+    estimate_course() を毎パケットは呼ばず、revalidate_every 件ごと、または前回位置から
+    discontinuity_m を超えて飛んだ時だけ「位置が確定コースの bounds 内か」を確かめる。
+    bounds の重複で生推定値が入れ替わるだけでは外れ扱いにしない(ロックの目的)。
+    外れたら以後は毎パケット確かめ、unlock_after 件続けて外れた時だけ確定を解いて
+    投票からやり直す(ヒステリシス)。1件でも戻れば外れの計数は 0 に戻る。
+    """
+
+    def __init__(self, estimator, vote_window=10, revalidate_every=30, unlock_after=3,
+                 discontinuity_m=DISCONTINUITY_M):
+        self.estimator = estimator
+        self.vote_window = vote_window
+        self.revalidate_every = revalidate_every
+        self.unlock_after = unlock_after
+        self._jump_sq = discontinuity_m * discontinuity_m
+        self.lap_count = None
+        self.estimates = 0       # estimate_course() を呼んだ回数(診断・テスト用)
+        self.unlocks = 0         # ヒステリシスを越えて確定を解いた回数
+        self._last_x = None
+        self._last_z = None
+        self._unlock()
+
+    def _unlock(self):
+        self.lock_id = None       # 確定済みcourse_id(未確定はNone)
+        self.lock_result = None   # 確定済みcourse dict(id/name/name_en/name_ja/confidence/verified/source)
+        self._lock_bounds = None  # 確定コースの bounds(unknown 等で無ければ None)
+        self._vote_counts = {}    # id -> 出現回数(投票window中のみ)
+        self._vote_samples = {}   # id -> そのidを得た最初のcourse dict(確定時の代表値)
+        self._votes = 0
+        self._since_check = 0
+        self._misses = 0
+
+    @property
+    def locked(self):
+        return self.lock_id is not None
+
+    def update(self, lap_count, x, z):
+        """1パケット分の位置を渡し、このパケットの course dict を返す。
+
+        投票中は生推定値、確定後は確定値(同じ dict)を返す。
+        """
+        if lap_count != self.lap_count:
+            self.lap_count = lap_count
+            self._unlock()
+
+        jumped = (
+            self._last_x is not None
+            and (x - self._last_x) ** 2 + (z - self._last_z) ** 2 > self._jump_sq
+        )
+        self._last_x = x
+        self._last_z = z
+
+        if self.lock_id is not None:
+            self._since_check += 1
+            if self._misses == 0 and not jumped and self._since_check < self.revalidate_every:
+                return self.lock_result
+            self._since_check = 0
+            if self._still_on_course(x, z):
+                self._misses = 0
+                return self.lock_result
+            self._misses += 1
+            if self._misses < self.unlock_after:
+                return self.lock_result
+            logger.info(f"Course lock released: {self.lock_id} (lap {lap_count})")
+            self.unlocks += 1
+            self._unlock()
+
+        raw = self.estimator.estimate_course(x, z)
+        self.estimates += 1
+        cid = raw.get("id", "unknown")
+        self._vote_counts[cid] = self._vote_counts.get(cid, 0) + 1
+        self._vote_samples.setdefault(cid, raw)
+        self._votes += 1
+        if self._votes >= self.vote_window:
+            self.lock_id = max(self._vote_counts, key=self._vote_counts.get)
+            self.lock_result = self._vote_samples[self.lock_id]
+            self._lock_bounds = self.estimator.bounds_for(self.lock_result)
+        return raw
+
+    def _still_on_course(self, x, z):
+        if self._lock_bounds is not None:
+            return CourseEstimator._point_in_bounds(x, z, self._lock_bounds)
+        # unknown 確定(どの bounds にも入らなかった)はどこかのコースに入ったら外れ
+        self.estimates += 1
+        return self.estimator.estimate_course(x, z).get("id", "unknown") == self.lock_id
+
+
 class GT7Decoder:
     """GT7テレメトリーパケットの復号と解析"""
 
@@ -155,13 +273,48 @@ class GT7Decoder:
         b'~': 0x55FABB4F,
     }
 
+    # decrypt_many の1回の NumPy 演算で扱う最大パケット数。Salsa20 状態
+    # (16ワード×ブロック数×件数)の一時配列が数百MBに膨らまないよう分割する。
+    BATCH_CHUNK = 4096
+
+    # 重複判定に保持する直近データグラム数。GT7 の正規パケットは IV(0x40) と
+    # package_id が毎回変わるため、バイト列が完全一致するのは再送・ループ等の重複のみ。
+    DUPLICATE_WINDOW = 256
+
+    # マジック判定に使う先頭ブロック長(Salsa20 の1ブロック)
+    PROBE_SIZE = 64
+
+    # 一度も復号できないまま連続でマジック不一致となった送信元は、GT7 以外の機器と
+    # みなして暗号処理なしで破棄する。ただし FOREIGN_REPROBE 件に1件は判定し直す。
+    FOREIGN_THRESHOLD = 8
+    FOREIGN_REPROBE = 256
+    # 連続失敗数を追跡する送信元数の上限(送信元を偽装した大量トラフィック対策)
+    MAX_TRACKED_ADDRS = 1024
+
+    # 復号前段での破棄理由(reject_counts のキー)
+    REJECT_REASONS = ("too_small", "duplicate", "foreign", "bad_magic", "error")
+
     def __init__(self, heartbeat_type=b'~'):
         self._parse_count = 0
         self.heartbeat_type = heartbeat_type
         self._xor_value = self.XOR_MAP.get(heartbeat_type, 0xDEADBEAF)
+        # 送信元アドレス -> 直近に復号できた XOR 値
+        self._xor_by_addr = {}
+        # 送信元アドレス -> 復号できなかった連続件数(未だ復号できていない送信元のみ)
+        self._bad_by_addr = {}
+        # 重複検出用: 直近 DUPLICATE_WINDOW 件のデータグラム(集合 + 挿入順)
+        self._recent = set()
+        self._recent_order = collections.deque()
+        # 破棄理由ごとの累計件数(受信経路の観測用)
+        self.reject_counts = dict.fromkeys(self.REJECT_REASONS, 0)
 
     def _try_decrypt(self, data: bytes, xor_value: int) -> bytes:
-        """指定のXOR値でSalsa20復号を試行"""
+        """指定のXOR値でSalsa20復号を試行
+
+        先頭1ブロック(64バイト)だけを復号して G7S0 マジックを確認し、一致した
+        場合のみ同じ暗号器で残りを続けて復号する。XOR 値違い・他機器のパケットは
+        1ブロック分の処理で棄却される。
+        """
         # 遅延 import: CourseEstimator は Crypto 非依存のため、復号時のみ読み込む。
         # これにより Crypto 未導入環境でも `import decoder` が成功する。
         from Crypto.Cipher import Salsa20
@@ -171,53 +324,175 @@ class GT7Decoder:
         iv = iv2.to_bytes(4, 'little') + iv1.to_bytes(4, 'little')
 
         cipher = Salsa20.new(self.SALSA20_KEY[:32], bytes(iv))
-        decrypted = cipher.decrypt(data)
-        magic = int.from_bytes(decrypted[0:4], byteorder='little')
+        head = cipher.decrypt(data[:self.PROBE_SIZE])
+        magic = int.from_bytes(head[0:4], byteorder='little')
         if magic == self.MAGIC_G7S0:
-            return decrypted
+            return head + cipher.decrypt(data[self.PROBE_SIZE:])
         return b''
 
-    def decrypt(self, data: bytes) -> bytes:
-        """GT7パケットをSalsa20で復号（XOR自動フォールバック付き）"""
+    def _count_reject(self, reason, message):
+        """破棄理由を計上する。他機器のトラフィックでログが溢れないよう警告は初回のみ"""
+        self.reject_counts[reason] += 1
+        if self.reject_counts[reason] == 1:
+            logger.warning(f"{message} (further '{reason}' rejects are counted in reject_counts)")
+        else:
+            logger.debug(message)
+
+    def _is_duplicate(self, data) -> bool:
+        """直近 DUPLICATE_WINDOW 件にバイト単位で同一のデータグラムがあれば True(無ければ記録)"""
+        data = bytes(data)
+        if data in self._recent:
+            return True
+        self._recent.add(data)
+        self._recent_order.append(data)
+        if len(self._recent_order) > self.DUPLICATE_WINDOW:
+            self._recent.discard(self._recent_order.popleft())
+        return False
+
+    def decrypt(self, data: bytes, addr=None) -> bytes:
+        """GT7パケットをSalsa20で復号（XOR自動フォールバック付き）
+
+        暗号処理の前に、最小サイズ未満・直近と完全一致する重複データグラムを破棄する。
+        addr(送信元アドレス)を渡すと、そのアドレスで前回復号できた XOR 値から試し、
+        復号できない状態が続く送信元(他機器)のデータグラムは暗号処理せずに破棄する。
+        破棄した場合は空 bytes を返し、理由ごとに reject_counts を加算する。
+        """
         if len(data) < self.MIN_PACKET_SIZE:
-            logger.warning(f"Packet too small: {len(data)} bytes")
+            self._count_reject("too_small", f"Packet too small: {len(data)} bytes")
             return b''
 
+        if self._is_duplicate(data):
+            self.reject_counts["duplicate"] += 1
+            return b''
+
+        cached = None
+        if addr is not None:
+            cached = self._xor_by_addr.get(addr)
+            if cached is None:
+                bad = self._bad_by_addr.get(addr, 0)
+                if bad >= self.FOREIGN_THRESHOLD and bad % self.FOREIGN_REPROBE:
+                    self._bad_by_addr[addr] = bad + 1
+                    self.reject_counts["foreign"] += 1
+                    return b''
+
+        result = self._decrypt_any_xor(data, addr, cached)
+        if addr is not None and cached is None:
+            if result:
+                self._bad_by_addr.pop(addr, None)
+            elif len(self._bad_by_addr) < self.MAX_TRACKED_ADDRS or addr in self._bad_by_addr:
+                self._bad_by_addr[addr] = self._bad_by_addr.get(addr, 0) + 1
+        return result
+
+    def _decrypt_any_xor(self, data, addr, cached):
+        """送信元の既知 XOR → 現在の XOR → 他の XOR の順に復号を試行する"""
         try:
-            # 現在のXOR値で復号を試行
+            if cached is not None and cached != self._xor_value:
+                result = self._try_decrypt(data, cached)
+                if result:
+                    return result
+
             result = self._try_decrypt(data, self._xor_value)
             if result:
+                if addr is not None and cached != self._xor_value:
+                    self._xor_by_addr[addr] = self._xor_value
                 return result
 
             # フォールバック: 他のXOR値を試す
             for hb_type, xor_val in self.XOR_MAP.items():
-                if xor_val == self._xor_value:
+                if xor_val == self._xor_value or xor_val == cached:
                     continue
                 result = self._try_decrypt(data, xor_val)
                 if result:
                     logger.info(f"XOR fallback: switched to heartbeat type '{hb_type.decode()}'")
                     self._xor_value = xor_val
                     self.heartbeat_type = hb_type
+                    if addr is not None:
+                        self._xor_by_addr[addr] = xor_val
                     return result
 
-            logger.warning("Decryption failed: no valid XOR value found")
+            self._count_reject("bad_magic", "Decryption failed: no valid XOR value found")
             return b''
         except Exception as e:
+            self.reject_counts["error"] += 1
             logger.error(f"Decryption failed: {e}")
             return b''
 
-    def parse(self, decrypted_data: bytes) -> dict:
-        """復号済みパケットを解析してテレメトリデータを返す"""
+    def decrypt_many(self, packets):
+        """複数パケットを NumPy でまとめて Salsa20 復号する(オフライン再処理用)。
+
+        ライブ受信の decrypt() とは別経路。記録済みの生パケットを大量に再デコード
+        する用途で、パケットごとの暗号器生成と Python ループを避け、全パケットの
+        キーストリームを一括計算する。XOR値は現在値→他の値の順に、マジック
+        不一致だった行だけを対象にフォールバックする(self の XOR 状態は変更しない)。
+
+        戻り値: (decrypted, valid)
+          decrypted: uint8 の2次元配列 (N, 最大パケット長)。短いパケットの末尾は0埋め。
+          valid:     bool 配列 (N,)。G7S0 マジックが一致した行のみ True。
+        """
+        import numpy as np
+
+        n = len(packets)
+        lengths = np.fromiter((len(p) for p in packets), dtype=np.int64, count=n)
+        width = int(lengths.max()) if n else 0
+        if n == 0 or width < self.MIN_PACKET_SIZE:
+            return np.zeros((n, width), dtype=np.uint8), np.zeros(n, dtype=bool)
+
+        if (lengths == width).all():
+            data = np.frombuffer(b''.join(packets), dtype=np.uint8).reshape(n, width)
+        else:
+            data = np.zeros((n, width), dtype=np.uint8)
+            for i, p in enumerate(packets):
+                data[i, :len(p)] = np.frombuffer(p, dtype=np.uint8)
+
+        out = np.zeros((n, width), dtype=np.uint8)
+        valid = np.zeros(n, dtype=bool)
+        usable = lengths >= self.MIN_PACKET_SIZE
+
+        xor_order = [self._xor_value] + [
+            v for v in self.XOR_MAP.values() if v != self._xor_value
+        ]
+        for start in range(0, n, self.BATCH_CHUNK):
+            rows = np.arange(start, min(start + self.BATCH_CHUNK, n))
+            pending = rows[usable[rows]]
+            for xor_value in xor_order:
+                if pending.size == 0:
+                    break
+                chunk = data[pending]
+                plain = chunk ^ _salsa20_keystream_batch(
+                    self.SALSA20_KEY[:32], _gt7_nonces(chunk, xor_value), width
+                )
+                ok = plain[:, :4].copy().view('<u4')[:, 0] == self.MAGIC_G7S0
+                out[pending[ok]] = plain[ok]
+                valid[pending[ok]] = True
+                pending = pending[~ok]
+
+        # 可変長混在時: 0埋め領域にもキーストリームが XOR されているため戻す
+        if not (lengths == width).all():
+            out[np.arange(width)[None, :] >= lengths[:, None]] = 0
+        return out, valid
+
+    def view(self, decrypted_data):
+        """復号済みパケットの遅延解析ビュー(TelemetryView)を返す。短すぎる場合は None。
+
+        バッファはコピーせず memoryview で参照し、フィールドは初回アクセス時に
+        そのフィールドだけを読み出す。package_id だけで破棄が決まるパケットや、
+        一部のフィールドしか読まない消費者は全フィールド解析のコストを払わない。
+        """
+        if isinstance(decrypted_data, TelemetryView):
+            return decrypted_data
         if not decrypted_data or len(decrypted_data) < self.MIN_PARSE_SIZE:
             logger.warning(f"Data too small for parsing: {len(decrypted_data) if decrypted_data else 0} bytes")
             return None
+        return TelemetryView(decrypted_data)
 
-        try:
-            d = decrypted_data
-            result = self._extract_fields(d)
+    def parse(self, decrypted_data) -> dict:
+        """復号済みパケット(または view() の TelemetryView)を解析してテレメトリデータを返す"""
+        view = self.view(decrypted_data)
+        if view is None:
+            return None
 
-            # コース推定はmain.pyで実行
-            result["course"] = {"id": "unknown", "name": "", "confidence": 0}
+        try:
+            result = view.to_dict()
 
             self._parse_count += 1
             if self._parse_count <= 3:
@@ -235,176 +510,384 @@ class GT7Decoder:
             return None
 
     @staticmethod
-    def _quat(d, f):
-        """パケットから単位クォータニオン (x, y, z, w) を読む"""
-        return (f('f', d, 0x1C)[0], f('f', d, 0x20)[0], f('f', d, 0x24)[0], f('f', d, 0x28)[0])
+    def _layout_for(size):
+        """パケット長に収まる最大のバリアント(~ > B > A)のレイアウトを返す"""
+        for layout in _PACKET_LAYOUTS:
+            if size >= layout.size:
+                return layout
+        return None
 
     @staticmethod
-    def _quat_pitch(d, f):
-        x, y, z, w = GT7Decoder._quat(d, f)
+    def _quat_euler(x, y, z, w):
+        """単位クォータニオン (x, y, z, w) から (pitch, yaw, roll) [rad] を求める"""
         fy = 2 * (y * z - w * x)                       # 車体前方ベクトルの上下成分
-        return -math.asin(max(-1.0, min(1.0, fy)))     # 正=機首上げ
-
-    @staticmethod
-    def _quat_yaw(d, f):
-        x, y, z, w = GT7Decoder._quat(d, f)
+        pitch = -math.asin(max(-1.0, min(1.0, fy)))    # 正=機首上げ
         fx = 2 * (x * z + w * y)
         fz = 1 - 2 * (x * x + y * y)
-        return math.atan2(-fx, -fz)                    # 前方=-Z 規約。±π, 0=北
-
-    @staticmethod
-    def _quat_roll(d, f):
-        x, y, z, w = GT7Decoder._quat(d, f)
+        yaw = math.atan2(-fx, -fz)                     # 前方=-Z 規約。±π, 0=北
         ry = 2 * (x * y + w * z)                       # 車体右ベクトルの上下成分
-        return math.asin(max(-1.0, min(1.0, ry)))      # 正=右ロール
+        roll = math.asin(max(-1.0, min(1.0, ry)))      # 正=右ロール
+        return pitch, yaw, roll
 
     @staticmethod
     def _extract_fields(d: bytes) -> dict:
-        """バイナリデータからテレメトリフィールドを抽出"""
-        f = struct.unpack_from
+        """バイナリデータからテレメトリフィールドを抽出
 
-        speed_ms = f('f', d, 0x4C)[0]
-        gear_byte = f('B', d, 0x90)[0]
-        rpm_alert_max = f('H', d, 0x8A)[0]
-        flags_raw = f('H', d, 0x8E)[0]
+        packet_def.json からコンパイルしたバリアント別 struct.Struct で全フィールドを
+        1回の unpack_from で取り出す。生値のまま出すフィールドは一括で dict 化し、
+        派生値(オイラー角・ペダル%・フラグ等)だけをここで計算して追加する。
+        Packet B/~ の拡張フィールドはバリアントのレイアウトに含まれる場合のみ出力される。
+        """
+        layout = GT7Decoder._layout_for(len(d))
+        v = layout.struct.unpack_from(d)
+        ix = layout.index
+        result = layout.public(v)
 
-        # スタート順位・参加台数 (レース前のみ有効、開始後は-1)
-        pre_race_position = f('h', d, 0x84)[0]
-        num_cars_pre_race = f('h', d, 0x86)[0]
+        gear_byte = v[ix["gear_byte"]]
+        rpm_alert_max = v[ix["rpm_alert_max"]]
         suggested = gear_byte >> 4
+        # スタート順位・参加台数 (レース前のみ有効、開始後は-1)
+        pre_race_position = v[ix["pre_race_position_raw"]]
+        num_cars_pre_race = v[ix["num_cars_pre_race_raw"]]
+        quat_w = v[ix["quat_w"]]
+
+        # 回転: 真のオイラー角(rad)。パケット 0x1C-0x28 はオイラー角ではなく
+        # 単位クォータニオン(x,y,z,w) — 実走2万フレームで x²+y²+z²+w²=1.0000 を確認。
+        # 旧実装は成分をラジアン扱いしており、yaw は無意味な値・pitch/roll は約半分だった。
+        # 検証: yaw は速度ベクトル方位と中央値0.18°で一致 / corr(sin(pitch), vy/v)=+0.97 /
+        #       roll は右輪サス圧縮差と正相関(17万フレーム)。
+        pitch, yaw, roll = GT7Decoder._quat_euler(
+            v[ix["quat_x"]], v[ix["quat_y"]], v[ix["quat_z"]], quat_w
+        )
 
-        result = {
-            # 速度
-            "speed_ms": speed_ms,
-            "speed_kmh": speed_ms * 3.6,
-
-            # エンジン
-            "rpm": f('f', d, 0x3C)[0],
-            "max_rpm": rpm_alert_max if rpm_alert_max > 0 else 9000,
-            "rpm_alert_min": f('H', d, 0x88)[0],
-
-            # ギア・ペダル
-            "gear": gear_byte & 0x0F,
-            "suggested_gear": suggested if suggested < 15 else None,
-            "throttle": f('B', d, 0x91)[0],
-            "throttle_pct": f('B', d, 0x91)[0] / GT7Decoder.PEDAL_PCT_DIVISOR,
-            "brake": f('B', d, 0x92)[0],
-            "brake_pct": f('B', d, 0x92)[0] / GT7Decoder.PEDAL_PCT_DIVISOR,
-
-            # クラッチ
-            "clutch": f('f', d, 0xF4)[0],
-            "clutch_engagement": f('f', d, 0xF8)[0],
-            "clutch_gearbox_rpm": f('f', d, 0xFC)[0],
-
-            # タイヤ温度 [FL, FR, RL, RR]
-            "tyre_temp": [f('f', d, 0x60 + i * 4)[0] for i in range(4)],
-
-            # 路面法線ベクトル
-            "road_plane_x": f('f', d, 0x94)[0],
-            "road_plane_y": f('f', d, 0x98)[0],
-            "road_plane_z": f('f', d, 0x9C)[0],
-            "road_plane_distance": f('f', d, 0xA0)[0],
-
-            # サスペンション高さ [FL, FR, RL, RR]
-            "susp_height": [f('f', d, 0xC4 + i * 4)[0] for i in range(4)],
-
-            # タイヤ半径 [FL, FR, RL, RR]
-            "tyre_radius": [f('f', d, 0xB4 + i * 4)[0] for i in range(4)],
-
-            # ホイールRPS [FL, FR, RL, RR]
-            "wheel_rps": [f('f', d, 0xA4 + i * 4)[0] for i in range(4)],
-
-            # 位置
-            "position_x": f('f', d, 0x04)[0],
-            "position_y": f('f', d, 0x08)[0],
-            "position_z": f('f', d, 0x0C)[0],
-
-            # 速度ベクトル (m/s)
-            "velocity_x": f('f', d, 0x10)[0],
-            "velocity_y": f('f', d, 0x14)[0],
-            "velocity_z": f('f', d, 0x18)[0],
-
-            # 回転: 真のオイラー角(rad)。パケット 0x1C-0x28 はオイラー角ではなく
-            # 単位クォータニオン(x,y,z,w) — 実走2万フレームで x²+y²+z²+w²=1.0000 を確認。
-            # 旧実装は成分をラジアン扱いしており、yaw は無意味な値・pitch/roll は約半分だった。
-            # 検証: yaw は速度ベクトル方位と中央値0.18°で一致 / corr(sin(pitch), vy/v)=+0.97 /
-            #       roll は右輪サス圧縮差と正相関(17万フレーム)。
-            "rotation_pitch": GT7Decoder._quat_pitch(d, f),   # 正=機首上げ
-            "rotation_yaw": GT7Decoder._quat_yaw(d, f),       # 世界ヘディング ±π(0=北)
-            "rotation_roll": GT7Decoder._quat_roll(d, f),     # 正=右ロール
-
-            # 方角 = クォータニオン w 成分 (1.0=北, 0.0=南)。HDG 表示が使用。
-            "orientation": f('f', d, 0x28)[0],
-
-            # 角速度 (rad/s)
-            "angular_velocity_x": f('f', d, 0x2C)[0],
-            "angular_velocity_y": f('f', d, 0x30)[0],
-            "angular_velocity_z": f('f', d, 0x34)[0],
-
-            # 車体
-            "body_height": f('f', d, 0x38)[0],
-            "car_max_speed": f('H', d, 0x8C)[0],
-            "oil_pressure": f('f', d, 0x54)[0],
-
-            # 燃料
-            "current_fuel": f('f', d, 0x44)[0],
-            "fuel_capacity": f('f', d, 0x48)[0],
-
-            # ブースト
-            "boost": f('f', d, 0x50)[0] - 1,
-
-            # トランスミッション
-            "transmission_max_speed": f('f', d, 0x100)[0],
-
-            # ギア比 [1st - 8th]
-            "gear_ratios": [f('f', d, 0x104 + i * 4)[0] for i in range(8)],
-
-            # パッケージID
-            "package_id": f('i', d, 0x70)[0],
-
-            # ラップ
-            "lap_count": f('h', d, 0x74)[0],
-            "total_laps": f('h', d, 0x76)[0],
-            "best_laptime": f('i', d, 0x78)[0],
-            "last_laptime": f('i', d, 0x7C)[0],
-            "current_laptime": f('i', d, 0x80)[0],
-
-            # レース (スタート前のみ有効、開始後は-1)
-            "pre_race_position": pre_race_position if pre_race_position >= 0 else None,
-            "num_cars_pre_race": num_cars_pre_race if num_cars_pre_race >= 0 else None,
-
-            # フラグ
-            "flags": {
-                "car_on_track": bool(flags_raw & 0x0001),
-                "paused": bool(flags_raw & 0x0002),
-                "loading": bool(flags_raw & 0x0004),
-                "in_gear": bool(flags_raw & 0x0008),
-                "has_turbo": bool(flags_raw & 0x0010),
-                "rev_limiter": bool(flags_raw & 0x0020),
-                "hand_brake": bool(flags_raw & 0x0040),
-                "lights": bool(flags_raw & 0x0080),
-                "high_beams": bool(flags_raw & 0x0100),
-                "low_beams": bool(flags_raw & 0x0200),
-                "asm_active": bool(flags_raw & 0x0400),
-                "tcs_active": bool(flags_raw & 0x0800),
-            },
-
-            # 車種
-            "car_id": f('i', d, 0x124)[0],
-        }
-
-        # Packet B 拡張フィールド (316 bytes以上)
-        if len(d) >= 0x13C:
-            result["wheel_rotation"] = f('f', d, 0x128)[0]
-            result["body_accel_sway"] = f('f', d, 0x130)[0]
-            result["body_accel_heave"] = f('f', d, 0x134)[0]
-            result["body_accel_surge"] = f('f', d, 0x138)[0]
+        result["speed_kmh"] = result["speed_ms"] * 3.6
+        result["max_rpm"] = rpm_alert_max if rpm_alert_max > 0 else 9000
+        result["gear"] = gear_byte & 0x0F
+        result["suggested_gear"] = suggested if suggested < 15 else None
+        result["throttle_pct"] = result["throttle"] / GT7Decoder.PEDAL_PCT_DIVISOR
+        result["brake_pct"] = result["brake"] / GT7Decoder.PEDAL_PCT_DIVISOR
+        result["rotation_pitch"] = pitch   # 正=機首上げ
+        result["rotation_yaw"] = yaw       # 世界ヘディング ±π(0=北)
+        result["rotation_roll"] = roll     # 正=右ロール
+        # 方角 = クォータニオン w 成分 (1.0=北, 0.0=南)。HDG 表示が使用。
+        result["orientation"] = quat_w
+        result["boost"] = v[ix["boost_raw"]] - 1
+        result["pre_race_position"] = pre_race_position if pre_race_position >= 0 else None
+        result["num_cars_pre_race"] = num_cars_pre_race if num_cars_pre_race >= 0 else None
+        result["flags"] = GT7Decoder._decode_flags(v[ix["flags_raw"]])
 
         # Packet ~ 拡張フィールド (344 bytes以上)
-        if len(d) >= 0x158:
-            result["throttle_filtered_pct"] = f('B', d, 0x13C)[0] / GT7Decoder.PEDAL_PCT_DIVISOR
-            result["brake_filtered_pct"] = f('B', d, 0x13D)[0] / GT7Decoder.PEDAL_PCT_DIVISOR
-            result["torque_vector"] = [f('f', d, 0x140 + i * 4)[0] for i in range(4)]
-            result["energy_recovery"] = f('f', d, 0x150)[0]
+        if "throttle_filtered" in ix:
+            result["throttle_filtered_pct"] = v[ix["throttle_filtered"]] / GT7Decoder.PEDAL_PCT_DIVISOR
+            result["brake_filtered_pct"] = v[ix["brake_filtered"]] / GT7Decoder.PEDAL_PCT_DIVISOR
+
+        return result
+
+    # フラグビット (0x8E) の名前とマスク。解析結果 flags dict のキー順もこの順。
+    FLAG_BITS = (
+        ("car_on_track", 0x0001),
+        ("paused", 0x0002),
+        ("loading", 0x0004),
+        ("in_gear", 0x0008),
+        ("has_turbo", 0x0010),
+        ("rev_limiter", 0x0020),
+        ("hand_brake", 0x0040),
+        ("lights", 0x0080),
+        ("high_beams", 0x0100),
+        ("low_beams", 0x0200),
+        ("asm_active", 0x0400),
+        ("tcs_active", 0x0800),
+    )
+
+    # flags_raw -> flags dict のメモ。値域は 16bit に限られ、走行中はほぼ数種類しか現れない。
+    _FLAG_CACHE = {}
+
+    @staticmethod
+    def _decode_flags(flags_raw):
+        """フラグビットを名前付き bool の dict にする(呼び出し元が変更しても良いよう毎回複製)"""
+        flags = GT7Decoder._FLAG_CACHE.get(flags_raw)
+        if flags is None:
+            flags = {name: bool(flags_raw & mask) for name, mask in GT7Decoder.FLAG_BITS}
+            GT7Decoder._FLAG_CACHE[flags_raw] = flags
+        return dict(flags)
+
+
+# ─────────────────────────────────────────────────────────────────────
+# 遅延解析ビュー
+# ─────────────────────────────────────────────────────────────────────
+
+# 解析結果の course 初期値(コース推定は main.py で実行)
+_COURSE_UNKNOWN = {"id": "unknown", "name": "", "confidence": 0}
+
+# フィールド単位アクセス用の struct.Struct((書式文字, 要素数) ごとに共有)
+_FIELD_STRUCTS = {}
+
+
+def _field_struct(code, count):
+    st = _FIELD_STRUCTS.get((code, count))
+    if st is None:
+        st = _FIELD_STRUCTS[(code, count)] = struct.Struct(f'<{count}{code}')
+    return st
+
+
+def _derive_rotation(view):
+    pitch, yaw, roll = GT7Decoder._quat_euler(
+        view._raw("quat_x"), view._raw("quat_y"), view._raw("quat_z"), view._raw("quat_w")
+    )
+    view._cache["rotation_pitch"] = pitch
+    view._cache["rotation_yaw"] = yaw
+    view._cache["rotation_roll"] = roll
+
+
+def _derive_nonnegative(raw_name):
+    def derive(view):
+        value = view._raw(raw_name)
+        return value if value >= 0 else None
+    return derive
+
+
+# 派生キー -> 計算関数。定義は GT7Decoder._extract_fields と同じ(test_decoder で一致を検証)。
+# rotation_* は3値を一度に計算してキャッシュへ入れるため None を返す。
+_DERIVED = {
+    "speed_kmh": lambda v: v["speed_ms"] * 3.6,
+    "max_rpm": lambda v: v._raw("rpm_alert_max") if v._raw("rpm_alert_max") > 0 else 9000,
+    "gear": lambda v: v._raw("gear_byte") & 0x0F,
+    "suggested_gear": lambda v: (v._raw("gear_byte") >> 4) if (v._raw("gear_byte") >> 4) < 15 else None,
+    "throttle_pct": lambda v: v["throttle"] / GT7Decoder.PEDAL_PCT_DIVISOR,
+    "brake_pct": lambda v: v["brake"] / GT7Decoder.PEDAL_PCT_DIVISOR,
+    "rotation_pitch": _derive_rotation,
+    "rotation_yaw": _derive_rotation,
+    "rotation_roll": _derive_rotation,
+    "orientation": lambda v: v._raw("quat_w"),
+    "boost": lambda v: v._raw("boost_raw") - 1,
+    "pre_race_position": _derive_nonnegative("pre_race_position_raw"),
+    "num_cars_pre_race": _derive_nonnegative("num_cars_pre_race_raw"),
+    "flags": lambda v: GT7Decoder._decode_flags(v._raw("flags_raw")),
+    "course": lambda v: dict(_COURSE_UNKNOWN),
+}
+_DERIVED_EXTENDED = {
+    "throttle_filtered_pct": lambda v: v._raw("throttle_filtered") / GT7Decoder.PEDAL_PCT_DIVISOR,
+    "brake_filtered_pct": lambda v: v._raw("brake_filtered") / GT7Decoder.PEDAL_PCT_DIVISOR,
+}
+
+
+class TelemetryView(Mapping):
+    """復号済みパケット上の読み取り専用・遅延解析ビュー(GT7Decoder.view() が生成)。
+
+    parse() の結果 dict と同じキー・値を Mapping として提供するが、値は初回アクセス時に
+    memoryview からそのフィールドだけを読み出してキャッシュする。JSON 化や記録など
+    全キーが必要になった時点で to_dict() を呼ぶ(1回の unpack で全フィールドを解析)。
+    """
+
+    __slots__ = ('_buf', '_layout', '_cache', '_keys')
+
+    # レイアウト名 -> キー集合(parse() 結果のキー集合と同一)
+    _KEYS = {}
+
+    def __init__(self, decrypted_data):
+        self._buf = memoryview(decrypted_data)
+        self._layout = GT7Decoder._layout_for(len(self._buf))
+        self._cache = {}
+        self._keys = self._KEYS.get(self._layout.name)
+        if self._keys is None:
+            self._keys = self._KEYS[self._layout.name] = self._key_set(self._layout)
+
+    @staticmethod
+    def _key_set(layout):
+        keys = [
+            name for name, (_, _, count) in layout.fields.items()
+            if count > 1 or name in layout._public_keys
+        ]
+        keys += _DERIVED
+        if "throttle_filtered" in layout.index:
+            keys += _DERIVED_EXTENDED
+        return frozenset(keys)
+
+    @property
+    def buffer(self):
+        """参照中の復号済みバッファ(memoryview、コピーなし)"""
+        return self._buf
+
+    def _raw(self, name):
+        """packet_def.json のフィールドを1つだけ読み出す(配列は list)"""
+        offset, code, count = self._layout.fields[name]
+        values = _field_struct(code, count).unpack_from(self._buf, offset)
+        return values[0] if count == 1 else list(values)
+
+    def __getitem__(self, key):
+        cache = self._cache
+        if key in cache:
+            return cache[key]
+        if key not in self._keys:
+            raise KeyError(key)
+        derive = _DERIVED.get(key) or _DERIVED_EXTENDED.get(key)
+        if derive is None:
+            value = self._raw(key)
+        else:
+            value = derive(self)
+            if value is None and key in cache:   # rotation_* は derive 内でキャッシュ済み
+                return cache[key]
+        cache[key] = value
+        return value
+
+    def __contains__(self, key):
+        return key in self._keys
+
+    def __iter__(self):
+        return iter(self._keys)
 
+    def __len__(self):
+        return len(self._keys)
+
+    def to_dict(self):
+        """parse() と同じ解析結果 dict を新たに作って返す(呼び出し側で変更してよい)"""
+        result = GT7Decoder._extract_fields(self._buf)
+        result["course"] = dict(_COURSE_UNKNOWN)
         return result
+
+
+# ─────────────────────────────────────────────────────────────────────
+# packet_def.json → バリアント別 struct.Struct へのコンパイル
+# ─────────────────────────────────────────────────────────────────────
+
+PACKET_DEF_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'packet_def.json')
+
+
+class _PacketLayout:
+    """1バリアント(A/B/~)分のコンパイル済みレイアウト。
+
+    struct:  全フィールドを1回で取り出す struct.Struct
+    index:   name -> unpack 結果タプル内の位置(配列は先頭要素の位置)
+    fields:  name -> (offset, struct 書式文字, 要素数)。フィールド単位アクセス用。
+    """
+
+    __slots__ = ('name', 'size', 'struct', 'index', 'fields',
+                 '_public_keys', '_public_get', '_arrays')
+
+    def __init__(self, name, size, fields):
+        self.name = name
+        self.size = size
+        self.index = {}
+        self.fields = {}
+        fmt = ['<']
+        public = []   # (name, index): internal でないスカラー(解析結果へそのまま出す)
+        arrays = []   # (name, 先頭 index, 要素数)
+        pos = 0
+        index = 0
+        for offset, field, code, count, internal in sorted(fields):
+            width = struct.calcsize('<' + code) * count
+            if offset + width > size:
+                continue  # このバリアントのパケットには存在しないフィールド
+            if offset < pos:
+                raise ValueError(f"packet_def.json: field '{field}' overlaps previous field")
+            if offset > pos:
+                fmt.append(f'{offset - pos}x')
+            fmt.append(f'{count}{code}' if count > 1 else code)
+            if count > 1:
+                arrays.append((field, index, count))
+            elif not internal:
+                public.append((field, index))
+            self.index[field] = index
+            self.fields[field] = (offset, code, count)
+            index += count
+            pos = offset + width
+        self.struct = struct.Struct(''.join(fmt))
+        self._public_keys = tuple(name for name, _ in public)
+        self._public_get = operator.itemgetter(*(i for _, i in public))
+        self._arrays = tuple(arrays)
+
+    def public(self, values):
+        """unpack 結果から、そのまま出力するフィールドの dict(配列は list)を作る"""
+        r = dict(zip(self._public_keys, self._public_get(values)))
+        for name, i, count in self._arrays:
+            r[name] = list(values[i:i + count])
+        return r
+
+
+def _compile_packet_layouts(path=PACKET_DEF_FILE):
+    """packet_def.json を読み、サイズ降順(~, B, A)の _PacketLayout タプルを返す"""
+    with open(path, 'r', encoding='utf-8') as f:
+        spec = json.load(f)
+    types = spec['types']
+    fields = [
+        (int(d['offset'], 16), name, types[d['type']], d.get('length', 1), d.get('internal', False))
+        for name, d in spec['fields'].items()
+    ]
+    layouts = [
+        _PacketLayout(name, int(v['size'], 16), fields)
+        for name, v in spec['variants'].items()
+    ]
+    return tuple(sorted(layouts, key=lambda layout: layout.size, reverse=True))
+
+
+_PACKET_LAYOUTS = _compile_packet_layouts()
+
+
+# ─────────────────────────────────────────────────────────────────────
+# NumPy 版 Salsa20/20(GT7Decoder.decrypt_many 用)
+#
+# pycryptodome はパケットごとに暗号器を生成する必要があるため、大量の記録済み
+# パケットを再処理する経路では (パケット×ブロック) を列とする uint32 配列で
+# 全キーストリームを一括計算する。numpy はこの経路でのみ遅延 import する。
+# ─────────────────────────────────────────────────────────────────────
+
+_SALSA20_SIGMA = (0x61707865, 0x3320646E, 0x79622D32, 0x6B206574)  # "expand 32-byte k"
+
+# (a, b, c, d): b ^= rotl(a+d, 7); c ^= rotl(b+a, 9); d ^= rotl(c+b, 13); a ^= rotl(d+c, 18)
+_SALSA20_COLUMN_ROUND = ((0, 4, 8, 12), (5, 9, 13, 1), (10, 14, 2, 6), (15, 3, 7, 11))
+_SALSA20_ROW_ROUND = ((0, 1, 2, 3), (5, 6, 7, 4), (10, 11, 8, 9), (15, 12, 13, 14))
+
+
+def _gt7_nonces(data, xor_value):
+    """暗号文配列 (N, L) の 0x40 シードから GT7 の 8バイト nonce を (N, 2) uint32 で返す"""
+    import numpy as np
+    iv1 = data[:, 0x40:0x44].copy().view('<u4')[:, 0].astype(np.uint32)
+    iv2 = iv1 ^ np.uint32(xor_value)
+    return np.stack([iv2, iv1], axis=1)
+
+
+def _salsa20_keystream_batch(key, nonces, length):
+    """nonce ごとに length バイトの Salsa20/20 キーストリームを (N, length) uint8 で返す"""
+    import numpy as np
+
+    n = nonces.shape[0]
+    blocks = (length + 63) // 64
+    k = np.frombuffer(key, dtype='<u4').astype(np.uint32)
+    cols = n * blocks
+    counter = np.tile(np.arange(blocks, dtype=np.uint32), n)
+
+    init = np.empty((16, cols), dtype=np.uint32)
+    init[0] = _SALSA20_SIGMA[0]
+    init[1:5] = k[0:4, None]
+    init[5] = _SALSA20_SIGMA[1]
+    init[6] = np.repeat(nonces[:, 0], blocks)
+    init[7] = np.repeat(nonces[:, 1], blocks)
+    init[8] = counter
+    init[9] = 0  # GT7 パケットは 64ブロック未満のため上位カウンタは常に0
+    init[10] = _SALSA20_SIGMA[2]
+    init[11:15] = k[4:8, None]
+    init[15] = _SALSA20_SIGMA[3]
+
+    x = init.copy()
+    t = np.empty(cols, dtype=np.uint32)
+    u = np.empty(cols, dtype=np.uint32)
+
+    def step(dst, p, q, r):
+        # x[dst] ^= rotl(x[p] + x[q], r)。一時配列を使い回し割当てを避ける
+        np.add(x[p], x[q], out=t)
+        np.left_shift(t, r, out=u)
+        np.right_shift(t, 32 - r, out=t)
+        np.bitwise_or(t, u, out=t)
+        np.bitwise_xor(x[dst], t, out=x[dst])
+
+    for _ in range(10):
+        for rnd in (_SALSA20_COLUMN_ROUND, _SALSA20_ROW_ROUND):
+            for a, b, c, d in rnd:
+                step(b, a, d, 7)
+                step(c, b, a, 9)
+                step(d, c, b, 13)
+                step(a, d, c, 18)
+
+    words = x + init  # (16, N*blocks)
+    stream = words.T.astype('<u4').reshape(n, blocks * 16).view(np.uint8)
+    return stream[:, :length]
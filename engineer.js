@@ -4,7 +4,8 @@
  * 別端末から /ws へ接続し、{"type":"engineer_message", "text":..., "severity":...}
  * をドライバー側クライアントへ送信する専用の軽量ページ。
  * メインダッシュボード(index.html/websocket.js)とは独立したファイルであり、
- * テレメトリ受信・解析は一切行わない(送信専用)。
+ * テレメトリ受信・解析は一切行わない(送信専用)。接続時に受信ヘルスを購読し、
+ * サーバから1秒ごとに届く receive_health を「受信ヘルス」カードに表示する。
  */
 
 const engineerState = {
@@ -67,13 +68,24 @@ function engineerSendMessage(text, severity) {
 
 function engineerConnect() {
     const wsProtocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
-    const wsUrl = wsProtocol + '//' + window.location.host + '/ws';
+    // マルチコンソール: /engineer?console=<id> で担当リグのチャンネルへ接続する
+    // 遠隔(別室・VPN)からは /engineer?compress=1 でこの接続だけ permessage-deflate を使う
+    const params = new URLSearchParams(window.location.search);
+    const consoleId = params.get('console');
+    const query = [];
+    if (consoleId) query.push('console=' + encodeURIComponent(consoleId));
+    if (params.get('compress') === '1') query.push('compress=1');
+    const wsUrl = wsProtocol + '//' + window.location.host + '/ws' +
+        (query.length ? '?' + query.join('&') : '');
     engineerState.ws = new WebSocket(wsUrl);
 
     engineerState.ws.onopen = function() {
         engineerSetStatus('Connected', 'connected');
         engineerSetControlsEnabled(true);
         engineerState.reconnectDelay = 1000;
+        engineerState.ws.send(JSON.stringify({ type: 'subscribe_health' }));
+        // 本ページはテレメトリを表示しないので、60Hz のフレームは受け取らない(rate 0)
+        engineerState.ws.send(JSON.stringify({ type: 'subscribe', rate: 0 }));
     };
 
     engineerState.ws.onclose = function() {
@@ -86,7 +98,7 @@ function engineerConnect() {
         engineerSetStatus('Error', 'error');
     };
 
-    // #436 T2: ドライバー側からのdriver_response(OK/COPY/RE-PLAN)のみ処理する。
+    // #436 T2: ドライバー側からのdriver_response(OK/COPY/RE-PLAN)と受信ヘルスのみ処理する。
     // テレメトリ・他エンジニア端末からのengineer_message echo等は本ページでは処理不要。
     engineerState.ws.onmessage = function(event) {
         let data;
@@ -97,10 +109,75 @@ function engineerConnect() {
         }
         if (data && data.type === 'driver_response' && typeof data.response === 'string') {
             engineerLog(data.response, false, 'driver-response-log');
+        } else if (data && data.type === 'receive_health') {
+            engineerRenderHealth(data);
         }
     };
 }
 
+function engineerFormatNumber(value, digits) {
+    if (value === null || value === undefined) {
+        return '--';
+    }
+    return typeof digits === 'number' ? value.toFixed(digits) : String(value);
+}
+
+// 受信ヘルス(main.py health_stream_task → health.ReceiveHealth.snapshot())の表示
+function engineerRenderHealth(health) {
+    const summary = document.getElementById('receive-health-summary');
+    const histogram = document.getElementById('receive-health-histogram');
+    if (!summary || !histogram) {
+        return;
+    }
+
+    const rows = [];
+    Object.keys(health.sources || {}).forEach(function(host) {
+        const src = health.sources[host];
+        rows.push([host, `${engineerFormatNumber(src.rate_hz, 1)} Hz / jitter ${engineerFormatNumber(src.jitter_ms, 2)} ms`, false]);
+    });
+    const sock = health.socket || {};
+    rows.push(['kernel drops', engineerFormatNumber(sock.kernel_drops), sock.kernel_drops > 0]);
+    rows.push(['kernel queue', `${engineerFormatNumber(sock.kernel_rx_queue_bytes)} / ${engineerFormatNumber(sock.rcvbuf_bytes)} B`, false]);
+    const total = (health.loss && health.loss.total) || {};
+    Object.keys(total).forEach(function(cause) {
+        rows.push([cause, engineerFormatNumber(total[cause]), total[cause] > 0]);
+    });
+    const depths = health.queue_depths || {};
+    Object.keys(depths).forEach(function(name) {
+        rows.push([`depth ${name}`, engineerFormatNumber(depths[name]), false]);
+    });
+    rows.push(['max interval', `${engineerFormatNumber(health.max_interval_ms, 1)} ms`, false]);
+
+    summary.replaceChildren();
+    rows.forEach(function(row) {
+        const dt = document.createElement('dt');
+        dt.textContent = row[0];
+        const dd = document.createElement('dd');
+        dd.textContent = row[1];
+        if (row[2]) {
+            dd.classList.add('warn');
+        }
+        summary.append(dt, dd);
+    });
+
+    // 到着間隔ヒストグラム(件数の最大値を100%とした横棒)
+    const buckets = health.interval_histogram_ms || [];
+    const maxCount = Math.max(1, ...buckets.map(function(b) { return b.count; }));
+    histogram.replaceChildren();
+    buckets.forEach(function(b) {
+        const row = document.createElement('div');
+        row.className = 'engineer-health-bar';
+        const label = document.createElement('span');
+        label.textContent = b.le === null ? '> 1000ms' : `≤ ${b.le}ms`;
+        const bar = document.createElement('span');
+        bar.style.width = `${(100 * b.count / maxCount).toFixed(1)}%`;
+        const count = document.createElement('span');
+        count.textContent = String(b.count);
+        row.append(label, bar, count);
+        histogram.append(row);
+    });
+}
+
 function scheduleEngineerReconnect() {
     if (engineerState.reconnectTimer) {
         return;
@@ -0,0 +1,367 @@
+"""
+WebSocket 配信の購読(クライアントごとの更新レートとフィールドの投影)と間引き
+
+受信は約60Hzだが、ダッシュボードは requestAnimationFrame と UPDATE_INTERVALS で
+大半のフレームを描画前に捨てており、エンジニア画面や Wi-Fi のスマートフォンは
+もっと少なくてよい。クライアントは /ws で購読メッセージを送り、受け取りたい
+レート(Hz)を指定できる:
+
+    {"type": "subscribe", "rate": 20}
+
+サーバはレートごとの群(tier)に分けて間引く。フレームごとに「いま送る時刻に
+達した tier」を求め、どの tier も送らないフレームは JSON 化自体を省く。送る
+フレームは1回だけ JSON 化し、送る時刻に達した tier のクライアントにだけ送る。
+
+  - rate が FULL_RATE(60)以上、または購読メッセージを送っていないクライアントは全フレーム
+  - rate 0 はテレメトリを送らない(エンジニアメッセージ等の低頻度メッセージは届く)
+
+フレームは約70フィールド(JSON で約2.5KB)あり、軽い画面は大半を使わない。購読
+メッセージにはフィールドの一覧か名前付きプロファイルを付けられる(投影):
+
+    {"type": "subscribe", "profile": "drive"}
+    {"type": "subscribe", "fields": ["speed_kmh", "gear", "lap_count"], "rate": 20}
+
+同じ投影のクライアントは1つの群にまとめ、フレームごとに投影ごと1回だけ JSON 化する。
+投影には PROJECTION_ALWAYS(フレームの識別と時刻)を常に含める。
+
+フィールドの多く(car_id・gear_ratios・fuel_capacity・flags・確定済みの course 等)は
+連続するフレームで変わらない。"delta": true を購読したクライアントには差分で送る:
+
+    {"type": "keyframe", "seq": 120, "frame": {...全フィールド(投影後)...}}
+    {"type": "delta", "seq": 121, "frame": {...前回から変わったフィールドだけ...}}
+
+差分の基準は群(同じ rate・投影)へ最後に送ったフレームで、送る時(配信タスク)に
+作るので、配信の遅れで上書きされたフレームがあっても基準はずれない。keyframe は
+DELTA_KEYFRAME_EVERY 件ごと、群へのクライアントの参加時、resync の要求時に送る。
+送信タスク(writer.ClientWriter)は未送信のフレームを delta で上書きせず、そのクライアント
+にだけ次を keyframe で送らせるので、送信の遅れでは seq は欠けない。それでも seq が
+前回 +1 でなければ、クライアントは {"type": "resync"} を送り、次の keyframe まで
+差分を捨てる。前回あって今回無いフィールドは delta の "removed" に名前を載せる。
+
+"format": "binary" を購読したクライアントには、まずスキーマ(JSON のテキストメッセージ)を
+送り、以後のフレームは固定長のリトルエンディアンのレコード(バイナリメッセージ)で送る:
+
+    {"type": "schema", "id": 1, "size": 344, "fields": [{"name": "rpm", "dtype": "f32", "offset": 30}, ...]}
+    <u16 スキーマ id><各フィールド ...>                  # BinaryCodec.pack、struct.pack 1回
+
+レコードは事前にコンパイルした struct.Struct で詰め、ブラウザは DataView で読む。
+浮動小数点は f32、整数はパケット上の型に合わせて u8/i16/u16/i32、時刻(ns)は i64、flags は
+FLAG_BITS のビット列(u16)。値が無い(None)時は f32 は NaN、整数はスキーマの null 値。
+course(文字列を含む)は変わった時だけ {"type": "course", "course": {...}} を JSON で送る。
+エンジニアメッセージ等の低頻度メッセージも JSON のまま。バイナリ形式は差分配信より優先する。
+
+API(main.py からの使用順序):
+    tiers = RateTiers()
+    tiers.add(rate) / tiers.discard(rate)   # クライアントの購読・解除(同じ rate の数を数える)
+    due = tiers.due(arrival_ns)             # このフレームを送る tier(rate)の tuple
+    projection = parse_projection(profile, fields)   # None = 全フィールド。不正なら ValueError
+    payload = project(frame, projection)    # 投影した dict
+    messages = FrameMessages(frame)         # 投影 -> JSON メッセージ(配信チャンネルへ書く)
+    stream = DeltaStream()
+    message = stream.encode(payload)        # keyframe / delta の JSON
+    codec = BinaryCodec(schema_id, projection)
+    codec.schema / codec.pack(frame)        # スキーマ(dict) / バイナリのレコード(bytes)
+"""
+
+import collections
+import json
+import math
+import struct
+
+from decoder import GT7Decoder
+
+# 全フレームを送る tier(これ以上の rate は全フレーム扱い)
+FULL_RATE = 60
+# 投影に常に含めるフィールド(timestamp は legacy_iso_timestamps の時だけフレームにある)
+PROJECTION_ALWAYS = ("package_id", "arrival_ns", "wall_anchor_ns", "timestamp")
+# fields で指定できるフィールド数の上限
+PROJECTION_MAX_FIELDS = 128
+# 名前付きプロファイル。full(または profile 省略で fields も無し)は全フィールド
+PROJECTION_PROFILES = {
+    # DRIVE ビュー: 速度・ギア・ペダル・ラップ・燃料・タイヤと、ラップ解析(デルタ)の入力
+    "drive": (
+        "speed_kmh", "speed_ms", "rpm", "max_rpm", "rpm_alert_min", "gear", "suggested_gear",
+        "throttle_pct", "brake_pct", "lap_count", "total_laps", "best_laptime", "last_laptime",
+        "current_laptime", "current_fuel", "fuel_capacity", "fuel_per_lap", "fuel_laps_remaining",
+        "tyre_temp", "tyre_radius", "wheel_rps", "position_x", "position_z", "flags", "course", "car_id",
+    ),
+    # ピットウォール: 周回・タイム・燃料・タイヤ温度・順位・位置
+    "engineer": (
+        "lap_count", "total_laps", "best_laptime", "last_laptime", "current_laptime",
+        "current_fuel", "fuel_capacity", "fuel_per_lap", "fuel_laps_remaining", "fuel_consumed",
+        "laps_since_refuel", "tyre_temp", "speed_kmh", "gear", "pre_race_position",
+        "num_cars_pre_race", "position_x", "position_z", "flags", "course", "car_id",
+    ),
+    # 走行解析: 入力・挙動・加速度・サスペンションと、距離積分に使う位置・車輪
+    "analysis": (
+        "speed_kmh", "speed_ms", "rpm", "gear", "throttle_pct", "brake_pct", "wheel_rotation",
+        "accel_g", "accel_decel", "body_accel_sway", "body_accel_surge", "body_accel_heave",
+        "angular_velocity_y", "susp_height", "position_x", "position_y", "position_z",
+        "lap_count", "total_laps", "current_laptime", "last_laptime", "current_fuel",
+        "fuel_capacity", "tyre_radius", "wheel_rps", "energy_recovery", "torque_vector", "flags",
+    ),
+}
+
+# 差分配信で keyframe を送る間隔(群へ送った件数。60Hz なら約1秒)
+DELTA_KEYFRAME_EVERY = 60
+# 差分で「前回は無かった」を表す値(フレームの値として現れない)
+_MISSING = object()
+# delta メッセージの先頭(DeltaStream.encode が "type" を先頭に json.dumps する)
+_DELTA_PREFIX = '{"type": "delta"'
+
+
+def is_delta_message(message):
+    """message が DeltaStream の delta(直前のフレームを基準にした差分)か"""
+    return isinstance(message, str) and message.startswith(_DELTA_PREFIX)
+
+# バイナリ形式のフィールド: (名前, struct の書式文字, 要素数)。この順にレコードへ詰める。
+# 整数の幅は packet_def.json の元の型に合わせる(範囲外の値は値が無いものとして詰める)
+BINARY_FIELDS = (
+    ("package_id", "i", 1), ("arrival_ns", "q", 1), ("wall_anchor_ns", "q", 1),
+    ("speed_kmh", "f", 1), ("speed_ms", "f", 1), ("rpm", "f", 1), ("max_rpm", "H", 1),
+    ("rpm_alert_min", "H", 1), ("gear", "B", 1), ("suggested_gear", "B", 1),
+    ("throttle", "B", 1), ("throttle_pct", "f", 1), ("brake", "B", 1), ("brake_pct", "f", 1),
+    ("throttle_filtered_pct", "f", 1), ("brake_filtered_pct", "f", 1),
+    ("clutch", "f", 1), ("clutch_engagement", "f", 1), ("clutch_gearbox_rpm", "f", 1),
+    ("position_x", "f", 1), ("position_y", "f", 1), ("position_z", "f", 1),
+    ("velocity_x", "f", 1), ("velocity_y", "f", 1), ("velocity_z", "f", 1),
+    ("rotation_pitch", "f", 1), ("rotation_yaw", "f", 1), ("rotation_roll", "f", 1),
+    ("orientation", "f", 1), ("angular_velocity_x", "f", 1), ("angular_velocity_y", "f", 1),
+    ("angular_velocity_z", "f", 1), ("body_height", "f", 1), ("wheel_rotation", "f", 1),
+    ("body_accel_sway", "f", 1), ("body_accel_heave", "f", 1), ("body_accel_surge", "f", 1),
+    ("accel_g", "f", 1), ("accel_decel", "f", 1),
+    ("road_plane_x", "f", 1), ("road_plane_y", "f", 1), ("road_plane_z", "f", 1),
+    ("road_plane_distance", "f", 1),
+    ("tyre_temp", "f", 4), ("susp_height", "f", 4), ("tyre_radius", "f", 4), ("wheel_rps", "f", 4),
+    ("torque_vector", "f", 4), ("gear_ratios", "f", 8), ("transmission_max_speed", "f", 1),
+    ("car_max_speed", "H", 1), ("oil_pressure", "f", 1), ("boost", "f", 1), ("energy_recovery", "f", 1),
+    ("current_fuel", "f", 1), ("fuel_capacity", "f", 1), ("fuel_consumed", "f", 1),
+    ("fuel_per_lap", "f", 1), ("fuel_laps_remaining", "f", 1), ("laps_since_refuel", "h", 1),
+    ("lap_count", "h", 1), ("total_laps", "h", 1), ("best_laptime", "i", 1),
+    ("last_laptime", "i", 1), ("current_laptime", "i", 1),
+    ("pre_race_position", "h", 1), ("num_cars_pre_race", "h", 1), ("car_id", "i", 1),
+    ("flags", "H", 1),
+)
+# 書式文字 -> スキーマの dtype 名(DataView の getter に対応)
+BINARY_DTYPES = {"B": "u8", "h": "i16", "H": "u16", "i": "i32", "q": "i64", "f": "f32"}
+# 整数で値が無い(None)ことを表す値
+BINARY_NULLS = {"B": 0xFF, "h": -0x8000, "H": 0xFFFF, "i": -0x80000000, "q": -0x8000000000000000}
+# 書式文字 -> 詰められる値の範囲(f32 は有限の最大値。inf / NaN はそのまま詰める)
+_BINARY_RANGES = {
+    "B": (0, 0xFF), "h": (-0x8000, 0x7FFF), "H": (0, 0xFFFF), "i": (-0x80000000, 0x7FFFFFFF),
+    "q": (-0x8000000000000000, 0x7FFFFFFFFFFFFFFF), "f": (-3.4028234663852886e38, 3.4028234663852886e38),
+}
+
+# 送信時刻の許容幅: 到着のジッタで送る時刻の直前に着いたフレームも送る(60Hz の1/4周期)
+RATE_SLACK_NS = 4_000_000
+
+
+def parse_rate(value):
+    """購読メッセージの rate を 0..FULL_RATE の整数 Hz にする(不正なら None)"""
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return None
+    if value != value:   # NaN
+        return None
+    return max(0, min(FULL_RATE, int(value)))
+
+
+def parse_projection(profile=None, fields=None):
+    """購読メッセージの profile / fields を投影にする。
+
+    fields があればそれを、無ければ profile を使う。全フィールドは None、それ以外は
+    PROJECTION_ALWAYS を先頭にしたフィールド名の tuple(同じ集合なら順序によらず同じ値)。
+    未知の profile・文字列以外を含む fields は ValueError。
+    """
+    if fields is not None:
+        if not isinstance(fields, list) or len(fields) > PROJECTION_MAX_FIELDS:
+            raise ValueError(f"fields must be a list of at most {PROJECTION_MAX_FIELDS} names")
+        if not all(isinstance(name, str) for name in fields):
+            raise ValueError("fields must be strings")
+        names = fields
+    elif profile is None or profile == "full":
+        return None
+    elif isinstance(profile, str) and profile in PROJECTION_PROFILES:
+        names = PROJECTION_PROFILES[profile]
+    else:
+        raise ValueError(f"unknown profile: {profile!r}")
+    return PROJECTION_ALWAYS + tuple(sorted(set(names).difference(PROJECTION_ALWAYS)))
+
+
+def project(frame, projection):
+    """フレーム dict を投影する(フレームに無いフィールドは含めない)"""
+    return {name: frame[name] for name in projection if name in frame}
+
+
+class RateTiers:
+    """購読レートごとのクライアント数と次に送る時刻。
+
+    イベントループ上の単一スレッドから使う前提(ロックなし)。
+    """
+
+    def __init__(self):
+        self._members = collections.Counter()   # rate -> 購読クライアント数(rate 0 は数えない)
+        self._next_due_ns = {}                  # rate -> 次に送る到着時刻(FULL_RATE は持たない)
+
+    def __len__(self):
+        """購読クライアントのいる tier の数"""
+        return len(self._members)
+
+    def add(self, rate):
+        if rate:
+            self._members[rate] += 1
+
+    def discard(self, rate):
+        if not rate or rate not in self._members:
+            return
+        self._members[rate] -= 1
+        if self._members[rate] <= 0:
+            del self._members[rate]
+            self._next_due_ns.pop(rate, None)
+
+    def due(self, arrival_ns):
+        """arrival_ns に着いたフレームを送る tier(rate)の tuple(無ければ空)"""
+        due = []
+        next_due_ns = self._next_due_ns
+        for rate in self._members:
+            if rate >= FULL_RATE:
+                due.append(rate)
+                continue
+            next_due = next_due_ns.get(rate)
+            if next_due is not None and arrival_ns < next_due - RATE_SLACK_NS:
+                continue
+            # 遅れて着いた時は到着時刻から数え直す(停滞後にまとめて送り直さない)
+            if next_due is None or arrival_ns > next_due:
+                next_due = arrival_ns
+            next_due_ns[rate] = next_due + 1_000_000_000 // rate
+            due.append(rate)
+        return tuple(due)
+
+
+class FrameMessages(dict):
+    """1フレーム分の 投影 -> JSON メッセージ(None は全フィールド)。
+
+    frame は元のフレーム dict で、差分配信のクライアントへは配信タスクがここから作る。
+    """
+
+    __slots__ = ("frame",)
+
+    def __init__(self, frame):
+        super().__init__()
+        self.frame = frame
+
+
+class DeltaStream:
+    """1つの群(同じ rate・投影)へ送ったフレームを基準に keyframe / delta を作る
+
+    resync したクライアントには、群全体を keyframe にせず、keyframe() で直前のフレームを
+    同じ seq の keyframe にして送る(次の delta はそのフレームが基準なので続けて使える)。
+    """
+
+    def __init__(self, keyframe_every=DELTA_KEYFRAME_EVERY):
+        self.keyframe_every = keyframe_every
+        self.seq = 0
+        self.force_keyframe = False
+        self._last = None
+        self._since_keyframe = 0
+        self._keyframe = None
+
+    def encode(self, payload):
+        """payload(投影済みのフレーム dict)を送る JSON メッセージにする"""
+        self.seq += 1
+        last = self._last
+        self._last = payload
+        if last is None or self.force_keyframe or self._since_keyframe >= self.keyframe_every:
+            self.force_keyframe = False
+            self._since_keyframe = 1
+            self._keyframe = json.dumps({"type": "keyframe", "seq": self.seq, "frame": payload})
+            return self._keyframe
+        self._keyframe = None
+        self._since_keyframe += 1
+        changed = {k: v for k, v in payload.items() if last.get(k, _MISSING) != v}
+        message = {"type": "delta", "seq": self.seq, "frame": changed}
+        removed = last.keys() - payload.keys()
+        if removed:
+            message["removed"] = sorted(removed)
+        return json.dumps(message)
+
+    def keyframe(self):
+        """直前に encode したフレームを、同じ seq の keyframe メッセージにする"""
+        if self._keyframe is None:
+            self._keyframe = json.dumps({"type": "keyframe", "seq": self.seq, "frame": self._last})
+        return self._keyframe
+
+
+class BinaryCodec:
+    """バイナリ形式のスキーマと、フレームを固定長レコードへ詰める事前コンパイル済みの struct。
+
+    projection(投影)を渡すと、BINARY_FIELDS のうち投影に含まれるフィールドだけを詰める。
+    """
+
+    def __init__(self, schema_id, projection=None):
+        self.schema_id = schema_id
+        self._fields = tuple(
+            f for f in BINARY_FIELDS if projection is None or f[0] in projection
+        )
+        self._struct = struct.Struct("<H" + "".join(code * count for _, code, count in self._fields))
+        # レコードの値ごとの書式文字(先頭のスキーマ ID を除く)。範囲外の値を詰め直す時に使う
+        self._codes = "".join(code * count for _, code, count in self._fields)
+        self.size = self._struct.size
+        fields = []
+        offset = 2
+        for name, code, count in self._fields:
+            field = {"name": name, "dtype": BINARY_DTYPES[code], "offset": offset}
+            if count > 1:
+                field["count"] = count
+            if name == "flags":
+                field["bits"] = [[bit, mask] for bit, mask in GT7Decoder.FLAG_BITS]
+            elif code in BINARY_NULLS:
+                field["null"] = BINARY_NULLS[code]
+            fields.append(field)
+            offset += struct.calcsize("<" + code) * count
+        self.schema = {"type": "schema", "id": schema_id, "size": self.size, "fields": fields}
+
+    def pack(self, frame):
+        """フレーム dict を1件のレコード(bytes)にする"""
+        values = [self.schema_id]
+        append = values.append
+        for name, code, count in self._fields:
+            value = frame.get(name)
+            if count > 1:
+                if value is None or len(value) != count:
+                    values.extend((math.nan,) * count)
+                else:
+                    values.extend(value)
+            elif name == "flags":
+                bits = 0
+                if value:
+                    for bit, mask in GT7Decoder.FLAG_BITS:
+                        if value.get(bit):
+                            bits |= mask
+                append(bits)
+            elif value is None:
+                append(math.nan if code == "f" else BINARY_NULLS[code])
+            else:
+                append(value)
+        try:
+            return self._struct.pack(*values)
+        except (struct.error, OverflowError, TypeError):
+            # 範囲外・型の違う値(派生値の f32 の溢れ等)が1つでもあると struct は全体を
+            # 拒否する。その値だけを値が無いもの(NaN / BINARY_NULLS)にして詰め直す
+            return self._struct.pack(self.schema_id, *map(_binary_value, self._codes, values[1:]))
+
+
+def _binary_value(code, value):
+    """値を書式 code で詰められる値にする(詰められない値は値が無いものにする)"""
+    lo, hi = _BINARY_RANGES[code]
+    if code == "f":
+        try:
+            value = float(value)
+        except (TypeError, ValueError, OverflowError):
+            return math.nan
+        if math.isfinite(value) and not lo <= value <= hi:
+            return math.nan
+        return value
+    if isinstance(value, int) and lo <= value <= hi:
+        return value
+    return BINARY_NULLS.get(code, 0)
+
@@ -0,0 +1,215 @@
+"""
+受信経路のヘルスモデル
+
+パケットが欠けたとき、原因がネットワーク・カーネル・自プロセスの消費側の
+どこにあるかを切り分けるための計測をまとめて持つ:
+
+  - カーネル: UDP 受信バッファの溢れ(drops)と滞留バイト数(/proc/net/udp の当該ソケット行)、
+    実効 SO_RCVBUF(getsockopt)
+  - 到着間隔: 送信元ごとの到着間隔ヒストグラムと RFC 3550 方式の平滑化ジッタ
+  - 損失の原因別内訳: 復号失敗・解析失敗・順序逆転・package_id の欠番・キュー溢れ・カーネル破棄
+  - 段ごとのキュー深さ(登録されたプローブを snapshot() 時に読む)
+
+典型的な読み方:
+  - 大きな到着間隔のあと通常間隔が続き、欠番が増える → ネットワーク(送信側・Wi-Fi)
+  - kernel_drop が増える・カーネル滞留が SO_RCVBUF に近い → 消費側が止まりカーネルで溢れた
+  - 大きな到着間隔のあと 0ms 付近の間隔が続く → 自プロセスが止まり、溜まった分をまとめて読んだ
+
+API(main.py からの使用順序):
+    health = ReceiveHealth(receive_port)
+    client.health = health                      # 受信側が record_arrival() を呼ぶ
+    health.add_depth_probe("receive_ring", fn)  # fn() -> int
+    health.count_loss("decrypt_failure", console_id="rig1")
+    snap = health.snapshot()                    # JSON 化可能な dict
+"""
+
+import bisect
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# 損失の原因。コンソールに帰属するもの(package_id 判定・解析)と、
+# 振り分け前にソケット/キューで失われるものがある。
+LOSS_CAUSES = (
+    "decrypt_failure",   # 復号できなかった(重複・他機器・壊れたデータグラムを含む)
+    "parse_failure",     # 復号できたが解析できなかった
+    "out_of_order",      # package_id の逆行・重複で受理しなかった
+    "package_id_gap",    # 受理したパケット間の package_id の欠番
+    "queue_overflow",    # 受信キュー/デコードリングの溢れで読まれずに捨てた
+    "kernel_drop",       # カーネルの UDP 受信バッファ溢れ(/proc/net/udp の drops)
+)
+
+# 到着間隔ヒストグラムの上端(ms)。60Hz(16.7ms)付近を細かく、停止・まとめ読みの両端を粗く取る。
+INTERVAL_BUCKETS_MS = (1, 4, 10, 14, 16, 17, 18, 20, 25, 34, 50, 100, 250, 1000)
+
+# /proc/net/udp(IPv4)と /proc/net/udp6(0.0.0.0 バインドでは通常 v4 側のみ)
+PROC_NET_UDP = ("/proc/net/udp", "/proc/net/udp6")
+
+
+def read_udp_socket_stats(port, paths=PROC_NET_UDP):
+    """ローカルポート port で待ち受ける UDP ソケットの (rx_queue バイト数, drops) を返す。
+
+    /proc/net/udp の該当行を合計する(同じポートのソケットは通常このプロセスの1本だけ)。
+    Linux 以外・読み取り不可・該当行なしの場合は None。
+    """
+    port_hex = f":{port:04X}"
+    rx_queue = drops = 0
+    found = False
+    for path in paths:
+        try:
+            with open(path, "r", encoding="ascii") as f:
+                next(f, None)  # ヘッダ行
+                for line in f:
+                    cols = line.split()
+                    # sl local_address rem_address st tx_queue:rx_queue ... drops
+                    if len(cols) < 13 or not cols[1].endswith(port_hex):
+                        continue
+                    rx_queue += int(cols[4].split(":")[1], 16)
+                    drops += int(cols[-1])
+                    found = True
+        except (OSError, ValueError, IndexError):
+            continue
+    return (rx_queue, drops) if found else None
+
+
+class _SourceStats:
+    """送信元1つ分の到着間隔の状態"""
+
+    __slots__ = ("packets", "last_ns", "last_interval_ms", "jitter_ms", "mean_interval_ms")
+
+    def __init__(self):
+        self.packets = 0
+        self.last_ns = None
+        self.last_interval_ms = None
+        self.jitter_ms = 0.0
+        self.mean_interval_ms = None
+
+
+class ReceiveHealth:
+    """受信経路のヘルス計測。イベントループ上の単一スレッドから使う前提(ロックなし)。"""
+
+    # 平滑化係数(RFC 3550 のジッタ推定と同じ 1/16)
+    SMOOTHING = 1.0 / 16
+
+    def __init__(self, receive_port=None, rcvbuf_requested=None):
+        self.receive_port = receive_port
+        self.rcvbuf_requested = rcvbuf_requested
+        # 実効 SO_RCVBUF(受信ソケットを持つ側が設定する。デコードワーカー構成では不明)
+        self.rcvbuf_bytes = None
+        self.started_at = time.monotonic()
+        self.interval_counts = [0] * (len(INTERVAL_BUCKETS_MS) + 1)
+        self.max_interval_ms = 0.0
+        self._sources = {}
+        # 原因別の損失。None キーは振り分け前(コンソールに帰属しない)分
+        self._loss = {}
+        # どのコンソールにも振り分けられなかったデータグラム(未登録の送信元。損失ではない)
+        self.unrouted = 0
+        self._depth_probes = {}
+        # カーネル drops はソケット作成時点からの累計なので、計測開始時点を基準にする
+        stats = read_udp_socket_stats(receive_port) if receive_port is not None else None
+        self._kernel_drops_base = stats[1] if stats else 0
+
+    # ── 記録(受信ループ側) ──
+
+    def record_arrival(self, addr, arrival_ns):
+        """データグラム1件の到着を記録する(arrival_ns は time.monotonic_ns())"""
+        host = addr[0] if addr else None
+        src = self._sources.get(host)
+        if src is None:
+            src = self._sources[host] = _SourceStats()
+        src.packets += 1
+        if src.last_ns is not None:
+            interval_ms = (arrival_ns - src.last_ns) / 1e6
+            self.interval_counts[bisect.bisect_left(INTERVAL_BUCKETS_MS, interval_ms)] += 1
+            if interval_ms > self.max_interval_ms:
+                self.max_interval_ms = interval_ms
+            if src.last_interval_ms is not None:
+                # RFC 3550 §6.4.1: 連続する到着間隔の差の絶対値を 1/16 で平滑化
+                d = abs(interval_ms - src.last_interval_ms)
+                src.jitter_ms += (d - src.jitter_ms) * self.SMOOTHING
+            if src.mean_interval_ms is None:
+                src.mean_interval_ms = interval_ms
+            else:
+                src.mean_interval_ms += (interval_ms - src.mean_interval_ms) * self.SMOOTHING
+            src.last_interval_ms = interval_ms
+        src.last_ns = arrival_ns
+
+    def count_loss(self, cause, count=1, console_id=None):
+        """損失を原因別に計上する(console_id=None は振り分け前の損失)"""
+        if count <= 0:
+            return
+        losses = self._loss.get(console_id)
+        if losses is None:
+            losses = self._loss[console_id] = dict.fromkeys(LOSS_CAUSES, 0)
+        losses[cause] += count
+
+    def add_depth_probe(self, name, probe):
+        """snapshot() 時に呼ばれるキュー深さのプローブ(引数なしで int を返す)を登録する"""
+        self._depth_probes[name] = probe
+
+    # ── 読み出し(HTTP/配信側) ──
+
+    def kernel_stats(self):
+        """(滞留バイト数, 計測開始以降の drops) を返す。取得できなければ None"""
+        if self.receive_port is None:
+            return None
+        stats = read_udp_socket_stats(self.receive_port)
+        if stats is None:
+            return None
+        rx_queue, drops = stats
+        if drops < self._kernel_drops_base:
+            self._kernel_drops_base = 0  # ソケットが作り直された
+        return rx_queue, drops - self._kernel_drops_base
+
+    def snapshot(self):
+        """現在のヘルスを JSON 化可能な dict で返す"""
+        now_ns = time.monotonic_ns()
+        kernel = self.kernel_stats()
+
+        total = dict.fromkeys(LOSS_CAUSES, 0)
+        for losses in self._loss.values():
+            for cause, n in losses.items():
+                total[cause] += n
+        if kernel is not None:
+            total["kernel_drop"] = kernel[1]
+
+        depths = {}
+        for name, probe in self._depth_probes.items():
+            try:
+                depths[name] = probe()
+            except Exception as e:
+                logger.debug(f"Queue depth probe {name!r} failed: {e}")
+                depths[name] = None
+
+        edges = INTERVAL_BUCKETS_MS + (None,)
+        return {
+            "uptime_s": round(time.monotonic() - self.started_at, 1),
+            "socket": {
+                "receive_port": self.receive_port,
+                "rcvbuf_requested": self.rcvbuf_requested,
+                "rcvbuf_bytes": self.rcvbuf_bytes,
+                "kernel_rx_queue_bytes": kernel[0] if kernel else None,
+                "kernel_drops": kernel[1] if kernel else None,
+            },
+            "sources": {
+                str(host): {
+                    "packets": src.packets,
+                    "rate_hz": round(1000.0 / src.mean_interval_ms, 1) if src.mean_interval_ms else None,
+                    "jitter_ms": round(src.jitter_ms, 3),
+                    "last_seen_ms_ago": round((now_ns - src.last_ns) / 1e6, 1) if src.last_ns else None,
+                }
+                for host, src in self._sources.items()
+            },
+            "interval_histogram_ms": [
+                {"le": edge, "count": count} for edge, count in zip(edges, self.interval_counts)
+            ],
+            "max_interval_ms": round(self.max_interval_ms, 3),
+            "loss": {
+                "total": total,
+                "before_routing": dict(self._loss.get(None) or dict.fromkeys(LOSS_CAUSES, 0)),
+                "by_console": {cid: dict(l) for cid, l in self._loss.items() if cid is not None},
+            },
+            "unrouted_datagrams": self.unrouted,
+            "queue_depths": depths,
+        }
@@ -174,18 +174,18 @@ async function lpFetchReferenceDistance(courseId, carId) {
     }
     lpState.referenceDistanceFetching[key] = true;
     try {
-        const listResp = await fetch(
+        const listResp = await fetch(withConsole(
             '/api/laps?car_id=' + encodeURIComponent(carId) + '&limit=' + LP_REFERENCE_CANDIDATE_LIMIT
-        );
+        ));
         if (!listResp.ok) {
             return null;
         }
         const listData = await listResp.json();
         const candidates = listData.laps || [];
         for (const cand of candidates) {
-            const detailResp = await fetch(
+            const detailResp = await fetch(withConsole(
                 '/api/laps/' + encodeURIComponent(cand.file) + '?fields=position_x,position_z'
-            );
+            ));
             if (!detailResp.ok) {
                 continue;
             }
@@ -0,0 +1,183 @@
+"""
+フレーム単位の遅延トレース(UDP 到着 → WebSocket 送信完了)
+
+「ドライバーが見ているフレームは何 ms 前のものか」に答えるため、抜き取った
+フレームに到着時刻(受信ソケットから読み出した時点の time.monotonic_ns)を付け、
+処理の各段の完了時刻をチェックポイントとして記録する:
+
+    arrival → decrypt → parse → course_fuel → record → serialize → enqueue → send(クライアントごと)
+
+段ごとの所要時間(直前のチェックポイントからの差)と、到着から各クライアントへの
+送信完了までの合計を、直近 WINDOW 件の窓で p50/p99/最大として集計する。
+decrypt は受信キューでの待ち時間を、send は配信チャンネルとクライアントごとの
+送信タスク(writer.ClientWriter)での待ちを含む。配信前に新しいフレームで上書きされた
+トレースは送信されないので superseded に数える(送信タスクの枠で上書きされた分は
+そのクライアントの送信として記録されない)。
+
+トレースは sample_every 件に1件だけ取る(抜き取らないフレームのコストは
+カウンタの加算1回と、消費側の空 dict の参照1回)。
+
+API(main.py からの使用順序):
+    tracer = LatencyTracer(sample_every=10)
+    client.tracer = tracer                  # 受信側が on_arrival(data, arrival_ns) を呼ぶ
+    trace = tracer.claim(payload)           # 抜き取ったフレームなら FrameTrace、それ以外は None
+    trace.mark("decrypt") ...               # 各段の完了時
+    tracer.record_send(trace, client_id)    # クライアントへの送信完了ごと
+    tracer.finish(trace)                    # 段の集計(送信は record_send 側で集計)
+    snap = tracer.snapshot()                # JSON 化可能な dict
+"""
+
+import collections
+import time
+
+# チェックポイント(段)の順序。段の所要時間は直前の記録済みチェックポイントからの差
+LATENCY_STAGES = ("decrypt", "parse", "course_fuel", "record", "serialize", "enqueue")
+
+
+class FrameTrace:
+    """抜き取った1フレーム分のチェックポイント(monotonic ns)"""
+
+    __slots__ = ("arrival_ns", "marks")
+
+    def __init__(self, arrival_ns):
+        self.arrival_ns = arrival_ns
+        self.marks = []
+
+    def mark(self, stage, now_ns=None):
+        """段 stage の完了時刻を記録する"""
+        self.marks.append((stage, time.monotonic_ns() if now_ns is None else now_ns))
+
+    @property
+    def last_ns(self):
+        """最後のチェックポイントの時刻(未記録なら到着時刻)"""
+        return self.marks[-1][1] if self.marks else self.arrival_ns
+
+
+class _Window:
+    """直近 size 件の所要時間(ns)と、累計件数・全期間の最大"""
+
+    __slots__ = ("samples", "count", "max_ns")
+
+    def __init__(self, size):
+        self.samples = collections.deque(maxlen=size)
+        self.count = 0
+        self.max_ns = 0
+
+    def add(self, ns):
+        self.samples.append(ns)
+        self.count += 1
+        if ns > self.max_ns:
+            self.max_ns = ns
+
+    def summary(self):
+        ordered = sorted(self.samples)
+        n = len(ordered)
+
+        def pct(p):
+            return round(ordered[min(n - 1, int(p / 100 * n))] / 1e6, 3) if n else None
+
+        return {
+            "count": self.count,
+            "p50_ms": pct(50),
+            "p99_ms": pct(99),
+            "window_max_ms": round(ordered[-1] / 1e6, 3) if n else None,
+            "max_ms": round(self.max_ns / 1e6, 3),
+        }
+
+
+class LatencyTracer:
+    """抜き取りトレースの開始・受け渡しと段/クライアント別の集計。
+
+    イベントループ上の単一スレッドから使う前提(ロックなし)。受信側は到着した
+    データグラムのオブジェクトに紐付けてトレースを開始し、消費側は同じオブジェクトで
+    claim() して受け取る(受信キューの要素の形は変えない)。
+    """
+
+    # 集計窓の件数(抜き取り後の件数。60Hz・10件に1件なら約3分)
+    WINDOW = 1024
+    # 受信キューで捨てられ claim されなかったトレースの保持上限
+    PENDING_MAX = 256
+
+    def __init__(self, sample_every=10):
+        self.sample_every = max(1, int(sample_every))
+        self.started_at = time.monotonic()
+        self._counter = 0
+        # id(data) -> (data, FrameTrace)。data を保持するので id は再利用されない
+        self._pending = {}
+        self.traces = 0
+        self.abandoned = 0
+        self.superseded = 0
+        self._stages = {stage: _Window(self.WINDOW) for stage in LATENCY_STAGES}
+        self._stages["send"] = _Window(self.WINDOW)
+        self._total = _Window(self.WINDOW)
+        self._clients = {}
+
+    # ── 受信側 ──
+
+    def on_arrival(self, data, arrival_ns):
+        """受信したデータグラム1件の到着を通知する(sample_every 件に1件トレースを開始)"""
+        self._counter += 1
+        if self._counter < self.sample_every:
+            return
+        self._counter = 0
+        pending = self._pending
+        if len(pending) >= self.PENDING_MAX:
+            # 消費されずに捨てられた(受信キュー溢れ・未登録の送信元)分。最古から捨てる
+            del pending[next(iter(pending))]
+            self.abandoned += 1
+        pending[id(data)] = (data, FrameTrace(arrival_ns))
+
+    def claim(self, data):
+        """data に紐付いたトレースを取り出す(抜き取っていなければ None)"""
+        pending = self._pending
+        if not pending:
+            return None
+        entry = pending.pop(id(data), None)
+        if entry is None:
+            return None
+        self.traces += 1
+        return entry[1]
+
+    # ── 集計 ──
+
+    def finish(self, trace):
+        """トレースの段ごとの所要時間を集計する"""
+        prev = trace.arrival_ns
+        for stage, ns in trace.marks:
+            window = self._stages.get(stage)
+            if window is not None:
+                window.add(ns - prev)
+            prev = ns
+
+    def record_send(self, trace, client_id, now_ns=None):
+        """クライアント client_id への送信完了を記録する"""
+        now_ns = time.monotonic_ns() if now_ns is None else now_ns
+        self._stages["send"].add(now_ns - trace.last_ns)
+        total = now_ns - trace.arrival_ns
+        self._total.add(total)
+        window = self._clients.get(client_id)
+        if window is None:
+            window = self._clients[client_id] = _Window(self.WINDOW)
+        window.add(total)
+
+    def count_superseded(self):
+        """配信前に新しいフレームで上書きされたトレースを数える"""
+        self.superseded += 1
+
+    def forget_client(self, client_id):
+        """切断したクライアントの集計を捨てる"""
+        self._clients.pop(client_id, None)
+
+    def snapshot(self):
+        """段別・クライアント別の遅延を JSON 化可能な dict で返す"""
+        return {
+            "uptime_s": round(time.monotonic() - self.started_at, 1),
+            "sample_every": self.sample_every,
+            "traces": self.traces,
+            "superseded": self.superseded,
+            "abandoned": self.abandoned,
+            "pending": len(self._pending),
+            "stages": {stage: window.summary() for stage, window in self._stages.items()},
+            "end_to_end": self._total.summary(),
+            "clients": {cid: window.summary() for cid, window in self._clients.items()},
+        }
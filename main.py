@@ -1,6 +1,7 @@
 import asyncio
 import csv
 import io
+import itertools
 import json
 import os
 import re
@@ -8,11 +9,22 @@ import ssl
 import logging
 import time
 import aiohttp
+from concurrent.futures import ThreadPoolExecutor
 import joblib
 from datetime import datetime
 from aiohttp import web
-from telemetry import GT7TelemetryClient
-from decoder import GT7Decoder, CourseEstimator
+from telemetry import GT7TelemetryClient, heartbeat_loop
+from channel import CoalescingChannel
+from decoder import GT7Decoder, CourseEstimator, CourseTracker
+from recorder import LapFileWriter
+from decode_worker import DecodeWorkerClient
+from capture import CAPTURE_SUFFIX, ReplayTelemetryClient
+from health import ReceiveHealth
+from latency import LatencyTracer
+from writer import ClientWriter, parse_batch_ms
+from fanout import (
+    FULL_RATE, BinaryCodec, DeltaStream, FrameMessages, RateTiers, parse_projection, parse_rate, project,
+)
 
 logging.basicConfig(
     level=logging.INFO,
@@ -25,7 +37,7 @@ logger = logging.getLogger(__name__)
 KMH_TO_MS = 3.6
 GRAVITY_MS2 = 9.81
 MAX_ACCEL_G = 5.0
-MIN_TIME_DELTA = 0.001
+MIN_TIME_DELTA_NS = 1_000_000
 REFUEL_JUMP_FRACTION = 0.5
 
 # ネットワーク/設定のデフォルト値
@@ -83,18 +95,30 @@ def load_config():
 
 CONFIG = load_config()
 
-# アプリケーション状態: 接続中のWebSocketクライアント一覧
-websocket_clients = set()
+# 配信チャンネル(#434 P1-b): telemetry_background_taskの受信ループから配信I/O
+# (クライアントごとの送信タスク writer.ClientWriter への書き込み)を
+# 分離する。ライブ表示は最新値だけが必要なため、キューではなく CoalescingChannel の
+# 「最新」スロットを使い、配信タスクが遅れても次に送るのは常に最新の1件にする
+# (旧: 16件の asyncio.Queue で最古を手動破棄。遅れると最大16フレーム古い値を送っていた)。
+# チャンネルと接続中クライアント一覧はコンソールごと(ConsolePipeline)に持つ。
+# 受信ループが1回の await で受け取るパケット数の上限(60Hz で約1秒分)。
+# 停滞後のバックログはこの単位でまとめて処理し、各バッチの間に他のタスクへ制御を戻す。
+RECEIVE_BATCH_MAX = 64
+
+# 受信ヘルスをエンジニア画面(subscribe_health したクライアント)へ配信する間隔(秒)
+HEALTH_STREAM_INTERVAL_SEC = 1.0
 
-# 配信専用キュー(#434 P1-b): telemetry_background_taskの受信ループから配信I/O
-# (broadcast_to_clients、低速/無応答クライアントで最大1秒/クライアントの遅延あり)を
-# 分離するためのバッファ。telemetry.py側の受信キュー(#434 P1予備調査(b)で確認済み)と
-# 同じ「最新優先」ポリシー(満杯時は最古を破棄して最新を積む)を踏襲する。
-BROADCAST_QUEUE_MAXSIZE = 16
-broadcast_queue = asyncio.Queue(maxsize=BROADCAST_QUEUE_MAXSIZE)
+# 遅延トレースの抜き取り間隔の既定値(N 件に1件。config.json の latency_trace_sample_every、0 で無効)
+LATENCY_TRACE_SAMPLE_EVERY = 10
 
 # アプリケーション状態: テレメトリ監視タスク（on_cleanup でキャンセルするため保持）
 _telemetry_supervisor_task = None
+# 実行中のテレメトリタスクの受信ヘルス(/api/health/receive が参照。未起動なら None)
+_receive_health = None
+# 実行中のテレメトリタスクの遅延トレース(/api/health/latency が参照。未起動・無効なら None)
+_latency_tracer = None
+# WebSocket クライアントの通し番号(遅延トレースのクライアント別集計のキーに使う)
+_ws_client_ids = itertools.count(1)
 
 LOG_DIR = "gt7data"
 
@@ -112,12 +136,34 @@ IMPORT_MAX_UPLOAD_BYTES = 100 * 1024 * 1024
 # 接尾辞を付けるため、/api/laps一覧走査(_scan_lap_files)には混入しない。
 LOG_DIR_FAILED = "gt7data_failed"
 
-# 進行中ラップの周期チェックポイント保存先・間隔(#434 P1)。固定ファイル名1本を
-# 上書きすることで、SIGKILL/OOM等でfinally節を経ずに終了した場合の未保存データを
-# 一定間隔ごとに縮小する。ファイル名はLAP_FILE_REと一致しない固定名のため
+# 進行中ラップの書き込み先・書き出し間隔(#434 P1)。進行中ラップはラップファイル形式の
+# まま CHECKPOINT_INTERVAL_SEC ごとに増えた分を書き足し(recorder.LapFileWriter、
+# 書き出しスレッド)、ラップの終わりに最終名へ改名する。受信側が持つのは未書き出しの
+# 約1秒分だけで、ラップ境界の処理量はラップの長さによらない。SIGKILL/OOM等で
+# finally節を経ずに終了して残った分は、次回起動時にラップファイルへ復旧する
+# (ConsolePipeline.recover_checkpoint)。ファイル名はLAP_FILE_REと一致しない固定名のため
 # /api/laps一覧走査には現れない。
-CHECKPOINT_FILE = f"{LOG_DIR}/.checkpoint_current_lap.json"
-CHECKPOINT_INTERVAL_SEC = 5.0
+CHECKPOINT_BASENAME = ".current_lap.json.part"
+CHECKPOINT_FILE = f"{LOG_DIR}/{CHECKPOINT_BASENAME}"
+CHECKPOINT_INTERVAL_SEC = 1.0
+CHECKPOINT_INTERVAL_NS = int(CHECKPOINT_INTERVAL_SEC * 1e9)
+# 旧形式のチェックポイント(全体上書きの JSON)。更新前のプロセスが残した分も復旧する
+LEGACY_CHECKPOINT_BASENAME = ".checkpoint_current_lap.json"
+
+# 長時間ラップの分割。フリーラン・メニュー放置・タイムトライアル等では lap_count が
+# 何時間も変わらず、1ファイルが際限なく大きくなる(実測: 83,926s の中断を含むラップ)。
+# 書き込み中のファイルの先頭からの到着時刻差が SEGMENT_MAX_SEC 以上、または
+# SEGMENT_MAX_SAMPLES 件に達したら、そこで完成させて続きを次のセグメントへ書く。
+# セグメントは {1つ目の日時}_CAR-{1つ目の車種}_Lap-{n}_Seg-{k}.json で、同じ走行の
+# セグメントは番号だけが違う(API が名前から前後を辿る)。サンプル数の上限は
+# 約12.5分@60Hz・約85MB(REVIEW/再生が扱える実測最大ファイル相当)。
+# config.json の segment_max_sec / segment_max_samples で変更でき、0 で無効。
+SEGMENT_MAX_SEC = 1800
+SEGMENT_MAX_SAMPLES = 45_000
+
+# パケットロス・配信の読み飛ばし・復号前の破棄内訳を警告ログへ出す間隔
+STATS_LOG_INTERVAL_SEC = 5.0
+STATS_LOG_INTERVAL_NS = int(STATS_LOG_INTERVAL_SEC * 1e9)
 
 # save_lap_to_file の書込み失敗時リトライ回数・待機秒数(#434 P1)。
 SAVE_RETRY_COUNT = 3
@@ -125,22 +171,29 @@ SAVE_RETRY_DELAY_SEC = 0.5
 
 # コース推定ロックインの多数決window件数(#436 B4フォローアップ)。約60Hzで167ms相当。
 COURSE_LOCK_VOTE_WINDOW = 10
+# 確定後の再検証間隔(パケット数、約60Hzで0.5秒)と、確定を解くまでの連続外れ件数
+COURSE_REVALIDATE_EVERY = 30
+COURSE_UNLOCK_AFTER = 3
+
 
+def ensure_log_dir(log_dir=LOG_DIR):
+    if not os.path.exists(log_dir):
+        os.makedirs(log_dir)
+        logger.info(f"Created log directory: {log_dir}")
 
-def ensure_log_dir():
-    if not os.path.exists(LOG_DIR):
-        os.makedirs(LOG_DIR)
-        logger.info(f"Created log directory: {LOG_DIR}")
 
+def save_lap_to_file(lap_data, lap_num, log_dir=LOG_DIR, failed_dir=LOG_DIR_FAILED, recorded_at=None):
+    """ラップを保存し、書いたファイルのパスを返す(記録OFF・保存も退避も失敗なら None)。
 
-def save_lap_to_file(lap_data, lap_num):
+    ファイル名の日時は recorded_at(省略時は現在時刻)。
+    """
     # 記録ON/OFF(P1 B案 #124): config.json の recording_enabled (既定 true=従来どおり)。
     # 入口の1分岐のみで、受信・復号・WS配信(ライブ表示)には影響しない。
     if not CONFIG.get("recording_enabled", True):
-        return
-    timestamp = datetime.now().strftime("%Y-%m-%d_%H_%M_%S")
+        return None
+    timestamp = (recorded_at or datetime.now()).strftime("%Y-%m-%d_%H_%M_%S")
     car_id = lap_data[0].get("car_id", 0) if lap_data else 0
-    filename = f"{LOG_DIR}/{timestamp}_CAR-{car_id}_Lap-{lap_num}.json"
+    filename = f"{log_dir}/{timestamp}_CAR-{car_id}_Lap-{lap_num}.json"
 
     # 書込み失敗時の再試行(#434 P1): 一時的なI/Oエラーの自己解消を想定し、
     # 短い待機を挟んで規定回数まで再試行してから退避処理へ進む。
@@ -150,7 +203,7 @@ def save_lap_to_file(lap_data, lap_num):
             with open(filename, 'w') as f:
                 json.dump(lap_data, f)
             logger.info(f"Saved lap data: {filename} ({len(lap_data)} samples)")
-            return
+            return filename
         except Exception as e:
             last_error = e
             logger.warning(
@@ -162,14 +215,15 @@ def save_lap_to_file(lap_data, lap_num):
     # 全リトライ失敗 → 退避ディレクトリへ(#434 P1)。実データ(LOG_DIR)とは物理分離し、
     # 単純破棄していた旧挙動から変更する。
     try:
-        os.makedirs(LOG_DIR_FAILED, exist_ok=True)
-        failed_filename = f"{LOG_DIR_FAILED}/{timestamp}_CAR-{car_id}_Lap-{lap_num}_failed.json"
+        os.makedirs(failed_dir, exist_ok=True)
+        failed_filename = f"{failed_dir}/{timestamp}_CAR-{car_id}_Lap-{lap_num}_failed.json"
         with open(failed_filename, 'w') as f:
             json.dump(lap_data, f)
         logger.error(
             f"Saved lap data to fallback after {SAVE_RETRY_COUNT} failed attempts: "
             f"{failed_filename} ({len(lap_data)} samples). Last error: {last_error}"
         )
+        return failed_filename
     except Exception as e:
         logger.error(
             f"Lap data LOST: primary and fallback save both failed for lap {lap_num} "
@@ -177,43 +231,44 @@ def save_lap_to_file(lap_data, lap_num):
             f"primary_error={last_error} fallback_error={e}",
             exc_info=True
         )
+        return None
 
 
-def _save_checkpoint(lap_data, lap_num):
-    """進行中ラップの周期チェックポイントを固定ファイルへ上書き保存する(#434 P1)。
-
-    ラップ境界保存(save_lap_to_file)とは独立した安全網であり、失敗しても
-    ロギングのみ行い次回間隔で再試行する(例外を上位へ伝播させない)。
-    """
-    if not lap_data:
-        return
-    try:
-        with open(CHECKPOINT_FILE, 'w') as f:
-            json.dump({"lap_num": lap_num, "samples": lap_data}, f)
-    except Exception as e:
-        logger.warning(f"Checkpoint save failed: {e}")
-
-
-def _clear_checkpoint():
+def _clear_checkpoint(path=CHECKPOINT_FILE):
     """チェックポイントファイルを削除する(#434 P1)。
 
     ラップ境界での正規保存成功時・正常シャットダウン時に呼び、既に完全保存済み
     ラップの残骸をチェックポイントとして誤認しないようにする。
     """
     try:
-        if os.path.exists(CHECKPOINT_FILE):
-            os.remove(CHECKPOINT_FILE)
+        if os.path.exists(path):
+            os.remove(path)
     except Exception as e:
         logger.warning(f"Checkpoint clear failed: {e}")
 
 
-def calculate_acceleration(speed_kmh, last_speed_kmh, time_delta):
-    """速度差分から加速G/減速Gを計算"""
-    if time_delta <= MIN_TIME_DELTA:
+def _wall_anchor_ns():
+    """壁時計アンカー: 現在の epoch ns と monotonic ns の差(epoch ns = arrival_ns + アンカー)。
+
+    ラップごとに1回だけ取り、ラップ内の時刻差は monotonic 時計だけで決まるようにする
+    (NTP 補正等で壁時計が跳んでもラップ所要時間・加速度が歪まない)。
+    """
+    return time.time_ns() - time.monotonic_ns()
+
+
+def _ns_to_iso(epoch_ns):
+    """epoch ns をローカル時刻の ISO 文字列(v2 の timestamp と同じ datetime.isoformat 形式)にする"""
+    sec, ns = divmod(epoch_ns, 1_000_000_000)
+    return datetime.fromtimestamp(sec).replace(microsecond=ns // 1000).isoformat()
+
+
+def calculate_acceleration(speed_kmh, last_speed_kmh, delta_ns):
+    """速度差分と到着時刻の差(整数 ns)から加速G/減速Gを計算"""
+    if delta_ns <= MIN_TIME_DELTA_NS:
         return 0.0, 0.0
 
     speed_delta_ms = (speed_kmh - last_speed_kmh) / KMH_TO_MS
-    accel_g = max(-MAX_ACCEL_G, min(MAX_ACCEL_G, speed_delta_ms / time_delta / GRAVITY_MS2))
+    accel_g = max(-MAX_ACCEL_G, min(MAX_ACCEL_G, speed_delta_ms * 1e9 / delta_ns / GRAVITY_MS2))
 
     if accel_g > 0:
         return accel_g, 0.0
@@ -259,275 +314,975 @@ class FuelTracker:
         return result
 
 
-async def broadcast_to_clients(message):
-    """WebSocketクライアントにメッセージを配信"""
-    if not websocket_clients:
-        return
-
-    disconnected = set()
-    # list() スナップショット: 送信の await 中に websocket_handler が
-    # websocket_clients を変更しても RuntimeError にならないようにする
-    for ws in list(websocket_clients):
-        try:
-            # タイムアウト付き送信: 1クライアントの停滞が全体の配信を止めるのを防ぐ。
-            # タイムアウトしたクライアントは切断扱いにして close を試みる。
-            await asyncio.wait_for(ws.send_str(message), timeout=1.0)
-        except asyncio.TimeoutError:
-            disconnected.add(ws)
-            try:
-                await asyncio.wait_for(ws.close(), timeout=1.0)
-            except Exception:
-                pass
-        except Exception:
-            disconnected.add(ws)
-
-    if disconnected:
-        websocket_clients.difference_update(disconnected)
-        logger.info(f"Removed {len(disconnected)} disconnected client(s). Active: {len(websocket_clients)}")
+async def _close_client(ws):
+    """送れなくなったクライアントを閉じる(無応答でも1秒で諦める)"""
+    try:
+        await asyncio.wait_for(ws.close(), timeout=1.0)
+    except Exception:
+        pass
 
 
-async def _heartbeat_loop(client):
-    """ハートビート送信を独立周期で回すタスク。
+async def broadcast_consumer_task(pipeline):
+    """配信チャンネルの最新メッセージをWebSocketクライアントへ配信する専用タスク(#434 P1-b)。
 
-    受信ループから分離することで、パケット未着時でも定期送信を維持し、
-    かつ受信処理がハートビート間隔に引きずられないようにする。
+    telemetry_background_taskの受信ループから配信I/Oを切り離すことで、低速/無応答
+    クライアントによる配信遅延が受信ループ(→telemetry.py内部キューの溢れ)へ波及しない
+    ようにする。コンソールごとに1本。送信自体はクライアントごとの送信タスク
+    (writer.ClientWriter)が行い、このタスクはフレーム枠へ書き込むだけで待たない。
     """
-    interval = client.heartbeat_interval
-    # try は while の内側に置く: 想定外例外でこのループ自体が死ぬと GT7 が
-    # テレメトリ送信を止め、恒久的なサイレント停止になるため、
-    # 例外はログして interval 秒後に再試行し続ける（CancelledError のみ終了）。
+    seq = pipeline.broadcast.seq
     while True:
+        latest = await pipeline.broadcast.get_latest(seq)
+        if latest is None:
+            return
+        seq, messages = latest
+        pipeline.broadcast_sent_seq = seq
+        # 射影・シリアライズの失敗はそのフレームだけ読み飛ばす(タスクが終わると全クライアントが止まる)
         try:
-            await client.send_heartbeat()
-            await asyncio.sleep(interval)
-        except asyncio.CancelledError:
-            break
+            sends = pipeline.take_sends(messages)
+            trace = pipeline.take_trace(seq)
+            on_sent = None
+            if trace is not None:
+                tracer = pipeline.tracer
+                # 送信タスクが後で呼ぶので、このフレームの trace を作成時に束縛する
+                on_sent = lambda ws, trace=trace: tracer.record_send(trace, pipeline.client_ids.get(ws))  # noqa: E731
+            for message, targets in sends:
+                pipeline.offer(message, on_sent, targets)
         except Exception as e:
-            logger.error(f"Heartbeat loop error: {e}; retrying in {interval}s", exc_info=True)
-            await asyncio.sleep(interval)
+            logger.error(f"Broadcast consumer error: {e}", exc_info=True)
 
 
-async def broadcast_consumer_task():
-    """配信キューを消費しWebSocketクライアントへ配信する専用タスク(#434 P1-b)。
+async def health_stream_task(health):
+    """受信ヘルスを購読中のクライアント(エンジニア画面)へ定期配信する専用タスク。
 
-    telemetry_background_taskの受信ループから配信I/O(broadcast_to_clients)を
-    切り離すことで、低速/無応答クライアントによる配信遅延が受信ループ
-    (→telemetry.py内部キューの溢れ)へ波及しないようにする。
+    購読者のいないコンソールではスナップショットを作らない。クライアントごとの送信タスクへ
+    制御メッセージとして書き込み、高頻度の配信チャンネルとは独立している。
     """
     while True:
-        message = await broadcast_queue.get()
+        await asyncio.sleep(HEALTH_STREAM_INTERVAL_SEC)
+        pipelines = [p for p in CONSOLES.values() if p.health_subscribers]
+        if not pipelines:
+            continue
         try:
-            await broadcast_to_clients(message)
+            message = json.dumps({"type": "receive_health", **health.snapshot()})
+            for pipeline in pipelines:
+                pipeline.send(message, pipeline.health_subscribers)
         except asyncio.CancelledError:
             raise
         except Exception as e:
-            logger.error(f"Broadcast consumer error: {e}", exc_info=True)
+            logger.error(f"Health stream error: {e}", exc_info=True)
+
+
+# マルチコンソール受信: コンソールIDに使える文字(記録ディレクトリ名・?console= に使う)
+CONSOLE_ID_RE = re.compile(r'^[A-Za-z0-9_-]{1,32}$')
+# consoles 未設定(従来の1台構成)のコンソールID
+DEFAULT_CONSOLE_ID = "default"
+
+
+class ConsolePipeline:
+    """1台のコンソール(PS5)分のテレメトリ処理状態と配信チャンネル。
+
+    マルチコンソール受信では、1本の受信ソケットに届いたデータグラムを送信元IPで
+    振り分け、コンソールごとに独立した package_id 判定・ラップ記録・コース
+    ロックイン・燃料計算・WebSocket チャンネル(/ws?console=<id>)を持つ。
+    復号器(XOR キャッシュ・重複判定)とコース推定 DB は全コンソールで共有する。
+    """
+
+    def __init__(self, console_id, ip, log_dir=LOG_DIR, failed_dir=LOG_DIR_FAILED):
+        self.console_id = console_id
+        self.ip = ip
+        self.log_dir = log_dir
+        self.failed_dir = failed_dir
+        # 進行中ラップの書き込み先(ラップの最初の書き出しで作り、ラップの終わりに改名する)
+        self.checkpoint_file = os.path.join(log_dir, CHECKPOINT_BASENAME)
+        # ラップファイルの書き出しスレッド(1本なので追記・完成の順序が保たれる)。
+        # _lap_file と _lap_failed_over / _lap_lost はこのスレッドからだけ触る
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"lap-writer-{console_id}")
+        self._lap_file = None
+        self._lap_failed_over = False   # 退避ディレクトリへ切り替えた
+        self._lap_lost = False          # 退避先でも書けず、このラップの残りを捨てている
+        self._segment_run = None        # 分割中の走行のファイル名の共通部分(1つ目のセグメントで決まる)
+        # 接続中のWebSocketクライアント(このコンソールのチャンネル)と配信チャンネル(最新のみ)
+        self.clients = set()
+        self.broadcast = CoalescingChannel()
+        # 配信タスクが最後に送り始めたメッセージの seq(broadcast.seq との差が配信の遅れ)
+        self.broadcast_sent_seq = 0
+        # 受信ヘルスの購読クライアント(エンジニア画面。clients の部分集合)
+        self.health_subscribers = set()
+        # クライアント -> 遅延トレースの集計キー("<console>/<remote>#<通し番号>")
+        self.client_ids = {}
+        # クライアント -> 送信タスク(writer.ClientWriter)。配信は書き込むだけで送信を待たない
+        self.writers = {}
+        # 更新レートの購読: クライアント -> rate(Hz、FULL_RATE 未満のクライアントだけ)と
+        # rate ごとの送信時刻。購読していないクライアントは全フレーム。client_rates は
+        # 購読したレート(requested_rates)と遅れたクライアントの上限(rate_caps)の小さい方
+        self.client_rates = {}
+        self.requested_rates = {}
+        self.rate_caps = {}
+        self.rate_tiers = RateTiers()
+        # フィールドの投影: クライアント -> 投影(フィールド名の tuple。全フィールドのクライアントは持たない)
+        self.client_projections = {}
+        # 差分配信(keyframe / delta)のクライアントと、(投影, rate) の群ごとの差分の基準。
+        # delta_resync は次のフレームを keyframe で受け取るクライアント(参加時・resync 要求時)
+        self.delta_clients = set()
+        self.delta_streams = {}
+        self.delta_resync = set()
+        # バイナリ形式のクライアント(差分配信より優先)、投影ごとのコーデック、クライアントへ最後に送った course
+        self.binary_clients = set()
+        self.binary_codecs = {}
+        self.binary_courses = {}
+        self._binary_schema_id = 0
+        # 配信チャンネルへ書いてから配信タスクが受け取るまでに送る時刻に達した tier
+        self._due_rates = set()
+        # 受信ヘルス(テレメトリタスクが設定する。None なら原因別の計上はしない)
+        self.health = None
+        # 遅延トレース(テレメトリタスクが設定する。None ならトレースしない)
+        self.tracer = None
+        self.reset()
+
+    def reset(self):
+        """受信セッションの状態を初期化する(テレメトリタスクの起動・再起動ごと)"""
+        self.fuel_tracker = FuelTracker()
+        self.last_package_id = 0
+        self.last_speed_kmh = 0.0
+        # 直前に受理したフレームの到着時刻(monotonic ns)。加速度の時間差に使う
+        self.last_arrival_ns = time.monotonic_ns()
+        # 進行中ラップの壁時計アンカー(_wall_anchor_ns)。ラップが変わるたびに取り直す
+        self.wall_anchor_ns = _wall_anchor_ns()
+        # 進行中ラップのうち書き出しスレッドへまだ渡していないサンプル(約 CHECKPOINT_INTERVAL_SEC 分)。
+        # 書き出し済みの分はメモリに残さない。lap_samples は書き込み中のファイル(ラップ、
+        # 分割時はセグメント)のサンプル数、segment_start_ns はその先頭の到着時刻。
+        # 約1秒分しか持たないので解析結果の dict をそのまま貯め(列へ詰め直さない)、
+        # JSON 化は書き出しスレッドで行う(dict は受け取った後に書き換えない)
+        self.lap_batch = []
+        self.lap_samples = 0
+        self.segment_start_ns = 0
+        # 長時間ラップの分割: このラップで完成させたセグメント数(分割していなければ 0)と上限
+        self.segment_index = 0
+        self.segment_max_ns = int(CONFIG.get("segment_max_sec", SEGMENT_MAX_SEC) * 1e9)
+        self.segment_max_samples = int(CONFIG.get("segment_max_samples", SEGMENT_MAX_SAMPLES))
+        self.current_lap_number = 0
+        # コース推定ロックイン(#436 B4フォローアップ): course_database.jsonの特定コースペアの
+        # バウンディングボックス重複により、1ラップ中に生の推定値が頻繁に入れ替わる
+        # 不安定性が判明した(析の全数調査)ため、ラップ開始からCOURSE_LOCK_VOTE_WINDOW件の
+        # 生推定値を多数決し、以後そのラップ中は確定値に凍結する。状態と再検証は
+        # decoder.CourseTracker が持つ(推定器は handle で渡されるので初回に作る)。
+        self.course_tracker = None
+        # パケットロス計測(#434 P1): 受理されなかった/破棄されたパケットの累積カウント。
+        self.packet_loss_count = 0
+        # 周期的な書き出し(#434 P1): 前回書き出しスレッドへ渡してからの経過時間追跡。
+        self.last_checkpoint_ns = self.last_arrival_ns
+        self.last_stats_log_ns = self.last_arrival_ns
+        # 配信の読み飛ばし計測(#434 P1-b): telemetry.py側のパケットドロップ(packet_loss_count)
+        # とは別に、配信側の遅れ(送信前に新しいメッセージで上書きされた件数)を計測する。
+        # チャンネル自体の累計(broadcast.coalesced)との差分で、このセッション分を数える。
+        self._broadcast_coalesced_base = self.broadcast.coalesced
+        # 配信チャンネルへ書いた抜き取りフレームの (seq, FrameTrace)。配信タスクが送信時に受け取る
+        self._pending_trace = None
+
+    @property
+    def broadcast_drop_count(self):
+        """このセッションで配信前に上書きされた(送られなかった)メッセージ数"""
+        return self.broadcast.coalesced - self._broadcast_coalesced_base
+
+    def count_loss(self, cause, count=1):
+        """パケットロスを計上する(累計 packet_loss_count と、受信ヘルスの原因別内訳)"""
+        self.packet_loss_count += count
+        if self.health is not None:
+            self.health.count_loss(cause, count, self.console_id)
+
+    def add_client(self, ws, transport=None):
+        """接続したクライアントを加え、その送信タスクを起動する"""
+        self.clients.add(ws)
+        writer = self.writers[ws] = ClientWriter(
+            ws, transport, on_rate_cap=self.set_rate_cap, on_close=self._drop_client,
+            on_delta_lost=self.request_keyframe,
+        )
+        writer.start()
+        return writer
+
+    def _drop_client(self, ws, reason):
+        """送信タスクが送れなくなったクライアントを外して閉じる"""
+        logger.info(f"Dropping WebSocket client {self.client_ids.get(ws)}: {reason}")
+        self.forget_client(ws)
+        asyncio.create_task(_close_client(ws))
+
+    def set_rate(self, ws, rate):
+        """クライアントの購読レート(Hz)を設定する。FULL_RATE 以上は全フレーム"""
+        if rate < FULL_RATE:
+            self.requested_rates[ws] = rate
+        else:
+            self.requested_rates.pop(ws, None)
+        writer = self.writers.get(ws)
+        if writer is not None:
+            writer.requested_rate = min(rate, FULL_RATE)
+        self._apply_rate(ws)
+
+    def set_batch(self, ws, batch_ms):
+        """クライアントへのフレームのバッチの間隔(ミリ秒)を設定する(0 はバッチしない)"""
+        writer = self.writers.get(ws)
+        if writer is not None:
+            writer.batch_ms = batch_ms
+
+    def set_rate_cap(self, ws, cap):
+        """遅れたクライアントの rate の上限を設定する(FULL_RATE は上限なし。送信タスクが呼ぶ)"""
+        if cap < FULL_RATE:
+            self.rate_caps[ws] = cap
+        else:
+            self.rate_caps.pop(ws, None)
+        logger.info(f"WebSocket client {self.client_ids.get(ws)} rate cap: {cap}Hz")
+        self._apply_rate(ws)
+
+    def _apply_rate(self, ws):
+        rate = min(self.requested_rates.get(ws, FULL_RATE), self.rate_caps.get(ws, FULL_RATE))
+        self.rate_tiers.discard(self.client_rates.pop(ws, None))
+        if rate < FULL_RATE:
+            self.client_rates[ws] = rate
+            self.rate_tiers.add(rate)
+        self._sync_delta_streams(ws)
+
+    def set_projection(self, ws, projection):
+        """クライアントのフィールドの投影を設定する(None は全フィールド)"""
+        if projection is None:
+            self.client_projections.pop(ws, None)
+        else:
+            self.client_projections[ws] = projection
+        self._sync_delta_streams(ws)
+        self._sync_binary_codecs()
+
+    def set_delta(self, ws, enabled):
+        """クライアントへの差分配信(keyframe / delta)を切り替える"""
+        if enabled:
+            self.delta_clients.add(ws)
+        else:
+            self.delta_clients.discard(ws)
+            self.delta_resync.discard(ws)
+        self._sync_delta_streams(ws)
+
+    def set_binary(self, ws, enabled):
+        """クライアントへのバイナリ形式の配信を切り替える"""
+        if enabled:
+            self.binary_clients.add(ws)
+        else:
+            self.binary_clients.discard(ws)
+            self.binary_courses.pop(ws, None)
+        self._sync_binary_codecs()
+
+    def binary_schema(self, ws):
+        """バイナリ形式のクライアントが今の投影で受け取るレコードのスキーマ(それ以外は None)
+
+        購読を変えたら送り直す。course は次のフレームで送り直す。
+        """
+        if ws not in self.binary_clients:
+            return None
+        self.binary_courses.pop(ws, None)
+        return self._binary_codec(self.client_projections.get(ws)).schema
+
+    def _binary_codec(self, projection):
+        codec = self.binary_codecs.get(projection)
+        if codec is None:
+            # 投影を変えた(コーデックを作り直した)ら id も変わり、クライアントは古いレコードを捨てられる
+            self._binary_schema_id = self._binary_schema_id % 0xFFFF + 1
+            codec = self.binary_codecs[projection] = BinaryCodec(self._binary_schema_id, projection)
+        return codec
+
+    def _sync_binary_codecs(self):
+        """誰も使わない投影のコーデックを捨てる"""
+        used = {self.client_projections.get(c) for c in self.binary_clients}
+        for projection in [p for p in self.binary_codecs if p not in used]:
+            del self.binary_codecs[projection]
+
+    def request_keyframe(self, ws):
+        """差分配信のクライアントへ、次は keyframe を送る(参加時・resync 要求時)
+
+        keyframe を受け取るのはそのクライアントだけで、同じ群の他のクライアントには
+        delta を送り続ける(送信の遅れで seq が欠けるクライアントが群全体の帯域を上げない)。
+        """
+        if ws in self.delta_clients:
+            self.delta_resync.add(ws)
+
+    def _delta_key(self, ws):
+        return (self.client_projections.get(ws), self.client_rates.get(ws, FULL_RATE))
+
+    def _sync_delta_streams(self, ws=None):
+        """差分配信の群を購読に合わせる(誰もいない群を捨て、ws の群は keyframe から始める)"""
+        keys = {self._delta_key(c) for c in self.delta_clients}
+        for key in [k for k in self.delta_streams if k not in keys]:
+            del self.delta_streams[key]
+        if ws in self.delta_clients:
+            self.request_keyframe(ws)
+
+    def forget_client(self, ws):
+        """切断したクライアントの購読を外す"""
+        self.clients.discard(ws)
+        self.health_subscribers.discard(ws)
+        self.client_ids.pop(ws, None)
+        writer = self.writers.pop(ws, None)
+        if writer is not None:
+            writer.close()
+        self.client_projections.pop(ws, None)
+        self.requested_rates.pop(ws, None)
+        self.rate_caps.pop(ws, None)
+        self.rate_tiers.discard(self.client_rates.pop(ws, None))
+        if ws in self.delta_clients:
+            self.delta_clients.discard(ws)
+            self.delta_resync.discard(ws)
+            self._sync_delta_streams()
+        if ws in self.binary_clients:
+            self.binary_clients.discard(ws)
+            self.binary_courses.pop(ws, None)
+            self._sync_binary_codecs()
+
+    def send(self, message, targets=None):
+        """制御メッセージ(欠落させない)をクライアントの送信タスクへ書き込む。targets 省略時は全員"""
+        for ws in list(self.clients if targets is None else targets):
+            writer = self.writers.get(ws)
+            if writer is not None:
+                writer.put(message)
+
+    def offer(self, message, on_sent=None, targets=None):
+        """テレメトリのフレームをクライアントの送信タスクへ書き込む(未送信の分は上書き)"""
+        for ws in list(self.clients if targets is None else targets):
+            writer = self.writers.get(ws)
+            if writer is not None:
+                writer.offer(message, on_sent)
+
+    def _due_tiers(self, arrival_ns):
+        """arrival_ns に着いたフレームを送る tier。購読していないクライアントがいれば FULL_RATE を含む"""
+        due = self.rate_tiers.due(arrival_ns) if self.rate_tiers else ()
+        if len(self.clients) > len(self.client_rates):
+            due += (FULL_RATE,)
+        return due
+
+    def _serialize(self, frame):
+        """送る時刻に達した tier のクライアントが使う投影ごとに1回だけ JSON 化する
+
+        FrameMessages(投影 -> メッセージ。None は全フィールド)を返す。配信が遅れて上書き
+        されたフレームで送る時刻に達した tier の分も、このフレームで JSON 化する。
+        差分配信・バイナリ形式のクライアントの分は配信タスクが送る時に frame から作る。
+        """
+        messages = FrameMessages(frame)
+        if not self.client_projections and not self.delta_clients and not self.binary_clients:
+            messages[None] = json.dumps(frame)
+            return messages
+        due = self._due_rates
+        for ws in self.clients:
+            if ws in self.delta_clients or ws in self.binary_clients or self.client_rates.get(ws, FULL_RATE) not in due:
+                continue
+            projection = self.client_projections.get(ws)
+            if projection not in messages:
+                messages[projection] = json.dumps(frame if projection is None else project(frame, projection))
+        return messages
+
+    def take_sends(self, messages):
+        """配信タスクが最新のフレームを送る直前に、(メッセージ, 送り先) の list を受け取る
+
+        送り先が None なら全クライアント。配信が遅れて上書きされたフレームで送る時刻に
+        達した tier にも、最新のフレームを送る。差分配信の群には、その群へ最後に
+        送ったフレームとの差分をここで作る(resync したクライアントにだけ keyframe)。
+        バイナリ形式のクライアントには投影ごとに1回だけレコードを詰め、course が前回
+        送った値から変わったクライアントには course を制御メッセージとして送る
+        (送信タスクはフレームより先に送る)。
+        """
+        due, self._due_rates = self._due_rates, set()
+        # 全フィールドだけを作ったフレームなら全員へ同じメッセージ。JSON 化の後で投影を
+        # 外した・切断したクライアントしかいなければ None は無いので、群ごとの経路へ進む
+        if (not self.client_rates and not self.client_projections and not self.delta_clients
+                and not self.binary_clients and FULL_RATE in due and None in messages):
+            return [(messages[None], None)]
+        groups = {}
+        binary_groups = {}
+        for ws in self.clients:
+            rate = self.client_rates.get(ws, FULL_RATE)
+            if rate not in due:
+                continue
+            projection = self.client_projections.get(ws)
+            if ws in self.binary_clients:
+                binary_groups.setdefault(projection, []).append(ws)
+                continue
+            # 差分配信は (投影, rate) の群ごと(群ごとに基準のフレームが違う)、それ以外は投影ごと
+            key = (projection, rate) if ws in self.delta_clients else (projection,)
+            groups.setdefault(key, []).append(ws)
+        sends = []
+        for key, targets in groups.items():
+            if len(key) == 1:
+                # 受け取ってから投影を変えたクライアントには、このフレームは送らない
+                if key[0] in messages:
+                    sends.append((messages[key[0]], targets))
+                continue
+            stream = self.delta_streams.get(key)
+            if stream is None:
+                stream = self.delta_streams[key] = DeltaStream()
+            frame = messages.frame if key[0] is None else project(messages.frame, key[0])
+            message = stream.encode(frame)
+            resync = [ws for ws in targets if ws in self.delta_resync]
+            if resync:
+                self.delta_resync.difference_update(resync)
+                keyframe = stream.keyframe()
+                if keyframe is not message:
+                    sends.append((keyframe, resync))
+                    targets = [ws for ws in targets if ws not in resync]
+            if targets:
+                sends.append((message, targets))
+        for projection, targets in binary_groups.items():
+            frame = messages.frame
+            if projection is None or "course" in projection:
+                course = frame.get("course")
+                stale = [ws for ws in targets if self.binary_courses.get(ws) != course]
+                if stale:
+                    self.send(json.dumps({"type": "course", "course": course}), stale)
+                    for ws in stale:
+                        self.binary_courses[ws] = course
+            sends.append((self._binary_codec(projection).pack(frame), targets))
+        return sends
+
+    def take_trace(self, seq):
+        """配信タスクが seq のメッセージを送る直前に、そのフレームのトレースを受け取る
+
+        抜き取ったフレームが送られずに新しいフレームで上書きされていれば superseded に数える。
+        """
+        pending = self._pending_trace
+        if pending is None or pending[0] > seq:
+            return None
+        self._pending_trace = None
+        if pending[0] < seq:
+            self.tracer.count_superseded()
+            return None
+        return pending[1]
+
+    def handle(self, decrypted, decoder, course_estimator, trace=None, arrival_ns=None):
+        """復号済みパケット1件を処理する(受理判定・解析・記録・配信キュー投入)
+
+        arrival_ns は受信コールバックで取った到着時刻(monotonic ns)。省略時は処理時点の時刻。
+        trace(latency.FrameTrace)は抜き取られたフレームのみ。各段の完了時刻を記録する。
+        """
+        # 遅延解析ビュー: 受理判定は package_id だけを読み、破棄される
+        # パケット(重複・順序逆転)には全フィールド解析のコストを払わせない
+        view = decoder.view(decrypted)
+        if view is None:
+            # パケットロス計測(#434 P1): 復号はできたが解析できなかったパケット
+            self.count_loss("parse_failure")
+            return
+
+        pid = view["package_id"]
+        # 受理条件: 通常は単調増加のみ（重複・順序逆転パケットを除外）。
+        # ただしゲーム再起動で package_id が 0 付近にリセットされると
+        # 「pid > last_package_id」を二度と満たせず全パケットが弾かれて
+        # 無言で固まるため、大幅な後退（1000 超）はリセットとみなして受理する。
+        if not (pid > self.last_package_id or pid < self.last_package_id - 1000):
+            # パケットロス計測(#434 P1): 受理されなかったパケット
+            # (重複・順序逆転。リセット扱いでもない)
+            self.count_loss("out_of_order")
+            return
+
+        # パケットロス計測(#434 P1): 単調増加区間で生じた欠番(gap)を損失として
+        # 計上する。リセット(大幅後退)直後はgap計算をスキップする(誤検知防止)。
+        if self.last_package_id > 0:
+            gap = pid - self.last_package_id - 1
+            if gap > 0:
+                self.count_loss("package_id_gap", gap)
+        self.last_package_id = pid
+
+        parsed = decoder.parse(view)
+        if parsed is None:
+            self.count_loss("parse_failure")
+            return
+        if trace is not None:
+            trace.mark("parse")
+
+        if arrival_ns is None:
+            arrival_ns = time.monotonic_ns()
+
+        # ラップ境界検知(コース推定ロックインの判定にも使うため、lap_count
+        # 変化検知より前に前倒しで取得する。値自体は従来どおり)
+        lap_count = parsed.get("lap_count", 1)
+        if lap_count != self.current_lap_number:
+            self.wall_anchor_ns = _wall_anchor_ns()
+
+        # フレーム時刻(v3): 整数2つ。ISO 文字列は旧クライアント・CSV 向けに必要な所でだけ作る
+        parsed["arrival_ns"] = arrival_ns
+        parsed["wall_anchor_ns"] = self.wall_anchor_ns
+        if CONFIG.get("legacy_iso_timestamps"):
+            parsed["timestamp"] = _ns_to_iso(arrival_ns + self.wall_anchor_ns)
+
+        # 加速度計算
+        accel_g, decel_g = calculate_acceleration(
+            parsed["speed_kmh"], self.last_speed_kmh, arrival_ns - self.last_arrival_ns
+        )
+        parsed["accel_g"] = accel_g
+        parsed["accel_decel"] = decel_g
+        self.last_speed_kmh = parsed["speed_kmh"]
+        self.last_arrival_ns = arrival_ns
+
+        # コース推定(#436 B4フォローアップ: ロックイン方式で安定化)。ラップ変化で
+        # ロックをリセットし、確定後は CourseTracker が間引いて再検証する
+        tracker = self.course_tracker
+        if tracker is None or tracker.estimator is not course_estimator:
+            tracker = self.course_tracker = CourseTracker(
+                course_estimator,
+                vote_window=COURSE_LOCK_VOTE_WINDOW,
+                revalidate_every=COURSE_REVALIDATE_EVERY,
+                unlock_after=COURSE_UNLOCK_AFTER,
+            )
+        parsed["course"] = tracker.update(
+            lap_count, parsed.get("position_x", 0), parsed.get("position_z", 0)
+        )
+
+        # 燃料計算
+        fuel_data = self.fuel_tracker.update(
+            parsed.get("current_fuel"),
+            parsed.get("fuel_capacity", 100),
+            self.current_lap_number
+        )
+        parsed.update(fuel_data)
+        if trace is not None:
+            trace.mark("course_fuel")
+
+        # ラップデータ蓄積(記録ON/OFF P1 B案 #124: OFF の間は記録しない)
+        if CONFIG.get("recording_enabled", True):
+            if self.lap_samples and self._segment_full(arrival_ns):
+                self.segment_index += 1
+                self._end_lap(self.current_lap_number, self.segment_index)
+            if not self.lap_samples:
+                self.segment_start_ns = arrival_ns
+            self.lap_batch.append(parsed)
+            self.lap_samples += 1
+
+        # 周期的な書き出し(#434 P1): ラップ境界を待たず一定間隔で貯めた分を
+        # 書き出しスレッドへ渡す(待たない)。SIGKILL/OOM等でfinally節を経ずに
+        # 終了しても、失うのは最後の約 CHECKPOINT_INTERVAL_SEC 秒分だけになる。
+        if arrival_ns - self.last_checkpoint_ns >= CHECKPOINT_INTERVAL_NS:
+            if self.lap_batch:
+                self._writer.submit(self._write_batch, self.lap_batch)
+                self.lap_batch = []
+            self.last_checkpoint_ns = arrival_ns
+        if arrival_ns - self.last_stats_log_ns >= STATS_LOG_INTERVAL_NS:
+            if self.packet_loss_count > 0:
+                logger.warning(f"[{self.console_id}] Packet loss count (cumulative): {self.packet_loss_count}")
+            if self.broadcast_drop_count > 0:
+                # 配信キュー溢れ計測(#434 P1-b): packet_loss_countとは別指標として明示
+                logger.warning(
+                    f"[{self.console_id}] Broadcast messages superseded before send (cumulative): {self.broadcast_drop_count}"
+                )
+            self.last_stats_log_ns = arrival_ns
+
+        # ラップ境界検出：lap_countが変化したら保存
+        # 残りの分と完成(改名)を書き出しスレッドへ渡すだけで待たないので、
+        # ラップ境界の処理時間はラップの長さによらない。
+        if lap_count > self.current_lap_number and self.current_lap_number > 0:
+            self._end_last_segment()
+            self.last_checkpoint_ns = arrival_ns
+        self.current_lap_number = lap_count
+        if trace is not None:
+            trace.mark("record")
+
+        # WebSocket配信(#434 P1-b): 受信ループを配信I/Oから切り離すため、
+        # 直接awaitせず配信チャンネルの最新スロットへ書くだけにする。実際の送信は
+        # broadcast_consumer_taskが独立して行い、遅れた分は最新の1件に合体される。
+        # 購読者のいないチャンネルと、どの更新レートの tier も送る時刻に達していない
+        # フレームは JSON 化自体を省く(無人のリグ・低レートだけのリグのコストを抑える)。
+        due = self._due_tiers(arrival_ns) if self.clients else ()
+        if not due:
+            if trace is not None:
+                self.tracer.finish(trace)
+            return
+        self._due_rates.update(due)
+        if trace is None:
+            self.broadcast.publish(self._serialize(parsed))
+            return
+        messages = self._serialize(parsed)
+        trace.mark("serialize")
+        self.broadcast.publish(messages)
+        trace.mark("enqueue")
+        self.tracer.finish(trace)
+        if self._pending_trace is not None:
+            self.tracer.count_superseded()
+        self._pending_trace = (self.broadcast.seq, trace)
+
+    def _segment_full(self, arrival_ns):
+        """書き込み中のファイルが分割の上限(時間・サンプル数)に達したか"""
+        return (
+            (self.segment_max_samples > 0 and self.lap_samples >= self.segment_max_samples)
+            or (self.segment_max_ns > 0 and arrival_ns - self.segment_start_ns >= self.segment_max_ns)
+        )
+
+    def _end_lap(self, lap_num, segment=None):
+        """書き込み中のファイルの残りを渡して完成させる(書き出しスレッドの Future を返す。記録が無ければ None)。
+
+        segment はセグメント番号(分割していないラップは None)。
+        """
+        if not self.lap_samples:
+            return None
+        future = self._writer.submit(self._finish_lap, self.lap_batch, lap_num, datetime.now(), segment)
+        self.lap_batch = []
+        self.lap_samples = 0
+        return future
+
+    def _end_last_segment(self):
+        """ラップの終わり: 分割していれば最後のセグメントとして、していなければラップとして完成させる"""
+        segment = self.segment_index + 1 if self.segment_index else None
+        self.segment_index = 0
+        return self._end_lap(self.current_lap_number, segment)
+
+    def drain(self):
+        """書き出しスレッドへ渡した処理が全て終わるまで待つ"""
+        self._writer.submit(lambda: None).result()
+
+    # ── 以下は書き出しスレッドで実行する ──
+
+    def _retry(self, action, what):
+        """action() を SAVE_RETRY_COUNT 回まで試す(#434 P1)。全て失敗すれば最後の例外を送出する"""
+        for attempt in range(1, SAVE_RETRY_COUNT + 1):
+            try:
+                return action()
+            except Exception as e:
+                logger.warning(f"[{self.console_id}] {what} attempt {attempt}/{SAVE_RETRY_COUNT} failed: {e}")
+                if attempt == SAVE_RETRY_COUNT:
+                    raise
+                time.sleep(SAVE_RETRY_DELAY_SEC)
+
+    def _lap_io(self, action, what):
+        """進行中ラップのファイル操作 action(lap_file) を行い、成功すれば True を返す。
+
+        一時的なI/Oエラーの自己解消を想定して再試行し、なお失敗すれば書き込み済みの分ごと
+        退避ディレクトリへ移って続ける(#434 P1)。退避先でも失敗したら、そのラップの
+        以後の分を捨てる(書き込み済みの part ファイルは残り、次回起動時に復旧される)。
+        """
+        if self._lap_lost:
+            return False
+        lap_file = self._lap_file
+        try:
+            self._retry(lambda: action(lap_file), f"{what} {lap_file.part_path}")
+            return True
+        except Exception as e:
+            primary_error = e
+        fallback_error = None
+        if not self._lap_failed_over:
+            self._lap_failed_over = True
+            try:
+                os.makedirs(self.failed_dir, exist_ok=True)
+                dropped = lap_file.move(os.path.join(self.failed_dir, CHECKPOINT_BASENAME))
+                action(lap_file)
+                logger.error(
+                    f"[{self.console_id}] Lap recording moved to fallback {lap_file.part_path} after "
+                    f"{SAVE_RETRY_COUNT} failed attempts ({dropped} earlier samples could not be moved). "
+                    f"Last error: {primary_error}"
+                )
+                return True
+            except Exception as e:
+                fallback_error = e
+        self._lap_lost = True
+        logger.error(
+            f"[{self.console_id}] Lap data LOST: {what} failed for the lap in progress "
+            f"(car_id={lap_file.car_id}, {lap_file.samples} samples kept in {lap_file.part_path}); "
+            f"dropping the rest of the lap. primary_error={primary_error} fallback_error={fallback_error}"
+        )
+        return False
+
+    def _write_batch(self, batch):
+        """渡されたサンプルを進行中ラップのファイルへ書き足す"""
+        if self._lap_file is None:
+            self._lap_file = LapFileWriter(self.checkpoint_file)
+        self._lap_io(lambda lap_file: lap_file.append(batch), "Lap write")
+
+    def _finish_lap(self, batch, lap_num, recorded_at, segment=None):
+        """残りを書き足してラップファイルを完成させ、パスを返す(保存できなければ None)。
+
+        ファイル名の日時は recorded_at(ラップ境界を検出した時刻)。セグメントは
+        1つ目の日時・車種ID・ラップ番号を引き継ぎ、_Seg-{segment} を付ける。
+        """
+        if batch:
+            self._write_batch(batch)
+        lap_file = self._lap_file
+        if lap_file is None:
+            return None
+        name = f"{recorded_at.strftime('%Y-%m-%d_%H_%M_%S')}_CAR-{lap_file.car_id}_Lap-{lap_num}"
+        if segment is not None:
+            if segment == 1 or self._segment_run is None:
+                self._segment_run = name
+            name = f"{self._segment_run}_Seg-{segment}"
+
+        def finish(f):
+            if self._lap_failed_over:
+                return f.finish(f"{self.failed_dir}/{name}_failed.json")
+            return f.finish(f"{self.log_dir}/{name}.json")
+
+        saved = self._lap_io(finish, "Lap finish")
+        if saved:
+            logger.info(f"[{self.console_id}] Saved lap data: {lap_file.final_path} ({lap_file.samples} samples)")
+        else:
+            lap_file.close()
+        self._lap_file = None
+        self._lap_failed_over = False
+        self._lap_lost = False
+        return lap_file.final_path if saved else None
+
+    def recover_checkpoint(self):
+        """前回のプロセスが残した進行中ラップをラップファイルへ復旧する(テレメトリタスクの起動時)。
+
+        SIGKILL/OOM 等で flush() を経ずに終了すると進行中ラップの part ファイルが残る。
+        途中で切れた末尾の行を捨てて閉じ括弧を書き、ラップファイル名へ改名する
+        (退避ディレクトリに残った分は退避ファイル名へ)。ファイル名の日時は最後に
+        書き足した時刻(ファイルの更新時刻)、ラップ番号は最後のサンプルの lap_count。
+        旧形式のチェックポイントは save_lap_to_file で保存できたものだけ削除する。
+        読めないファイルは退避ディレクトリへ移す。戻り値は復旧したサンプル数。
+        """
+        if not CONFIG.get("recording_enabled", True):
+            return 0   # 記録OFF: 記録ONで起動したときに復旧する
+        recovered = 0
+        for directory, suffix in ((self.log_dir, ""), (self.failed_dir, "_failed")):
+            path = os.path.join(directory, CHECKPOINT_BASENAME)
+            if not os.path.exists(path):
+                continue
+            try:
+                lap_file = LapFileWriter.resume(path)
+                recorded_at = datetime.fromtimestamp(os.path.getmtime(path))
+            except (OSError, ValueError) as e:
+                self._move_aside(path, e)
+                continue
+            if not lap_file.samples:
+                _clear_checkpoint(path)
+                continue
+            timestamp = recorded_at.strftime("%Y-%m-%d_%H_%M_%S")
+            try:
+                lap_file.finish(f"{directory}/{timestamp}_CAR-{lap_file.car_id}_Lap-{lap_file.lap_count}{suffix}.json")
+            except OSError as e:
+                lap_file.close()
+                logger.error(f"[{self.console_id}] Could not recover {path} (will retry on next start): {e}")
+                continue
+            logger.warning(
+                f"[{self.console_id}] Recovered {lap_file.samples} samples of lap {lap_file.lap_count} "
+                f"left by a previous run: {lap_file.final_path}"
+            )
+            recovered += lap_file.samples
+
+        path = os.path.join(self.log_dir, LEGACY_CHECKPOINT_BASENAME)
+        if not os.path.exists(path):
+            return recovered
+        try:
+            with open(path, 'r') as f:
+                legacy = json.load(f)
+            lap_num, samples = legacy.get("lap_num"), legacy.get("samples")
+            if not isinstance(samples, list):
+                raise ValueError("checkpoint has no sample array")
+            recorded_at = datetime.fromtimestamp(os.path.getmtime(path))
+        except (OSError, ValueError, AttributeError) as e:
+            self._move_aside(path, e)
+            return recovered
+        if samples:
+            if save_lap_to_file(samples, lap_num, self.log_dir, self.failed_dir, recorded_at) is None:
+                return recovered   # 保存できなかった: 次回起動時に再試行する
+            logger.warning(
+                f"[{self.console_id}] Recovered {len(samples)} samples of lap {lap_num} "
+                f"from checkpoint left by a previous run"
+            )
+            recovered += len(samples)
+        _clear_checkpoint(path)
+        return recovered
+
+    def _move_aside(self, path, error):
+        """読めないチェックポイントを退避ディレクトリへ移す(次回起動時に読み直さない)"""
+        logger.error(f"[{self.console_id}] Unreadable checkpoint {path}: {error}")
+        try:
+            os.makedirs(self.failed_dir, exist_ok=True)
+            stamp = datetime.now().strftime("%Y-%m-%d_%H_%M_%S")
+            os.replace(path, os.path.join(self.failed_dir, f"{stamp}_unreadable{os.path.basename(path)}"))
+        except OSError as move_error:
+            logger.error(f"[{self.console_id}] Could not move aside {path}: {move_error}")
+
+    def flush(self):
+        """未保存の進行中ラップを保存し、書き出しが終わるまで待つ(テレメトリタスク終了時)"""
+        self._end_last_segment()
+        self.drain()
+
+
+def build_console_pipelines(cfg):
+    """設定からコンソールID -> ConsolePipeline の dict(設定順)を作る。
+
+    "consoles": [{"id": "rig1", "ip": "192.168.1.128"}, ...] があればマルチコンソール
+    構成とし、各コンソールの記録は gt7data/<id>/ へ分ける。無ければ従来どおり
+    ps5_ip の1台を DEFAULT_CONSOLE_ID として gt7data/ 直下へ記録する。
+    """
+    pipelines = {}
+    for entry in cfg.get("consoles") or []:
+        console_id = str(entry.get("id", "")) if isinstance(entry, dict) else ""
+        ip = entry.get("ip") if isinstance(entry, dict) else None
+        if not CONSOLE_ID_RE.match(console_id) or not ip or console_id in pipelines:
+            logger.error(f"Ignoring invalid console entry in config.json: {entry!r}")
+            continue
+        pipelines[console_id] = ConsolePipeline(
+            console_id, ip,
+            os.path.join(LOG_DIR, console_id),
+            os.path.join(LOG_DIR_FAILED, console_id),
+        )
+    if not pipelines:
+        pipelines[DEFAULT_CONSOLE_ID] = ConsolePipeline(DEFAULT_CONSOLE_ID, cfg["ps5_ip"])
+    return pipelines
+
+
+CONSOLES = build_console_pipelines(CONFIG)
+
+
+def route_console(addr):
+    """送信元アドレスからパイプラインを返す。1台構成では送信元を問わない(従来互換)"""
+    if len(CONSOLES) == 1:
+        return next(iter(CONSOLES.values()))
+    if addr is None:
+        return None
+    for pipeline in CONSOLES.values():
+        if pipeline.ip == addr[0]:
+            return pipeline
+    return None
 
 
 async def telemetry_background_task():
     """バックグラウンドでGT7からのテレメトリデータを受信し続けるタスク。
 
-    受信は asyncio.DatagramProtocol ベースの await client.receive() で待機する。
+    受信は await client.receive_batch() で待機し、溜まっている分をまとめて受け取って
+    タイトなループで処理する(停滞後のバックログも1回の起床で吸い出す)。
     旧実装の asyncio.sleep(0.01) ポーリングは廃止し、パケット到着時のみ処理する。
-    ハートビートは _heartbeat_loop に独立タスク化して受信ループから分離。
+    ハートビートは telemetry.heartbeat_loop に独立タスク化して受信ループから分離。
+    マルチコンソール構成では1本のソケットで全台を受信し、送信元IPで ConsolePipeline へ振り分ける。
     """
-    client = GT7TelemetryClient(
-        CONFIG["ps5_ip"],
+    global _receive_health, _latency_tracer
+    receive_port = CONFIG.get("receive_port", DEFAULT_RECEIVE_PORT)
+    # 受信ソケットの SO_RCVBUF(未設定ならカーネル既定)。停滞時にカーネルで溢れるまでの余裕になる
+    rcvbuf = CONFIG.get("udp_rcvbuf_bytes") or None
+    endpoint = (
+        [pipeline.ip for pipeline in CONSOLES.values()],
         CONFIG.get("send_port", DEFAULT_SEND_PORT),
-        CONFIG.get("receive_port", DEFAULT_RECEIVE_PORT),
+        receive_port,
         CONFIG["heartbeat_interval"]
     )
+    # 再生(replay_capture): PS5 の代わりにキャプチャファイルを同じ API で流し込む
+    replay_path = CONFIG.get("replay_capture")
+    # 生パケットのキャプチャ(raw_capture_dir): 受信した暗号化データグラムを到着時刻付きで保存
+    capture_path = None
+    capture_dir = CONFIG.get("raw_capture_dir")
+    if capture_dir and not replay_path:
+        os.makedirs(capture_dir, exist_ok=True)
+        capture_path = os.path.join(
+            capture_dir, f"capture_{datetime.now().strftime('%Y-%m-%d_%H_%M_%S')}{CAPTURE_SUFFIX}"
+        )
+    # デコードワーカー(オプトイン): 受信・ハートビート・復号を別プロセスへ移し、
+    # 復号済みフレームを共有メモリのリング経由で受け取る(decode_worker.py)
+    if CONFIG.get("decode_worker", False) and not replay_path:
+        worker = DecodeWorkerClient(*endpoint, rcvbuf=rcvbuf, capture_path=capture_path)
+    else:
+        worker = None
+    if replay_path:
+        client = ReplayTelemetryClient(replay_path, CONFIG.get("replay_speed", 1.0), endpoint[0])
+    elif worker is not None:
+        client = worker
+    else:
+        client = GT7TelemetryClient(*endpoint, rcvbuf=rcvbuf, capture_path=capture_path)
+    # 復号器(送信元別 XOR・重複判定)とコース推定 DB は全コンソールで共有
     decoder = GT7Decoder()
     course_estimator = CourseEstimator()
-    fuel_tracker = FuelTracker()
-
-    ensure_log_dir()
-    logger.info(f"Logging enabled. Data will be saved to: {os.path.abspath(LOG_DIR)}/")
-
-    last_package_id = 0
-    last_speed_kmh = 0.0
-    last_time = datetime.now()
-    current_lap_data = []
-    current_lap_number = 0
-    # コース推定ロックイン(#436 B4フォローアップ): course_estimator.estimate_course()
-    # 自体(bounds面積最小選択)は無改変。course_database.jsonの特定コースペアの
-    # バウンディングボックス重複により、1ラップ中に生の推定値が頻繁に入れ替わる
-    # 不安定性が判明した(析の全数調査)ため、ラップ開始からCOURSE_LOCK_VOTE_WINDOW件の
-    # 生推定値を多数決し、以後そのラップ中は確定値に凍結する。lap_count変化(増減とも)で
-    # リセットする(析調査で実績のある「先頭サンプル=100%内部一貫」のラップ単位の粒度を踏襲)。
-    course_lock_id = None       # 確定済みcourse_id(未確定はNone)
-    course_lock_result = None   # 確定済みcourse dict(id/name/name_en/name_ja/confidence/verified/source)
-    course_vote_counts = {}     # id -> 出現回数(投票window中のみ)
-    course_vote_samples = {}    # id -> そのidを得た最初のcourse dict(確定時の代表値)
-    course_vote_count = 0       # 投票windowに入れた生サンプル数
-    # パケットロス計測(#434 P1): 受理されなかった/破棄されたパケットの累積カウント。
-    packet_loss_count = 0
-    # 周期的チェックポイント保存(#434 P1): 前回チェックポイントからの経過時間追跡。
-    last_checkpoint_time = datetime.now()
-    # 配信キュー溢れ計測(#434 P1-b): telemetry.py側のパケットドロップ(packet_loss_count)
-    # とは別に、配信側の遅延蓄積(broadcast_queue満杯による最古メッセージ破棄)を計測する。
-    broadcast_drop_count = 0
+
+    # 受信ヘルス: 到着間隔・原因別の損失・キュー深さ・カーネルの受信バッファ(health.py)
+    health = ReceiveHealth(receive_port, rcvbuf)
+    client.health = health
+    health.add_depth_probe("receive_queue", lambda: client.queue_depth)
+    # 遅延トレース: 抜き取ったフレームの到着から各クライアントへの送信完了まで(latency.py)
+    sample_every = CONFIG.get("latency_trace_sample_every", LATENCY_TRACE_SAMPLE_EVERY)
+    tracer = LatencyTracer(sample_every) if sample_every else None
+    client.tracer = tracer
+    for pipeline in CONSOLES.values():
+        pipeline.reset()
+        pipeline.health = health
+        pipeline.tracer = tracer
+        health.add_depth_probe(
+            f"broadcast:{pipeline.console_id}",
+            lambda p=pipeline: p.broadcast.seq - p.broadcast_sent_seq,
+        )
+        ensure_log_dir(pipeline.log_dir)
+        await asyncio.to_thread(pipeline.recover_checkpoint)
+        logger.info(
+            f"Console '{pipeline.console_id}' ({pipeline.ip}): "
+            f"data will be saved to {os.path.abspath(pipeline.log_dir)}/"
+        )
+    _receive_health = health
+    _latency_tracer = tracer
+    last_stats_time = datetime.now()
 
     await client.connect()  # UDP エンドポイント作成（イベントループ上で必要）
+    health.rcvbuf_bytes = getattr(client, "rcvbuf_bytes", None)
 
-    # ハートビート送信を独立タスクで駆動
-    heartbeat_task = asyncio.create_task(_heartbeat_loop(client))
+    # ハートビート送信を独立タスクで駆動(ワーカー構成ではワーカープロセスが送信する)
+    heartbeat_task = asyncio.create_task(heartbeat_loop(client)) if worker is None else None
     # 配信専用タスクを独立起動(#434 P1-b): 受信ループから配信I/Oを分離する
-    broadcast_task = asyncio.create_task(broadcast_consumer_task())
+    broadcast_tasks = [
+        asyncio.create_task(broadcast_consumer_task(pipeline)) for pipeline in CONSOLES.values()
+    ]
+    broadcast_tasks.append(asyncio.create_task(health_stream_task(health)))
 
     try:
         while True:
             # パケット到着までイベントループを阻塞せずに待機。
             # 旧 settimeout(1.0) 相当の生存確認は heartbeat_task が担うため不要。
-            raw_data = await client.receive()
-
-            if raw_data:
-                decrypted = decoder.decrypt(raw_data)
+            batch = await client.receive_batch(RECEIVE_BATCH_MAX, with_arrival=True)
+            if worker is not None:
+                # デコードワーカー経由: 受信・復号は別プロセスで済んでおり、ワーカー側で
+                # 破棄した件数とリングの周回遅れを振り分け前の損失として計上する
+                rejected, overrun = worker.take_losses()
+                health.count_loss("decrypt_failure", rejected)
+                health.count_loss("queue_overflow", overrun)
+
+            for payload, addr, arrival_ns in batch:
+                # 未登録の送信元は復号前に捨てる(マルチコンソール構成のみ。1台構成は全送信元を受理)
+                pipeline = route_console(addr)
+                if pipeline is None:
+                    health.unrouted += 1
+                    continue
+                trace = tracer.claim(payload) if tracer is not None else None
+                if worker is None:
+                    # 送信元アドレスを渡し、重複データグラムの破棄と送信元別 XOR キャッシュを使う
+                    decrypted = decoder.decrypt(payload, addr)
+                else:
+                    decrypted = payload
                 if not decrypted:
                     # パケットロス計測(#434 P1): 受信したが復号できなかったパケット
-                    packet_loss_count += 1
-                    continue
-
-                parsed = decoder.parse(decrypted)
-                if parsed is None:
-                    # パケットロス計測(#434 P1): 復号はできたが解析できなかったパケット
-                    packet_loss_count += 1
+                    pipeline.count_loss("decrypt_failure")
                     continue
+                if trace is not None:
+                    trace.mark("decrypt")
 
-                pid = parsed.get("package_id", 0)
-                # 受理条件: 通常は単調増加のみ（重複・順序逆転パケットを除外）。
-                # ただしゲーム再起動で package_id が 0 付近にリセットされると
-                # 「pid > last_package_id」を二度と満たせず全パケットが弾かれて
-                # 無言で固まるため、大幅な後退（1000 超）はリセットとみなして受理する。
-                if not (pid > last_package_id or pid < last_package_id - 1000):
-                    # パケットロス計測(#434 P1): 受理されなかったパケット
-                    # (重複・順序逆転。リセット扱いでもない)
-                    packet_loss_count += 1
-                    continue
+                pipeline.handle(decrypted, decoder, course_estimator, trace, arrival_ns)
 
-                # パケットロス計測(#434 P1): 単調増加区間で生じた欠番(gap)を損失として
-                # 計上する。リセット(大幅後退)直後はgap計算をスキップする(誤検知防止)。
-                if last_package_id > 0:
-                    gap = pid - last_package_id - 1
-                    if gap > 0:
-                        packet_loss_count += gap
-                last_package_id = pid
-
-                current_time = datetime.now()
-                parsed["timestamp"] = current_time.isoformat()
-
-                # 加速度計算
-                time_delta = (current_time - last_time).total_seconds()
-                accel_g, decel_g = calculate_acceleration(
-                    parsed["speed_kmh"], last_speed_kmh, time_delta
-                )
-                parsed["accel_g"] = accel_g
-                parsed["accel_decel"] = decel_g
-                last_speed_kmh = parsed["speed_kmh"]
-                last_time = current_time
-
-                # ラップ境界検知(コース推定ロックインの判定にも使うため、lap_count
-                # 変化検知より前に前倒しで取得する。値自体は従来どおり)
-                lap_count = parsed.get("lap_count", 1)
-
-                # コース推定(#436 B4フォローアップ: ロックイン方式で安定化)
-                # estimate_course()自体(bounds面積最小選択)は無改変。ラップ変化
-                # (増減とも)でロックをリセットし、開始からCOURSE_LOCK_VOTE_WINDOW件の
-                # 生推定値を多数決、以後そのラップ中は確定値に凍結する(析調査で実績の
-                # ある「先頭サンプル=100%内部一貫」をラップ単位の粒度で拡張する設計)。
-                if lap_count != current_lap_number:
-                    course_lock_id = None
-                    course_lock_result = None
-                    course_vote_counts = {}
-                    course_vote_samples = {}
-                    course_vote_count = 0
-
-                raw_course = course_estimator.estimate_course(
-                    parsed.get("position_x", 0),
-                    parsed.get("position_z", 0)
-                )
-                if course_lock_id is None:
-                    cid = raw_course.get("id", "unknown")
-                    course_vote_counts[cid] = course_vote_counts.get(cid, 0) + 1
-                    course_vote_samples.setdefault(cid, raw_course)
-                    course_vote_count += 1
-                    if course_vote_count >= COURSE_LOCK_VOTE_WINDOW:
-                        course_lock_id = max(course_vote_counts, key=course_vote_counts.get)
-                        course_lock_result = course_vote_samples[course_lock_id]
-                    parsed["course"] = raw_course
-                else:
-                    parsed["course"] = course_lock_result
-
-                # 燃料計算
-                fuel_data = fuel_tracker.update(
-                    parsed.get("current_fuel"),
-                    parsed.get("fuel_capacity", 100),
-                    current_lap_number
-                )
-                parsed.update(fuel_data)
-
-                # ラップデータ蓄積・保存（lap_count変化検知）
-                current_lap_data.append(parsed)
-
-                # 周期的チェックポイント保存(#434 P1): ラップ境界を待たず一定間隔で
-                # current_lap_data を中間保存する。SIGKILL/OOM等でfinally節を経ずに
-                # 終了した場合の未保存データを縮小する安全網。既存のラップ保存と同じく
-                # ワーカースレッドへオフロードし、受信ループ(イベントループ)を塞がない。
-                if (current_time - last_checkpoint_time).total_seconds() >= CHECKPOINT_INTERVAL_SEC:
-                    await asyncio.to_thread(_save_checkpoint, current_lap_data, current_lap_number)
-                    if packet_loss_count > 0:
-                        logger.warning(f"Packet loss count (cumulative): {packet_loss_count}")
-                    if broadcast_drop_count > 0:
-                        # 配信キュー溢れ計測(#434 P1-b): packet_loss_countとは別指標として明示
-                        logger.warning(f"Broadcast queue full, dropped (cumulative): {broadcast_drop_count}")
-                    last_checkpoint_time = current_time
-
-                # ラップ境界検出：lap_countが変化したら保存
-                # 同期 json 書込はイベントループを数百ms塞ぐためワーカースレッドへ。
-                # 旧リストは保存スレッドに渡し切り、以後はここで新リストへ差し替えるので
-                # 書込み中のリストが変更されることはない。
-                if lap_count > current_lap_number and current_lap_number > 0:
-                    await asyncio.to_thread(save_lap_to_file, current_lap_data, current_lap_number)
-                    await asyncio.to_thread(_clear_checkpoint)
-                    current_lap_data = []
-                    last_checkpoint_time = current_time
-                current_lap_number = lap_count
-
-                # WebSocket配信(#434 P1-b): 受信ループを配信I/Oから切り離すため、
-                # 直接awaitせず非ブロッキングでbroadcast_queueへ積む。実際の送信は
-                # broadcast_consumer_taskが独立して行う。満杯時は最古を破棄して
-                # 最新を積む(telemetry.py:50-55と同じ「最新優先」ポリシー)。
-                message = json.dumps(parsed)
-                try:
-                    broadcast_queue.put_nowait(message)
-                except asyncio.QueueFull:
-                    try:
-                        broadcast_queue.get_nowait()
-                    except asyncio.QueueEmpty:
-                        pass
-                    broadcast_drop_count += 1
-                    try:
-                        broadcast_queue.put_nowait(message)
-                    except asyncio.QueueFull:
-                        pass
+            now = datetime.now()
+            if (now - last_stats_time).total_seconds() >= STATS_LOG_INTERVAL_SEC:
+                if any(decoder.reject_counts.values()):
+                    # 復号前段の破棄内訳(重複・他機器パケット等)。各コンソールの packet_loss_count に含まれる
+                    logger.warning(f"Rejected datagrams by reason (cumulative): {decoder.reject_counts}")
+                if health.unrouted > 0:
+                    logger.warning(f"Datagrams not routed to any console (cumulative): {health.unrouted}")
+                last_stats_time = now
 
     except Exception as e:
         logger.error(f"Telemetry task error: {e}", exc_info=True)
     finally:
-        heartbeat_task.cancel()
-        try:
-            await heartbeat_task
-        except asyncio.CancelledError:
-            pass
-        broadcast_task.cancel()
-        try:
-            await broadcast_task
-        except asyncio.CancelledError:
-            pass
-        if current_lap_data:
-            save_lap_to_file(current_lap_data, current_lap_number)
-            _clear_checkpoint()
-        client.close()
+        if heartbeat_task is not None:
+            heartbeat_task.cancel()
+            try:
+                await heartbeat_task
+            except asyncio.CancelledError:
+                pass
+        for task in broadcast_tasks:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        for pipeline in CONSOLES.values():
+            pipeline.flush()
+        if worker is not None:
+            # ワーカープロセスの終了(最大5秒)をイベントループ上で待たない
+            await worker.aclose()
+        else:
+            client.close()
+        _receive_health = None
+        _latency_tracer = None
 
 
 # バーチャルピットウォール(#434 P4): エンジニア役からのメッセージ本文の長さ上限。
@@ -542,21 +1297,39 @@ ENGINEER_MESSAGE_SEVERITIES = frozenset(("notice", "good", "warning", "serious",
 DRIVER_RESPONSE_VALUES = frozenset(("OK", "COPY", "RE-PLAN"))
 
 
+def _request_console(request):
+    """?console=<id> のパイプラインを返す。省略時は先頭(1台構成ではその1台)、未登録なら None"""
+    console_id = request.query.get("console")
+    if console_id is None:
+        return next(iter(CONSOLES.values()))
+    return CONSOLES.get(console_id)
+
+
 async def websocket_handler(request):
-    """WebSocket接続を処理"""
-    ws = web.WebSocketResponse()
+    """WebSocket接続を処理(?console=<id> でコンソールのチャンネルを選択)"""
+    pipeline = _request_console(request)
+    if pipeline is None:
+        return web.json_response({"error": "unknown console"}, status=404)
+    clients = pipeline.clients
+
+    # permessage-deflate は ?compress=1 の接続だけ(遠隔の閲覧端末向け)。ローカルのダッシュボードは
+    # フレームごとの圧縮の CPU と遅延を払わない(aiohttp の既定はブラウザが申し出れば常に圧縮)
+    ws = web.WebSocketResponse(compress=request.query.get("compress") == "1")
     await ws.prepare(request)
 
-    logger.info(f"WebSocket client connected. Total: {len(websocket_clients) + 1}")
-    websocket_clients.add(ws)
+    # 遅延トレースのクライアント別集計のキー
+    client_id = f"{pipeline.console_id}/{request.remote}#{next(_ws_client_ids)}"
+    pipeline.client_ids[ws] = client_id
+    logger.info(f"WebSocket client connected to '{pipeline.console_id}'. Total: {len(clients) + 1}")
+    pipeline.add_client(ws, request.transport)
 
     try:
         async for msg in ws:
             if msg.type == aiohttp.WSMsgType.TEXT:
                 # バーチャルピットウォール(#434 P4 / #436 T2): エンジニア↔ドライバーの
-                # メッセージ受信。テレメトリ配信(broadcast_queue、P1-b)とは別経路で
-                # 直接配信する(低頻度・欠落厳禁のため、高頻度テレメトリ向けの
-                # 「最新優先」破棄ポリシーを持つbroadcast_queueは経由しない)。
+                # メッセージ受信。テレメトリ配信(broadcast チャンネル、P1-b)とは別経路で
+                # 制御メッセージとして送る(低頻度・欠落厳禁のため、高頻度テレメトリ向けの
+                # 「最新のみ」に合体されるbroadcast チャンネル・フレーム枠は経由しない)。
                 try:
                     data = json.loads(msg.data)
                 except json.JSONDecodeError:
@@ -571,7 +1344,7 @@ async def websocket_handler(request):
                     severity = data.get("severity")
                     if severity not in ENGINEER_MESSAGE_SEVERITIES:
                         severity = "notice"
-                    await broadcast_to_clients(json.dumps({
+                    pipeline.send(json.dumps({
                         "type": "engineer_message",
                         "text": text,
                         "severity": severity,
@@ -581,22 +1354,77 @@ async def websocket_handler(request):
                     response = data.get("response")
                     if response not in DRIVER_RESPONSE_VALUES:
                         continue
-                    await broadcast_to_clients(json.dumps({
+                    pipeline.send(json.dumps({
                         "type": "driver_response",
                         "response": response,
                     }))
+                elif msg_type == "subscribe_health":
+                    # エンジニア画面: 受信ヘルス(receive_health)の定期配信を購読する
+                    pipeline.health_subscribers.add(ws)
+                elif msg_type == "subscribe":
+                    # テレメトリの更新レート(Hz)。0 はテレメトリを送らない(fanout.py)
+                    rate = parse_rate(data.get("rate"))
+                    if rate is not None:
+                        pipeline.set_rate(ws, rate)
+                    # フィールドの投影(profile / fields。省略時は変えない)
+                    reschema = False
+                    if "profile" in data or "fields" in data:
+                        try:
+                            projection = parse_projection(data.get("profile"), data.get("fields"))
+                        except ValueError as e:
+                            logger.debug(f"Ignored subscribe projection: {e}")
+                        else:
+                            pipeline.set_projection(ws, projection)
+                            reschema = True
+                    # 差分配信(keyframe / delta。省略時は変えない)
+                    if isinstance(data.get("delta"), bool):
+                        pipeline.set_delta(ws, data["delta"])
+                    # フレームのバッチの間隔(ミリ秒、0 はバッチしない。省略時は変えない)
+                    batch_ms = parse_batch_ms(data.get("batch_ms"))
+                    if batch_ms is not None:
+                        pipeline.set_batch(ws, batch_ms)
+                    # フレームの形式(json / binary。省略時は変えない)。binary は先にスキーマを送る
+                    if data.get("format") in ("json", "binary"):
+                        pipeline.set_binary(ws, data["format"] == "binary")
+                        reschema = True
+                    schema = pipeline.binary_schema(ws) if reschema else None
+                    if schema is not None:
+                        pipeline.send(json.dumps(schema), (ws,))
+                elif msg_type == "resync":
+                    # 差分配信のクライアントが seq の欠けを見つけた: 次は keyframe を送る
+                    pipeline.request_keyframe(ws)
             elif msg.type == aiohttp.WSMsgType.ERROR:
                 logger.warning(f"WebSocket error: {ws.exception()}")
                 break
     except Exception as e:
         logger.error(f"WebSocket handler error: {e}", exc_info=True)
     finally:
-        websocket_clients.discard(ws)
-        logger.info(f"WebSocket client disconnected. Remaining: {len(websocket_clients)}")
+        pipeline.forget_client(ws)
+        if _latency_tracer is not None:
+            _latency_tracer.forget_client(client_id)
+        logger.info(f"WebSocket client disconnected from '{pipeline.console_id}'. Remaining: {len(clients)}")
 
     return ws
 
 
+async def api_receive_health_handler(request):
+    """GET /api/health/receive: 受信経路のヘルス(カーネル破棄・到着間隔・原因別損失・キュー深さ)"""
+    health = _receive_health
+    if health is None:
+        return web.json_response({"running": False}, status=503)
+    return web.json_response({"running": True, **health.snapshot()})
+
+
+async def api_latency_handler(request):
+    """GET /api/health/latency: 抜き取りフレームの段別・クライアント別遅延(p50/p99/最大)"""
+    tracer = _latency_tracer
+    if tracer is None:
+        return web.json_response(
+            {"running": _receive_health is not None, "enabled": False}, status=503
+        )
+    return web.json_response({"running": True, "enabled": True, **tracer.snapshot()})
+
+
 async def index_handler(request):
     """メインダッシュボードを配信"""
     # no-cache: ブラウザは ETag で必ず再検証する（デプロイ後に古い JS/HTML を掴み続けるのを防ぐ）
@@ -643,10 +1471,11 @@ async def static_handler(request):
 #  docs/P1詳細計画書_セッションレビューと保存ポリシー_20260716.md §2.1。
 # ================================================================
 
-# save_lap_to_file の命名形式に完全一致するファイルのみをAPIの対象にする
-# (許可リスト方式: パス区切り・別拡張子・BU等の変則名は正規表現の時点で排除)
+# save_lap_to_file の命名形式(長時間ラップのセグメントは _Seg-{k} 付き)に完全一致する
+# ファイルのみをAPIの対象にする(許可リスト方式: パス区切り・別拡張子・BU等の変則名は
+# 正規表現の時点で排除)
 LAP_FILE_RE = re.compile(
-    r'^(\d{4})-(\d{2})-(\d{2})_(\d{2})_(\d{2})_(\d{2})_CAR-(\d+)_Lap-(\d+)\.json$'
+    r'^(\d{4})-(\d{2})-(\d{2})_(\d{2})_(\d{2})_(\d{2})_CAR-(\d+)_Lap-(\d+)(?:_Seg-(\d+))?\.json$'
 )
 
 # 詳細APIの既定射影: REVIEWビューの距離基準比較に必要な最小フィールド集合
@@ -677,7 +1506,7 @@ CSV_ALL_FIELDS = ("timestamp",) + tuple(sorted((
     "speed_kmh", "speed_ms", "suggested_gear", "susp_height", "throttle",
     "throttle_filtered_pct", "throttle_pct", "torque_vector", "total_laps",
     "transmission_max_speed", "tyre_radius", "tyre_temp", "velocity_x", "velocity_y",
-    "velocity_z", "wheel_rotation", "wheel_rps",
+    "velocity_z", "wheel_rotation", "wheel_rps", "arrival_ns", "wall_anchor_ns",
 )))
 
 # CSV変換(#174仕様書§2)における配列/辞書フィールドの列展開ルール
@@ -828,6 +1657,9 @@ _CSV_INT_FIELDS = frozenset((
     "car_id", "laps_since_refuel",
 ))
 
+# v3 のフレーム時刻(整数 ns)。float を経由すると 2**53 を超える桁が丸まるため int() で直接復元する
+_CSV_NS_FIELDS = frozenset(("arrival_ns", "wall_anchor_ns"))
+
 
 def _valid_csv_columns():
     """本ツールがエクスポートし得る全CSV列名の集合(アップロードのヘッダ検証用、#178)。"""
@@ -887,6 +1719,8 @@ def _csv_row_to_sample(row):
             sample["timestamp"] = v
         elif v is None or v == "":
             continue
+        elif col in _CSV_NS_FIELDS:
+            sample[col] = int(v)
         elif col in _CSV_INT_FIELDS:
             sample[col] = int(float(v))
         else:
@@ -965,13 +1799,28 @@ def _parse_lap_filename(name):
     m = LAP_FILE_RE.match(name)
     if not m:
         return None
-    y, mo, d, h, mi, s, car, lap = m.groups()
-    return {
+    y, mo, d, h, mi, s, car, lap, segment = m.groups()
+    meta = {
         "file": name,
         "recorded_at": f"{y}-{mo}-{d}T{h}:{mi}:{s}",
         "car_id": int(car),
         "lap_number": int(lap),
     }
+    if segment is not None:
+        meta["segment"] = int(segment)
+    return meta
+
+
+def _segment_neighbors(directory, meta):
+    """セグメントの前後のファイル名を (prev, next) で返す(無ければ None。書き込み中の続きも None)"""
+    prefix = meta["file"][:meta["file"].rindex("_Seg-")]
+    index = meta["segment"]
+    prev_name = f"{prefix}_Seg-{index - 1}.json"
+    next_name = f"{prefix}_Seg-{index + 1}.json"
+    return (
+        prev_name if index > 1 and os.path.isfile(os.path.join(directory, prev_name)) else None,
+        next_name if os.path.isfile(os.path.join(directory, next_name)) else None,
+    )
 
 
 def _int_query(request, name, default, lo, hi):
@@ -1008,7 +1857,7 @@ def _scan_lap_files(date_filter, car_id_filter, log_dir=LOG_DIR, source="recorde
     except FileNotFoundError:
         # ディレクトリ未作成は初回起動直後の正常状態 → 空一覧
         return []
-    entries.sort(key=lambda m: m["recorded_at"], reverse=True)
+    entries.sort(key=lambda m: (m["recorded_at"], m.get("segment", 0)), reverse=True)
     return entries
 
 
@@ -1027,14 +1876,19 @@ async def api_laps_list_handler(request):
     except ValueError as e:
         return web.json_response({"error": str(e)}, status=400)
 
+    # マルチコンソール構成では ?console=<id> のコンソールの記録ディレクトリを走査する
+    pipeline = _request_console(request)
+    if pipeline is None:
+        return web.json_response({"error": "unknown console"}, status=404)
+
     include_imported = request.query.get("include_imported") == "true"
-    entries = await asyncio.to_thread(_scan_lap_files, date_filter, car_id, LOG_DIR, "recorded")
+    entries = await asyncio.to_thread(_scan_lap_files, date_filter, car_id, pipeline.log_dir, "recorded")
     if include_imported:
         imported = await asyncio.to_thread(
             _scan_lap_files, date_filter, car_id, IMPORT_LOG_DIR, "imported"
         )
         entries = entries + imported
-        entries.sort(key=lambda m: m["recorded_at"], reverse=True)
+        entries.sort(key=lambda m: (m["recorded_at"], m.get("segment", 0)), reverse=True)
 
     return web.json_response(
         {"total": len(entries), "laps": entries[offset:offset + limit]},
@@ -1053,11 +1907,14 @@ def _load_lap_file(path, fields, every, output_format='json'):
         data = json.load(f)
     if not isinstance(data, list):
         raise ValueError("lap file is not a sample array")
-    samples = [
-        {k: s[k] for k in fields if k in s}
-        for s in data[::every]
-        if isinstance(s, dict)
-    ]
+    rows = [s for s in data[::every] if isinstance(s, dict)]
+    samples = [{k: s[k] for k in fields if k in s} for s in rows]
+    if "timestamp" in fields and (output_format != 'json' or "arrival_ns" not in fields):
+        # 互換: v3 のラップは timestamp を持たない。CSV・FastF1 と、arrival_ns を要求しない
+        # JSON(旧クライアント)にだけ整数時刻から ISO 文字列を作って返す
+        for projected, s in zip(samples, rows):
+            if "timestamp" not in projected and "arrival_ns" in s:
+                projected["timestamp"] = _sample_iso_timestamp(s)
     first = data[0] if data and isinstance(data[0], dict) else {}
     duration_ms = _lap_duration_approx_ms(data)
     if output_format == 'csv':
@@ -1074,6 +1931,16 @@ def _load_lap_file(path, fields, every, output_format='json'):
 # ギャップがあり、単純な先頭↔最終差(84,195s)は無意味、クランプ後(268.9s)は
 # サンプル数/60Hz(270s)と一致。
 LAP_DURATION_GAP_S = 2.0
+LAP_DURATION_GAP_NS = int(LAP_DURATION_GAP_S * 1e9)
+
+
+def _sample_iso_timestamp(sample):
+    """サンプルの受信時刻を ISO 文字列で返す(v3 は arrival_ns + wall_anchor_ns から作る。無ければ None)"""
+    arrival_ns = sample.get("arrival_ns")
+    anchor_ns = sample.get("wall_anchor_ns")
+    if isinstance(arrival_ns, int) and isinstance(anchor_ns, int):
+        return _ns_to_iso(arrival_ns + anchor_ns)
+    return sample.get("timestamp")
 
 
 def _lap_duration_approx_ms(data):
@@ -1082,10 +1949,24 @@ def _lap_duration_approx_ms(data):
     注意: decoder.py が current_laptime に格納する値(パケット 0x80)は実際には
     「ゲーム内時刻の進行 ms」でありラップ経過時間ではない(実データで機械確認:
     全サンプル定数 or 日時起点の単調増加。2026-07-16 計承認の是正案(a))。
-    そのため v1/v2 共通で受信時刻 dt(< LAP_DURATION_GAP_S)の合計を使う。
+    そのため受信時刻 dt(< LAP_DURATION_GAP_S)の合計を使う。v3 は整数の arrival_ns
+    の差で、v1/v2(arrival_ns を持たない)は ISO 文字列の timestamp の差で求める。
     ラップ確定値(次ラップの last_laptime)ではない点は「approx」の名で明示する。
     _load_lap_file と同じワーカースレッド内で呼ぶこと(全サンプル走査のため)。
     """
+    first = next((s for s in data if isinstance(s, dict)), {})
+    if isinstance(first.get("arrival_ns"), int):
+        total_ns = 0
+        prev_ns = None
+        for s in data:
+            t_ns = s.get("arrival_ns") if isinstance(s, dict) else None
+            if not isinstance(t_ns, int):
+                continue
+            if prev_ns is not None and 0 < t_ns - prev_ns < LAP_DURATION_GAP_NS:
+                total_ns += t_ns - prev_ns
+            prev_ns = t_ns
+        return (total_ns + 500_000) // 1_000_000 if total_ns > 0 else None
+
     total_s = 0.0
     prev = None
     for s in data:
@@ -1115,7 +1996,10 @@ async def api_lap_detail_handler(request):
     meta = _parse_lap_filename(name)
     if meta is None:
         return web.json_response({"error": "not found"}, status=404)
-    filepath = os.path.join(LOG_DIR, name)
+    pipeline = _request_console(request)
+    if pipeline is None:
+        return web.json_response({"error": "unknown console"}, status=404)
+    filepath = os.path.join(pipeline.log_dir, name)
     if not os.path.isfile(filepath):
         # gt7data/ に無ければインポート分(#177/#178)を探す(一覧でオプトイン
         # 表示されたインポート済みラップの詳細取得・CSV変換・再生に必要)
@@ -1172,13 +2056,20 @@ async def api_lap_detail_handler(request):
             }
         )
 
-    # スキーマ世代: 2026-07系(v2)は lap_count を持つ。2026-02系(v1)は持たない。
-    schema = "v2" if "lap_count" in first else "v1"
+    # スキーマ世代: v3 は整数時刻(arrival_ns / wall_anchor_ns)を持ち ISO の timestamp を持たない。
+    # 2026-07系(v2)は lap_count を持つ。2026-02系(v1)は持たない。
+    if "arrival_ns" in first:
+        schema = "v3"
+    else:
+        schema = "v2" if "lap_count" in first else "v1"
     course = None
     course_raw = first.get("course")
     if isinstance(course_raw, dict):
         course = {k: course_raw.get(k) for k in ("id", "name_ja", "name_en")}
 
+    if "segment" in meta:
+        # 長時間ラップのセグメント: 前後のセグメントを辿って繋げられるようにする
+        meta["segment_prev"], meta["segment_next"] = _segment_neighbors(os.path.dirname(filepath), meta)
     meta.update({
         "samples_total": samples_total,
         "samples_returned": samples_returned,
@@ -1253,7 +2144,7 @@ async def api_laps_import_handler(request):
 #
 #  train_laptime_model.py(オフライン学習パイプライン)が生成した学習済みモデルを
 #  用いた読み取り専用の推論エンドポイント。ライブ受信経路(decoder.py/telemetry.py/
-#  telemetry_background_task/broadcast_to_clients/broadcast_consumer_task、
+#  telemetry_background_task/broadcast_consumer_task、
 #  P1/P1-b実装分)には一切触れない、独立したモジュールレベル関数。
 #
 #  品質ゲート(采指示2026-08-02厳守): MAE%が QUALITY_GATE_MAE_PCT(train_laptime_model.py
@@ -1484,6 +2375,8 @@ def main():
     app.router.add_post('/api/laps/import', api_laps_import_handler)
     app.router.add_get('/api/laps/{file}', api_lap_detail_handler)
     app.router.add_get('/api/predict/laptime', api_predict_laptime_handler)
+    app.router.add_get('/api/health/receive', api_receive_health_handler)
+    app.router.add_get('/api/health/latency', api_latency_handler)
     app.router.add_get('/', index_handler)
     app.router.add_get('/engineer', engineer_handler)
     app.router.add_get('/ws', websocket_handler)
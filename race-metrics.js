@@ -37,7 +37,7 @@ const RM_REPLAY_HL_MS = 250;             // 再生G-Gの現在位置更新周期
 // 補助取得(案a): 必要最小フィールドのみ射影(位置は距離軸整合用)
 // P2(#146): サスヒストグラム用に susp_height を追加(承認済み方式の同一枠内)
 // P3(#147): 滑らかさスコア用に throttle_pct を追加(同上)
-const RM_AUX_FIELDS = 'timestamp,position_x,position_z,body_accel_sway,' +
+const RM_AUX_FIELDS = 'timestamp,arrival_ns,position_x,position_z,body_accel_sway,' +
                       'accel_g,accel_decel,wheel_rotation,brake_pct,susp_height,' +
                       'throttle_pct';
 const RM_AUX_EVERY = 6;
@@ -488,8 +488,8 @@ function rmFetchAux(file) {
     if (rmState.auxCache[file]) {
         return Promise.resolve(rmState.auxCache[file]);
     }
-    return fetch('/api/laps/' + encodeURIComponent(file) +
-                 '?every=' + RM_AUX_EVERY + '&fields=' + RM_AUX_FIELDS)
+    return fetch(withConsole('/api/laps/' + encodeURIComponent(file) +
+                 '?every=' + RM_AUX_EVERY + '&fields=' + RM_AUX_FIELDS))
         .then(function(res) {
             if (!res.ok) {
                 throw new Error('HTTP ' + res.status);
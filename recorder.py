@@ -0,0 +1,483 @@
+"""
+ラップ記録用の列指向バッファ
+
+telemetry_background_task は受信した全パケットの解析結果(約70キーの dict)を
+進行中ラップとして保持していたが、放置セッションでは1ラップが数十万サンプルに
+達し、dict 表現はディスク上の JSON(実測最大84MB)の数倍のメモリを消費していた。
+
+LapBuffer は1フィールド=1列(float32 / float64 / 整数型)の NumPy 構造化配列へサンプルを
+詰めて保持する。フラグはビットへ戻して uint16 1列、コースは同一 dict を
+インターン表への添字として持つ。時刻は v3 フレームの整数2列(arrival_ns /
+wall_anchor_ns、main.py 参照)をそのまま int64 で持ち、v2 以前の ISO 文字列の
+timestamp(インポート分等)は datetime64 列で持つ。ラップファイルへは従来と同じ
+JSON サンプル配列形式で直接書き出し、dict 行が必要なコード向けに添字アクセス/イテレーションも提供する。
+
+LapFileWriter は進行中ラップをラップファイル形式のまま到着順に書き足し、ラップの
+終わりに改名して完成させる(完了したサンプルをメモリに残さない)。これにより受信側が
+持つのは未書き出しの約1秒分だけになり、main.py はそれを dict の list のまま渡す
+(その程度の行数では列へ詰めて戻す手間の方が大きい)。LapBuffer は1ラップ分を
+メモリに持つ用途(長時間のサンプル列を手元に溜める解析・テスト等)向けに残している。
+"""
+
+import json
+import logging
+import operator
+import os
+import shutil
+import struct
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from decoder import GT7Decoder
+
+logger = logging.getLogger(__name__)
+
+# 整数列で None を表す番兵値(suggested_gear / pre_race_position 等の nullable 列)
+_INT_NONE = -32768
+
+# 列定義: (キー, dtype, 要素数, グループ)。
+# パケット上の float32 の値は f4 でそのまま戻る。Python 側で計算・丸めた派生値
+# (speed_kmh・rotation_*・accel_*・燃料の集計値等)は f8 で持ち、配信した値と同じ JSON にする。
+# グループ単位で「そのサンプルにキーが存在したか」をビットで記録し、
+# 行 dict の復元時に元と同じキー集合を再現する(Packet A に B/~ 拡張キーは無い等)。
+LAP_COLUMNS = (
+    ("speed_ms", "f4", 1, "base"),
+    ("speed_kmh", "f8", 1, "base"),
+    ("rpm", "f4", 1, "base"),
+    ("max_rpm", "i4", 1, "base"),
+    ("rpm_alert_min", "u2", 1, "base"),
+    ("gear", "u1", 1, "base"),
+    ("suggested_gear", "i2", 1, "base"),
+    ("throttle", "u1", 1, "base"),
+    ("throttle_pct", "f8", 1, "base"),
+    ("brake", "u1", 1, "base"),
+    ("brake_pct", "f8", 1, "base"),
+    ("clutch", "f4", 1, "base"),
+    ("clutch_engagement", "f4", 1, "base"),
+    ("clutch_gearbox_rpm", "f4", 1, "base"),
+    ("tyre_temp", "f4", 4, "base"),
+    ("road_plane_x", "f4", 1, "base"),
+    ("road_plane_y", "f4", 1, "base"),
+    ("road_plane_z", "f4", 1, "base"),
+    ("road_plane_distance", "f4", 1, "base"),
+    ("susp_height", "f4", 4, "base"),
+    ("tyre_radius", "f4", 4, "base"),
+    ("wheel_rps", "f4", 4, "base"),
+    ("position_x", "f4", 1, "base"),
+    ("position_y", "f4", 1, "base"),
+    ("position_z", "f4", 1, "base"),
+    ("velocity_x", "f4", 1, "base"),
+    ("velocity_y", "f4", 1, "base"),
+    ("velocity_z", "f4", 1, "base"),
+    ("rotation_pitch", "f8", 1, "base"),
+    ("rotation_yaw", "f8", 1, "base"),
+    ("rotation_roll", "f8", 1, "base"),
+    ("orientation", "f4", 1, "base"),
+    ("angular_velocity_x", "f4", 1, "base"),
+    ("angular_velocity_y", "f4", 1, "base"),
+    ("angular_velocity_z", "f4", 1, "base"),
+    ("body_height", "f4", 1, "base"),
+    ("car_max_speed", "u2", 1, "base"),
+    ("oil_pressure", "f4", 1, "base"),
+    ("current_fuel", "f4", 1, "base"),
+    ("fuel_capacity", "f4", 1, "base"),
+    ("boost", "f8", 1, "base"),
+    ("transmission_max_speed", "f4", 1, "base"),
+    ("gear_ratios", "f4", 8, "base"),
+    ("package_id", "i4", 1, "base"),
+    ("lap_count", "i2", 1, "base"),
+    ("total_laps", "i2", 1, "base"),
+    ("best_laptime", "i4", 1, "base"),
+    ("last_laptime", "i4", 1, "base"),
+    ("current_laptime", "i4", 1, "base"),
+    ("pre_race_position", "i2", 1, "base"),
+    ("num_cars_pre_race", "i2", 1, "base"),
+    ("flags", "u2", 1, "base"),
+    ("car_id", "i4", 1, "base"),
+    ("course", "i2", 1, "course"),
+    ("wheel_rotation", "f4", 1, "ext_b"),
+    ("body_accel_sway", "f4", 1, "ext_b"),
+    ("body_accel_heave", "f4", 1, "ext_b"),
+    ("body_accel_surge", "f4", 1, "ext_b"),
+    ("throttle_filtered_pct", "f8", 1, "ext_tilde"),
+    ("brake_filtered_pct", "f8", 1, "ext_tilde"),
+    ("torque_vector", "f4", 4, "ext_tilde"),
+    ("energy_recovery", "f4", 1, "ext_tilde"),
+    ("timestamp", "M8[us]", 1, "timestamp"),
+    ("arrival_ns", "i8", 1, "clock"),
+    ("wall_anchor_ns", "i8", 1, "clock"),
+    ("accel_g", "f8", 1, "accel"),
+    ("accel_decel", "f8", 1, "accel"),
+    ("fuel_consumed", "f8", 1, "fuel"),
+    ("fuel_per_lap", "f8", 1, "fuel"),
+    ("laps_since_refuel", "i4", 1, "fuel"),
+    ("fuel_laps_remaining", "f8", 1, "fuel"),
+)
+
+_NULLABLE_INT_COLUMNS = frozenset(("suggested_gear", "pre_race_position", "num_cars_pre_race"))
+_SPECIAL_COLUMNS = _NULLABLE_INT_COLUMNS | {"flags", "course", "timestamp"}
+_KNOWN_KEYS = frozenset(name for name, *_ in LAP_COLUMNS)
+
+# 格納順: グループごとに「変換不要のスカラー列 → 配列列 → 変換が必要な列」。
+# 変換不要のスカラー列は itemgetter 1回でまとめて取り出せるよう連続させる。
+_GROUPS = []  # (グループ名, 存在ビット, 先頭キー, スカラー itemgetter, 配列列, 特殊列, 欠落時の値)
+_STORAGE_COLUMNS = []
+for _group in dict.fromkeys(g for *_, g in LAP_COLUMNS):
+    _cols = [c for c in LAP_COLUMNS if c[3] == _group]
+    _plain = [c for c in _cols if c[2] == 1 and c[0] not in _SPECIAL_COLUMNS]
+    _arrays = [c for c in _cols if c[2] > 1]
+    _special = [c for c in _cols if c[0] in _SPECIAL_COLUMNS]
+    _STORAGE_COLUMNS += _plain + _arrays + _special
+    _GROUPS.append((
+        _group,
+        1 << len(_GROUPS),
+        _cols[0][0],
+        operator.itemgetter(*(c[0] for c in _plain)) if len(_plain) > 1 else None,
+        tuple((c[0], c[2]) for c in _arrays),
+        tuple(c[0] for c in _special),
+        (0,) * sum(c[2] for c in _cols),
+    ))
+_GROUP_BITS = {g[0]: g[1] for g in _GROUPS}
+
+LAP_DTYPE = np.dtype(
+    [(name, dtype, (count,)) if count > 1 else (name, dtype) for name, dtype, count, _ in _STORAGE_COLUMNS]
+    + [("_present", "u1")]
+)
+
+# 1行を1回の pack_into で書き込むための Struct。LAP_DTYPE(アライメント無し)と同一配置。
+_STRUCT_CODES = {"f8": "d", "f4": "f", "i8": "q", "i4": "i", "i2": "h", "u2": "H", "u1": "B", "M8[us]": "q"}
+_ROW_STRUCT = struct.Struct(
+    "<" + "".join(
+        f"{count}{_STRUCT_CODES[dtype]}" if count > 1 else _STRUCT_CODES[dtype]
+        for _name, dtype, count, _group in _STORAGE_COLUMNS
+    ) + "B"
+)
+assert _ROW_STRUCT.size == LAP_DTYPE.itemsize
+
+_EPOCH = datetime(1970, 1, 1)
+_ONE_US = timedelta(microseconds=1)
+
+
+def _pack_flags(flags):
+    raw = 0
+    for name, mask in GT7Decoder.FLAG_BITS:
+        if flags.get(name):
+            raw |= mask
+    return raw
+
+
+class LapBuffer:
+    """進行中ラップのサンプルを列指向で保持する伸長可能なバッファ。
+
+    append() は解析結果 dict(または同じキーを持つ Mapping)を1行に詰める。
+    列に無いキー(将来の追加フィールド等)は行番号ごとの補助 dict に保持し、
+    行の復元・書き出し時に元のキーとして戻す。パケット上の float32 の値は f4、
+    派生値(speed_kmh 等)は f8 の列に詰めるので、どちらも元の float のまま戻る。
+    """
+
+    INITIAL_CAPACITY = 4096  # 約68秒@60Hz。満杯時は2倍に伸長する
+
+    def __init__(self, capacity=INITIAL_CAPACITY):
+        self._data = np.zeros(max(1, capacity), dtype=LAP_DTYPE)
+        self._bytes = self._data.view(np.uint8)
+        self._len = 0
+        self._courses = []         # 添字 -> course dict
+        self._course_index = {}    # course の (key, value) タプル -> 添字
+        self._extra = {}           # 行番号 -> 列に無いキーの dict
+        self._unpacked = {}        # 行番号 -> 列に詰められなかったサンプルそのもの
+
+    def __len__(self):
+        return self._len
+
+    @property
+    def nbytes(self):
+        """確保済み配列のバイト数(補助 dict は含まない)"""
+        return self._data.nbytes
+
+    def _grow(self):
+        grown = np.zeros(len(self._data) * 2, dtype=LAP_DTYPE)
+        grown[:self._len] = self._data[:self._len]
+        self._data = grown
+        self._bytes = grown.view(np.uint8)
+
+    def _intern_course(self, course):
+        key = tuple(course.items())
+        idx = self._course_index.get(key)
+        if idx is None:
+            idx = len(self._courses)
+            self._courses.append(dict(course))
+            self._course_index[key] = idx
+        return idx
+
+    def _special_value(self, name, value):
+        if name == "flags":
+            return _pack_flags(value) if isinstance(value, dict) else 0
+        if name == "course":
+            return self._intern_course(value) if isinstance(value, dict) else 0
+        if name == "timestamp":
+            return (datetime.fromisoformat(value) - _EPOCH) // _ONE_US if value else 0
+        return _INT_NONE if value is None else value  # nullable 整数列
+
+    def _pack_values(self, sample, strict):
+        """sample を _ROW_STRUCT の引数列にする。
+
+        strict=True は高速経路: グループ内のキーが揃い値が None でない前提で
+        itemgetter で一括取得する(満たさなければ KeyError/TypeError/struct.error)。
+        strict=False は1列ずつ get し、欠落は 0・float の None は NaN で埋める。
+        """
+        values = []
+        present = 0
+        for group, bit, first_key, plain_get, arrays, special, missing in _GROUPS:
+            if first_key not in sample:
+                values.extend(missing)
+                continue
+            present |= bit
+            if strict and plain_get is not None:
+                values.extend(plain_get(sample))
+            else:
+                for name, dtype, count, g in _STORAGE_COLUMNS:
+                    if g != group or count > 1 or name in _SPECIAL_COLUMNS:
+                        continue
+                    value = sample.get(name)
+                    values.append(value if value is not None else (np.nan if dtype[0] == "f" else 0))
+            for name, count in arrays:
+                value = sample[name] if strict else sample.get(name)
+                if not strict and (not isinstance(value, (list, tuple)) or len(value) != count):
+                    value = (0.0,) * count
+                values.extend(value)
+            for name in special:
+                values.append(self._special_value(name, sample.get(name)))
+        values.append(present)
+        return values
+
+    def append(self, sample):
+        """解析結果1件を末尾に追加する(全列を1回の pack_into で書き込む。詰められなければ dict のまま持つ)"""
+        if self._len == len(self._data):
+            self._grow()
+        offset = self._len * _ROW_STRUCT.size
+        try:
+            _ROW_STRUCT.pack_into(self._bytes, offset, *self._pack_values(sample, True))
+        except (KeyError, TypeError, ValueError, OverflowError, struct.error):
+            # 1列ずつ詰め直しても詰められない(不正な timestamp・範囲外の値等)サンプルは
+            # 行を空けたまま dict の複製で持ち、読み出し時にそのまま返す。
+            # 例外を上げると記録そのものが止まり、捨てると呼び出し側の件数と合わなくなる
+            try:
+                _ROW_STRUCT.pack_into(self._bytes, offset, *self._pack_values(sample, False))
+            except (KeyError, TypeError, ValueError, OverflowError, struct.error) as e:
+                logger.warning(f"LapBuffer: keeping a sample that cannot be packed as a dict: {e}")
+                self._unpacked[self._len] = dict(sample)
+                self._len += 1
+                return
+
+        if len(sample) > len(_KNOWN_KEYS) or not _KNOWN_KEYS.issuperset(sample):
+            self._extra[self._len] = {k: v for k, v in sample.items() if k not in _KNOWN_KEYS}
+        self._len += 1
+
+    def _rows(self, start, stop):
+        """[start, stop) 行を dict として順に生成する(列ごとに tolist してから組み立て)"""
+        block = self._data[start:stop]
+        cols = {}
+        for name, dtype, _count, _group in LAP_COLUMNS:
+            if dtype.startswith("M8"):
+                cols[name] = np.datetime_as_string(block[name], unit="us").tolist()
+            else:
+                cols[name] = block[name].tolist()
+        presents = block["_present"].tolist()
+        flag_bits = GT7Decoder.FLAG_BITS
+        for offset, present in enumerate(presents):
+            unpacked = self._unpacked.get(start + offset)
+            if unpacked is not None:
+                yield dict(unpacked)
+                continue
+            row = {}
+            for name, _dtype, _count, group in LAP_COLUMNS:
+                if not present & _GROUP_BITS[group]:
+                    continue
+                value = cols[name][offset]
+                if name == "flags":
+                    value = {flag: bool(value & mask) for flag, mask in flag_bits}
+                elif name == "course":
+                    value = dict(self._courses[value])
+                elif name in _NULLABLE_INT_COLUMNS:
+                    value = None if value == _INT_NONE else value
+                elif value != value:  # NaN(元の値が None)
+                    value = None
+                row[name] = value
+            extra = self._extra.get(start + offset)
+            if extra:
+                row.update(extra)
+            yield row
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self._len
+        if not 0 <= index < self._len:
+            raise IndexError("LapBuffer index out of range")
+        return next(self._rows(index, index + 1))
+
+    def __iter__(self):
+        return self.rows()
+
+    # 書き出し・行生成のブロック単位。tolist() の一時リストを一定量に抑える。
+    _ROW_BLOCK = 4096
+
+    def rows(self, start=0):
+        """start 行目以降を dict として順に生成する"""
+        for block_start in range(start, self._len, self._ROW_BLOCK):
+            yield from self._rows(block_start, min(block_start + self._ROW_BLOCK, self._len))
+
+    def write_json(self, f, start=0):
+        """start 行目以降を json.dump(list) と同じ形式の JSON 配列として f へ書き出す"""
+        f.write("[")
+        first = True
+        for row in self.rows(start):
+            if not first:
+                f.write(", ")
+            f.write(json.dumps(row))
+            first = False
+        f.write("]")
+
+
+class LapFileWriter:
+    """1ラップ分のサンプルをラップファイル形式(JSON 配列)で到着順に書き足す。
+
+    書き込み中は part_path(LAP_FILE_RE と一致しない名前)へ "[\n" 行1, ",\n" 行2 ...
+    の1行1サンプルで追記し、finish() で閉じ括弧を書いて最終名へ os.replace する
+    (ラップ一覧・読み手は完成したファイルしか見ない)。書き切った位置(バイト数)を
+    持ち、書き込みに失敗したときはそこまで切り詰めて例外を送出するので、再試行しても
+    ファイルが壊れない。プロセスが落ちて残った part ファイルは resume() で続きから
+    書ける状態に戻せる(電源断に備える fsync はしない)。
+
+    スレッドセーフではない。1つの書き出しスレッドからだけ使う。
+    """
+
+    def __init__(self, part_path):
+        self.part_path = part_path
+        self.final_path = None
+        self.samples = 0        # 書き切ったサンプル数
+        self.car_id = None      # 先頭サンプルの car_id(ファイル名用)
+        self.lap_count = None   # 最後に書いたサンプルの lap_count
+        self._size = 0          # 書き切った位置(バイト)
+        self._f = None
+
+    def _open(self):
+        if self._size == 0:
+            self._f = open(self.part_path, 'wb')
+        else:
+            self._f = open(self.part_path, 'r+b')
+            self._f.seek(self._size)
+            self._f.truncate()
+
+    def _rewind(self):
+        """書きかけを最後に書き切った位置まで戻す(戻せなければ閉じて次回開き直す)"""
+        try:
+            self._f.seek(self._size)
+            self._f.truncate()
+        except (OSError, ValueError):
+            self.close()
+
+    def append(self, rows):
+        """rows(dict の列。LapBuffer.rows() 等)を追記して flush する"""
+        rows = list(rows)
+        if not rows:
+            return
+        encoded = [json.dumps(row) for row in rows]
+        data = (",\n" if self.samples else "[\n") + ",\n".join(encoded)
+        data = data.encode()
+        if self._f is None:
+            self._open()
+        try:
+            self._f.write(data)
+            self._f.flush()
+        except Exception:
+            self._rewind()
+            raise
+        if self.samples == 0:
+            self.car_id = rows[0].get("car_id", 0)
+        self.lap_count = rows[-1].get("lap_count")
+        self.samples += len(rows)
+        self._size += len(data)
+
+    def finish(self, final_path):
+        """閉じ括弧を書いて閉じ、final_path へ改名する(失敗後の再呼び出しも可)"""
+        if self._f is None:
+            self._open()
+        try:
+            self._f.seek(self._size)
+            self._f.write(b"]" if self.samples else b"[]")
+            self._f.truncate()
+            self._f.flush()
+        except Exception:
+            self._rewind()
+            raise
+        self.close()
+        os.replace(self.part_path, final_path)
+        self.final_path = final_path
+        return final_path
+
+    def move(self, part_path):
+        """書き込み済みの内容ごと part_path へ移る(退避ディレクトリへの切り替え)。
+
+        改名できなければ書き切った分をコピーする。元ファイルを読めずに持ち出せなかった
+        サンプル数を返す(元ファイルは残すので次回起動時の復旧対象になる)。
+        """
+        self.close()
+        dropped = 0
+        try:
+            os.replace(self.part_path, part_path)
+        except OSError:
+            try:
+                shutil.copyfile(self.part_path, part_path)
+                os.truncate(part_path, self._size)
+                try:
+                    os.remove(self.part_path)
+                except OSError:
+                    pass
+            except OSError:
+                dropped = self.samples
+                self.samples = 0
+                self.car_id = self.lap_count = None
+                self._size = 0
+        self.part_path = part_path
+        return dropped
+
+    def close(self):
+        """ファイルを閉じる(中身は残す)"""
+        if self._f is not None:
+            try:
+                self._f.close()
+            except OSError:
+                pass
+            self._f = None
+
+    @classmethod
+    def resume(cls, part_path):
+        """途中で終わった part ファイルを、書き切った行の直後から続けられる状態で返す。
+
+        途中で切れた末尾の行は捨てる(次の append/finish で切り詰める)。
+        part ファイルの形式でなければ ValueError。
+        """
+        writer = cls(part_path)
+        with open(part_path, 'rb') as f:
+            head = f.readline()
+            if not head:
+                return writer
+            if head != b"[\n":
+                raise ValueError(f"not a lap part file: {part_path}")
+            offset = len(head)
+            for line in f:
+                row = line.rstrip(b"\n")
+                if row.endswith((b",", b"]")):
+                    row = row[:-1]
+                try:
+                    sample = json.loads(row)
+                except ValueError:
+                    break   # 追記の途中で止まった最終行
+                if writer.samples == 0:
+                    writer.car_id = sample.get("car_id", 0)
+                writer.lap_count = sample.get("lap_count")
+                writer.samples += 1
+                writer._size = offset + len(row)
+                offset += len(line)
+        return writer
@@ -34,7 +34,7 @@ const REPLAY_FIELDS = (
     'position_z,pre_race_position,road_plane_distance,road_plane_x,' +
     'road_plane_y,road_plane_z,rotation_pitch,rotation_roll,rotation_yaw,' +
     'rpm,rpm_alert_min,speed_kmh,speed_ms,susp_height,throttle_filtered_pct,' +
-    'throttle_pct,timestamp,total_laps,transmission_max_speed,tyre_radius,' +
+    'throttle_pct,timestamp,arrival_ns,total_laps,transmission_max_speed,tyre_radius,' +
     'tyre_temp,velocity_x,velocity_y,velocity_z,wheel_rotation,wheel_rps,' +
     // P3 M-6(#147): race-metrics.js が回生/トルク配分表示で消費(冒頭コメントの
     // 「カード追加時の追随手順」による追加。ペイロード影響は+2フィールドで軽微)
@@ -111,7 +111,7 @@ function replayEnsureEls() {
 
 /**
  * フレーム列から時間・距離索引とギャップ/有効区間を構築する。
- * 時間: timestamp のクランプ付き累積秒(#128 と同一規則)。
+ * 時間: 受信時刻(v3 は arrival_ns、v1/v2 は timestamp。frameTimeMs)のクランプ付き累積秒(#128 と同一規則)。
  * 距離: position x/z の弦長積算(120mクランプ。REVIEW と同一規則)。
  * @param {Array} frames
  * @returns {{t:number[], d:number[], gaps:number[], segments:Array}}
@@ -128,19 +128,17 @@ function replayBuildIndices(frames) {
 
     for (let i = 0; i < frames.length; i++) {
         const f = frames[i];
-        if (f.timestamp) {
-            const ts = Date.parse(f.timestamp);
-            if (!isNaN(ts)) {
-                if (prevTs !== null) {
-                    const dt = (ts - prevTs) / 1000;
-                    if (dt > 0 && dt < REPLAY_TIME_GAP_S) {
-                        clock += dt;
-                    } else if (dt >= REPLAY_TIME_GAP_S) {
-                        gaps.push(i);
-                    }
+        const ts = frameTimeMs(f);
+        if (!isNaN(ts)) {
+            if (prevTs !== null) {
+                const dt = (ts - prevTs) / 1000;
+                if (dt > 0 && dt < REPLAY_TIME_GAP_S) {
+                    clock += dt;
+                } else if (dt >= REPLAY_TIME_GAP_S) {
+                    gaps.push(i);
                 }
-                prevTs = ts;
             }
+            prevTs = ts;
         }
         t[i] = clock;
         if (f.position_x != null && f.position_z != null) {
@@ -181,8 +179,8 @@ function replayBuildIndices(frames) {
  * ================================================================ */
 
 function replayFetch(file, every) {
-    return fetch('/api/laps/' + encodeURIComponent(file) +
-                 '?every=' + every + '&fields=' + REPLAY_FIELDS)
+    return fetch(withConsole('/api/laps/' + encodeURIComponent(file) +
+                 '?every=' + every + '&fields=' + REPLAY_FIELDS))
         .then(function(res) {
             if (!res.ok) {
                 throw new Error('HTTP ' + res.status);
@@ -218,8 +216,9 @@ function replaySizeTier(file) {
  * 再生開始(REVIEW 一覧の▶から呼ばれる公開入口)。
  * 10Hz 先行ロード → v1 判定 → モード進入 → 再生開始 → 背景高レート差替。
  * @param {string} file - gt7data ファイル名
+ * @param {boolean} [fromReview] - 終了時の復帰先(省略時は現在の表示モードから判定)
  */
-function replayStart(file) {
+function replayStart(file, fromReview) {
     const seq = ++replayState.seq;
     const tier = replaySizeTier(file);
     const els = replayEnsureEls();
@@ -242,7 +241,7 @@ function replayStart(file) {
             replayState.tier = tier;
             replayState.rateLabel = '10Hz';
             replayState.hqRequested = false;
-            replayState.fromReview =
+            replayState.fromReview = (fromReview !== undefined) ? fromReview :
                 document.body.classList.contains('review-mode');
             replaySetBuffer(body.samples);
             replayEnterMode();
@@ -445,10 +444,22 @@ function replayTick() {
 
     if (i >= n) {
         replaySetPlaying(false); // 終端で自動停止(バーは表示のまま)
+        replayContinueSegment();
     }
     replayUpdateBar();
 }
 
+/**
+ * 長時間ラップのセグメント(meta.segment_next)があれば続けて再生する。
+ * 復帰先(fromReview)は最初のセグメントを開いたときのものを引き継ぐ。
+ */
+function replayContinueSegment() {
+    const next = replayState.meta && replayState.meta.segment_next;
+    if (next) {
+        replayStart(next, replayState.fromReview);
+    }
+}
+
 /** 1フレームを既存単一入口へ供給する。 */
 function replaySupplyFrame(i) {
     const f = replayState.frames[i];
@@ -642,6 +653,8 @@ function replayUpdateBar() {
         els.title.textContent = (replayState.file || '') +
             (course && (course.name_ja || course.name_en)
                 ? ' | ' + (course.name_ja || course.name_en) : '') +
+            (replayState.meta && replayState.meta.segment
+                ? ' | 分割' + replayState.meta.segment : '') +
             ' | ' + replayState.rateLabel;
     }
     if (els.scrubber && n) {
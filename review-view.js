@@ -40,6 +40,10 @@ const REVIEW_TIME_GAP_S = 2.0;
 const REVIEW_LIST_PAGE = 1000;
 // 詳細取得の間引き(60Hz→約10Hz)
 const REVIEW_FETCH_EVERY = 6;
+// 詳細取得の射影(サーバ既定 DEFAULT_LAP_FIELDS + v3 の整数時刻 arrival_ns。
+// arrival_ns を要求すると v3 ラップの timestamp(ISO)互換生成が省かれる)
+const REVIEW_FIELDS = 'timestamp,arrival_ns,current_laptime,speed_kmh,throttle_pct,brake_pct,' +
+                      'position_x,position_z,gear,lap_count,last_laptime';
 
 const REVIEW_VIEW_STORAGE_VALUE = 'review';
 
@@ -314,7 +318,7 @@ function reviewLoadList() {
     const importedQuery = includeImported ? '&include_imported=true' : '';
 
     const fetchPage = function(offset) {
-        return fetch('/api/laps?limit=' + REVIEW_LIST_PAGE + '&offset=' + offset + importedQuery)
+        return fetch(withConsole('/api/laps?limit=' + REVIEW_LIST_PAGE + '&offset=' + offset + importedQuery))
             .then(function(res) {
                 if (!res.ok) {
                     throw new Error('HTTP ' + res.status);
@@ -344,7 +348,11 @@ function reviewLoadList() {
     fetchPage(0)
         .then(function(total) {
             // recorded_at 降順を全件で保証(ページ間の追記ずれ対策)
+            // (長時間ラップのセグメントは日時が同じなので番号の降順)
             collected.sort(function(a, b) {
+                if (a.recorded_at === b.recorded_at) {
+                    return (b.segment || 0) - (a.segment || 0);
+                }
                 return a.recorded_at < b.recorded_at ? 1 : -1;
             });
             reviewState.laps = collected;
@@ -479,6 +487,7 @@ function reviewBuildLapItem(lap) {
     const detail = reviewState.detailCache[lap.file];
     const laptime = detail && detail.meta.laptime_ms_approx;
     label.textContent = 'Lap' + lap.lap_number +
+        (lap.segment ? ' 分割' + lap.segment : '') +
         (laptime && typeof formatLapTime === 'function'
             ? ' ' + formatLapTime(laptime) : '');
 
@@ -510,7 +519,7 @@ function reviewBuildLapItem(lap) {
     // 行クリック(A/B選択)とは分離。ブラウザネイティブのdownload属性でトリガー(#174仕様書§4)。
     const csvLink = document.createElement('a');
     csvLink.className = 'review-lap-csv';
-    csvLink.href = '/api/laps/' + encodeURIComponent(lap.file) + '?format=csv';
+    csvLink.href = withConsole('/api/laps/' + encodeURIComponent(lap.file) + '?format=csv');
     csvLink.download = lap.file.replace(/\.json$/, '.csv');
     csvLink.textContent = '⬇ CSV';
     csvLink.title = 'このラップをCSVでダウンロード（自前形式。他ソフトとの互換性は未検証）';
@@ -615,9 +624,9 @@ function reviewStepM() {
  * APIサンプル列から距離・時間系列を構築する。
  * 距離: position x/z の弦長積算(REVIEW_DISCONTINUITY_M 超はテレポートとしてスキップ。
  *       telemetry-analysis.js updateDistanceIndex と同一規則)。
- * 時間: timestamp のクランプ付き累積経過秒(dt < REVIEW_TIME_GAP_S のみ加算。
+ * 時間: 受信時刻のクランプ付き累積経過秒(dt < REVIEW_TIME_GAP_S のみ加算。
  *       2026-07-16 設計訂正: current_laptime はゲーム内時刻進行のため使わない。
- *       v1/v2 共通で機能する)。
+ *       v3 は arrival_ns、v1/v2 は timestamp(frameTimeMs)で全世代共通に機能する)。
  * @param {Array} samples - /api/laps/{file} の samples
  * @returns {Object} {samples: resampleByDist互換の配列, cumDist}
  */
@@ -631,17 +640,15 @@ function reviewBuildSeries(samples) {
 
     (samples || []).forEach(function(s) {
         // 時間軸
-        if (s.timestamp) {
-            const ts = Date.parse(s.timestamp);
-            if (!isNaN(ts)) {
-                if (prevTs !== null) {
-                    const dt = (ts - prevTs) / 1000;
-                    if (dt > 0 && dt < REVIEW_TIME_GAP_S) {
-                        t += dt;
-                    }
+        const ts = frameTimeMs(s);
+        if (!isNaN(ts)) {
+            if (prevTs !== null) {
+                const dt = (ts - prevTs) / 1000;
+                if (dt > 0 && dt < REVIEW_TIME_GAP_S) {
+                    t += dt;
                 }
-                prevTs = ts;
             }
+            prevTs = ts;
         }
         // 距離索引
         if (s.position_x != null && s.position_z != null) {
@@ -680,7 +687,8 @@ function reviewFetchDetail(file) {
     if (els.listStatus) {
         els.listStatus.textContent = file + ' を読込中…';
     }
-    return fetch('/api/laps/' + encodeURIComponent(file) + '?every=' + REVIEW_FETCH_EVERY)
+    return fetch(withConsole('/api/laps/' + encodeURIComponent(file) +
+                             '?every=' + REVIEW_FETCH_EVERY + '&fields=' + REVIEW_FIELDS))
         .then(function(res) {
             if (!res.ok) {
                 throw new Error('HTTP ' + res.status);
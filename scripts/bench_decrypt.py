@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""一括復号(GT7Decoder.decrypt_many)と従来のパケット単位復号の比較ベンチマーク。
+
+記録済みセッションのオフライン再デコードを想定し、合成した暗号化パケット列を
+  A. decoder.decrypt() をパケットごとに呼ぶ従来経路(ライブ受信と同じ)
+  B. decoder.decrypt_many() で一括復号する NumPy 経路
+の両方で復号し、処理速度とリアルタイム比(60Hz換算で何倍速か)を表示する。
+両経路の復号結果がバイト単位で一致することも確認する。
+
+usage: python3 scripts/bench_decrypt.py [--packets N] [--heartbeat ~|A|B]
+(リポジトリルートをカレントディレクトリとして実行)
+"""
+import argparse
+import os
+import struct
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Crypto.Cipher import Salsa20  # noqa: E402
+
+from decoder import GT7Decoder  # noqa: E402
+
+PACKET_RATE_HZ = 60
+PACKET_SIZES = {b'A': 0x128, b'B': 0x13C, b'~': 0x158}
+
+
+def encrypt_packet(plaintext, xor_value):
+    """decoder.decrypt の逆変換(tests/test_decoder.py の _encrypt_packet と同一手順)"""
+    oiv = plaintext[0x40:0x44]
+    iv1 = int.from_bytes(oiv, byteorder='little')
+    iv = (iv1 ^ xor_value).to_bytes(4, 'little') + iv1.to_bytes(4, 'little')
+    encrypted = Salsa20.new(GT7Decoder.SALSA20_KEY[:32], iv).encrypt(plaintext)
+    return encrypted[:0x40] + oiv + encrypted[0x44:]
+
+
+def build_packets(n, heartbeat_type):
+    """package_id・速度・シードを変化させた暗号化パケットを n 件生成する"""
+    size = PACKET_SIZES[heartbeat_type]
+    xor_value = GT7Decoder.XOR_MAP[heartbeat_type]
+    packets = []
+    for i in range(n):
+        d = bytearray(size)
+        struct.pack_into('<I', d, 0x00, GT7Decoder.MAGIC_G7S0)
+        struct.pack_into('<f', d, 0x4C, 30.0 + (i % 600) / 10)
+        struct.pack_into('<i', d, 0x70, i + 1)
+        struct.pack_into('<I', d, 0x40, (i * 2654435761) & 0xFFFFFFFF)
+        packets.append(encrypt_packet(bytes(d), xor_value))
+    return packets
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument('--packets', type=int, default=60 * 60 * 5, help='パケット数(既定: 60Hz×5分)')
+    ap.add_argument('--heartbeat', default='~', choices=('A', 'B', '~'))
+    args = ap.parse_args()
+
+    hb = args.heartbeat.encode()
+    packets = build_packets(args.packets, hb)
+    recorded_s = args.packets / PACKET_RATE_HZ
+
+    decoder = GT7Decoder(heartbeat_type=hb)
+    t0 = time.perf_counter()
+    per_packet = [decoder.decrypt(p) for p in packets]
+    t_single = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    batch, valid = decoder.decrypt_many(packets)
+    t_batch = time.perf_counter() - t0
+
+    mismatch = sum(
+        1 for i, ref in enumerate(per_packet)
+        if not valid[i] or bytes(batch[i, :len(ref)]) != ref
+    )
+
+    print(f"packets: {args.packets} (heartbeat '{args.heartbeat}', {recorded_s:.0f}s @ {PACKET_RATE_HZ}Hz)")
+    for label, elapsed in (("decrypt (per packet)", t_single), ("decrypt_many (batch)", t_batch)):
+        print(
+            f"  {label:22s} {elapsed:8.3f}s  {args.packets / elapsed:10.0f} pkt/s  "
+            f"{recorded_s / elapsed:8.0f}x realtime"
+        )
+    print(f"  speedup: {t_single / t_batch:.1f}x  mismatches: {mismatch}")
+    return 1 if mismatch else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
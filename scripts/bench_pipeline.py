@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+"""ライブ受信経路(60Hz ホットパス)の段階別マイクロベンチマーク。
+
+A/B/~ の各ハートビート種別について、走行を模した暗号化パケット列(周回する位置・
+速度・回転数・燃料減少・ラップ進行)を合成し、main.py の受信ループと同じ順で
+  decrypt → parse → CourseEstimator.estimate_course → FuelTracker.update → json.dumps(配信)
+の各段を1呼び出しずつ計測する。段ごとに pkt/s と呼び出し遅延の p50/p90/p99/max(μs)を
+表示し、実行環境・コミットと合わせて JSON に保存する(最適化前後の比較用)。
+--capture を渡すと合成走行の代わりに生パケットのキャプチャ(capture.py)の
+データグラムをそのまま使う(実トラフィックでの再現可能な計測)。
+
+usage: python3 scripts/bench_pipeline.py [--packets N] [--variants ~AB]
+                                         [--capture FILE]
+                                         [--output FILE] [--compare FILE]
+(リポジトリルートをカレントディレクトリとして実行。既定の保存先は bench_results/)
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import struct
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench_decrypt import PACKET_RATE_HZ, PACKET_SIZES, encrypt_packet  # noqa: E402
+from capture import iter_capture  # noqa: E402
+from decoder import GT7Decoder, CourseEstimator  # noqa: E402
+from main import FuelTracker  # noqa: E402
+
+STAGES = ("decrypt", "parse", "estimate_course", "fuel_update", "json_dumps")
+RESULTS_DIR = os.path.join(ROOT, 'bench_results')
+
+# 合成走行のパラメータ: 1周 LAP_PACKETS パケット(60Hz で約90秒)の楕円コース
+LAP_PACKETS = 90 * PACKET_RATE_HZ
+TRACK_RADIUS_X = 400.0
+TRACK_RADIUS_Z = 500.0
+
+
+def _put(buf, layout, name, value):
+    """packet_def.json のフィールド定義に従って値を書き込む(バリアントに無ければ無視)"""
+    field = layout.fields.get(name)
+    if field is None:
+        return
+    offset, code, count = field
+    if count > 1:
+        struct.pack_into(f'<{count}{code}', buf, offset, *value)
+    else:
+        struct.pack_into(f'<{code}', buf, offset, value)
+
+
+def build_stream(n, heartbeat_type):
+    """走行を模した暗号化パケットを n 件生成する"""
+    size = PACKET_SIZES[heartbeat_type]
+    xor_value = GT7Decoder.XOR_MAP[heartbeat_type]
+    layout = GT7Decoder._layout_for(size)
+    packets = []
+    for i in range(n):
+        lap, phase = divmod(i, LAP_PACKETS)
+        theta = 2 * math.pi * phase / LAP_PACKETS
+        # 直線と低速コーナーを繰り返す速度変化(約 90〜270 km/h)
+        speed_ms = 50.0 + 25.0 * math.cos(6 * theta)
+        rpm = 4000.0 + 3000.0 * (0.5 + 0.5 * math.sin(12 * theta))
+        heading = theta + math.pi / 2
+        qw, qy = math.cos(heading / 2), math.sin(heading / 2)
+
+        d = bytearray(size)
+        struct.pack_into('<I', d, 0x00, GT7Decoder.MAGIC_G7S0)
+        struct.pack_into('<I', d, 0x40, (i * 2654435761) & 0xFFFFFFFF)
+        _put(d, layout, 'position_x', TRACK_RADIUS_X * math.cos(theta))
+        _put(d, layout, 'position_y', 12.0 + math.sin(3 * theta))
+        _put(d, layout, 'position_z', TRACK_RADIUS_Z * math.sin(theta))
+        _put(d, layout, 'velocity_x', -speed_ms * math.sin(theta))
+        _put(d, layout, 'velocity_z', speed_ms * math.cos(theta))
+        _put(d, layout, 'quat_y', qy)
+        _put(d, layout, 'quat_w', qw)
+        _put(d, layout, 'body_height', 0.08)
+        _put(d, layout, 'rpm', rpm)
+        _put(d, layout, 'current_fuel', max(0.0, 100.0 - 0.0004 * i))
+        _put(d, layout, 'fuel_capacity', 100.0)
+        _put(d, layout, 'speed_ms', speed_ms)
+        _put(d, layout, 'boost_raw', 1.0)
+        _put(d, layout, 'oil_pressure', 4.5)
+        _put(d, layout, 'tyre_temp', [80.0 + (i % 7), 81.0, 78.5, 79.0])
+        _put(d, layout, 'package_id', i + 1)
+        _put(d, layout, 'lap_count', lap + 1)
+        _put(d, layout, 'total_laps', 10)
+        _put(d, layout, 'best_laptime', 92345 if lap else -1)
+        _put(d, layout, 'last_laptime', 92345 if lap else -1)
+        _put(d, layout, 'current_laptime', phase * 1000 // PACKET_RATE_HZ)
+        _put(d, layout, 'pre_race_position_raw', -1)
+        _put(d, layout, 'num_cars_pre_race_raw', -1)
+        _put(d, layout, 'rpm_alert_min', 7000)
+        _put(d, layout, 'rpm_alert_max', 8500)
+        _put(d, layout, 'car_max_speed', 300)
+        _put(d, layout, 'flags_raw', 0x0009)
+        _put(d, layout, 'gear_byte', (4 << 4) | (3 + int(speed_ms > 60)))
+        _put(d, layout, 'throttle', int(255 * (0.5 + 0.5 * math.cos(6 * theta))))
+        _put(d, layout, 'brake', int(255 * max(0.0, -math.sin(6 * theta))))
+        _put(d, layout, 'wheel_rps', [speed_ms / 0.33] * 4)
+        _put(d, layout, 'tyre_radius', [0.33] * 4)
+        _put(d, layout, 'susp_height', [0.1, 0.1, 0.11, 0.11])
+        _put(d, layout, 'gear_ratios', [3.2, 2.3, 1.8, 1.4, 1.15, 0.95, 0.0, 0.0])
+        _put(d, layout, 'car_id', 3467)
+        _put(d, layout, 'wheel_rotation', 0.2 * math.sin(6 * theta))
+        _put(d, layout, 'throttle_filtered', int(255 * (0.5 + 0.5 * math.cos(6 * theta))))
+        packets.append(encrypt_packet(bytes(d), xor_value))
+    return packets
+
+
+def _measure(fn, inputs):
+    """fn を inputs の各要素で1回ずつ呼び、(結果リスト, 各呼び出しの ns) を返す"""
+    clock = time.perf_counter_ns
+    outputs = []
+    timings = []
+    for x in inputs:
+        t0 = clock()
+        outputs.append(fn(x))
+        timings.append(clock() - t0)
+    return outputs, timings
+
+
+def _summarize(timings):
+    ordered = sorted(timings)
+    n = len(ordered)
+    total_ns = sum(ordered)
+
+    def pct(p):
+        return ordered[min(n - 1, int(p / 100 * n))] / 1000
+
+    return {
+        "calls": n,
+        "total_s": round(total_ns / 1e9, 6),
+        "pkt_per_s": round(n / (total_ns / 1e9), 1) if total_ns else None,
+        "p50_us": round(pct(50), 2),
+        "p90_us": round(pct(90), 2),
+        "p99_us": round(pct(99), 2),
+        "max_us": round(ordered[-1] / 1000, 2),
+    }
+
+
+def run_variant(n, heartbeat_type, packets=None):
+    """1ハートビート種別について全段を計測し、段名 -> 集計 dict を返す
+
+    packets を渡した場合(キャプチャ)は合成せずにそれを使い、種別は自動判別させる。
+    """
+    if packets is None:
+        packets = build_stream(n, heartbeat_type)
+        decoder = GT7Decoder(heartbeat_type=heartbeat_type)
+    else:
+        decoder = GT7Decoder()
+    estimator = CourseEstimator(os.path.join(ROOT, 'course_database.json'))
+    fuel = FuelTracker()
+
+    decrypted, t_decrypt = _measure(decoder.decrypt, packets)
+    # 復号できなかったもの(キャプチャ中の重複・他機器のデータグラム)は以降の段から除く
+    decrypted = [d for d in decrypted if d]
+    parsed, t_parse = _measure(decoder.parse, decrypted)
+    parsed = [p for p in parsed if p]
+    courses, t_course = _measure(
+        lambda p: estimator.estimate_course(p.get("position_x", 0), p.get("position_z", 0)), parsed)
+    fuels, t_fuel = _measure(
+        lambda p: fuel.update(p.get("current_fuel"), p.get("fuel_capacity", 100), p.get("lap_count", 1)),
+        parsed)
+
+    # 配信直前と同じ形(フレーム時刻・加速度・コース・燃料を付与)にしてから json.dumps
+    anchor_ns = time.time_ns() - time.monotonic_ns()
+    for i, p in enumerate(parsed):
+        p["arrival_ns"] = time.monotonic_ns()
+        p["wall_anchor_ns"] = anchor_ns
+        p["accel_g"] = 0.0
+        p["accel_decel"] = 0.0
+        p["course"] = courses[i]
+        p.update(fuels[i])
+    messages, t_json = _measure(json.dumps, parsed)
+
+    return {
+        "decrypt": _summarize(t_decrypt),
+        "parse": _summarize(t_parse),
+        "estimate_course": _summarize(t_course),
+        "fuel_update": _summarize(t_fuel),
+        "json_dumps": dict(_summarize(t_json), message_bytes=round(sum(map(len, messages)) / len(messages))),
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _print_results(results, baseline=None):
+    for variant, stages in results.items():
+        print(f"heartbeat '{variant}':")
+        total_p50 = 0.0
+        for stage in STAGES:
+            r = stages[stage]
+            total_p50 += r["p50_us"]
+            line = (
+                f"  {stage:16s} {r['pkt_per_s']:>11.0f} pkt/s  p50 {r['p50_us']:7.2f}μs  "
+                f"p90 {r['p90_us']:7.2f}μs  p99 {r['p99_us']:7.2f}μs  max {r['max_us']:8.1f}μs"
+            )
+            base = (baseline or {}).get(variant, {}).get(stage)
+            if base and base.get("p50_us"):
+                line += f"  (p50 x{r['p50_us'] / base['p50_us']:.2f} vs baseline)"
+            print(line)
+        budget_us = 1e6 / PACKET_RATE_HZ
+        print(f"  {'total (p50)':16s} {total_p50:.1f}μs/packet = {100 * total_p50 / budget_us:.2f}% of the {PACKET_RATE_HZ}Hz budget")
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument('--packets', type=int, default=LAP_PACKETS, help='種別ごとのパケット数(既定: 合成1周分)')
+    ap.add_argument('--variants', default='~AB', help='計測するハートビート種別(既定: ~AB)')
+    ap.add_argument('--output', help='結果 JSON の保存先(既定: bench_results/bench_pipeline_<日時>.json)')
+    ap.add_argument('--compare', help='比較対象の過去の結果 JSON(p50 の比を併記)')
+    ap.add_argument('--capture', help='合成走行の代わりに使う生パケットのキャプチャ(.gt7raw)')
+    args = ap.parse_args()
+
+    results = {}
+    if args.capture:
+        packets = [data for _, data, _ in iter_capture(args.capture)][:args.packets]
+        if not packets:
+            ap.error(f"no datagrams in capture: {args.capture}")
+        results["capture"] = run_variant(len(packets), None, packets)
+    for ch in ('' if args.capture else args.variants):
+        if ch.encode() not in PACKET_SIZES:
+            ap.error(f"unknown heartbeat type: {ch!r}")
+        results[ch] = run_variant(args.packets, ch.encode())
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)["results"]
+    _print_results(results, baseline)
+
+    report = {
+        "benchmark": "bench_pipeline",
+        "created_at": datetime.now().isoformat(timespec='seconds'),
+        "git_commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "packets_per_variant": args.packets,
+        "capture": args.capture,
+        "results": results,
+    }
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"bench_pipeline_{datetime.now():%Y%m%d_%H%M%S}.json")
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"saved: {output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
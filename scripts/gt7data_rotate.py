@@ -33,9 +33,9 @@ import shutil
 import sys
 from datetime import datetime, timedelta
 
-# main.py の save_lap_to_file 命名形式と同一(完全一致のみ対象)
+# main.py の LAP_FILE_RE と同一(長時間ラップのセグメント _Seg-{k} を含む。完全一致のみ対象)
 LAP_FILE_RE = re.compile(
-    r'^(\d{4})-(\d{2})-(\d{2})_(\d{2})_(\d{2})_(\d{2})_CAR-(\d+)_Lap-(\d+)\.json$'
+    r'^(\d{4})-(\d{2})-(\d{2})_(\d{2})_(\d{2})_(\d{2})_CAR-(\d+)_Lap-(\d+)(?:_Seg-(\d+))?\.json$'
 )
 
 KEEP_FILENAME = ".rotate_keep"
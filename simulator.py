@@ -0,0 +1,465 @@
+#!/usr/bin/env python3
+"""
+PS5 の代役(負荷試験用のテレメトリ送信シミュレータ)
+
+実機の GT7 と同じように、ハートビート(b'A' / b'B' / b'~')を受け取った相手へ
+そのバリアントの暗号化パケットを送り続ける。復号鍵・XOR 値・パケットレイアウトは
+decoder.py(GT7Decoder / packet_def.json)のものをそのまま使うため、受信側からは
+実機と区別できない。PS5 なしで telemetry.py + main.py の飽和点を実測したり、
+受信経路の性能退行を検出したりするのに使う。
+
+  - 走行データ: 記録済みのラップファイル(gt7data/*.json)を周回させる。
+    指定しなければ楕円コースを一定の速度変化で走る合成ラップを使う。
+  - 送信レート: 60Hz(実機)から数 kHz まで。1パケット = 1サンプルなので、
+    レートを上げるとラップは早回しになる。
+  - 損失・順序入れ替え: 確率で指定。欠番・逆行は受信側の損失内訳に現れる。
+  - 複数台: コンソールごとに別のループバックアドレス(127.0.0.2, 127.0.0.3, ...)で
+    待ち受け、送信元 IP でサーバ側のコンソール振り分け(config.json の consoles)を試せる。
+
+実機と同じく、最後のハートビートから heartbeat_timeout 秒経つと送信を止める。
+データはハートビートの送信元アドレス(サーバの受信ソケット = 33740)へ送る。
+
+API:
+    console = SimulatedConsole(samples, host='127.0.0.2', rate_hz=1000, loss=0.01)
+    await console.start()       # host:33739 でハートビートを待ち受ける
+    ...
+    console.stats()             # 送信・損失・入れ替え件数
+    await console.stop()
+
+usage: python3 simulator.py [--consoles N] [--host 127.0.0.2] [--rate HZ]
+                            [--loss P] [--reorder P] [--lap FILE] [--duration SEC]
+(サーバ側は config.json の consoles に表示されたアドレスを登録して起動する)
+"""
+
+import argparse
+import asyncio
+import ipaddress
+import json
+import logging
+import math
+import random
+import socket
+import struct
+import time
+
+from Crypto.Cipher import Salsa20
+
+from decoder import GT7Decoder
+
+logger = logging.getLogger(__name__)
+
+# ハートビート種別 -> パケットサイズ(packet_def.json のバリアントと同じ)
+PACKET_SIZES = {b'A': 0x128, b'B': 0x13C, b'~': 0x158}
+
+HEARTBEAT_PORT = 33739
+
+# 合成ラップ: 1周 90秒(60Hz)の楕円コース
+SYNTHETIC_LAP_SAMPLES = 90 * 60
+_TRACK_RADIUS_X = 400.0
+_TRACK_RADIUS_Z = 500.0
+
+_IV_OFFSET = 0x40
+
+
+def encrypt_packet(plaintext, xor_value):
+    """GT7Decoder.decrypt の逆変換(0x40-0x43 の IV シードは平文のまま残る)"""
+    oiv = plaintext[_IV_OFFSET:_IV_OFFSET + 4]
+    iv1 = int.from_bytes(oiv, byteorder='little')
+    iv = (iv1 ^ xor_value).to_bytes(4, 'little') + iv1.to_bytes(4, 'little')
+    encrypted = Salsa20.new(GT7Decoder.SALSA20_KEY[:32], iv).encrypt(bytes(plaintext))
+    return encrypted[:_IV_OFFSET] + oiv + encrypted[_IV_OFFSET + 4:]
+
+
+def _quat_mul(a, b):
+    ax, ay, az, aw = a
+    bx, by, bz, bw = b
+    return (
+        aw * bx + ax * bw + ay * bz - az * by,
+        aw * by - ax * bz + ay * bw + az * bx,
+        aw * bz + ax * by - ay * bx + az * bw,
+        aw * bw - ax * bx - ay * by - az * bz,
+    )
+
+
+def _euler_quat(pitch, yaw, roll):
+    """GT7Decoder._quat_euler の逆変換: (pitch, yaw, roll) [rad] -> (x, y, z, w)"""
+    # _quat_euler の roll は右ベクトルの上下成分なので、ピッチ分を補正した回転角に戻す
+    roll = math.asin(max(-1.0, min(1.0, math.sin(roll) / max(1e-9, math.cos(pitch)))))
+    yaw += math.pi  # 前方 = -Z 規約
+    q = (0.0, math.sin(yaw / 2), 0.0, math.cos(yaw / 2))
+    q = _quat_mul(q, (math.sin(pitch / 2), 0.0, 0.0, math.cos(pitch / 2)))
+    return _quat_mul(q, (0.0, 0.0, math.sin(roll / 2), math.cos(roll / 2)))
+
+
+def _raw_fields(sample):
+    """解析結果形式のサンプルから、派生値の元になる生フィールドを復元する"""
+    raw = {}
+    if 'gear' in sample:
+        suggested = sample.get('suggested_gear')
+        raw['gear_byte'] = ((15 if suggested is None else suggested) << 4) | (sample['gear'] & 0x0F)
+    if 'boost' in sample:
+        raw['boost_raw'] = sample['boost'] + 1
+    if 'max_rpm' in sample:
+        raw['rpm_alert_max'] = sample['max_rpm']
+    for key in ('pre_race_position', 'num_cars_pre_race'):
+        if key in sample:
+            raw[key + '_raw'] = -1 if sample[key] is None else sample[key]
+    flags = sample.get('flags')
+    if isinstance(flags, dict):
+        raw['flags_raw'] = sum(mask for name, mask in GT7Decoder.FLAG_BITS if flags.get(name))
+    for key in ('throttle_filtered', 'brake_filtered'):
+        pct = sample.get(key + '_pct')
+        if pct is not None:
+            raw[key] = round(pct * GT7Decoder.PEDAL_PCT_DIVISOR)
+    if 'rotation_yaw' in sample:
+        quat = _euler_quat(
+            sample.get('rotation_pitch') or 0.0, sample['rotation_yaw'], sample.get('rotation_roll') or 0.0
+        )
+        raw.update(zip(('quat_x', 'quat_y', 'quat_z', 'quat_w'), quat))
+    return raw
+
+
+def encode_sample(sample, size):
+    """解析結果形式のサンプル(ラップファイルの1行)を平文パケット(bytearray)にする
+
+    packet_def.json のレイアウトに従って書き込む。サンプルに無いフィールドは 0 のまま。
+    """
+    layout = GT7Decoder._layout_for(size)
+    buf = bytearray(size)
+    struct.pack_into('<I', buf, 0, GT7Decoder.MAGIC_G7S0)
+    raw = _raw_fields(sample)
+    for name, (offset, code, count) in layout.fields.items():
+        value = raw.get(name, sample.get(name))
+        if value is None:
+            continue
+        cast = float if code in 'fd' else int
+        try:
+            if count > 1:
+                struct.pack_into(f'<{count}{code}', buf, offset, *(cast(v) for v in value[:count]))
+            else:
+                struct.pack_into(f'<{code}', buf, offset, cast(value))
+        except (struct.error, TypeError, ValueError):
+            continue  # 範囲外・型違いの値は 0 のまま(記録側の欠損と同じ扱い)
+    return buf
+
+
+def synthetic_lap(n=SYNTHETIC_LAP_SAMPLES):
+    """楕円コースを走る1周分のサンプル(解析結果形式の dict)を n 件生成する"""
+    samples = []
+    for i in range(n):
+        theta = 2 * math.pi * i / n
+        # 直線と低速コーナーを繰り返す速度変化(約 90〜270 km/h)
+        speed_ms = 50.0 + 25.0 * math.cos(6 * theta)
+        pedal = 0.5 + 0.5 * math.cos(6 * theta)
+        samples.append({
+            'position_x': _TRACK_RADIUS_X * math.cos(theta),
+            'position_y': 12.0 + math.sin(3 * theta),
+            'position_z': _TRACK_RADIUS_Z * math.sin(theta),
+            'velocity_x': -speed_ms * math.sin(theta),
+            'velocity_z': speed_ms * math.cos(theta),
+            'rotation_pitch': 0.0,
+            'rotation_yaw': math.atan2(math.sin(theta), -math.cos(theta)),  # 進行方向(前方 = -Z 規約)
+            'rotation_roll': 0.0,
+            'body_height': 0.08,
+            'speed_ms': speed_ms,
+            'rpm': 4000.0 + 3000.0 * (0.5 + 0.5 * math.sin(12 * theta)),
+            'max_rpm': 8500,
+            'rpm_alert_min': 7000,
+            'gear': 3 + int(speed_ms > 60),
+            'suggested_gear': 4,
+            'throttle': int(255 * pedal),
+            'brake': int(255 * max(0.0, -math.sin(6 * theta))),
+            'throttle_filtered_pct': 100 * pedal,
+            'current_fuel': 100.0 - 2.5 * i / n,
+            'fuel_capacity': 100.0,
+            'boost': 0.0,
+            'oil_pressure': 4.5,
+            'tyre_temp': [80.0 + (i % 7), 81.0, 78.5, 79.0],
+            'wheel_rps': [speed_ms / 0.33] * 4,
+            'tyre_radius': [0.33] * 4,
+            'susp_height': [0.1, 0.1, 0.11, 0.11],
+            'gear_ratios': [3.2, 2.3, 1.8, 1.4, 1.15, 0.95, 0.0, 0.0],
+            'car_max_speed': 300,
+            'car_id': 3467,
+            'total_laps': 0,
+            'current_laptime': i * 90000 // n,
+            'pre_race_position': None,
+            'num_cars_pre_race': None,
+            'flags': {'car_on_track': True, 'in_gear': True, 'has_turbo': True},
+            'wheel_rotation': 0.2 * math.sin(6 * theta),
+        })
+    return samples
+
+
+def load_lap(path):
+    """記録済みラップファイル(JSON のサンプル配列)を読み、1周分のサンプルを返す
+
+    ラップファイルは境界のパケット(次周の lap_count)を末尾に含むため、
+    先頭と lap_count が異なるサンプルは除く。
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        samples = json.load(f)
+    if not isinstance(samples, list) or not samples:
+        raise ValueError(f"no samples in lap file: {path}")
+    lap = samples[0].get('lap_count')
+    samples = [s for s in samples if s.get('lap_count') == lap]
+    return samples
+
+
+class SimulatedConsole:
+    """ハートビートに応答してテレメトリを送る PS5 1台分。
+
+    host:heartbeat_port の UDP ソケットでハートビートを受け、同じソケットから
+    ハートビートの送信元へ送る。送信はイベントループ上のタスクで、
+    rate_hz の予定時刻に遅れた分はまとめて送る(1回あたり BURST_MAX 件まで)。
+    """
+
+    BURST_MAX = 256
+    # 予定からこれ以上遅れたら追いつくのをやめて予定を今へ合わせる(件数)
+    MAX_BACKLOG = 4096
+
+    def __init__(self, samples, host='127.0.0.1', heartbeat_port=HEARTBEAT_PORT, rate_hz=60.0,
+                 loss=0.0, reorder=0.0, heartbeat_timeout=30.0, start_index=0, seed=None):
+        if not samples:
+            raise ValueError("samples must not be empty")
+        self.samples = samples
+        self.host = host
+        self.heartbeat_port = heartbeat_port
+        self.rate_hz = rate_hz
+        self.loss = loss
+        self.reorder = reorder
+        self.heartbeat_timeout = heartbeat_timeout
+        self.heartbeat_type = None
+        self.target = None
+        self.package_id = 0
+        self.heartbeats = 0
+        self.sent = 0
+        self.lost = 0
+        self.reordered = 0
+        self.send_errors = 0
+        self._index = start_index % len(samples)
+        self._lap = 1
+        self._lap_time_ms = self._lap_duration_ms(samples)
+        self._templates = {}
+        self._held = None
+        self._rng = random.Random(seed)
+        self._last_heartbeat = None
+        self._sock = None
+        self._loop = None
+        self._task = None
+        self._active = None
+
+    @staticmethod
+    def _lap_duration_ms(samples):
+        last = samples[-1].get('current_laptime')
+        if isinstance(last, (int, float)) and last > 0:
+            return int(last)
+        return len(samples) * 1000 // 60
+
+    @property
+    def port(self):
+        """実際に待ち受けているポート(heartbeat_port=0 の場合に使う)"""
+        return self._sock.getsockname()[1] if self._sock else None
+
+    @property
+    def streaming(self):
+        return self._active is not None and self._active.is_set()
+
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._active = asyncio.Event()
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            sock.setblocking(False)
+            sock.bind((self.host, self.heartbeat_port))
+        except OSError:
+            sock.close()
+            raise
+        self._sock = sock
+        self._loop.add_reader(sock.fileno(), self._on_heartbeat)
+        self._task = self._loop.create_task(self._stream_loop())
+        logger.info(f"Simulated console listening {self.host}:{self.port} ({self.rate_hz:g} Hz)")
+
+    def _on_heartbeat(self):
+        while True:
+            try:
+                data, addr = self._sock.recvfrom(64)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError as e:
+                logger.debug(f"Heartbeat recvfrom error: {e}")
+                return
+            hb = data[:1]
+            if hb not in PACKET_SIZES:
+                continue
+            if hb != self.heartbeat_type or addr != self.target:
+                logger.info(f"Heartbeat {hb!r} from {addr[0]}:{addr[1]} ({self.host})")
+            self.heartbeat_type = hb
+            self.target = addr
+            self.heartbeats += 1
+            self._last_heartbeat = time.monotonic()
+            self._active.set()
+
+    def _template(self, index):
+        templates = self._templates.get(self.heartbeat_type)
+        if templates is None:
+            size = PACKET_SIZES[self.heartbeat_type]
+            templates = self._templates[self.heartbeat_type] = [
+                bytes(encode_sample(s, size)) for s in self.samples
+            ]
+        return templates[index]
+
+    def _next_plaintext(self):
+        """次の1サンプル分の平文パケットを作る(package_id・周回は送信側で進める)"""
+        layout = GT7Decoder._layout_for(PACKET_SIZES[self.heartbeat_type])
+        buf = bytearray(self._template(self._index))
+        self.package_id += 1
+        struct.pack_into('<I', buf, _IV_OFFSET, (self.package_id * 2654435761) & 0xFFFFFFFF)
+        struct.pack_into('<i', buf, layout.fields['package_id'][0], self.package_id)
+        struct.pack_into('<h', buf, layout.fields['lap_count'][0], self._lap)
+        if self._lap > 1:
+            struct.pack_into('<i', buf, layout.fields['last_laptime'][0], self._lap_time_ms)
+            struct.pack_into('<i', buf, layout.fields['best_laptime'][0], self._lap_time_ms)
+        self._index += 1
+        if self._index == len(self.samples):
+            self._index = 0
+            self._lap += 1
+        return buf
+
+    def next_datagrams(self, n):
+        """n サンプル分を進め、損失・入れ替えを適用した送信データグラムのリストを返す"""
+        xor_value = GT7Decoder.XOR_MAP[self.heartbeat_type]
+        out = []
+        for _ in range(n):
+            plaintext = self._next_plaintext()
+            if self.loss and self._rng.random() < self.loss:
+                self.lost += 1
+                continue
+            packet = encrypt_packet(plaintext, xor_value)
+            if self._held is None and self.reorder and self._rng.random() < self.reorder:
+                self._held = packet  # 次のパケットの後ろへ回す
+                continue
+            out.append(packet)
+            if self._held is not None:
+                out.append(self._held)
+                self._held = None
+                self.reordered += 1
+        return out
+
+    def _send(self, datagrams):
+        for data in datagrams:
+            try:
+                self._sock.sendto(data, self.target)
+                self.sent += 1
+            except (BlockingIOError, InterruptedError):
+                self.send_errors += 1  # 送信バッファ満杯: 実機の取りこぼしと同じく捨てる
+            except OSError as e:
+                self.send_errors += 1
+                logger.debug(f"sendto {self.target} failed: {e}")
+
+    async def _stream_loop(self):
+        interval = 1.0 / self.rate_hz
+        while True:
+            await self._active.wait()
+            next_due = time.monotonic()
+            while True:
+                now = time.monotonic()
+                if now - self._last_heartbeat > self.heartbeat_timeout:
+                    logger.info(f"Heartbeat timeout ({self.host}): stop streaming")
+                    self._active.clear()
+                    break
+                due = int((now - next_due) / interval) + 1 if now >= next_due else 0
+                if due > self.MAX_BACKLOG:
+                    logger.warning(f"Simulated console {self.host} fell {due} packets behind; resyncing")
+                    next_due = now
+                    due = 1
+                n = min(due, self.BURST_MAX)
+                if n:
+                    self._send(self.next_datagrams(n))
+                    next_due += n * interval
+                await asyncio.sleep(max(0.0, next_due - time.monotonic()))
+
+    def stats(self):
+        return {
+            "host": self.host,
+            "heartbeat_type": self.heartbeat_type.decode() if self.heartbeat_type else None,
+            "streaming": self.streaming,
+            "heartbeats": self.heartbeats,
+            "package_id": self.package_id,
+            "sent": self.sent,
+            "lost": self.lost,
+            "reordered": self.reordered,
+            "send_errors": self.send_errors,
+            "lap": self._lap,
+        }
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._sock is not None:
+            self._loop.remove_reader(self._sock.fileno())
+            self._sock.close()
+            self._sock = None
+
+
+async def _run(args):
+    samples = load_lap(args.lap) if args.lap else synthetic_lap()
+    base = ipaddress.IPv4Address(args.host)
+    consoles = [
+        SimulatedConsole(
+            samples, host=str(base + i), heartbeat_port=args.heartbeat_port, rate_hz=args.rate,
+            loss=args.loss, reorder=args.reorder, heartbeat_timeout=args.heartbeat_timeout,
+            start_index=i * len(samples) // args.consoles,
+        )
+        for i in range(args.consoles)
+    ]
+    for console in consoles:
+        await console.start()
+    print('config.json: "consoles": ' + json.dumps(
+        [{"id": f"sim{i + 1}", "ip": c.host} for i, c in enumerate(consoles)]
+    ))
+    started = time.monotonic()
+    try:
+        while args.duration is None or time.monotonic() - started < args.duration:
+            await asyncio.sleep(args.report_interval)
+            for c in consoles:
+                s = c.stats()
+                print(f"{s['host']}: hb={s['heartbeat_type'] or '-'} sent={s['sent']} lost={s['lost']} "
+                      f"reordered={s['reordered']} send_errors={s['send_errors']} lap={s['lap']}")
+    finally:
+        for console in consoles:
+            await console.stop()
+
+
+def main():
+    ap = argparse.ArgumentParser(description="PS5 stand-in: answer GT7 heartbeats with encrypted telemetry")
+    ap.add_argument('--consoles', type=int, default=1, help='模擬する台数(既定: 1)')
+    ap.add_argument('--host', default='127.0.0.2', help='1台目の待ち受けアドレス(2台目以降は +1 ずつ)')
+    ap.add_argument('--heartbeat-port', type=int, default=HEARTBEAT_PORT)
+    ap.add_argument('--rate', type=float, default=60.0, help='1台あたりの送信レート Hz(既定: 60)')
+    ap.add_argument('--loss', type=float, default=0.0, help='送信しない確率(0〜1)')
+    ap.add_argument('--reorder', type=float, default=0.0, help='次のパケットと順序を入れ替える確率(0〜1)')
+    ap.add_argument('--lap', help='周回させる記録済みラップファイル(既定: 合成ラップ)')
+    ap.add_argument('--heartbeat-timeout', type=float, default=30.0,
+                    help='最後のハートビートから送信を止めるまでの秒数')
+    ap.add_argument('--duration', type=float, help='実行秒数(既定: Ctrl+C まで)')
+    ap.add_argument('--report-interval', type=float, default=5.0)
+    args = ap.parse_args()
+    if args.consoles < 1 or args.rate <= 0:
+        ap.error("--consoles and --rate must be positive")
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    try:
+        asyncio.run(_run(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -51,8 +51,8 @@ const analysisState = {
     lastX: null, lastZ: null,    // 直前位置(距離弦長用)
     // ラップ内経過クロック[s](#128是正)。current_laptime(0x80)は実際には
     // ゲーム内時刻進行でありラップ経過時間ではない(#127診断で確定)ため、
-    // 受信 timestamp のクランプ付き累積で自前計時する(P1-3 REVIEW実証方式)。
-    // TEST MODE合成フレームは timestamp を持たないため current_laptime 差分に
+    // 受信時刻(arrival_ns / 旧 timestamp)のクランプ付き累積で自前計時する(P1-3 REVIEW実証方式)。
+    // TEST MODE合成フレームは受信時刻を持たないため current_laptime 差分に
     // フォールバックする(デモは正しいラップ内msを合成する。test-mode.js:435)。
     lapClockS: 0,                // 現在ラップの経過秒
     _clockPrevTsMs: null,        // 直前サンプルの受信時刻[ms](ライブ経路)
@@ -300,8 +300,8 @@ function analysisOnFrame(data) {
 
 /**
  * ラップ内経過クロックを更新する(#128是正)。
- * dt のソースは受信 timestamp(ライブ経路。main.py:258 が必ず付与)を優先し、
- * timestamp が無いフレーム(TEST MODE合成)のみ current_laptime 差分に
+ * dt のソースは受信時刻(ライブ経路。main.py が arrival_ns を必ず付与。frameTimeMs)を優先し、
+ * 受信時刻が無いフレーム(TEST MODE合成)のみ current_laptime 差分に
  * フォールバックする(デモは正しいラップ内msを合成する)。
  * dt >= LAP_CLOCK_GAP_S は記録中断(タブ非活性・メニュー等)、paused フレームは
  * ゲーム内一時停止として、いずれも加算しない(真のラップタイマーの挙動)。
@@ -309,14 +309,12 @@ function analysisOnFrame(data) {
  */
 function updateLapClock(data) {
     let dt = 0;
-    if (data.timestamp) {
-        const ts = Date.parse(data.timestamp);
-        if (!isNaN(ts)) {
-            if (analysisState._clockPrevTsMs != null) {
-                dt = (ts - analysisState._clockPrevTsMs) / 1000;
-            }
-            analysisState._clockPrevTsMs = ts;
+    const ts = frameTimeMs(data);
+    if (!isNaN(ts)) {
+        if (analysisState._clockPrevTsMs != null) {
+            dt = (ts - analysisState._clockPrevTsMs) / 1000;
         }
+        analysisState._clockPrevTsMs = ts;
     } else if (data.current_laptime != null) {
         if (analysisState._clockPrevCltMs != null) {
             dt = (data.current_laptime - analysisState._clockPrevCltMs) / 1000;
@@ -2,81 +2,36 @@
 GT7 テレメトリクライアント（非同期版）
 
 PS5/PS4 からの UDP テレメトリパケットを asyncio ベースで受信する。
-従来の同期ソケット + ブロッキング recvfrom() + asyncio.sleep ポーリング構成を
-asyncio.DatagramProtocol に置き換え、イベントループを阻塞せずに
-パケット到着時のみ処理を起動できるようにした。
+ノンブロッキングソケットをイベントループの reader に登録し、読み出し可能に
+なった1回の起床でカーネルの受信バッファに溜まった分をまとめて吸い出す。
+イベントループを阻塞せず、パケット到着時のみ処理を起動する。
 
 API（main.py からの使用順序）:
     client = GT7TelemetryClient(ip, ...)
     await client.connect()        # UDP エンドポイント作成
     await client.send_heartbeat() # ハートビート送信
     data = await client.receive() # パケット受信（到着まで await）
+    data, addr = await client.receive_from()  # 送信元アドレス付き
+    batch = await client.receive_batch(64)    # 溜まっている分をまとめて [(data, addr), ...]
+    batch = await client.receive_batch(64, with_arrival=True)  # [(data, addr, arrival_ns), ...]
     client.close()
+
+arrival_ns は読み出しコールバック(_on_readable)で取った time.monotonic_ns。記録フレームの
+時刻(main.py の arrival_ns)はこの値で、キューでの待ち時間や処理の遅れに左右されない。
+
+capture_path を渡すと、受信した暗号化データグラムを到着時刻付きでキャプチャファイルへ
+追記する(capture.py。再生は capture.ReplayTelemetryClient)。
 """
 
 import asyncio
 import logging
+import socket
 import time
 
-logger = logging.getLogger(__name__)
-
-
-class _TelemetryProtocol(asyncio.DatagramProtocol):
-    """UDP パケットを受信してキューに積むプロトコル。
-
-    受信コールバックはイベントループ上で呼ばれるため、ロック不要の
-    asyncio.Queue にパケットを蓄積する。main.py 側は await receive() で取り出す。
-    """
-
-    # キュー溢れ警告のログ間引き間隔（秒）。この間隔に1回だけ累積ドロップ数を出す。
-    _DROP_LOG_INTERVAL_SEC = 60.0
-
-    def __init__(self, queue: asyncio.Queue, on_first_packet):
-        self._queue = queue
-        self._on_first_packet = on_first_packet
-        self.transport = None
-        # キュー溢れの監視用カウンタ（ログ洪水を防ぐため間引いて出力）
-        self._dropped_since_log = 0
-        self._last_drop_log = 0.0
+from capture import CaptureWriter
+from channel import CoalescingChannel
 
-    def connection_made(self, transport):  # noqa: D401 - asyncio API 実装
-        self.transport = transport
-        sockname = transport.get_extra_info('sockname')
-        logger.info(f"UDP listener bound to {sockname}")
-
-    def datagram_received(self, data, addr):  # noqa: D401 - asyncio API 実装
-        # キューが溢れる場合は古いパケットから破棄（テレメトリは過去値より最新値優先）
-        dropped = False
-        if self._queue.full():
-            try:
-                self._queue.get_nowait()
-                dropped = True
-            except asyncio.QueueEmpty:
-                pass
-        try:
-            self._queue.put_nowait((data, addr))
-        except asyncio.QueueFull:
-            # 満杯ならこの1パケットを捨てる（受信レート>>消費レート時の安全装置）
-            dropped = True
-
-        # 溢れが起きている場合は間引いて警告（1分に1回・累積ドロップ数を通知）
-        # → 「テレメトリが遅い/飛ぶ」不具合の原因診断を可能にする
-        if dropped:
-            self._dropped_since_log += 1
-            now = time.monotonic()
-            if now - self._last_drop_log >= self._DROP_LOG_INTERVAL_SEC:
-                logger.warning(
-                    f"Telemetry queue overflow: dropped {self._dropped_since_log} packet(s) "
-                    f"in the last interval (queue max={self._queue.maxsize}). "
-                    f"Consumer is slower than producer."
-                )
-                self._dropped_since_log = 0
-                self._last_drop_log = now
-
-        self._on_first_packet(data, addr)
-
-    def error_received(self, exc):  # noqa: D401 - asyncio API 実装
-        logger.error(f"UDP receive error: {exc}")
+logger = logging.getLogger(__name__)
 
 
 class GT7TelemetryClient:
@@ -87,70 +42,178 @@ class GT7TelemetryClient:
       - send_heartbeat() は async def
       - 追加: await connect() でエンドポイント作成（旧: __init__ 内で即 bind）
       - settimeout は廃止（非同期待機で不要）
+      - 追加: receive_batch(max_n) で溜まっているパケットを1回の await でまとめて取得
+      - 追加: receive_batch(max_n, with_arrival=True) で到着時刻(monotonic ns)付きで取得
     """
 
     # 受信キュー上限。過剰に溜め込まない安全装置。
     QUEUE_MAXSIZE = 256
 
+    # 1回の起床でソケットから読み出す上限。これを超えて溜まっている分は次の起床で読む
+    # (大量のバックログを吸い出す間に他のタスクを長く待たせないため)。
+    READ_BURST_MAX = 256
+
+    # recvfrom のバッファ長。最大バリアント(0x158 = 344 bytes)に余裕を持たせる。
+    RECV_BUFSIZE = 2048
+
+    # キュー溢れ警告のログ間引き間隔（秒）。この間隔に1回だけ累積ドロップ数を出す。
+    _DROP_LOG_INTERVAL_SEC = 60.0
+
     # UDP 受信ソケットのバインド先ホスト（全インターフェースで待ち受け）。
     BIND_HOST = '0.0.0.0'
 
     def __init__(self, ip, send_port=33739, receive_port=33740,
-                 heartbeat_interval=10, heartbeat_type=b'~'):
-        self.ip = ip
+                 heartbeat_interval=10, heartbeat_type=b'~', rcvbuf=None, capture_path=None):
+        # ip は1台分の文字列、または複数台(マルチコンソール受信)の IP のリスト。
+        # 受信ソケットは1本のまま、ハートビートだけを全台へ送る。
+        self.ips = [ip] if isinstance(ip, str) else list(ip)
+        self.ip = self.ips[0]
         self.send_port = send_port
         self.receive_port = receive_port
         self.heartbeat_interval = heartbeat_interval
         self.heartbeat_type = heartbeat_type
-        # 最終ハートビート送信時刻（記録専用・間隔制御は _heartbeat_loop 側が担う）。
+        # 受信ソケットの SO_RCVBUF 要求値(None ならカーネル既定)と実効値(connect 後)
+        self.rcvbuf = rcvbuf
+        self.rcvbuf_bytes = None
+        # 受信ヘルス(health.ReceiveHealth)。設定されていればデータグラムごとに到着を記録する
+        self.health = None
+        # 遅延トレース(latency.LatencyTracer)。設定されていれば到着時刻で抜き取りトレースを開始する
+        self.tracer = None
+        # 生パケットのキャプチャ先(None なら記録しない)。connect() で開き close() で閉じる
+        self.capture_path = capture_path
+        self._capture = None
+        # 最終ハートビート送信時刻（記録専用・間隔制御は heartbeat_loop 側が担う）。
         # デバッグ/観測用に残しており、送信経路の健全性確認等で参照する用途。
         self.last_heartbeat = 0.0
         self.packets_received = 0
 
-        # 非同期受信キュー。connect() 時にイベントループが確定してから生成する。
+        # 受信済み・未消費のパケット (data, addr, arrival_ns) のリング。満杯時は最古から破棄する
+        # (テレメトリは過去値より最新値優先)。connect() 時に生成する。
         self._queue = None
-        self._transport = None
+        self._sock = None
+        self._loop = None
         self._connected = False
+        # キュー溢れの監視用カウンタ（ログ洪水を防ぐため間引いて出力）
+        self.dropped_count = 0
+        self._dropped_since_log = 0
+        self._last_drop_log = 0.0
 
     async def connect(self):
-        """UDP エンドポイントを作成し、受信を開始する。
+        """UDP ソケットを作成し、受信を開始する。
 
-        旧実装の __init__ 内 bind に相当。イベントループ上で動作するため、
-        プロトコル/トランスポートの生成は __init__ ではなくここで行う。
+        旧実装の __init__ 内 bind に相当。reader の登録先イベントループを確定させるため、
+        ソケットの生成は __init__ ではなくここで行う。
         """
-        loop = asyncio.get_running_loop()
-        self._queue = asyncio.Queue(maxsize=self.QUEUE_MAXSIZE)
-
-        def _on_first_packet(data, addr):
-            if self.packets_received == 0:
-                logger.info(f"Started receiving data: {len(data)} bytes from {addr}")
-
-        transport, protocol = await loop.create_datagram_endpoint(
-            lambda: _TelemetryProtocol(self._queue, _on_first_packet),
-            local_addr=(self.BIND_HOST, self.receive_port),
-        )
-        self._transport = transport
+        self._loop = asyncio.get_running_loop()
+        self._queue = CoalescingChannel(ring_size=self.QUEUE_MAXSIZE)
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            sock.setblocking(False)
+            if self.rcvbuf:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.rcvbuf)
+            sock.bind((self.BIND_HOST, self.receive_port))
+        except OSError:
+            sock.close()
+            raise
+        self._sock = sock
+        # Linux は要求値の2倍(管理領域込み)を返し、上限は net.core.rmem_max で頭打ちになる
+        self.rcvbuf_bytes = sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)
+        if self.rcvbuf and self.rcvbuf_bytes < self.rcvbuf:
+            logger.warning(
+                f"SO_RCVBUF capped at {self.rcvbuf_bytes} bytes (requested {self.rcvbuf}); "
+                f"raise net.core.rmem_max to allow a larger receive buffer"
+            )
+        if self.capture_path:
+            self._capture = CaptureWriter(self.capture_path)
+            logger.info(f"Capturing raw datagrams to {self.capture_path}")
+        self._loop.add_reader(sock.fileno(), self._on_readable)
         self._connected = True
+        logger.info(f"UDP listener bound to {sock.getsockname()} (SO_RCVBUF={self.rcvbuf_bytes})")
         logger.info(
             f"GT7TelemetryClient ready: listening {self.BIND_HOST}:{self.receive_port}, "
-            f"heartbeat -> {self.ip}:{self.send_port}"
+            f"heartbeat -> {', '.join(self.ips)}:{self.send_port}"
         )
 
+    @property
+    def queue_depth(self):
+        """受信済み・未消費のパケット数"""
+        return len(self._queue) if self._queue is not None else 0
+
+    def _on_readable(self):
+        """ソケットが読み出し可能になったとき、溜まっているデータグラムをまとめて吸い出す。
+
+        受信のたびにコールバック・キュー操作・待機タスクの起床が走る
+        DatagramProtocol 構成と違い、起床1回あたりの処理が1バッチ分で済む。
+        """
+        sock = self._sock
+        health = self.health
+        capture = self._capture
+        tracer = self.tracer
+        received = []
+        while len(received) < self.READ_BURST_MAX:
+            try:
+                data, addr = sock.recvfrom(self.RECV_BUFSIZE)
+            except (BlockingIOError, InterruptedError):
+                break
+            except OSError as e:
+                # ICMP 到達不能の通知等。ソケット自体は使い続けられる
+                logger.error(f"UDP receive error: {e}")
+                break
+            # 到着時刻は常に取る(記録フレームの時刻になる。1回数十 ns)
+            arrival_ns = time.monotonic_ns()
+            if health is not None:
+                health.record_arrival(addr, arrival_ns)
+            if capture is not None:
+                capture.write(data, addr, arrival_ns)
+            if tracer is not None:
+                tracer.on_arrival(data, arrival_ns)
+            received.append((data, addr, arrival_ns))
+        if not received:
+            return
+
+        if self._queue.seq == 0:
+            data, addr, _ = received[0]
+            logger.info(f"Started receiving data: {len(data)} bytes from {addr}")
+
+        # キューが溢れる場合は古いパケットから破棄（テレメトリは過去値より最新値優先）
+        evicted = self._queue.extend(received)
+        if evicted:
+            self._count_dropped(evicted)
+            if health is not None:
+                health.count_loss("queue_overflow", evicted)
+
+    def _count_dropped(self, count):
+        # 溢れが起きている場合は間引いて警告（1分に1回・累積ドロップ数を通知）
+        # → 「テレメトリが遅い/飛ぶ」不具合の原因診断を可能にする
+        self.dropped_count += count
+        self._dropped_since_log += count
+        now = time.monotonic()
+        if now - self._last_drop_log >= self._DROP_LOG_INTERVAL_SEC:
+            logger.warning(
+                f"Telemetry queue overflow: dropped {self._dropped_since_log} packet(s) "
+                f"in the last interval (queue max={self.QUEUE_MAXSIZE}). "
+                f"Consumer is slower than producer."
+            )
+            self._dropped_since_log = 0
+            self._last_drop_log = now
+
     async def send_heartbeat(self):
         """PS5 にウェイクアップパケットを1つ送信する。
 
-        間隔制御は呼び出し側（main.py の _heartbeat_loop が asyncio.sleep で制御）に
+        間隔制御は呼び出し側（heartbeat_loop が asyncio.sleep で制御）に
         一元化しており、本メソッドは呼ばれるたびに無条件で1パケット送信する。
         二重の間隔チェックによる送信漏れを避けるため、ここでは時間判定しない。
         """
-        if not self._connected or self._transport is None:
+        if not self._connected or self._sock is None:
             return
 
         try:
-            self._transport.sendto(self.heartbeat_type, (self.ip, self.send_port))
+            for ip in self.ips:
+                self._sock.sendto(self.heartbeat_type, (ip, self.send_port))
             self.last_heartbeat = time.monotonic()
             if self.packets_received == 0:
-                logger.info(f"Heartbeat sent to {self.ip}:{self.send_port} - waiting for data...")
+                targets = ", ".join(f"{ip}:{self.send_port}" for ip in self.ips)
+                logger.info(f"Heartbeat sent to {targets} - waiting for data...")
             else:
                 logger.debug(f"Heartbeat sent. {self.packets_received} packets received so far")
         except Exception as e:
@@ -166,18 +229,72 @@ class GT7TelemetryClient:
         注意: asyncio.CancelledError は握りつぶさず re-raise する。
         呼び出し元のタスクがキャンセルされた場合は正しく終了できるようにするため。
         """
-        if not self._connected or self._queue is None:
-            return None
-        data, _addr = await self._queue.get()
-        self.packets_received += 1
-        return data
+        packet = await self.receive_from()
+        return packet[0] if packet else None
+
+    async def receive_from(self):
+        """receive() と同じく1パケットを待ち、(data, addr) を返す。
+
+        送信元アドレスを使う呼び出し側(GT7Decoder.decrypt の送信元別 XOR キャッシュ等)用。
+        未接続時は None。
+        """
+        batch = await self.receive_batch(1)
+        return batch[0] if batch else None
+
+    async def receive_batch(self, max_n=QUEUE_MAXSIZE, with_arrival=False):
+        """受信済みのパケットを最大 max_n 件まとめて [(data, addr), ...] で返す。
+
+        1件も無ければ到着まで待機する。バックログがある場合は1回の await で
+        まとめて取り出せるため、呼び出し側はタイトなループで処理できる。
+        with_arrival=True なら [(data, addr, arrival_ns), ...](到着時刻は monotonic ns)。
+        未接続時は空リスト。
+        """
+        if not self._connected:
+            return []
+        batch = await self._queue.get_batch(max_n)
+        self.packets_received += len(batch)
+        if with_arrival:
+            return batch
+        return [(data, addr) for data, addr, _ in batch]
 
     def close(self):
-        """トランスポートを閉じる"""
-        if self._transport is not None:
+        """ソケットを閉じる"""
+        if self._sock is not None:
             try:
-                self._transport.close()
+                self._loop.remove_reader(self._sock.fileno())
+            except (RuntimeError, ValueError, OSError):
+                pass  # イベントループが既に閉じている
+            try:
+                self._sock.close()
             except Exception as e:
-                logger.warning(f"Error closing transport: {e}")
+                logger.warning(f"Error closing socket: {e}")
+            self._sock = None
+        if self._capture is not None:
+            self._capture.close()
+            logger.info(f"Capture closed: {self._capture.records} datagrams in {self.capture_path}")
+            self._capture = None
         self._connected = False
+        if self._queue is not None:
+            self._queue.close()  # 待機中の receive_batch() を起こして終了させる
         logger.info("Telemetry client closed")
+
+
+async def heartbeat_loop(client):
+    """ハートビート送信を独立周期で回すタスク。
+
+    受信ループから分離することで、パケット未着時でも定期送信を維持し、
+    かつ受信処理がハートビート間隔に引きずられないようにする。
+    """
+    interval = client.heartbeat_interval
+    # try は while の内側に置く: 想定外例外でこのループ自体が死ぬと GT7 が
+    # テレメトリ送信を止め、恒久的なサイレント停止になるため、
+    # 例外はログして interval 秒後に再試行し続ける（CancelledError のみ終了）。
+    while True:
+        try:
+            await client.send_heartbeat()
+            await asyncio.sleep(interval)
+        except asyncio.CancelledError:
+            break
+        except Exception as e:
+            logger.error(f"Heartbeat loop error: {e}; retrying in {interval}s", exc_info=True)
+            await asyncio.sleep(interval)
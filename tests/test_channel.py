@@ -0,0 +1,90 @@
+"""
+合体チャンネル(channel.py の CoalescingChannel)の回帰テスト
+
+全フレーム用リングの上限と最古破棄の件数、最新スロットの読み飛ばし件数、
+消費側がどれだけ遅れても次に読むのが最新の1件であることを検証する。
+
+実行:
+    pytest tests/ -v
+"""
+
+import asyncio
+
+from channel import CoalescingChannel
+
+
+class TestRing:
+
+    def test_batch_in_order(self):
+        async def scenario():
+            ch = CoalescingChannel(ring_size=8)
+            ch.extend(range(5))
+            return await ch.get_batch(3), await ch.get_batch(10)
+
+        assert asyncio.run(scenario()) == ([0, 1, 2], [3, 4])
+
+    def test_overflow_drops_oldest_and_counts_exactly(self):
+        async def scenario():
+            ch = CoalescingChannel(ring_size=4)
+            evicted = [ch.publish(i) for i in range(6)]
+            evicted.append(ch.extend(range(6, 13)))
+            return evicted, ch.dropped, await ch.get_batch(100)
+
+        evicted, dropped, batch = asyncio.run(scenario())
+        assert evicted == [0, 0, 0, 0, 1, 1, 7]
+        assert dropped == 9
+        assert batch == [9, 10, 11, 12]
+
+    def test_waits_for_publish(self):
+        async def scenario():
+            ch = CoalescingChannel(ring_size=4)
+            reader = asyncio.create_task(ch.get_batch(4))
+            await asyncio.sleep(0)
+            ch.publish("x")
+            return await asyncio.wait_for(reader, 1)
+
+        assert asyncio.run(scenario()) == ["x"]
+
+    def test_latest_only_channel_keeps_no_ring(self):
+        ch = CoalescingChannel()
+        ch.extend(range(1000))
+        assert len(ch) == 0 and ch.dropped == 0 and ch.latest == 999
+
+
+class TestLatest:
+
+    def test_slow_reader_always_gets_newest_and_counts_skipped(self):
+        async def scenario():
+            ch = CoalescingChannel()
+            seen = []
+            seq = 0
+            for burst in (1, 50, 3):
+                ch.extend(range(ch.seq, ch.seq + burst))
+                seq, item = await ch.get_latest(seq)
+                seen.append((seq, item))
+            return seen, ch.coalesced
+
+        seen, coalesced = asyncio.run(scenario())
+        assert seen == [(1, 0), (51, 50), (54, 53)]
+        assert coalesced == 49 + 2
+
+    def test_ring_and_latest_readers_share_one_writer(self):
+        async def scenario():
+            ch = CoalescingChannel(ring_size=16)
+            latest_reader = asyncio.create_task(ch.get_latest(0))
+            ring_reader = asyncio.create_task(ch.get_batch(16))
+            await asyncio.sleep(0)
+            ch.extend(["a", "b", "c"])
+            return await asyncio.wait_for(latest_reader, 1), await asyncio.wait_for(ring_reader, 1)
+
+        assert asyncio.run(scenario()) == ((3, "c"), ["a", "b", "c"])
+
+    def test_close_wakes_readers(self):
+        async def scenario():
+            ch = CoalescingChannel(ring_size=4)
+            readers = [asyncio.create_task(ch.get_latest(0)), asyncio.create_task(ch.get_batch(4))]
+            await asyncio.sleep(0)
+            ch.close()
+            return await asyncio.wait_for(asyncio.gather(*readers), 1)
+
+        assert asyncio.run(scenario()) == [None, []]
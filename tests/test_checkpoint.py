@@ -0,0 +1,225 @@
+"""
+進行中ラップのストリーム書き出し(recorder.LapFileWriter と main.py の書き出しスレッド・復旧)の回帰テスト
+
+ラップファイル形式のまま書き足して改名で完成させること、書き込み失敗時に
+書きかけを切り詰めること、途中で落ちた part ファイルを続きから完成できること、
+パイプラインが未書き出しの分だけを持ちラップ境界で書き出しを待たないこと、
+退避ディレクトリへの切り替え、起動時の復旧(旧形式のチェックポイントを含む)を検証する。
+
+実行:
+    pytest tests/ -v
+"""
+
+import json
+import os
+import threading
+import time
+
+import pytest
+
+import main
+from decoder import CourseEstimator, GT7Decoder
+from recorder import LapBuffer, LapFileWriter
+
+from test_console_pipeline import _packet
+from test_recorder import _sample
+
+
+def _buffer(start, stop):
+    buf = LapBuffer()
+    for i in range(start, stop):
+        buf.append(_sample(i))
+    return buf
+
+
+class _FailingFile:
+    """write() でデータの半分だけ書いてから失敗するファイル(それ以外は委譲)"""
+
+    def __init__(self, f):
+        self._f = f
+
+    def write(self, data):
+        self._f.write(data[:len(data) // 2])
+        raise OSError("disk full")
+
+    def __getattr__(self, name):
+        return getattr(self._f, name)
+
+
+class TestLapFileWriter:
+
+    def test_batches_become_one_lap_file_on_finish(self, tmp_path):
+        part = tmp_path / ".lap.part"
+        writer = LapFileWriter(str(part))
+        first, second = _buffer(0, 5), _buffer(5, 8)
+        writer.append(first.rows())
+        writer.append(second.rows())
+        writer.append([])
+        assert writer.samples == 8 and writer.car_id == first[0]["car_id"]
+        final = tmp_path / "lap.json"
+        assert writer.finish(str(final)) == str(final)
+        assert not part.exists()
+        with open(final) as f:
+            assert json.load(f) == list(first) + list(second)
+
+    def test_failed_write_is_cut_back_and_can_be_retried(self, tmp_path):
+        part = tmp_path / ".lap.part"
+        writer = LapFileWriter(str(part))
+        writer.append(_buffer(0, 3).rows())
+        size = part.stat().st_size
+        writer._f = _FailingFile(writer._f)
+        with pytest.raises(OSError):
+            writer.append(_buffer(3, 6).rows())
+        assert part.stat().st_size == size and writer.samples == 3
+        writer._f = writer._f._f
+        writer.append(_buffer(3, 6).rows())
+        writer.finish(str(tmp_path / "lap.json"))
+        with open(tmp_path / "lap.json") as f:
+            assert [s["package_id"] for s in json.load(f)] == list(range(1, 7))
+
+    def test_resume_drops_the_truncated_tail(self, tmp_path):
+        part = tmp_path / ".lap.part"
+        writer = LapFileWriter(str(part))
+        rows = list(_buffer(0, 4))
+        writer.append(rows)
+        writer.close()
+        with open(part, 'a') as f:
+            f.write(',\n{"speed_ms": 12.')          # 追記の途中でプロセスが落ちた
+        resumed = LapFileWriter.resume(str(part))
+        assert resumed.samples == 4
+        assert resumed.car_id == rows[0]["car_id"] and resumed.lap_count == rows[-1]["lap_count"]
+        resumed.append(_buffer(4, 5).rows())
+        resumed.finish(str(tmp_path / "lap.json"))
+        with open(tmp_path / "lap.json") as f:
+            assert len(json.load(f)) == 5
+
+    def test_resume_rejects_other_files(self, tmp_path):
+        part = tmp_path / ".lap.part"
+        part.write_text('{"journal": 1, "lap_num": 1}\n')
+        with pytest.raises(ValueError):
+            LapFileWriter.resume(str(part))
+
+
+def _pipeline(tmp_path):
+    rig = main.ConsolePipeline("rig1", "192.168.1.31", str(tmp_path / "laps"), str(tmp_path / "failed"))
+    os.makedirs(rig.log_dir)
+    return rig
+
+
+def _feed(rig, packets, step_ns=main.CHECKPOINT_INTERVAL_NS // 2):
+    decoder = GT7Decoder()
+    estimator = CourseEstimator(os.path.join(os.path.dirname(main.__file__), 'course_database.json'))
+    base = max(time.monotonic_ns(), rig.last_arrival_ns)
+
+    for i, (pid, lap) in enumerate(packets):
+        rig.handle(_packet(pid, lap), decoder, estimator, arrival_ns=base + (i + 1) * step_ns)
+
+
+def _lap_files(directory):
+    return sorted(n for n in os.listdir(directory) if n.endswith(".json"))
+
+
+class TestPipelineStreaming:
+
+    def test_samples_are_written_while_the_lap_is_in_progress(self, tmp_path):
+        rig = _pipeline(tmp_path)
+        _feed(rig, [(pid, 1) for pid in range(1, 8)])
+        rig.drain()
+        # 1秒ごとに渡すので、手元に残るのは最後の間隔以降の分だけ
+        assert LapFileWriter.resume(rig.checkpoint_file).samples == 6
+        assert len(rig.lap_batch) == 1 and rig.lap_samples == 7
+
+        _feed(rig, [(8, 2)])
+        rig.drain()
+        assert not os.path.exists(rig.checkpoint_file)
+        (saved,) = _lap_files(rig.log_dir)
+        assert saved.endswith("_Lap-1.json")
+        with open(os.path.join(rig.log_dir, saved)) as f:
+            assert [s["package_id"] for s in json.load(f)] == list(range(1, 9))
+        assert len(rig.lap_batch) == 0 and rig.lap_samples == 0
+
+    def test_lap_boundary_does_not_wait_for_the_writer(self, tmp_path):
+        rig = _pipeline(tmp_path)
+        release = threading.Event()
+        rig._writer.submit(release.wait)                # 書き出しスレッドが詰まっている
+        _feed(rig, [(pid, 1) for pid in range(1, 6)] + [(6, 2)])
+        assert _lap_files(rig.log_dir) == []
+        release.set()
+        rig.drain()
+        assert len(_lap_files(rig.log_dir)) == 1
+
+    def test_flush_completes_the_lap_in_progress(self, tmp_path):
+        rig = _pipeline(tmp_path)
+        _feed(rig, [(pid, 1) for pid in range(1, 6)])
+        rig.flush()
+        assert not os.path.exists(rig.checkpoint_file)
+        (saved,) = _lap_files(rig.log_dir)
+        with open(os.path.join(rig.log_dir, saved)) as f:
+            assert len(json.load(f)) == 5
+
+    def test_recording_off_writes_nothing(self, tmp_path, monkeypatch):
+        monkeypatch.setitem(main.CONFIG, "recording_enabled", False)
+        rig = _pipeline(tmp_path)
+        _feed(rig, [(pid, 1) for pid in range(1, 6)] + [(6, 2)])
+        rig.flush()
+        assert os.listdir(rig.log_dir) == []
+
+    def test_write_failure_falls_over_to_the_failed_directory(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(main, "SAVE_RETRY_DELAY_SEC", 0)
+        rig = _pipeline(tmp_path)
+        _feed(rig, [(pid, 1) for pid in range(1, 4)])
+        rig.drain()
+        append = LapFileWriter.append
+
+        def append_outside_log_dir(self, rows):
+            if self.part_path.startswith(rig.log_dir):
+                raise OSError("read-only file system")
+            append(self, rows)
+
+        monkeypatch.setattr(LapFileWriter, "append", append_outside_log_dir)
+        _feed(rig, [(pid, 1) for pid in range(4, 8)] + [(8, 2)])
+        rig.drain()
+        assert _lap_files(rig.log_dir) == []
+        (saved,) = _lap_files(rig.failed_dir)
+        assert saved.endswith("_Lap-1_failed.json")
+        with open(os.path.join(rig.failed_dir, saved)) as f:
+            assert [s["package_id"] for s in json.load(f)] == list(range(1, 9))
+
+
+class TestRecovery:
+
+    def test_leftover_part_file_is_completed(self, tmp_path):
+        crashed = _pipeline(tmp_path)
+        _feed(crashed, [(pid, 4) for pid in range(1, 12)])
+        crashed.drain()                                 # SIGKILL 相当: flush() を経ずに終わる
+        os.utime(crashed.checkpoint_file, (1_790_000_000, 1_790_000_000))
+
+        restarted = main.ConsolePipeline("rig1", "192.168.1.31", crashed.log_dir, crashed.failed_dir)
+        assert restarted.recover_checkpoint() == 10
+        assert not os.path.exists(restarted.checkpoint_file)
+        (saved,) = _lap_files(restarted.log_dir)
+        meta = main._parse_lap_filename(saved)
+        assert meta["lap_number"] == 4
+        assert meta["recorded_at"] == main.datetime.fromtimestamp(1_790_000_000).isoformat()
+        with open(os.path.join(restarted.log_dir, saved)) as f:
+            assert [s["package_id"] for s in json.load(f)] == list(range(1, 11))
+        assert restarted.recover_checkpoint() == 0
+
+    def test_legacy_checkpoint_is_recovered(self, tmp_path):
+        rig = _pipeline(tmp_path)
+        snapshot = os.path.join(rig.log_dir, main.LEGACY_CHECKPOINT_BASENAME)
+        with open(snapshot, 'w') as f:
+            json.dump({"lap_num": 2, "samples": [_sample(i) for i in range(3)]}, f)
+        assert rig.recover_checkpoint() == 3
+        assert not os.path.exists(snapshot)
+        (saved,) = _lap_files(rig.log_dir)
+        assert saved.endswith("_Lap-2.json")
+
+    def test_unreadable_checkpoint_is_moved_aside(self, tmp_path):
+        rig = _pipeline(tmp_path)
+        with open(rig.checkpoint_file, 'w') as f:
+            f.write("garbage")
+        assert rig.recover_checkpoint() == 0
+        assert not os.path.exists(rig.checkpoint_file)
+        assert [n for n in os.listdir(rig.failed_dir) if n.endswith(main.CHECKPOINT_BASENAME)]
+        assert os.listdir(rig.log_dir) == []
@@ -0,0 +1,133 @@
+"""
+マルチコンソール受信(main.py の ConsolePipeline / build_console_pipelines)の回帰テスト
+
+1本の受信ソケットに届いたパケットを送信元IPでコンソールごとのパイプラインへ振り分け、
+package_id 判定・ラップ記録・配信チャンネルがコンソール間で独立していることを検証する。
+
+実行:
+    pytest tests/ -v
+"""
+
+import asyncio
+import json
+import os
+
+import pytest
+
+import main
+from decoder import CourseEstimator, GT7Decoder
+
+from test_decoder import _build_plaintext
+
+
+def _packet(package_id, lap_count):
+    d = bytearray(_build_plaintext(package_id=package_id))
+    d[0x74:0x76] = lap_count.to_bytes(2, 'little')
+    return bytes(d)
+
+
+class TestBuildConsolePipelines:
+
+    def test_default_single_console_records_to_log_dir(self):
+        pipelines = main.build_console_pipelines({"ps5_ip": "192.168.1.128"})
+        assert list(pipelines) == [main.DEFAULT_CONSOLE_ID]
+        assert pipelines["default"].log_dir == main.LOG_DIR
+        assert pipelines["default"].checkpoint_file == main.CHECKPOINT_FILE
+
+    def test_consoles_get_own_directories_and_invalid_entries_are_skipped(self):
+        pipelines = main.build_console_pipelines({
+            "ps5_ip": "192.168.1.128",
+            "consoles": [
+                {"id": "rig1", "ip": "192.168.1.31"},
+                {"id": "rig2", "ip": "192.168.1.32"},
+                {"id": "../etc", "ip": "192.168.1.33"},   # ディレクトリ名に使えない
+                {"id": "rig1", "ip": "192.168.1.34"},     # 重複
+                {"id": "rig3"},                           # ip なし
+            ],
+        })
+        assert list(pipelines) == ["rig1", "rig2"]
+        assert pipelines["rig2"].log_dir == os.path.join(main.LOG_DIR, "rig2")
+        assert pipelines["rig2"].failed_dir == os.path.join(main.LOG_DIR_FAILED, "rig2")
+
+    def test_route_by_source_ip(self, monkeypatch):
+        pipelines = main.build_console_pipelines({"consoles": [
+            {"id": "rig1", "ip": "192.168.1.31"}, {"id": "rig2", "ip": "192.168.1.32"},
+        ]})
+        monkeypatch.setattr(main, "CONSOLES", pipelines)
+        assert main.route_console(("192.168.1.32", 33740)) is pipelines["rig2"]
+        assert main.route_console(("192.168.1.99", 33740)) is None
+        assert main.route_console(None) is None
+
+    def test_single_console_accepts_any_source(self, monkeypatch):
+        pipelines = main.build_console_pipelines({"ps5_ip": "192.168.1.128"})
+        monkeypatch.setattr(main, "CONSOLES", pipelines)
+        assert main.route_console(("10.0.0.5", 33740)) is pipelines["default"]
+
+
+class TestConsolePipelineIsolation:
+
+    def test_state_and_recordings_are_independent(self, tmp_path):
+        """片方のコンソールの package_id・ラップ境界がもう片方に影響しないこと"""
+        rig1 = main.ConsolePipeline("rig1", "192.168.1.31", str(tmp_path / "rig1"), str(tmp_path / "f1"))
+        rig2 = main.ConsolePipeline("rig2", "192.168.1.32", str(tmp_path / "rig2"), str(tmp_path / "f2"))
+        for p in (rig1, rig2):
+            os.makedirs(p.log_dir)
+        decoder = GT7Decoder()
+        estimator = CourseEstimator(os.path.join(os.path.dirname(main.__file__), 'course_database.json'))
+
+        # rig1 は package_id が大きく進んでいても rig2 の小さな package_id は受理される
+        for pid in range(5000, 5010):
+            rig1.handle(_packet(pid, 1), decoder, estimator)
+        for pid in range(1, 6):
+            rig2.handle(_packet(pid, 1), decoder, estimator)
+        rig1.handle(_packet(5010, 2), decoder, estimator)   # rig1 だけラップ完了
+        rig1.drain()
+
+        assert rig1.packet_loss_count == 0 and rig2.packet_loss_count == 0
+        saved = os.listdir(rig1.log_dir)
+        assert len(saved) == 1 and saved[0].endswith("_Lap-1.json")
+        with open(os.path.join(rig1.log_dir, saved[0])) as f:
+            # 境界パケット(lap_count が変化した1件)までを完了ラップに含める既存仕様
+            assert [s["package_id"] for s in json.load(f)] == list(range(5000, 5011))
+        assert os.listdir(rig2.log_dir) == []
+        assert rig2.lap_samples == 5
+        assert rig1.lap_samples == 0
+
+    def test_messages_are_only_queued_for_subscribed_channel(self):
+        rig1 = main.ConsolePipeline("rig1", "192.168.1.31")
+        rig2 = main.ConsolePipeline("rig2", "192.168.1.32")
+        rig1.clients.add(object())   # 購読者あり(送信はしない)
+        decoder = GT7Decoder()
+        estimator = CourseEstimator(os.path.join(os.path.dirname(main.__file__), 'course_database.json'))
+
+        rig1.handle(_packet(1, 0), decoder, estimator)
+        rig2.handle(_packet(1, 0), decoder, estimator)
+        assert rig1.broadcast.seq == 1
+        assert json.loads(rig1.broadcast.latest[None])["package_id"] == 1
+        assert rig2.broadcast.seq == 0
+
+
+class TestLossBreakdown:
+
+    def test_losses_are_recorded_by_cause(self):
+        from health import ReceiveHealth
+
+        rig = main.ConsolePipeline("rig1", "192.168.1.31")
+        rig.health = ReceiveHealth()
+        decoder = GT7Decoder()
+        estimator = CourseEstimator(os.path.join(os.path.dirname(main.__file__), 'course_database.json'))
+
+        for pid in (1, 2, 5, 4, 5, 6):   # 3・4 欠番、4・5 は逆行/重複
+            rig.handle(_packet(pid, 0), decoder, estimator)
+        rig.handle(b"\x00" * 16, decoder, estimator)   # 解析できない長さ
+        loss = rig.health.snapshot()["loss"]["by_console"]["rig1"]
+        assert loss["package_id_gap"] == 2
+        assert loss["out_of_order"] == 2
+        assert loss["parse_failure"] == 1
+        assert rig.packet_loss_count == 5
+
+    def test_health_endpoint_reports_not_running_without_task(self, monkeypatch):
+        monkeypatch.setattr(main, "_receive_health", None)
+        response = asyncio.run(main.api_receive_health_handler(None))
+        assert response.status == 503
+        assert json.loads(response.text) == {"running": False}
@@ -0,0 +1,95 @@
+"""
+コース推定の状態管理(decoder.CourseTracker)の回帰テスト
+
+ラップ開始からの多数決で確定すること、確定後は estimate_course() を間引いて
+位置が確定コースの bounds 内かだけを確かめること、瞬間移動で即座に確かめること、
+連続して外れた時だけ確定を解くこと(ヒステリシス)、lap_count の変化で投票から
+やり直すことを検証する。
+
+実行:
+    pytest tests/ -v
+"""
+
+import json
+
+import pytest
+
+from decoder import CourseEstimator, CourseTracker
+
+
+def _box(min_x, max_x, min_z, max_z):
+    return {"min_x": min_x, "max_x": max_x, "min_z": min_z, "max_z": max_z}
+
+
+@pytest.fixture
+def estimator(tmp_path):
+    # wide の中に narrow が重なる(生推定値が入れ替わる組)。far は離れた別コース
+    db = {"known_courses": [
+        {"id": "wide", "name": "Wide", "verified": True, "bounds": _box(-1000, 1000, -1000, 1000)},
+        {"id": "narrow", "name": "Narrow", "verified": True, "bounds": _box(0, 100, 0, 100)},
+        {"id": "far", "name": "Far", "verified": True, "bounds": _box(5000, 6000, 5000, 6000)},
+    ]}
+    path = tmp_path / "course_database.json"
+    path.write_text(json.dumps(db))
+    return CourseEstimator(str(path))
+
+
+def _drive(tracker, points, lap=1):
+    return [tracker.update(lap, x, z)["id"] for x, z in points]
+
+
+class TestCourseTracker:
+
+    def test_majority_vote_locks_the_course(self, estimator):
+        tracker = CourseTracker(estimator, vote_window=5)
+        # 投票中は生推定値をそのまま返す
+        ids = _drive(tracker, [(-500, 0), (50, 50), (-400, 0), (-300, 0), (-200, 0)])
+        assert ids == ["wide", "narrow", "wide", "wide", "wide"]
+        assert tracker.locked and tracker.lock_id == "wide"
+        # 重複した narrow の中を通っても確定値のまま
+        assert _drive(tracker, [(50, 50)] * 3) == ["wide"] * 3
+
+    def test_locked_tracker_revalidates_at_a_low_rate(self, estimator):
+        tracker = CourseTracker(estimator, vote_window=3, revalidate_every=30)
+        _drive(tracker, [(-500 + i, 0) for i in range(3)])
+        before = tracker.estimates
+        _drive(tracker, [(-400 + i, 0) for i in range(300)])
+        # bounds 内の判定だけで済み、estimate_course() は呼ばれない
+        assert tracker.estimates == before == 3
+
+    def test_jump_is_checked_immediately_and_unlocks_with_hysteresis(self, estimator):
+        tracker = CourseTracker(estimator, vote_window=3, revalidate_every=1000, unlock_after=3)
+        _drive(tracker, [(-500, 0)] * 3)
+        # 瞬間移動直後の2件は外れても確定値を保つ
+        assert _drive(tracker, [(5500, 5500), (5501, 5500)]) == ["wide", "wide"]
+        # 1件でも戻れば外れの計数は 0 に戻る
+        assert _drive(tracker, [(-500, 0), (5500, 5500), (5501, 5500)]) == ["wide"] * 3
+        assert tracker.locked and tracker.unlocks == 0
+        # 3件続けて外れたら確定を解き、生推定値を返して投票し直す
+        assert _drive(tracker, [(5502, 5500)]) == ["far"]
+        assert not tracker.locked and tracker.unlocks == 1
+        _drive(tracker, [(5503, 5500), (5504, 5500)])
+        assert tracker.lock_id == "far"
+
+    def test_unknown_lock_releases_when_a_course_is_entered(self, estimator):
+        tracker = CourseTracker(estimator, vote_window=2, revalidate_every=2, unlock_after=2)
+        assert _drive(tracker, [(9000, 9000)] * 2) == ["unknown"] * 2
+        assert tracker.lock_id == "unknown"
+        assert _drive(tracker, [(9000, 9000)] * 4) == ["unknown"] * 4
+        assert _drive(tracker, [(-500, 0), (-500, 0), (-500, 0)])[-1] == "wide"
+        assert tracker.unlocks == 1
+
+    def test_lap_change_restarts_the_vote(self, estimator):
+        tracker = CourseTracker(estimator, vote_window=3)
+        _drive(tracker, [(50, 50)] * 3, lap=1)
+        assert tracker.lock_id == "narrow"
+        # ラップが変われば(戻っても)前の確定は持ち越さない
+        assert _drive(tracker, [(-500, 0)] * 2, lap=0) == ["wide", "wide"]
+        assert not tracker.locked
+        _drive(tracker, [(-500, 0)], lap=0)
+        assert tracker.lock_id == "wide"
+
+    def test_bounds_for_follows_the_result_source(self, estimator):
+        result = estimator.estimate_course(50, 50)
+        assert estimator.bounds_for(result) == _box(0, 100, 0, 100)
+        assert estimator.bounds_for(estimator.estimate_course(9000, 9000)) is None
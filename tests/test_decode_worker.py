@@ -0,0 +1,141 @@
+"""
+デコードワーカー(decode_worker.py)の回帰テスト
+
+共有メモリのフレームリング(FrameRing)の書き込み・読み出し・周回遅れ検出と、
+ワーカープロセスが UDP で受けた暗号化パケットを復号してリング経由で渡す
+一連の流れ(DecodeWorkerClient)と、停止時にプロセスの終了をイベントループを
+止めずに待つことを検証する。
+
+実行:
+    pytest tests/ -v
+"""
+
+import asyncio
+import socket
+import struct
+import time
+
+import pytest
+
+from decode_worker import DecodeWorkerClient, FrameRing, FRAME_SIZE
+from decoder import GT7Decoder
+
+from test_decoder import _build_plaintext, _encrypt_packet
+
+
+@pytest.fixture
+def ring():
+    r = FrameRing.create(slots=4)
+    yield r
+    r.close(unlink=True)
+
+
+class TestFrameRing:
+
+    def test_publish_then_read(self, ring):
+        data = _build_plaintext(package_id=7)
+        seq = ring.publish(data, 123456789, ("192.168.1.30", 33740))
+        assert seq == 1
+        assert ring.counters() == (1, 0)
+        assert ring.read(1) == (data, 123456789, ("192.168.1.30", 33740))
+
+    def test_overwritten_slot_is_detected(self, ring):
+        """スロット数を超えて書かれた古い seq は読めない(None)こと"""
+        for i in range(6):
+            ring.publish(bytes([i]) * 0x128, i)
+        assert ring.read(1) is None and ring.read(2) is None
+        assert ring.read(6) == (bytes([5]) * 0x128, 5, None)
+
+    def test_reader_attaches_by_name(self, ring):
+        reader = FrameRing.attach(ring.name, ring.slots)
+        try:
+            ring.publish(b'\xAB' * FRAME_SIZE, 1)
+            ring.add_rejected(3)
+            assert reader.counters() == (1, 3)
+            assert reader.read(1)[0] == b'\xAB' * FRAME_SIZE
+        finally:
+            reader.close()
+
+
+class TestDecodeWorkerClient:
+
+    def test_worker_process_decrypts_into_ring(self):
+        """別プロセスのワーカーが受信・復号したパケットを receive() で順に受け取れること"""
+        probe = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        probe.bind(('127.0.0.1', 0))
+        port = probe.getsockname()[1]
+        probe.close()
+
+        def packet(pid):
+            plaintext = bytearray(_build_plaintext(package_id=pid))
+            struct.pack_into('<I', plaintext, 0x40, 0x9E3779B9 * pid & 0xFFFFFFFF)
+            return _encrypt_packet(bytes(plaintext), GT7Decoder.XOR_MAP[b'~'])
+
+        async def scenario():
+            # heartbeat の送信先は discard ポート(9)。テストでは応答不要。
+            worker = DecodeWorkerClient('127.0.0.1', 9, port, 60)
+            await worker.connect()
+            tx = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            try:
+                # ワーカーの bind 完了まで送り直す(bind 前に送った分は単に届かない)
+                first = None
+                for pid in range(1, 200):
+                    tx.sendto(packet(pid), ('127.0.0.1', port))
+                    try:
+                        first = await asyncio.wait_for(worker.receive(), 0.1)
+                        break
+                    except asyncio.TimeoutError:
+                        continue
+                assert first is not None, "worker did not deliver any frame"
+                start = GT7Decoder().parse(first)["package_id"]
+
+                for pid in range(1000, 1010):
+                    tx.sendto(packet(pid), ('127.0.0.1', port))
+                tx.sendto(b'\x00' * 0x158, ('127.0.0.1', port))   # 復号できないパケット
+                got = []
+                while len(got) < 10:
+                    frame = await asyncio.wait_for(worker.receive(), 5)
+                    pid = GT7Decoder().parse(frame)["package_id"]
+                    if pid >= 1000:
+                        got.append(pid)
+                assert start >= 1
+                assert got == list(range(1000, 1010))
+                await asyncio.sleep(0.2)
+                assert worker.take_rejected() == 1
+            finally:
+                tx.close()
+                await worker.aclose()
+
+        asyncio.run(scenario())
+
+    def test_aclose_waits_for_the_worker_without_blocking_the_loop(self):
+        """終了の遅いワーカープロセスを待つ間も、イベントループの他のタスクが進むこと"""
+
+        class _SlowProcess:
+            terminated = False
+
+            def terminate(self):
+                self.terminated = True
+
+            def join(self, timeout=None):
+                time.sleep(0.3)
+
+        async def scenario():
+            worker = DecodeWorkerClient('127.0.0.1', 9, 0, 60)
+            worker._process = process = _SlowProcess()
+            ticks = 0
+
+            async def ticker():
+                nonlocal ticks
+                while True:
+                    await asyncio.sleep(0.01)
+                    ticks += 1
+
+            task = asyncio.create_task(ticker())
+            await worker.aclose()
+            task.cancel()
+            return process, worker, ticks
+
+        process, worker, ticks = asyncio.run(scenario())
+        assert process.terminated and worker._process is None
+        assert ticks >= 10
@@ -228,3 +228,151 @@ class TestCourseEstimator:
         # キー欠損 bounds は無効
         assert CourseEstimator._bounds_valid({'min_x': 0}) is False
         assert CourseEstimator._point_in_bounds(0, 0, {}) is False
+
+
+# ─────────────────────────────────────────────────────────────────────
+# 一括復号(decrypt_many)テスト
+# ─────────────────────────────────────────────────────────────────────
+
+class TestDecryptMany:
+    """NumPy 版一括復号が従来のパケット単位復号とバイト単位で一致することを検証。"""
+
+    def test_matches_per_packet_decrypt_for_all_variants(self, decoder):
+        """A/B/~ の各サイズ・各 XOR が混在しても decrypt() と同一結果になること"""
+        packets = []
+        for i, (hb_type, size) in enumerate(
+                [(b'A', 0x128), (b'B', 0x13C), (b'~', 0x158)] * 4):
+            plaintext = bytearray(_build_plaintext(package_id=i + 1, size=size))
+            struct.pack_into('<I', plaintext, 0x40, 0x01000193 * (i + 1) & 0xFFFFFFFF)
+            packets.append(_encrypt_packet(bytes(plaintext), GT7Decoder.XOR_MAP[hb_type]))
+
+        batch, valid = decoder.decrypt_many(packets)
+        assert valid.all()
+        for i, packet in enumerate(packets):
+            expected = GT7Decoder().decrypt(packet)
+            assert bytes(batch[i, :len(packet)]) == expected
+            assert not batch[i, len(packet):].any(), "短いパケットの末尾は0埋めであるべき"
+
+    def test_invalid_and_short_packets_are_flagged(self, decoder):
+        """マジック不一致・最小サイズ未満の行は valid=False になること"""
+        good = _encrypt_packet(_build_plaintext(package_id=5), decoder._xor_value)
+        batch, valid = decoder.decrypt_many([good, b'\x00' * 0x158, b'\x00' * 10])
+        assert valid.tolist() == [True, False, False]
+        assert decoder.parse(bytes(batch[0]))['package_id'] == 5
+
+    def test_empty_input(self, decoder):
+        batch, valid = decoder.decrypt_many([])
+        assert batch.shape[0] == 0 and valid.shape == (0,)
+
+
+# ─────────────────────────────────────────────────────────────────────
+# TelemetryView（遅延解析ビュー）
+# ─────────────────────────────────────────────────────────────────────
+
+class TestTelemetryView:
+    """view() のフィールド単位アクセスが parse() の結果と一致し、必要な分しか読まないことを検証。"""
+
+    @pytest.mark.parametrize("size", [0x128, 0x13C, 0x158])
+    def test_every_key_matches_parse(self, decoder, size):
+        """全キーの集合・値が parse() と一致し、to_dict() は parse() と同一であること"""
+        import random
+        from test_packet_def import _random_packet
+        data = _random_packet(random.Random(size), size)
+        expected = decoder.parse(data)
+        view = decoder.view(data)
+
+        assert set(view) == set(expected)
+        for key in expected:
+            assert view[key] == expected[key], key
+        assert view.to_dict() == expected
+
+    def test_zero_copy_and_lazy(self, decoder):
+        """バッファをコピーせず、アクセスしたフィールドだけを読むこと"""
+        data = bytearray(_build_plaintext(package_id=77))
+        view = decoder.view(data)
+        assert view.buffer.obj is data
+        assert view["package_id"] == 77
+        assert list(view._cache) == ["package_id"]
+        assert view.get("no_such_field") is None
+        with pytest.raises(KeyError):
+            view["no_such_field"]
+
+    def test_parse_accepts_view(self, decoder):
+        data = _build_plaintext(package_id=9, gear=4)
+        view = decoder.view(data)
+        assert view["gear"] == 4
+        assert decoder.parse(view) == decoder.parse(data)
+
+    def test_too_small_returns_none(self, decoder):
+        assert decoder.view(b'\x00' * 0x100) is None
+
+
+# ─────────────────────────────────────────────────────────────────────
+# 復号前段の破棄（重複・他機器パケット）と送信元別 XOR キャッシュ
+# ─────────────────────────────────────────────────────────────────────
+
+class TestReceivePrefilter:
+    """暗号処理前の重複破棄・先頭ブロック判定・送信元別 XOR と破棄理由カウンタを検証。"""
+
+    def _packet(self, package_id, hb_type=b'~'):
+        plaintext = bytearray(_build_plaintext(package_id=package_id))
+        struct.pack_into('<I', plaintext, 0x40, 0x9E3779B9 * package_id & 0xFFFFFFFF)
+        return _encrypt_packet(bytes(plaintext), GT7Decoder.XOR_MAP[hb_type])
+
+    def test_duplicate_datagram_is_dropped_before_crypto(self, decoder, monkeypatch):
+        packet = self._packet(1)
+        assert decoder.decrypt(packet)
+        calls = []
+        monkeypatch.setattr(decoder, "_try_decrypt", lambda *a: calls.append(a) or b'')
+        assert decoder.decrypt(packet) == b''
+        assert calls == []
+        assert decoder.reject_counts["duplicate"] == 1
+
+    def test_reject_reasons_are_counted_separately(self, decoder):
+        decoder.decrypt(b'\x00' * 10)
+        decoder.decrypt(bytes(range(256)) * 2)   # 他機器のトラフィック相当
+        assert decoder.reject_counts == {
+            "too_small": 1, "duplicate": 0, "foreign": 0, "bad_magic": 1, "error": 0,
+        }
+
+    def test_probe_result_matches_full_decrypt(self, decoder):
+        """先頭ブロック判定後に続けて復号した結果が、全体を一度に復号した結果と一致すること"""
+        from Crypto.Cipher import Salsa20
+        packet = self._packet(3)
+        iv1 = int.from_bytes(packet[0x40:0x44], 'little')
+        iv = (iv1 ^ decoder._xor_value).to_bytes(4, 'little') + iv1.to_bytes(4, 'little')
+        expected = Salsa20.new(SALSA20_KEY[:32], iv).decrypt(packet)
+        assert decoder.decrypt(packet) == expected
+
+    def test_xor_is_cached_per_source_address(self, decoder, monkeypatch):
+        """送信元ごとに前回の XOR から試し、別 XOR の送信元が混在してもフォールバックを繰り返さないこと"""
+        ps4, ps5 = ("192.168.1.20", 33740), ("192.168.1.30", 33740)
+        assert decoder.decrypt(self._packet(1, b'A'), ps4)
+        assert decoder.decrypt(self._packet(2, b'~'), ps5)
+
+        tried = []
+        original = decoder._try_decrypt
+        monkeypatch.setattr(decoder, "_try_decrypt",
+                            lambda data, xor: tried.append(xor) or original(data, xor))
+        assert decoder.decrypt(self._packet(3, b'A'), ps4)
+        assert decoder.decrypt(self._packet(4, b'~'), ps5)
+        assert tried == [GT7Decoder.XOR_MAP[b'A'], GT7Decoder.XOR_MAP[b'~']]
+
+    def test_foreign_source_is_dropped_without_crypto(self, decoder, monkeypatch):
+        """復号できない送信元は FOREIGN_THRESHOLD 件以降は暗号処理せず破棄し、定期的に判定し直すこと"""
+        import os
+        printer = ("192.168.1.99", 5353)
+        calls = []
+        original = decoder._try_decrypt
+        monkeypatch.setattr(decoder, "_try_decrypt",
+                            lambda data, xor: calls.append(xor) or original(data, xor))
+        total = GT7Decoder.FOREIGN_REPROBE + 1
+        for _ in range(total):
+            decoder.decrypt(os.urandom(0x158), printer)
+
+        probed = GT7Decoder.FOREIGN_THRESHOLD + 1   # 閾値到達まで + 再判定1回
+        assert len(calls) == probed * len(GT7Decoder.XOR_MAP)
+        assert decoder.reject_counts["bad_magic"] == probed
+        assert decoder.reject_counts["foreign"] == total - probed
+        # 別の送信元の GT7 パケットは影響を受けない
+        assert decoder.decrypt(self._packet(1), ("192.168.1.30", 33740))
@@ -0,0 +1,539 @@
+"""
+WebSocket 配信の購読(fanout.py と main.py の配信経路)の回帰テスト
+
+レートごとの tier が約60Hzの到着を目標レートに間引くこと、どの tier も送る時刻で
+ないフレームは JSON 化しないこと、フィールドの投影が同じクライアントの分は
+フレームごとに1回だけ JSON 化すること、差分配信(keyframe / delta)を組み立て直すと
+全フレームと一致し seq の欠けから resync できること(keyframe は resync した
+クライアントにだけ送る)、射影・シリアライズに失敗したフレームは読み飛ばして配信を
+続けること、JSON 化の後で投影を変えた・切断したクライアントしかいなくても送る直前の
+組み分けが失敗しないこと、バイナリ形式のレコードをスキーマどおりに読むと全フレームと
+一致し範囲外の値は値が無いものになること、/ws の購読メッセージでクライアントごとに
+受け取るフレーム数・フィールド・形式が変わることを検証する。
+
+実行:
+    pytest tests/ -v
+"""
+
+import asyncio
+import json
+import math
+import os
+import struct
+
+import aiohttp
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+import main
+from decoder import CourseEstimator, GT7Decoder
+from fanout import (
+    FULL_RATE, PROJECTION_ALWAYS, PROJECTION_PROFILES, BinaryCodec, DeltaStream, RateTiers,
+    parse_projection, parse_rate, project,
+)
+
+from test_console_pipeline import _packet
+
+FRAME_NS = 16_683_350   # GT7 の 59.94Hz
+
+
+def _count_due(tiers, arrivals):
+    counts = {}
+    for arrival_ns in arrivals:
+        for rate in tiers.due(arrival_ns):
+            counts[rate] = counts.get(rate, 0) + 1
+    return counts
+
+
+class TestRateTiers:
+
+    def test_59_94hz_stream_is_decimated_to_each_rate(self):
+        tiers = RateTiers()
+        for rate in (10, 20, 30, FULL_RATE):
+            tiers.add(rate)
+        counts = _count_due(tiers, [i * FRAME_NS for i in range(600)])
+        assert counts == {10: 100, 20: 200, 30: 300, FULL_RATE: 600}
+
+    def test_arrival_jitter_does_not_skip_a_frame(self):
+        tiers = RateTiers()
+        tiers.add(30)
+        jitter = [0, 3, -3, 2, -2, 1] * 100   # ms
+        counts = _count_due(tiers, [i * FRAME_NS + j * 1_000_000 for i, j in enumerate(jitter)])
+        assert 295 <= counts[30] <= 300
+
+    def test_late_frame_restarts_the_schedule(self):
+        tiers = RateTiers()
+        tiers.add(10)
+        assert tiers.due(0) == (10,)
+        # 5秒止まったあとにまとめて届いた分は1件だけ送る
+        assert _count_due(tiers, [5_000_000_000 + i for i in range(10)]) == {10: 1}
+
+    def test_members_are_counted_per_rate(self):
+        tiers = RateTiers()
+        tiers.add(20)
+        tiers.add(20)
+        tiers.add(0)          # テレメトリを送らない購読は数えない
+        tiers.discard(20)
+        assert tiers.due(0) == (20,) and len(tiers) == 1
+        tiers.discard(20)
+        assert tiers.due(10**9) == () and len(tiers) == 0
+
+    def test_parse_rate(self):
+        assert [parse_rate(v) for v in (20, 12.5, 240, -1, "30", None, True, float("nan"))] == [
+            20, 12, FULL_RATE, 0, None, None, None, None,
+        ]
+
+
+class TestProjection:
+
+    def test_profiles_and_field_lists(self):
+        assert parse_projection() is None and parse_projection("full") is None
+        drive = parse_projection("drive")
+        assert drive[:len(PROJECTION_ALWAYS)] == PROJECTION_ALWAYS
+        assert set(drive) == set(PROJECTION_PROFILES["drive"]) | set(PROJECTION_ALWAYS)
+        # 同じ集合なら順序・重複によらず同じ投影(同じ群)
+        assert parse_projection(fields=["gear", "rpm"]) == parse_projection(fields=["rpm", "gear", "rpm"])
+        # fields があれば profile より優先
+        assert parse_projection("drive", ["gear"]) == PROJECTION_ALWAYS + ("gear",)
+
+    def test_invalid_subscriptions_are_rejected(self):
+        for profile, fields in (("nope", None), (["drive"], None), (None, "gear"),
+                                (None, [1, 2]), (None, ["f"] * 129)):
+            with pytest.raises(ValueError):
+                parse_projection(profile, fields)
+
+    def test_project_skips_missing_fields(self):
+        frame = {"package_id": 7, "arrival_ns": 1, "wall_anchor_ns": 2, "gear": 3, "rpm": 4000.0}
+        assert project(frame, parse_projection(fields=["gear", "boost"])) == {
+            "package_id": 7, "arrival_ns": 1, "wall_anchor_ns": 2, "gear": 3,
+        }
+
+
+class _DeltaClient:
+    """クライアント側の組み立て直し(websocket.js と同じ規則)"""
+
+    def __init__(self):
+        self.frame = None
+        self.seq = None
+        self.resyncs = 0
+
+    def apply(self, message):
+        if message["type"] == "keyframe":
+            self.frame = dict(message["frame"])
+        elif self.frame is None or message["seq"] != self.seq + 1:
+            self.frame = None
+            self.resyncs += 1
+            return None
+        else:
+            self.frame.update(message["frame"])
+            for name in message.get("removed", ()):
+                self.frame.pop(name, None)
+        self.seq = message["seq"]
+        return dict(self.frame)
+
+
+class TestDeltaStream:
+
+    def test_keyframe_then_only_changed_fields(self):
+        stream = DeltaStream(keyframe_every=3)
+        frames = [{"package_id": i, "car_id": 51, "gear_ratios": [3.5, 2.0], "rpm": 5000.0 + (i % 2)}
+                  for i in range(1, 8)]
+        messages = [json.loads(stream.encode(f)) for f in frames]
+        assert [m["type"] for m in messages] == ["keyframe", "delta", "delta"] * 2 + ["keyframe"]
+        assert [m["seq"] for m in messages] == list(range(1, 8))
+        assert messages[1]["frame"] == {"package_id": 2, "rpm": 5000.0}
+        client = _DeltaClient()
+        assert [client.apply(m) for m in messages] == frames
+
+    def test_forced_keyframe_and_removed_fields(self):
+        stream = DeltaStream()
+        stream.encode({"package_id": 1, "timestamp": "x", "gear": 3})
+        delta = json.loads(stream.encode({"package_id": 2, "gear": 3}))
+        assert delta == {"type": "delta", "seq": 2, "frame": {"package_id": 2}, "removed": ["timestamp"]}
+        stream.force_keyframe = True
+        assert json.loads(stream.encode({"package_id": 3, "gear": 3}))["type"] == "keyframe"
+        assert json.loads(stream.encode({"package_id": 4, "gear": 3}))["type"] == "delta"
+
+
+_DTYPE_CODES = {"u8": "B", "i16": "h", "u16": "H", "i32": "i", "i64": "q", "f32": "f"}
+
+
+def _read_record(schema, record):
+    """スキーマどおりにレコードを読む(websocket.js の decodeBinaryFrame と同じ規則)"""
+    assert len(record) == schema["size"]
+    assert struct.unpack_from("<H", record)[0] == schema["id"]
+    frame = {}
+    for field in schema["fields"]:
+        code = _DTYPE_CODES[field["dtype"]]
+        values = struct.unpack_from("<%d%s" % (field.get("count", 1), code), record, field["offset"])
+        if "bits" in field:
+            frame[field["name"]] = {bit: bool(values[0] & mask) for bit, mask in field["bits"]}
+        elif "count" in field:
+            if not math.isnan(values[0]):
+                frame[field["name"]] = list(values)
+        elif values[0] != field.get("null") and not (code == "f" and math.isnan(values[0])):
+            frame[field["name"]] = values[0]
+    return frame
+
+
+def _assert_same_frame(decoded, frame):
+    """バイナリ(f32)で読んだフレームが JSON のフレームと一致する(course・timestamp・None は除く)"""
+    expected = {k: v for k, v in frame.items() if k not in ("course", "timestamp") and v is not None}
+    assert decoded.keys() == expected.keys()
+    for name, value in expected.items():
+        if isinstance(value, float):
+            assert decoded[name] == pytest.approx(value, rel=1e-6, abs=1e-4), name
+        elif isinstance(value, list):
+            assert decoded[name] == pytest.approx(value, rel=1e-6, abs=1e-4), name
+        else:
+            assert decoded[name] == value, name
+
+
+class TestBinaryCodec:
+
+    def _frame(self):
+        rig = main.ConsolePipeline("rig1", "192.168.1.31")
+        rig.clients.add(object())
+        _feed(rig, [1], rig.last_arrival_ns)
+        return rig.broadcast.latest.frame
+
+    def test_record_round_trips_and_is_much_smaller(self, monkeypatch):
+        monkeypatch.setitem(main.CONFIG, "recording_enabled", False)
+        frame = self._frame()
+        frame["flags"]["in_gear"] = frame["flags"]["tcs_active"] = True
+        frame["suggested_gear"] = None
+        codec = BinaryCodec(7)
+        record = codec.pack(frame)
+        _assert_same_frame(_read_record(codec.schema, record), frame)
+        assert len(record) == codec.size and len(record) * 4 < len(json.dumps(frame))
+        # スキーマ自体も JSON で送れる
+        assert json.loads(json.dumps(codec.schema)) == codec.schema
+
+    def test_missing_fields_and_projection(self, monkeypatch):
+        monkeypatch.setitem(main.CONFIG, "recording_enabled", False)
+        frame = self._frame()
+        del frame["gear_ratios"], frame["speed_kmh"]
+        decoded = _read_record(BinaryCodec(1).schema, BinaryCodec(1).pack(frame))
+        assert "gear_ratios" not in decoded and "speed_kmh" not in decoded
+        projection = parse_projection("drive")
+        codec = BinaryCodec(2, projection)
+        decoded = _read_record(codec.schema, codec.pack(frame))
+        assert set(decoded) <= set(projection) and "rpm" in decoded
+        assert codec.size < BinaryCodec(2).size
+
+    def test_out_of_range_values_are_packed_as_missing(self, monkeypatch):
+        monkeypatch.setitem(main.CONFIG, "recording_enabled", False)
+        frame = self._frame()
+        frame["fuel_laps_remaining"] = 1e39        # f32 の範囲外
+        frame["lap_count"] = 40000                 # i16 の範囲外
+        frame["gear"] = 2.0                        # 整数でない
+        frame["tyre_temp"] = [80.0, None, 81.0, math.inf]
+        codec = BinaryCodec(3)
+        decoded = _read_record(codec.schema, codec.pack(frame))
+        for name in ("fuel_laps_remaining", "lap_count", "gear"):
+            assert name not in decoded
+        assert decoded["tyre_temp"][0] == 80.0 and math.isnan(decoded["tyre_temp"][1])
+        assert decoded["tyre_temp"][3] == math.inf
+        # 他のフィールドはそのまま
+        assert decoded["package_id"] == frame["package_id"] and decoded["rpm"] == pytest.approx(frame["rpm"])
+
+
+def _feed(rig, pids, base):
+    decoder = GT7Decoder()
+    estimator = CourseEstimator(os.path.join(os.path.dirname(main.__file__), 'course_database.json'))
+
+    for pid in pids:
+        rig.handle(_packet(pid, 1), decoder, estimator, arrival_ns=base + pid * FRAME_NS)
+
+
+class TestPipelineRates:
+
+    def test_frames_no_tier_wants_are_not_serialized(self, monkeypatch):
+        monkeypatch.setitem(main.CONFIG, "recording_enabled", False)
+        rig = main.ConsolePipeline("rig1", "192.168.1.31")
+        dumps = []
+        monkeypatch.setattr(main.json, "dumps", lambda obj, **kw: dumps.append(obj) or "{}")
+        phone = object()
+        rig.clients.add(phone)
+        rig.set_rate(phone, 10)
+        _feed(rig, range(1, 61), rig.last_arrival_ns)
+        assert len(dumps) == rig.broadcast.seq == 10
+        assert rig.take_sends({None: "{}"}) == [("{}", [phone])]
+
+        # 全フレームのクライアント(購読なし)が加われば全フレームを JSON 化する
+        rig.clients.add(object())
+        _feed(rig, range(61, 121), rig.last_arrival_ns)
+        assert rig.broadcast.seq == 70
+
+        rig.forget_client(phone)
+        assert rig.client_rates == {} and len(rig.rate_tiers) == 0
+        rig._due_rates.add(FULL_RATE)
+        assert rig.take_sends({None: "{}"}) == [("{}", None)]
+
+
+    def test_each_projection_is_serialized_once_per_frame(self, monkeypatch):
+        monkeypatch.setitem(main.CONFIG, "recording_enabled", False)
+        rig = main.ConsolePipeline("rig1", "192.168.1.31")
+        dumps = []
+        real_dumps = json.dumps
+        monkeypatch.setattr(main.json, "dumps", lambda obj, **kw: dumps.append(obj) or real_dumps(obj))
+        pit_a, pit_b, dash = object(), object(), object()
+        for ws in (pit_a, pit_b, dash):
+            rig.clients.add(ws)
+        for ws in (pit_a, pit_b):
+            rig.set_projection(ws, parse_projection("engineer"))
+        _feed(rig, range(1, 11), rig.last_arrival_ns)
+        assert len(dumps) == 20
+        messages = rig.broadcast.latest
+        assert json.loads(messages[None])["package_id"] == 10
+        assert set(json.loads(messages[parse_projection("engineer")])) <= set(parse_projection("engineer"))
+        sends = dict((message, targets) for message, targets in rig.take_sends(messages))
+        assert sorted(map(len, sends.values())) == [1, 2]
+
+        # 投影を全フィールドに戻せば全員が同じメッセージ
+        for ws in (pit_a, pit_b):
+            rig.set_projection(ws, None)
+        _feed(rig, [11], rig.last_arrival_ns)
+        assert list(rig.broadcast.latest) == [None]
+
+    def test_projection_changed_after_serialize_does_not_break_take_sends(self, monkeypatch):
+        monkeypatch.setitem(main.CONFIG, "recording_enabled", False)
+        rig = main.ConsolePipeline("rig1", "192.168.1.31")
+        phone = object()
+        rig.clients.add(phone)
+        rig.set_projection(phone, parse_projection("drive"))
+        _feed(rig, [1, 2], rig.last_arrival_ns)
+        assert list(rig.broadcast.latest) == [parse_projection("drive")]
+        # JSON 化の後、配信タスクが送る前に投影を外した: このフレームは送らない
+        rig.set_projection(phone, None)
+        assert rig.take_sends(rig.broadcast.latest) == []
+
+        rig.set_projection(phone, parse_projection("drive"))
+        _feed(rig, [3], rig.last_arrival_ns)
+        rig.forget_client(phone)
+        assert rig.take_sends(rig.broadcast.latest) == []
+
+    def test_resync_sends_a_keyframe_only_to_the_client_that_asked(self, monkeypatch):
+        monkeypatch.setitem(main.CONFIG, "recording_enabled", False)
+        rig = main.ConsolePipeline("rig1", "192.168.1.31")
+        lagging, peer = object(), object()
+        clients = {lagging: _DeltaClient(), peer: _DeltaClient()}
+        received = {lagging: [], peer: []}
+        for ws in clients:
+            rig.clients.add(ws)
+            rig.set_delta(ws, True)
+
+        def deliver(pid, drop=()):
+            _feed(rig, [pid], rig.last_arrival_ns)
+            for raw, targets in rig.take_sends(rig.broadcast.latest):
+                for ws in targets:
+                    if ws not in drop:
+                        message = json.loads(raw)
+                        received[ws].append(message["type"])
+                        assert clients[ws].apply(message) is not None or ws is lagging
+
+        for pid in range(1, 5):
+            deliver(pid)
+        # 送信の遅れで lagging の枠が上書きされた → seq の欠けで resync
+        deliver(5, drop=(lagging,))
+        deliver(6)
+        rig.request_keyframe(lagging)
+        deliver(7)
+        deliver(8)
+        assert received[peer] == ["keyframe"] + ["delta"] * 7
+        assert received[lagging] == ["keyframe", "delta", "delta", "delta", "delta", "keyframe", "delta"]
+        assert clients[lagging].resyncs == 1 and clients[lagging].frame == clients[peer].frame
+        assert rig.delta_resync == set() and len(rig.delta_streams) == 1
+
+    def test_a_frame_that_fails_to_serialize_does_not_stop_the_broadcast(self, monkeypatch):
+        monkeypatch.setitem(main.CONFIG, "recording_enabled", False)
+        rig = main.ConsolePipeline("rig1", "192.168.1.31")
+        offered = []
+        real_take_sends = rig.take_sends
+
+        def take_sends(messages):
+            if json.loads(messages[None])["package_id"] == 2:
+                raise ValueError("bad frame")
+            return real_take_sends(messages)
+
+        monkeypatch.setattr(rig, "take_sends", take_sends)
+        monkeypatch.setattr(rig, "offer", lambda message, on_sent, targets: offered.append(message))
+        rig.clients.add(object())
+        decoder = GT7Decoder()
+        estimator = CourseEstimator(os.path.join(os.path.dirname(main.__file__), 'course_database.json'))
+
+        async def scenario():
+            consumer = asyncio.create_task(main.broadcast_consumer_task(rig))
+            for pid in (1, 2, 3):
+                rig.handle(_packet(pid, 1), decoder, estimator, arrival_ns=rig.last_arrival_ns + FRAME_NS)
+                await asyncio.sleep(0.01)
+            alive = not consumer.done()
+            consumer.cancel()
+            return alive
+
+        assert asyncio.run(scenario())
+        assert [json.loads(m)["package_id"] for m in offered] == [3]
+
+
+class TestWebSocketSubscribe:
+
+    def test_each_client_receives_its_subscribed_rate(self, tmp_path, monkeypatch):
+        rig = main.ConsolePipeline("default", "192.168.1.31", str(tmp_path / "laps"), str(tmp_path / "failed"))
+        monkeypatch.setattr(main, "CONSOLES", {"default": rig})
+        monkeypatch.setitem(main.CONFIG, "recording_enabled", False)
+        app = web.Application()
+        app.router.add_get('/ws', main.websocket_handler)
+        decoder = GT7Decoder()
+        estimator = CourseEstimator(os.path.join(os.path.dirname(main.__file__), 'course_database.json'))
+
+        async def drain(ws):
+            got = []
+            while True:
+                try:
+                    msg = await asyncio.wait_for(ws.receive(), 0.2)
+                except asyncio.TimeoutError:
+                    return got
+                got.append(json.loads(msg.data))
+
+        async def scenario():
+            async with TestServer(app) as server, aiohttp.ClientSession() as session:
+                full = await session.ws_connect(server.make_url('/ws'))
+                phone = await session.ws_connect(server.make_url('/ws'))
+                muted = await session.ws_connect(server.make_url('/ws'))
+                await phone.send_str(json.dumps({"type": "subscribe", "rate": 10}))
+                await muted.send_str(json.dumps({"type": "subscribe", "rate": 0}))
+                while len(rig.client_rates) < 2:
+                    await asyncio.sleep(0.01)
+                consumer = asyncio.create_task(main.broadcast_consumer_task(rig))
+                await asyncio.sleep(0)
+                base = rig.last_arrival_ns
+                for pid in range(1, 61):
+                    rig.handle(_packet(pid, 1), decoder, estimator, arrival_ns=base + pid * FRAME_NS)
+                    await asyncio.sleep(0.002)
+                got = [await drain(ws) for ws in (full, phone, muted)]
+                for ws in (full, phone, muted):
+                    await ws.close()
+                consumer.cancel()
+                return got
+
+        full, phone, muted = asyncio.run(scenario())
+        assert len(full) >= 50
+        assert [f["package_id"] for f in phone] == list(range(1, 61, 6))
+        assert muted == []
+
+    def test_profile_subscription_limits_the_fields(self, tmp_path, monkeypatch):
+        rig = main.ConsolePipeline("default", "192.168.1.31", str(tmp_path / "laps"), str(tmp_path / "failed"))
+        monkeypatch.setattr(main, "CONSOLES", {"default": rig})
+        monkeypatch.setitem(main.CONFIG, "recording_enabled", False)
+        app = web.Application()
+        app.router.add_get('/ws', main.websocket_handler)
+        decoder = GT7Decoder()
+        estimator = CourseEstimator(os.path.join(os.path.dirname(main.__file__), 'course_database.json'))
+
+        async def scenario():
+            async with TestServer(app) as server, aiohttp.ClientSession() as session:
+                pit = await session.ws_connect(server.make_url('/ws'))
+                await pit.send_str(json.dumps({"type": "subscribe", "profile": "engineer", "rate": 20}))
+                await pit.send_str(json.dumps({"type": "subscribe", "profile": "bogus"}))   # 無視される
+                while not rig.client_projections:
+                    await asyncio.sleep(0.01)
+                await asyncio.sleep(0.05)
+                consumer = asyncio.create_task(main.broadcast_consumer_task(rig))
+                await asyncio.sleep(0)
+                rig.handle(_packet(1, 1), decoder, estimator, arrival_ns=rig.last_arrival_ns + FRAME_NS)
+                frame = json.loads((await asyncio.wait_for(pit.receive(), 2)).data)
+                await pit.close()
+                consumer.cancel()
+                return frame
+
+        frame = asyncio.run(scenario())
+        assert frame["package_id"] == 1 and "lap_count" in frame and "course" in frame
+        assert set(frame) <= set(parse_projection("engineer"))
+        assert "gear_ratios" not in frame and "road_plane_x" not in frame
+
+    def test_delta_subscription_reconstructs_full_frames(self, tmp_path, monkeypatch):
+        rig = main.ConsolePipeline("default", "192.168.1.31", str(tmp_path / "laps"), str(tmp_path / "failed"))
+        monkeypatch.setattr(main, "CONSOLES", {"default": rig})
+        monkeypatch.setitem(main.CONFIG, "recording_enabled", False)
+        app = web.Application()
+        app.router.add_get('/ws', main.websocket_handler)
+        decoder = GT7Decoder()
+        estimator = CourseEstimator(os.path.join(os.path.dirname(main.__file__), 'course_database.json'))
+
+        async def scenario():
+            async with TestServer(app) as server, aiohttp.ClientSession() as session:
+                full = await session.ws_connect(server.make_url('/ws'))
+                remote = await session.ws_connect(server.make_url('/ws'))
+                await remote.send_str(json.dumps({"type": "subscribe", "delta": True}))
+                while not rig.delta_clients:
+                    await asyncio.sleep(0.01)
+                consumer = asyncio.create_task(main.broadcast_consumer_task(rig))
+                await asyncio.sleep(0)
+                base = rig.last_arrival_ns
+                client, rebuilt, expected, sizes = _DeltaClient(), [], [], []
+
+                async def step(pid):
+                    rig.handle(_packet(pid, 1), decoder, estimator, arrival_ns=base + pid * FRAME_NS)
+                    expected.append(json.loads((await asyncio.wait_for(full.receive(), 2)).data))
+                    raw = (await asyncio.wait_for(remote.receive(), 2)).data
+                    sizes.append(len(raw))
+                    rebuilt.append(client.apply(json.loads(raw)))
+
+                for pid in range(1, 11):
+                    await step(pid)
+                # seq の欠け(クライアント側で1件落とした)→ resync → 次は keyframe
+                client.seq -= 1
+                await step(11)
+                await remote.send_str(json.dumps({"type": "resync"}))
+                await asyncio.sleep(0.05)
+                await step(12)
+                for ws in (full, remote):
+                    await ws.close()
+                consumer.cancel()
+                return client, rebuilt, expected, sizes
+
+        client, rebuilt, expected, sizes = asyncio.run(scenario())
+        assert rebuilt[:10] == expected[:10]
+        assert rebuilt[10] is None and client.resyncs == 1
+        assert rebuilt[11] == expected[11]
+        # keyframe 以外は全フレームよりずっと小さい
+        assert max(sizes[1:10]) * 3 < sizes[0]
+
+    def test_binary_subscription_matches_full_frames(self, tmp_path, monkeypatch):
+        rig = main.ConsolePipeline("default", "192.168.1.31", str(tmp_path / "laps"), str(tmp_path / "failed"))
+        monkeypatch.setattr(main, "CONSOLES", {"default": rig})
+        monkeypatch.setitem(main.CONFIG, "recording_enabled", False)
+        app = web.Application()
+        app.router.add_get('/ws', main.websocket_handler)
+        decoder = GT7Decoder()
+        estimator = CourseEstimator(os.path.join(os.path.dirname(main.__file__), 'course_database.json'))
+
+        async def scenario():
+            async with TestServer(app) as server, aiohttp.ClientSession() as session:
+                full = await session.ws_connect(server.make_url('/ws'))
+                remote = await session.ws_connect(server.make_url('/ws'))
+                await remote.send_str(json.dumps({"type": "subscribe", "format": "binary", "delta": True}))
+                schema = json.loads((await asyncio.wait_for(remote.receive(), 2)).data)
+                consumer = asyncio.create_task(main.broadcast_consumer_task(rig))
+                await asyncio.sleep(0)
+                base = rig.last_arrival_ns
+                received, expected = [], []
+                for pid in range(1, 4):
+                    rig.handle(_packet(pid, 1), decoder, estimator, arrival_ns=base + pid * FRAME_NS)
+                    expected.append(json.loads((await asyncio.wait_for(full.receive(), 2)).data))
+                    # 最初のフレームの前にだけ course が届く
+                    for _ in range(2 if pid == 1 else 1):
+                        received.append((await asyncio.wait_for(remote.receive(), 2)).data)
+                for ws in (full, remote):
+                    await ws.close()
+                consumer.cancel()
+                return schema, received, expected
+
+        schema, received, expected = asyncio.run(scenario())
+        assert schema["type"] == "schema"
+        course, records = json.loads(received[0]), received[1:]
+        assert course == {"type": "course", "course": expected[0]["course"]}
+        assert all(isinstance(r, bytes) for r in records)
+        for record, frame in zip(records, expected):
+            _assert_same_frame(_read_record(schema, record), frame)
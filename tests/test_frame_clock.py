@@ -0,0 +1,162 @@
+"""
+記録フレームの整数時刻(v3: arrival_ns / wall_anchor_ns)の回帰テスト
+
+受信時刻が ISO 文字列ではなく整数 ns で記録・配信されること、壁時計アンカーが
+ラップ単位で固定されること、加速度・ラップ所要時間が整数の時刻差から求まること、
+旧クライアント・CSV 向けの ISO timestamp 互換生成と CSV 往復で ns が欠けないことを検証する。
+
+実行:
+    pytest tests/ -v
+"""
+
+import asyncio
+import json
+import os
+from datetime import datetime, timedelta
+
+import pytest
+
+import main
+from capture import ReplayTelemetryClient
+from decoder import CourseEstimator, GT7Decoder
+
+from test_capture import _write_capture
+from test_decoder import _build_plaintext, _encrypt_packet
+
+MS = 1_000_000
+
+
+def _packet(package_id, lap_count, speed_ms=10.0):
+    d = bytearray(_build_plaintext(package_id=package_id, speed_ms=speed_ms))
+    d[0x74:0x76] = lap_count.to_bytes(2, 'little')
+    return bytes(d)
+
+
+def _run(pipeline, frames):
+    """(package_id, lap_count, speed_ms, arrival_ns) の列を順に handle する"""
+    decoder = GT7Decoder()
+    estimator = CourseEstimator(os.path.join(os.path.dirname(main.__file__), 'course_database.json'))
+
+    for pid, lap, speed, arrival_ns in frames:
+        pipeline.handle(_packet(pid, lap, speed), decoder, estimator, arrival_ns=arrival_ns)
+
+
+class TestPipelineFrameClock:
+
+    def test_frames_carry_integer_clock_and_per_lap_anchor(self, tmp_path, monkeypatch):
+        anchors = iter(range(1, 100))
+        monkeypatch.setattr(main, "_wall_anchor_ns", lambda: next(anchors) * 10**18)
+        rig = main.ConsolePipeline("rig1", "192.168.1.31", str(tmp_path / "laps"), str(tmp_path / "failed"))
+        os.makedirs(rig.log_dir)
+        base = 10**12
+        _run(rig, [(pid, 1, 10.0, base + pid * 16 * MS) for pid in range(1, 6)])
+        lap1 = list(rig.lap_batch)   # 書き出し間隔未満なのでまだ渡していない
+        assert [s["arrival_ns"] for s in lap1] == [base + pid * 16 * MS for pid in range(1, 6)]
+        assert all(type(s["arrival_ns"]) is int for s in lap1)
+        assert "timestamp" not in lap1[0]
+        # reset() で1回、最初のフレームでラップが変わって1回。ラップ内は固定
+        assert {s["wall_anchor_ns"] for s in lap1} == {2 * 10**18}
+
+        _run(rig, [(6, 2, 10.0, base + 6 * 16 * MS), (7, 2, 10.0, base + 7 * 16 * MS)])
+        assert [s["wall_anchor_ns"] for s in rig.lap_batch] == [3 * 10**18]
+        rig.drain()
+        with open(os.path.join(rig.log_dir, os.listdir(rig.log_dir)[0])) as f:
+            saved = json.load(f)
+        assert [s["arrival_ns"] for s in saved] == [base + pid * 16 * MS for pid in range(1, 7)]
+        assert saved[0]["wall_anchor_ns"] == 2 * 10**18
+
+    def test_acceleration_uses_arrival_ns_delta(self):
+        rig = main.ConsolePipeline("rig1", "192.168.1.31")
+        rig.clients.add(object())
+        # 100ms で 0.981 m/s 加速 = 1G。処理時刻ではなく到着時刻の差で求まる
+        _run(rig, [(1, 0, 10.0, 5 * 10**9), (2, 0, 10.981, 5 * 10**9 + 100 * MS)])
+        frame = json.loads(rig.broadcast.latest[None])
+        assert frame["accel_g"] == pytest.approx(1.0, rel=1e-3)
+        assert frame["arrival_ns"] == 5 * 10**9 + 100 * MS
+        # 同時刻(1ms 以下)の到着は 0 除算せず 0 扱い
+        _run(rig, [(3, 0, 12.0, 5 * 10**9 + 100 * MS)])
+        assert json.loads(rig.broadcast.latest[None])["accel_g"] == 0.0
+
+    def test_legacy_iso_timestamp_is_opt_in(self, monkeypatch):
+        rig = main.ConsolePipeline("rig1", "192.168.1.31")
+        rig.clients.add(object())
+        _run(rig, [(1, 0, 10.0, 10**12)])
+        assert "timestamp" not in json.loads(rig.broadcast.latest[None])
+
+        monkeypatch.setitem(main.CONFIG, "legacy_iso_timestamps", True)
+        _run(rig, [(2, 0, 10.0, 10**12 + 16 * MS)])
+        frame = json.loads(rig.broadcast.latest[None])
+        assert frame["timestamp"] == main._ns_to_iso(frame["arrival_ns"] + frame["wall_anchor_ns"])
+
+
+def _v3_lap(n=10, gap_at=None):
+    anchor = int(datetime(2026, 10, 17, 9, 30).timestamp()) * 10**9 - 10**12
+    samples = []
+    t = 10**12
+    for i in range(n):
+        samples.append({"package_id": i + 1, "lap_count": 3, "speed_kmh": 100.0 + i,
+                        "position_x": float(i), "position_z": 0.0, "car_id": 1234,
+                        "arrival_ns": t, "wall_anchor_ns": anchor})
+        t += 60 * MS if i == gap_at else 16_666_667
+        if i == gap_at:
+            t += 3 * 10**9   # 記録の中断(LAP_DURATION_GAP_S 超)
+    return samples
+
+
+class TestLapFileClock:
+
+    def test_duration_is_summed_from_integer_deltas(self):
+        assert main._lap_duration_approx_ms(_v3_lap(61)) == 1000
+        # 中断区間(LAP_DURATION_GAP_S 以上)は算入しない
+        assert main._lap_duration_approx_ms(_v3_lap(61, gap_at=9)) == 983
+
+    def test_iso_duration_fallback_for_v2(self):
+        start = datetime(2026, 7, 16, 3, 48, 43)
+        v2 = [{"timestamp": (start + timedelta(milliseconds=20 * i)).isoformat(), "lap_count": 1}
+              for i in range(51)]
+        v2.insert(25, {"timestamp": (start + timedelta(seconds=100)).isoformat()})
+        assert main._lap_duration_approx_ms(v2) == 1000 - 20
+
+    def test_iso_timestamp_is_derived_only_for_requests_without_arrival_ns(self, tmp_path):
+        path = tmp_path / "lap.json"
+        path.write_text(json.dumps(_v3_lap(3)))
+
+        body, *_ = main._load_lap_file(str(path), ("timestamp", "speed_kmh"), 1)
+        first = json.loads(body)[0]
+        assert first["timestamp"] == "2026-10-17T09:30:00"
+
+        body, _, _, first_sample, _ = main._load_lap_file(str(path), ("timestamp", "arrival_ns"), 1)
+        assert json.loads(body)[0] == {"arrival_ns": 10**12}
+        assert "arrival_ns" in first_sample
+
+    def test_csv_export_round_trips_nanoseconds(self, tmp_path):
+        path = tmp_path / "lap.json"
+        samples = _v3_lap(3)
+        path.write_text(json.dumps(samples))
+        body, *_ = main._load_lap_file(str(path), main.CSV_ALL_FIELDS, 1, 'csv')
+        restored = main._parse_and_convert_csv(body.lstrip('\ufeff'))
+        assert [s["arrival_ns"] for s in restored] == [s["arrival_ns"] for s in samples]
+        assert restored[0]["wall_anchor_ns"] == samples[0]["wall_anchor_ns"]
+        assert restored[1]["timestamp"] == "2026-10-17T09:30:00.016666"
+
+
+class TestReplayArrival:
+
+    def test_replay_keeps_capture_spacing_at_max_speed(self, tmp_path):
+        xor = GT7Decoder.XOR_MAP[b'~']
+        path = tmp_path / "session.gt7raw"
+        _write_capture(path, [_encrypt_packet(_packet(pid, 1), xor) for pid in range(1, 11)],
+                       interval_ns=16_666_667)
+
+        async def scenario():
+            client = ReplayTelemetryClient(str(path), speed=0)
+            await client.connect()
+            got = []
+            while len(got) < 10:
+                got += await client.receive_batch(64, with_arrival=True)
+            client.close()
+            return got
+
+        got = asyncio.run(scenario())
+        arrivals = [a for _, _, a in got]
+        assert [b - a for a, b in zip(arrivals, arrivals[1:])] == [16_666_667] * 9
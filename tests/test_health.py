@@ -0,0 +1,120 @@
+"""
+受信ヘルス(health.py の ReceiveHealth)の回帰テスト
+
+/proc/net/udp の解析、到着間隔ヒストグラムとジッタ、原因別の損失集計、
+キュー深さプローブ、実ソケットでのカーネル滞留の読み取りを検証する。
+
+実行:
+    pytest tests/ -v
+"""
+
+import os
+import socket
+import time
+
+import pytest
+
+from health import INTERVAL_BUCKETS_MS, LOSS_CAUSES, ReceiveHealth, read_udp_socket_stats
+
+_PROC_SAMPLE = """\
+   sl  local_address rem_address   st tx_queue rx_queue tr tm->when retrnsmt   uid  timeout inode ref pointer drops
+  100: 00000000:83CC 00000000:0000 07 00000000:00000A00 00:00000000 00000000     0        0 12345 2 0000000000000000 17
+  101: 0100007F:0035 00000000:0000 07 00000000:00000000 00:00000000 00000000   101        0 23456 2 0000000000000000 0
+"""
+
+
+def _bucket(interval_ms):
+    return next((i for i, edge in enumerate(INTERVAL_BUCKETS_MS) if interval_ms <= edge), len(INTERVAL_BUCKETS_MS))
+
+
+class TestProcNetUdp:
+
+    def test_reads_rx_queue_and_drops_for_port(self, tmp_path):
+        path = tmp_path / "udp"
+        path.write_text(_PROC_SAMPLE)
+        assert read_udp_socket_stats(33740, paths=(str(path),)) == (0xA00, 17)
+        assert read_udp_socket_stats(33739, paths=(str(path),)) is None
+        assert read_udp_socket_stats(33740, paths=(str(tmp_path / "missing"),)) is None
+
+    @pytest.mark.skipif(not os.path.exists("/proc/net/udp"), reason="Linux only")
+    def test_unread_datagrams_show_up_as_kernel_queue(self):
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as rx, \
+                socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as tx:
+            rx.bind(("127.0.0.1", 0))
+            port = rx.getsockname()[1]
+            health = ReceiveHealth(port)
+            for _ in range(5):
+                tx.sendto(b"x" * 296, ("127.0.0.1", port))
+            time.sleep(0.05)
+            snap = health.snapshot()
+        assert snap["socket"]["kernel_rx_queue_bytes"] > 0
+        assert snap["socket"]["kernel_drops"] == 0
+
+
+class TestArrivals:
+
+    def test_interval_histogram_and_rate(self):
+        health = ReceiveHealth()
+        addr = ("192.168.1.31", 33740)
+        t = 0
+        for _ in range(61):
+            health.record_arrival(addr, t)
+            t += 16_666_667
+        assert health.snapshot()["sources"]["192.168.1.31"]["rate_hz"] == pytest.approx(60, abs=0.1)
+        health.record_arrival(addr, t + 200_000_000)   # 200ms 途切れる
+
+        counts = health.interval_counts
+        assert counts[_bucket(16.67)] == 60
+        assert counts[_bucket(216.67)] == 1
+        snap = health.snapshot()
+        src = snap["sources"]["192.168.1.31"]
+        assert src["packets"] == 62
+        assert src["rate_hz"] < 60   # 途切れは平滑化した受信レートを下げる
+        assert snap["max_interval_ms"] == pytest.approx(216.667, abs=0.01)
+        assert sum(b["count"] for b in snap["interval_histogram_ms"]) == 61
+        assert snap["interval_histogram_ms"][-1]["le"] is None
+
+    def test_jitter_is_zero_for_steady_stream_and_grows_with_variation(self):
+        steady, bursty = ReceiveHealth(), ReceiveHealth()
+        t = 0
+        for i in range(200):
+            steady.record_arrival(("a", 1), i * 16_666_667)
+            t += 1_000_000 if i % 2 else 32_000_000
+            bursty.record_arrival(("a", 1), t)
+        assert steady.snapshot()["sources"]["a"]["jitter_ms"] == pytest.approx(0, abs=1e-6)
+        assert bursty.snapshot()["sources"]["a"]["jitter_ms"] > 20
+
+    def test_sources_are_tracked_separately(self):
+        health = ReceiveHealth()
+        for i in range(10):
+            health.record_arrival(("rig1", 1), i * 16_666_667)
+            health.record_arrival(("rig2", 1), i * 16_666_667 + 1000)
+        # 2台が交互に届いても、間隔は送信元ごとに測る(0ms 付近には入らない)
+        assert health.interval_counts[0] == 0
+        assert set(health.snapshot()["sources"]) == {"rig1", "rig2"}
+
+
+class TestLossAndDepths:
+
+    def test_loss_breakdown_by_cause_and_console(self):
+        health = ReceiveHealth()
+        health.count_loss("out_of_order", console_id="rig1")
+        health.count_loss("package_id_gap", 3, console_id="rig1")
+        health.count_loss("parse_failure", console_id="rig2")
+        health.count_loss("queue_overflow", 5)
+        health.count_loss("decrypt_failure", 0)
+        loss = health.snapshot()["loss"]
+        assert set(loss["total"]) == set(LOSS_CAUSES)
+        assert loss["total"]["package_id_gap"] == 3
+        assert loss["total"]["queue_overflow"] == 5
+        assert loss["before_routing"]["queue_overflow"] == 5
+        assert loss["by_console"]["rig1"]["out_of_order"] == 1
+        assert loss["by_console"]["rig2"]["parse_failure"] == 1
+
+    def test_depth_probes_are_read_at_snapshot_time(self):
+        health = ReceiveHealth()
+        depth = [0]
+        health.add_depth_probe("receive_queue", lambda: depth[0])
+        health.add_depth_probe("broken", lambda: 1 / 0)
+        depth[0] = 7
+        assert health.snapshot()["queue_depths"] == {"receive_queue": 7, "broken": None}
@@ -0,0 +1,132 @@
+"""
+フレーム単位の遅延トレース(latency.py と main.py の配信経路)の回帰テスト
+
+抜き取り・データグラムとトレースの対応付け・段別/クライアント別の集計と、
+キャプチャの再生 → 受信ループ → WebSocket 送信までの結合で
+/api/health/latency に段別・クライアント別の遅延が現れることを検証する。
+
+実行:
+    pytest tests/ -v
+"""
+
+import asyncio
+import json
+
+import aiohttp
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+import main
+from decoder import GT7Decoder
+from latency import LATENCY_STAGES, FrameTrace, LatencyTracer
+
+from test_capture import ADDR, _write_capture
+from test_console_pipeline import _packet
+from test_decoder import _encrypt_packet
+
+
+class TestLatencyTracer:
+
+    def test_every_nth_datagram_is_sampled_and_claimed_by_identity(self):
+        tracer = LatencyTracer(sample_every=3)
+        datagrams = [bytes([i]) * 8 for i in range(9)]
+        for i, data in enumerate(datagrams):
+            tracer.on_arrival(data, 1000 + i)
+        claimed = [tracer.claim(data) for data in datagrams]
+        assert [i for i, t in enumerate(claimed) if t is not None] == [2, 5, 8]
+        assert claimed[5].arrival_ns == 1005
+        # 内容が同じでも別オブジェクト(重複データグラム)には紐付かない
+        tracer.on_arrival(b'x' * 8, 0)
+        tracer.on_arrival(b'y' * 8, 0)
+        tracer.on_arrival(datagrams[0], 0)
+        assert tracer.claim(bytes(bytearray(datagrams[0]))) is None
+        assert tracer.claim(datagrams[0]) is not None
+        assert tracer.traces == 4
+
+    def test_unclaimed_traces_are_bounded(self):
+        tracer = LatencyTracer(sample_every=1)
+        kept = [bytes([i % 256, i // 256]) for i in range(tracer.PENDING_MAX + 5)]
+        for data in kept:
+            tracer.on_arrival(data, 0)
+        snap = tracer.snapshot()
+        assert snap["abandoned"] == 5 and snap["pending"] == tracer.PENDING_MAX
+        assert tracer.claim(kept[0]) is None and tracer.claim(kept[-1]) is not None
+
+    def test_stage_durations_are_differences_between_checkpoints(self):
+        tracer = LatencyTracer(sample_every=1)
+        for offset in range(100):
+            trace = FrameTrace(arrival_ns=0)
+            t = 0
+            for i, stage in enumerate(LATENCY_STAGES):
+                t += (i + 1) * 1_000_000 + offset * 1000   # decrypt 1ms, parse 2ms, ...
+                trace.mark(stage, t)
+            tracer.finish(trace)
+            tracer.record_send(trace, "rig1/a#1", t + 500_000)
+            tracer.record_send(trace, "rig1/b#2", t + 2_500_000)
+        snap = tracer.snapshot()
+        assert snap["stages"]["decrypt"]["count"] == 100
+        assert 1.0 <= snap["stages"]["decrypt"]["p50_ms"] <= 1.1
+        assert 6.0 <= snap["stages"]["enqueue"]["p99_ms"] <= 6.1
+        assert snap["stages"]["send"]["count"] == 200
+        end = sum(range(1, len(LATENCY_STAGES) + 1))
+        assert snap["clients"]["rig1/a#1"]["p50_ms"] >= end + 0.5
+        assert snap["clients"]["rig1/b#2"]["max_ms"] == round(end + 2.5 + len(LATENCY_STAGES) * 0.099, 3)
+        tracer.forget_client("rig1/a#1")
+        assert list(tracer.snapshot()["clients"]) == ["rig1/b#2"]
+
+
+class TestEndToEndTracing:
+
+    def test_replayed_frames_are_traced_to_websocket_send(self, tmp_path, monkeypatch):
+        """再生したフレームが受信ループ・配信タスクを経て WebSocket で送られるまでを計測する"""
+        xor = GT7Decoder.XOR_MAP[b'~']
+        packets = [_encrypt_packet(_packet(pid, 1), xor) for pid in range(1, 121)]
+        capture_path = tmp_path / "session.gt7raw"
+        _write_capture(capture_path, packets, interval_ns=2_000_000)
+
+        pipeline = main.ConsolePipeline("default", ADDR[0], str(tmp_path / "gt7data"), str(tmp_path / "failed"))
+        monkeypatch.setattr(main, "CONSOLES", {"default": pipeline})
+        monkeypatch.setitem(main.CONFIG, "replay_capture", str(capture_path))
+        monkeypatch.setitem(main.CONFIG, "replay_speed", 1.0)
+        monkeypatch.setitem(main.CONFIG, "decode_worker", False)
+        monkeypatch.setitem(main.CONFIG, "latency_trace_sample_every", 2)
+
+        app = web.Application()
+        app.router.add_get('/ws', main.websocket_handler)
+        app.router.add_get('/api/health/latency', main.api_latency_handler)
+
+        async def scenario():
+            async with TestServer(app) as server, aiohttp.ClientSession() as session:
+                ws = await session.ws_connect(server.make_url('/ws'))
+                task = asyncio.create_task(main.telemetry_background_task())
+                received = 0
+                while pipeline.last_package_id < 120:
+                    msg = await asyncio.wait_for(ws.receive(), 2)
+                    received += msg.type == aiohttp.WSMsgType.TEXT
+                async with session.get(server.make_url('/api/health/latency')) as resp:
+                    status, body = resp.status, await resp.json()
+                await ws.close()
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+                async with session.get(server.make_url('/api/health/latency')) as resp:
+                    stopped = resp.status
+                return received, status, body, stopped
+
+        received, status, body, stopped = asyncio.run(scenario())
+        assert received > 0
+        assert status == 200 and body["enabled"] and body["sample_every"] == 2
+        assert body["traces"] == 60
+        for stage in LATENCY_STAGES:
+            assert body["stages"][stage]["count"] > 0, stage
+        sent = body["stages"]["send"]["count"]
+        # 最後の1件は問い合わせ時点で送信待ちの可能性がある。それ以外は送信済みか上書き済み
+        assert sent > 0 and sent + body["superseded"] >= 59
+        (client_id, client), = body["clients"].items()
+        assert client_id.startswith("default/")
+        assert client["count"] == body["end_to_end"]["count"] == sent
+        assert 0 < client["p50_ms"] <= client["max_ms"] < 1000
+        assert stopped == 503
+        assert json.dumps(body)
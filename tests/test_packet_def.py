@@ -0,0 +1,242 @@
+"""
+packet_def.json 由来のコンパイル済みパーサの回帰テスト
+
+decoder.py は packet_def.json をバリアント(A/B/~)ごとに1つの struct.Struct へ
+コンパイルして解析する。本テストは、フィールドごとに struct.unpack_from を呼んでいた
+旧実装(_legacy_extract_fields として下に原文のまま保存)と、全バリアント・乱数パケットで
+解析結果がフィールド単位で完全一致することを検証する。
+
+実行:
+    pytest tests/ -v
+"""
+
+import math
+import random
+import struct
+
+import pytest
+
+from decoder import GT7Decoder, _PACKET_LAYOUTS
+
+
+# ─────────────────────────────────────────────────────────────────────
+# 旧実装(フィールド単位 unpack_from)。比較の基準として変更しないこと。
+# ─────────────────────────────────────────────────────────────────────
+
+
+def _legacy_quat(d, f):
+    """パケットから単位クォータニオン (x, y, z, w) を読む"""
+    return (f('f', d, 0x1C)[0], f('f', d, 0x20)[0], f('f', d, 0x24)[0], f('f', d, 0x28)[0])
+
+
+def _legacy_quat_pitch(d, f):
+    x, y, z, w = _legacy_quat(d, f)
+    fy = 2 * (y * z - w * x)                       # 車体前方ベクトルの上下成分
+    return -math.asin(max(-1.0, min(1.0, fy)))     # 正=機首上げ
+
+
+def _legacy_quat_yaw(d, f):
+    x, y, z, w = _legacy_quat(d, f)
+    fx = 2 * (x * z + w * y)
+    fz = 1 - 2 * (x * x + y * y)
+    return math.atan2(-fx, -fz)                    # 前方=-Z 規約。±π, 0=北
+
+
+def _legacy_quat_roll(d, f):
+    x, y, z, w = _legacy_quat(d, f)
+    ry = 2 * (x * y + w * z)                       # 車体右ベクトルの上下成分
+    return math.asin(max(-1.0, min(1.0, ry)))      # 正=右ロール
+
+
+def _legacy_extract_fields(d: bytes) -> dict:
+    """バイナリデータからテレメトリフィールドを抽出"""
+    f = struct.unpack_from
+
+    speed_ms = f('f', d, 0x4C)[0]
+    gear_byte = f('B', d, 0x90)[0]
+    rpm_alert_max = f('H', d, 0x8A)[0]
+    flags_raw = f('H', d, 0x8E)[0]
+
+    # スタート順位・参加台数 (レース前のみ有効、開始後は-1)
+    pre_race_position = f('h', d, 0x84)[0]
+    num_cars_pre_race = f('h', d, 0x86)[0]
+    suggested = gear_byte >> 4
+
+    result = {
+        # 速度
+        "speed_ms": speed_ms,
+        "speed_kmh": speed_ms * 3.6,
+
+        # エンジン
+        "rpm": f('f', d, 0x3C)[0],
+        "max_rpm": rpm_alert_max if rpm_alert_max > 0 else 9000,
+        "rpm_alert_min": f('H', d, 0x88)[0],
+
+        # ギア・ペダル
+        "gear": gear_byte & 0x0F,
+        "suggested_gear": suggested if suggested < 15 else None,
+        "throttle": f('B', d, 0x91)[0],
+        "throttle_pct": f('B', d, 0x91)[0] / GT7Decoder.PEDAL_PCT_DIVISOR,
+        "brake": f('B', d, 0x92)[0],
+        "brake_pct": f('B', d, 0x92)[0] / GT7Decoder.PEDAL_PCT_DIVISOR,
+
+        # クラッチ
+        "clutch": f('f', d, 0xF4)[0],
+        "clutch_engagement": f('f', d, 0xF8)[0],
+        "clutch_gearbox_rpm": f('f', d, 0xFC)[0],
+
+        # タイヤ温度 [FL, FR, RL, RR]
+        "tyre_temp": [f('f', d, 0x60 + i * 4)[0] for i in range(4)],
+
+        # 路面法線ベクトル
+        "road_plane_x": f('f', d, 0x94)[0],
+        "road_plane_y": f('f', d, 0x98)[0],
+        "road_plane_z": f('f', d, 0x9C)[0],
+        "road_plane_distance": f('f', d, 0xA0)[0],
+
+        # サスペンション高さ [FL, FR, RL, RR]
+        "susp_height": [f('f', d, 0xC4 + i * 4)[0] for i in range(4)],
+
+        # タイヤ半径 [FL, FR, RL, RR]
+        "tyre_radius": [f('f', d, 0xB4 + i * 4)[0] for i in range(4)],
+
+        # ホイールRPS [FL, FR, RL, RR]
+        "wheel_rps": [f('f', d, 0xA4 + i * 4)[0] for i in range(4)],
+
+        # 位置
+        "position_x": f('f', d, 0x04)[0],
+        "position_y": f('f', d, 0x08)[0],
+        "position_z": f('f', d, 0x0C)[0],
+
+        # 速度ベクトル (m/s)
+        "velocity_x": f('f', d, 0x10)[0],
+        "velocity_y": f('f', d, 0x14)[0],
+        "velocity_z": f('f', d, 0x18)[0],
+
+        # 回転: 真のオイラー角(rad)。パケット 0x1C-0x28 はオイラー角ではなく
+        # 単位クォータニオン(x,y,z,w) — 実走2万フレームで x²+y²+z²+w²=1.0000 を確認。
+        # 旧実装は成分をラジアン扱いしており、yaw は無意味な値・pitch/roll は約半分だった。
+        # 検証: yaw は速度ベクトル方位と中央値0.18°で一致 / corr(sin(pitch), vy/v)=+0.97 /
+        #       roll は右輪サス圧縮差と正相関(17万フレーム)。
+        "rotation_pitch": _legacy_quat_pitch(d, f),   # 正=機首上げ
+        "rotation_yaw": _legacy_quat_yaw(d, f),       # 世界ヘディング ±π(0=北)
+        "rotation_roll": _legacy_quat_roll(d, f),     # 正=右ロール
+
+        # 方角 = クォータニオン w 成分 (1.0=北, 0.0=南)。HDG 表示が使用。
+        "orientation": f('f', d, 0x28)[0],
+
+        # 角速度 (rad/s)
+        "angular_velocity_x": f('f', d, 0x2C)[0],
+        "angular_velocity_y": f('f', d, 0x30)[0],
+        "angular_velocity_z": f('f', d, 0x34)[0],
+
+        # 車体
+        "body_height": f('f', d, 0x38)[0],
+        "car_max_speed": f('H', d, 0x8C)[0],
+        "oil_pressure": f('f', d, 0x54)[0],
+
+        # 燃料
+        "current_fuel": f('f', d, 0x44)[0],
+        "fuel_capacity": f('f', d, 0x48)[0],
+
+        # ブースト
+        "boost": f('f', d, 0x50)[0] - 1,
+
+        # トランスミッション
+        "transmission_max_speed": f('f', d, 0x100)[0],
+
+        # ギア比 [1st - 8th]
+        "gear_ratios": [f('f', d, 0x104 + i * 4)[0] for i in range(8)],
+
+        # パッケージID
+        "package_id": f('i', d, 0x70)[0],
+
+        # ラップ
+        "lap_count": f('h', d, 0x74)[0],
+        "total_laps": f('h', d, 0x76)[0],
+        "best_laptime": f('i', d, 0x78)[0],
+        "last_laptime": f('i', d, 0x7C)[0],
+        "current_laptime": f('i', d, 0x80)[0],
+
+        # レース (スタート前のみ有効、開始後は-1)
+        "pre_race_position": pre_race_position if pre_race_position >= 0 else None,
+        "num_cars_pre_race": num_cars_pre_race if num_cars_pre_race >= 0 else None,
+
+        # フラグ
+        "flags": {
+            "car_on_track": bool(flags_raw & 0x0001),
+            "paused": bool(flags_raw & 0x0002),
+            "loading": bool(flags_raw & 0x0004),
+            "in_gear": bool(flags_raw & 0x0008),
+            "has_turbo": bool(flags_raw & 0x0010),
+            "rev_limiter": bool(flags_raw & 0x0020),
+            "hand_brake": bool(flags_raw & 0x0040),
+            "lights": bool(flags_raw & 0x0080),
+            "high_beams": bool(flags_raw & 0x0100),
+            "low_beams": bool(flags_raw & 0x0200),
+            "asm_active": bool(flags_raw & 0x0400),
+            "tcs_active": bool(flags_raw & 0x0800),
+        },
+
+        # 車種
+        "car_id": f('i', d, 0x124)[0],
+    }
+
+    # Packet B 拡張フィールド (316 bytes以上)
+    if len(d) >= 0x13C:
+        result["wheel_rotation"] = f('f', d, 0x128)[0]
+        result["body_accel_sway"] = f('f', d, 0x130)[0]
+        result["body_accel_heave"] = f('f', d, 0x134)[0]
+        result["body_accel_surge"] = f('f', d, 0x138)[0]
+
+    # Packet ~ 拡張フィールド (344 bytes以上)
+    if len(d) >= 0x158:
+        result["throttle_filtered_pct"] = f('B', d, 0x13C)[0] / GT7Decoder.PEDAL_PCT_DIVISOR
+        result["brake_filtered_pct"] = f('B', d, 0x13D)[0] / GT7Decoder.PEDAL_PCT_DIVISOR
+        result["torque_vector"] = [f('f', d, 0x140 + i * 4)[0] for i in range(4)]
+        result["energy_recovery"] = f('f', d, 0x150)[0]
+
+    return result
+
+
+# ─────────────────────────────────────────────────────────────────────
+# 比較ヘルパー
+# ─────────────────────────────────────────────────────────────────────
+
+def _random_packet(rng, size):
+    """乱数で埋めたうえで float 領域を有限値に揃えた平文パケット"""
+    d = bytearray(rng.getrandbits(8) for _ in range(size))
+    layout = GT7Decoder._layout_for(size)
+    if layout is not None:
+        for offset, code, count in layout.fields.values():
+            if code == 'f':
+                for i in range(count):
+                    struct.pack_into('<f', d, offset + i * 4, rng.uniform(-1000.0, 1000.0))
+    # クォータニオンは正規化しておく(asin の定義域内で比較するため)
+    q = [rng.uniform(-1.0, 1.0) for _ in range(4)]
+    n = math.sqrt(sum(v * v for v in q))
+    struct.pack_into('<4f', d, 0x1C, *(v / n for v in q))
+    return bytes(d)
+
+
+class TestCompiledParserMatchesLegacy:
+
+    @pytest.mark.parametrize("size", [0x128, 0x130, 0x13C, 0x150, 0x158])
+    def test_field_for_field_equality(self, size):
+        """全バリアント(中間サイズ含む)で旧実装と同じキー・同じ値になること"""
+        rng = random.Random(size)
+        for _ in range(50):
+            packet = _random_packet(rng, size)
+            expected = _legacy_extract_fields(packet)
+            actual = GT7Decoder._extract_fields(packet)
+            assert set(actual) == set(expected), "キー集合が一致するべき"
+            for key, value in expected.items():
+                assert actual[key] == value, f"{key}: {actual[key]!r} != {value!r}"
+
+    def test_one_struct_per_variant(self):
+        """A/B/~ の3バリアントがサイズ降順にコンパイルされていること"""
+        assert [(layout.name, layout.size) for layout in _PACKET_LAYOUTS] == [
+            ('~', 0x158), ('B', 0x13C), ('A', 0x128)
+        ]
+        for layout in _PACKET_LAYOUTS:
+            assert layout.struct.size <= layout.size
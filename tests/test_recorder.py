@@ -0,0 +1,156 @@
+"""
+ラップ記録バッファ(recorder.LapBuffer)の回帰テスト
+
+LapBuffer は進行中ラップを NumPy の列指向配列で保持し、ラップファイルへは従来と
+同じ JSON サンプル配列として書き出す。解析結果 dict を詰めて戻したときに、
+キー集合・整数/フラグ/コース/None・タイムスタンプ(v3 の整数時刻を含む)と、派生値を
+含む float が元の値のまま保たれること、詰められないサンプルは捨てて記録を続けることを
+検証する。
+
+実行:
+    pytest tests/ -v
+"""
+
+import io
+import json
+import math
+from datetime import datetime, timedelta
+
+import pytest
+
+from decoder import GT7Decoder
+from recorder import LapBuffer
+
+from test_decoder import _build_plaintext
+
+
+def _sample(i, size=0x158, fuel=True):
+    """main.py の telemetry_background_task が蓄積するのと同じ形の1サンプル"""
+    parsed = GT7Decoder().parse(_build_plaintext(package_id=i + 1, speed_ms=10.0 + i, size=size))
+    parsed["timestamp"] = (datetime(2026, 7, 16, 3, 48, 43) + timedelta(milliseconds=16 * i)).isoformat()
+    parsed["accel_g"] = 0.25
+    parsed["accel_decel"] = 0.0
+    parsed["course"] = {"id": "suzuka", "name": "Suzuka Circuit", "confidence": 0.9}
+    if fuel:
+        parsed.update({"fuel_consumed": 0.01, "fuel_per_lap": 2.5,
+                       "laps_since_refuel": 1, "fuel_laps_remaining": 12.3})
+    return parsed
+
+
+def _assert_same_sample(expected, actual):
+    assert set(actual) == set(expected)
+    for key, value in expected.items():
+        if key == "timestamp":
+            assert datetime.fromisoformat(actual[key]) == datetime.fromisoformat(value)
+        elif isinstance(value, float):
+            assert actual[key] == pytest.approx(value, rel=1e-6, abs=1e-6), key
+        elif isinstance(value, list):
+            assert actual[key] == pytest.approx(value, rel=1e-6, abs=1e-6), key
+        else:
+            assert actual[key] == value, key
+
+
+class TestLapBuffer:
+
+    def test_round_trip_preserves_keys_and_values(self):
+        """A/B/~ と燃料キー有無が混在しても、各行のキー集合と値が元どおりに戻ること"""
+        samples = [
+            _sample(i, size=(0x128, 0x13C, 0x158)[i % 3], fuel=bool(i % 2))
+            for i in range(30)
+        ]
+        buf = LapBuffer(capacity=4)  # 伸長経路も通す
+        for s in samples:
+            buf.append(s)
+
+        assert len(buf) == len(samples)
+        for expected, actual in zip(samples, buf):
+            _assert_same_sample(expected, actual)
+        _assert_same_sample(samples[-1], buf[-1])
+
+    def test_nullable_and_unknown_keys(self):
+        """None(suggested_gear 等)と列に無いキーがそのまま戻ること"""
+        s = _sample(0)
+        s["suggested_gear"] = None
+        s["pre_race_position"] = None
+        s["extra_field"] = {"nested": [1, 2]}
+        buf = LapBuffer()
+        buf.append(s)
+        row = buf[0]
+        assert row["suggested_gear"] is None
+        assert row["pre_race_position"] is None
+        assert row["extra_field"] == {"nested": [1, 2]}
+        assert row["flags"] == s["flags"]
+
+    def test_v3_integer_clock_is_exact(self):
+        """v3 の arrival_ns / wall_anchor_ns(2**53 超の epoch ns を含む)が int のまま欠けずに戻ること"""
+        s = _sample(0)
+        del s["timestamp"]
+        s["arrival_ns"] = 987_654_321_012_345
+        s["wall_anchor_ns"] = 1_792_222_200_123_456_789
+        buf = LapBuffer()
+        buf.append(s)
+        row = buf[0]
+        _assert_same_sample(s, row)
+        assert type(row["arrival_ns"]) is int
+        assert row["arrival_ns"] + row["wall_anchor_ns"] == 1_793_209_854_444_469_134
+
+    def test_derived_floats_are_written_as_broadcast(self):
+        """Python で計算・丸めた派生値が float32 の下位桁を付けずに元の値で戻ること"""
+        s = _sample(0)
+        s.update({"accel_g": 0.12, "rotation_yaw": -math.pi, "fuel_per_lap": 2.37,
+                  "fuel_laps_remaining": 12.3})
+        buf = LapBuffer()
+        buf.append(s)
+        row = buf[0]
+        for key in ("accel_g", "rotation_yaw", "fuel_per_lap", "fuel_laps_remaining",
+                    "speed_kmh", "throttle_pct", "boost", "speed_ms"):
+            assert row[key] == s[key], key
+        assert json.dumps(row["rotation_yaw"]) == json.dumps(-math.pi)
+
+    def test_sample_that_cannot_be_packed_is_kept_as_is(self):
+        """列に詰められないサンプル(不正な timestamp 等)も捨てずに元の dict のまま戻ること"""
+        buf = LapBuffer()
+        buf.append(_sample(0))
+        bad = _sample(1)
+        bad["timestamp"] = "not-a-time"
+        buf.append(bad)
+        worse = _sample(2)
+        worse["gear_ratios"] = [None] * 8
+        worse["timestamp"] = "not-a-time"
+        buf.append(worse)
+        buf.append(_sample(3))
+        assert len(buf) == 4
+        rows = list(buf.rows())
+        assert [row["package_id"] for row in rows] == [1, 2, 3, 4]
+        assert rows[1] == bad and rows[2] == worse
+        assert buf[2] == worse and rows[3] == _sample(3)
+        out = io.StringIO()
+        buf.write_json(out)
+        assert json.loads(out.getvalue())[1]["timestamp"] == "not-a-time"
+
+    def test_write_json_matches_json_dump_of_rows(self):
+        """write_json の出力が行 dict のリストを json.dump したものと同一であること"""
+        buf = LapBuffer()
+        for i in range(10):
+            buf.append(_sample(i))
+        out = io.StringIO()
+        buf.write_json(out)
+        assert out.getvalue() == json.dumps(list(buf))
+        assert json.loads(out.getvalue())[3]["package_id"] == 4
+
+    def test_empty_buffer(self):
+        buf = LapBuffer()
+        out = io.StringIO()
+        buf.write_json(out)
+        assert out.getvalue() == "[]"
+        assert not buf
+        with pytest.raises(IndexError):
+            buf[0]
+
+    def test_much_smaller_than_dict_rows(self):
+        """1サンプルあたりの格納サイズが JSON 表現より十分小さいこと"""
+        buf = LapBuffer(capacity=1)
+        s = _sample(0)
+        buf.append(s)
+        assert buf.nbytes * 4 < len(json.dumps(s))   # 派生値の f8 列を含めて約 414 バイト
+        assert not math.isnan(buf[0]["speed_ms"])
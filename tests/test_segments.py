@@ -0,0 +1,120 @@
+"""
+lap_count が変わらない長時間ラップの分割(main.py のセグメント)の回帰テスト
+
+書き込み中のファイルがサンプル数・到着時刻差の上限に達したら番号付きセグメントとして
+完成させること、同じ走行のセグメントが番号だけ違う名前で繋がること、
+/api/laps の一覧・詳細がセグメント番号と前後のセグメントを返すことを検証する。
+
+実行:
+    pytest tests/ -v
+"""
+
+import asyncio
+import json
+import os
+
+import aiohttp
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+import main
+from decoder import CourseEstimator, GT7Decoder
+
+from test_console_pipeline import _packet
+
+SEC = 1_000_000_000
+
+
+def _pipeline(tmp_path, monkeypatch, **caps):
+    for key, value in caps.items():
+        monkeypatch.setitem(main.CONFIG, key, value)
+    rig = main.ConsolePipeline("rig1", "192.168.1.31", str(tmp_path / "laps"), str(tmp_path / "failed"))
+    os.makedirs(rig.log_dir)
+    return rig
+
+
+def _feed(rig, packets):
+    """(package_id, lap_count, arrival_ns) の列を順に handle する"""
+    decoder = GT7Decoder()
+    estimator = CourseEstimator(os.path.join(os.path.dirname(main.__file__), 'course_database.json'))
+
+    for pid, lap, arrival_ns in packets:
+        rig.handle(_packet(pid, lap), decoder, estimator, arrival_ns=arrival_ns)
+
+
+def _package_ids(directory, name):
+    with open(os.path.join(directory, name)) as f:
+        return [s["package_id"] for s in json.load(f)]
+
+
+class TestSegmentation:
+
+    def test_sample_cap_splits_the_lap_into_linked_segments(self, tmp_path, monkeypatch):
+        rig = _pipeline(tmp_path, monkeypatch, segment_max_samples=4)
+        base = rig.last_arrival_ns
+        _feed(rig, [(pid, 1, base + pid * SEC // 60) for pid in range(1, 11)] + [(11, 2, base + SEC)])
+        rig.drain()
+        saved = sorted(os.listdir(rig.log_dir))
+        assert [name.endswith(f"_Lap-1_Seg-{k}.json") for k, name in enumerate(saved, 1)] == [True] * 3
+        # 同じ走行のセグメントは番号以外の名前(日時・車種・ラップ番号)が同じ
+        assert len({name[:-len("_Seg-1.json")] for name in saved}) == 1
+        ids = [_package_ids(rig.log_dir, name) for name in saved]
+        assert ids == [[1, 2, 3, 4], [5, 6, 7, 8], [9, 10, 11]]
+        assert rig.segment_index == 0 and rig.lap_samples == 0
+
+        # 次のラップは分割されなければ従来の名前
+        _feed(rig, [(12, 2, base + 2 * SEC), (13, 3, base + 3 * SEC)])
+        rig.drain()
+        assert len([n for n in os.listdir(rig.log_dir) if n.endswith("_Lap-2.json")]) == 1
+
+    def test_time_cap_splits_at_a_long_pause(self, tmp_path, monkeypatch):
+        rig = _pipeline(tmp_path, monkeypatch, segment_max_sec=60)
+        base = rig.last_arrival_ns
+        pause = base + 83_926 * SEC          # メニュー放置で何時間も受信が途切れた
+        _feed(rig, [(1, 1, base + SEC), (2, 1, base + 2 * SEC), (3, 1, pause), (4, 1, pause + SEC)])
+        rig.flush()
+        saved = sorted(os.listdir(rig.log_dir))
+        assert [_package_ids(rig.log_dir, name) for name in saved] == [[1, 2], [3, 4]]
+        assert saved[1].endswith("_Lap-1_Seg-2.json")
+
+    def test_caps_of_zero_disable_splitting(self, tmp_path, monkeypatch):
+        rig = _pipeline(tmp_path, monkeypatch, segment_max_sec=0, segment_max_samples=0)
+        base = rig.last_arrival_ns
+        _feed(rig, [(pid, 1, base + pid * 10_000 * SEC) for pid in range(1, 6)])
+        rig.flush()
+        (saved,) = os.listdir(rig.log_dir)
+        assert saved.endswith("_Lap-1.json")
+
+
+class TestSegmentApi:
+
+    def test_list_and_detail_link_segments(self, tmp_path, monkeypatch):
+        rig = _pipeline(tmp_path, monkeypatch, segment_max_samples=3)
+        base = rig.last_arrival_ns
+        _feed(rig, [(pid, 1, base + pid * SEC // 60) for pid in range(1, 8)])
+        rig.flush()
+        monkeypatch.setattr(main, "CONSOLES", {"rig1": rig})
+        first, second, third = sorted(os.listdir(rig.log_dir))
+
+        app = web.Application()
+        app.router.add_get('/api/laps', main.api_laps_list_handler)
+        app.router.add_get('/api/laps/{file}', main.api_lap_detail_handler)
+
+        async def scenario():
+            async with TestServer(app) as server, aiohttp.ClientSession() as session:
+                async with session.get(server.make_url('/api/laps')) as resp:
+                    listing = await resp.json()
+                details = []
+                for name in (first, second, third):
+                    async with session.get(server.make_url('/api/laps/' + name)) as resp:
+                        details.append((await resp.json())["meta"])
+                return listing, details
+
+        listing, details = asyncio.run(scenario())
+        assert [lap["segment"] for lap in listing["laps"]] == [3, 2, 1]
+        assert [(m["segment_prev"], m["segment_next"]) for m in details] == [
+            (None, second), (first, third), (second, None),
+        ]
+        assert main._parse_lap_filename(first[:-len("_Seg-1.json")] + ".json").keys() == {
+            "file", "recorded_at", "car_id", "lap_number",
+        }
@@ -0,0 +1,163 @@
+"""
+PS5 代役シミュレータ(simulator.py)の回帰テスト
+
+サンプル → 平文パケットの符号化が decoder.py の解析と往復一致すること、
+ラップファイルの読み込み、ループバックの実ソケットでハートビートに応答して
+復号可能なパケットを送ること(損失・入れ替え・複数台・ハートビート途絶)を検証する。
+
+実行:
+    pytest tests/ -v
+"""
+
+import asyncio
+import json
+import math
+
+import pytest
+
+from decoder import GT7Decoder
+from simulator import PACKET_SIZES, SimulatedConsole, encode_sample, load_lap, synthetic_lap
+from telemetry import GT7TelemetryClient
+
+
+class TestEncodeSample:
+
+    @pytest.mark.parametrize("hb", [b'A', b'B', b'~'])
+    def test_round_trip_through_decoder(self, hb):
+        sample = synthetic_lap(120)[17]
+        sample.update(rotation_pitch=0.05, rotation_roll=-0.08, suggested_gear=None,
+                      pre_race_position=3, boost=0.4)
+        parsed = GT7Decoder().parse(bytes(encode_sample(sample, PACKET_SIZES[hb])))
+
+        for key in ('speed_ms', 'rpm', 'position_x', 'position_z', 'current_fuel', 'boost'):
+            assert parsed[key] == pytest.approx(sample[key], abs=1e-3)
+        for key in ('rotation_pitch', 'rotation_yaw', 'rotation_roll'):
+            assert parsed[key] == pytest.approx(sample[key], abs=1e-5)
+        assert parsed['gear'] == sample['gear']
+        assert parsed['suggested_gear'] is None
+        assert parsed['pre_race_position'] == 3
+        assert parsed['num_cars_pre_race'] is None
+        assert parsed['flags']['has_turbo'] and not parsed['flags']['paused']
+        assert parsed['tyre_temp'] == pytest.approx(sample['tyre_temp'])
+
+    def test_recorded_sample_round_trips(self):
+        # ラップファイルの1行(parse() の結果)をそのまま符号化しても同じ値に戻る
+        original = GT7Decoder().parse(bytes(encode_sample(synthetic_lap(60)[5], 0x158)))
+        again = GT7Decoder().parse(bytes(encode_sample(original, 0x158)))
+        for key, value in original.items():
+            if isinstance(value, float):
+                assert again[key] == pytest.approx(value, abs=1e-5), key
+            else:
+                assert again[key] == value, key
+
+    def test_synthetic_yaw_follows_velocity(self):
+        for s in synthetic_lap(36)[::6]:
+            # 前方 = -Z 規約の yaw から前方ベクトルを戻すと速度の向きに一致する
+            fx, fz = -math.sin(s['rotation_yaw']), -math.cos(s['rotation_yaw'])
+            speed = math.hypot(s['velocity_x'], s['velocity_z'])
+            assert fx == pytest.approx(s['velocity_x'] / speed, abs=1e-9)
+            assert fz == pytest.approx(s['velocity_z'] / speed, abs=1e-9)
+
+
+class TestLoadLap:
+
+    def test_boundary_sample_of_next_lap_is_dropped(self, tmp_path):
+        samples = [dict(s, lap_count=4) for s in synthetic_lap(10)]
+        samples.append(dict(samples[-1], lap_count=5))
+        path = tmp_path / "lap.json"
+        path.write_text(json.dumps(samples))
+        assert len(load_lap(path)) == 10
+
+    def test_empty_lap_is_rejected(self, tmp_path):
+        path = tmp_path / "lap.json"
+        path.write_text("[]")
+        with pytest.raises(ValueError):
+            load_lap(path)
+
+
+async def _collect(console_kwargs, n, heartbeat=b'~', hosts=("127.0.0.1",)):
+    """シミュレータを起動し、GT7TelemetryClient でハートビートを送って n 件受信する"""
+    samples = synthetic_lap(120)
+    consoles = []
+    port = 0
+    for host in hosts:
+        console = SimulatedConsole(samples, host=host, heartbeat_port=port, seed=1, **console_kwargs)
+        await console.start()
+        port = console.port
+        consoles.append(console)
+    client = GT7TelemetryClient(list(hosts), send_port=port, receive_port=0, heartbeat_type=heartbeat)
+    await client.connect()
+    try:
+        await client.send_heartbeat()
+        received = []
+        while len(received) < n:
+            received += await asyncio.wait_for(client.receive_batch(n), 2)
+        return consoles, received
+    finally:
+        client.close()
+        for console in consoles:
+            await console.stop()
+
+
+def _package_ids(received):
+    decoder = GT7Decoder()
+    return [decoder.parse(decoder.decrypt(data))['package_id'] for data, _ in received]
+
+
+class TestSimulatedConsole:
+
+    def test_answers_heartbeat_with_decryptable_packets(self):
+        consoles, received = asyncio.run(_collect({"rate_hz": 2000}, 150, heartbeat=b'A'))
+        assert {len(data) for data, _ in received} == {PACKET_SIZES[b'A']}
+        ids = _package_ids(received)
+        assert ids[:150] == list(range(1, 151))
+        assert consoles[0].stats()["heartbeat_type"] == 'A'
+
+    def test_lap_count_advances_when_the_lap_loops(self):
+        _, received = asyncio.run(_collect({"rate_hz": 4000}, 250))
+        decoder = GT7Decoder()
+        parsed = [decoder.parse(decoder.decrypt(data)) for data, _ in received[:250]]
+        laps = [p['lap_count'] for p in parsed]
+        assert laps[0] == 1 and laps[119] == 1 and laps[120] == 2 and laps[240] == 3
+        # 2周目以降は記録ラップの最終 current_laptime を前周タイムとして送る
+        assert parsed[0]['last_laptime'] == 0
+        assert parsed[130]['last_laptime'] == 119 * 90000 // 120
+
+    def test_loss_and_reorder_show_up_as_gaps_and_inversions(self):
+        consoles, received = asyncio.run(_collect({"rate_hz": 4000, "loss": 0.1, "reorder": 0.1}, 400))
+        ids = _package_ids(received)
+        stats = consoles[0].stats()
+        assert stats["lost"] > 0 and stats["reordered"] > 0
+        assert len(set(ids)) == len(ids)
+        assert max(ids) > len(ids)                                   # 欠番がある
+        assert any(b < a for a, b in zip(ids, ids[1:]))              # 逆行がある
+
+    def test_each_console_sends_from_its_own_address(self):
+        consoles, received = asyncio.run(
+            _collect({"rate_hz": 1000}, 100, hosts=("127.0.0.2", "127.0.0.3"))
+        )
+        assert {addr[0] for _, addr in received} == {"127.0.0.2", "127.0.0.3"}
+        assert all(c.stats()["sent"] > 0 for c in consoles)
+
+    def test_streaming_stops_without_heartbeats(self):
+        async def scenario():
+            console = SimulatedConsole(synthetic_lap(60), heartbeat_port=0, rate_hz=500,
+                                       heartbeat_timeout=0.1)
+            await console.start()
+            client = GT7TelemetryClient("127.0.0.1", send_port=console.port, receive_port=0)
+            await client.connect()
+            try:
+                await client.send_heartbeat()
+                await asyncio.sleep(0.05)
+                was_streaming = console.streaming
+                await asyncio.sleep(0.2)
+                sent = console.sent
+                await asyncio.sleep(0.1)
+                return was_streaming, console.streaming, sent, console.sent
+            finally:
+                client.close()
+                await console.stop()
+
+        was_streaming, streaming, sent, sent_later = asyncio.run(scenario())
+        assert was_streaming and not streaming
+        assert sent > 0 and sent_later == sent
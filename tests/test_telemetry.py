@@ -0,0 +1,128 @@
+"""
+テレメトリクライアント(telemetry.py の GT7TelemetryClient)の回帰テスト
+
+ループバックの実ソケットで、溜まったデータグラムの一括受信(receive_batch)・
+読み出し時点の到着時刻・満杯時の最古破棄・ハートビートの複数台送信を検証する。
+
+実行:
+    pytest tests/ -v
+"""
+
+import asyncio
+import socket
+import time
+
+from telemetry import GT7TelemetryClient
+
+
+def _client(**kwargs):
+    # receive_port=0 で空きポートへ bind する
+    return GT7TelemetryClient("127.0.0.1", receive_port=0, **kwargs)
+
+
+async def _send_and_settle(client, payloads):
+    port = client._sock.getsockname()[1]
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as tx:
+        for p in payloads:
+            tx.sendto(p, ("127.0.0.1", port))
+    await asyncio.sleep(0.05)  # reader コールバックに吸い出させる
+
+
+class TestReceiveBatch:
+
+    def test_backlog_is_drained_in_one_batch(self):
+        async def scenario():
+            client = _client()
+            await client.connect()
+            try:
+                await _send_and_settle(client, [bytes([i]) * 8 for i in range(100)])
+                batch = await asyncio.wait_for(client.receive_batch(64), 1)
+                rest = await asyncio.wait_for(client.receive_batch(64), 1)
+                return batch, rest, client.packets_received
+            finally:
+                client.close()
+
+        batch, rest, received = asyncio.run(scenario())
+        assert [d[0] for d, _ in batch] == list(range(64))
+        assert [d[0] for d, _ in rest] == list(range(64, 100))
+        assert received == 100
+        assert batch[0][1][0] == "127.0.0.1"
+
+    def test_arrival_ns_is_taken_in_the_read_callback(self):
+        async def scenario():
+            client = _client()
+            await client.connect()
+            try:
+                sent_ns = time.monotonic_ns()
+                await _send_and_settle(client, [bytes([i]) * 8 for i in range(10)])
+                settled_ns = time.monotonic_ns()
+                await asyncio.sleep(0.05)   # 処理が遅れても到着時刻は読み出し時点のまま
+                batch = await asyncio.wait_for(client.receive_batch(64, with_arrival=True), 1)
+                return sent_ns, settled_ns, batch
+            finally:
+                client.close()
+
+        sent_ns, settled_ns, batch = asyncio.run(scenario())
+        arrivals = [arrival_ns for _, _, arrival_ns in batch]
+        assert len(arrivals) == 10 and arrivals == sorted(arrivals)
+        assert sent_ns <= arrivals[0] and arrivals[-1] <= settled_ns
+
+    def test_receive_from_returns_one_packet_with_address(self):
+        async def scenario():
+            client = _client()
+            await client.connect()
+            try:
+                await _send_and_settle(client, [b"first", b"second"])
+                return await asyncio.wait_for(client.receive_from(), 1), await client.receive()
+            finally:
+                client.close()
+
+        (data, addr), second = asyncio.run(scenario())
+        assert data == b"first" and addr[0] == "127.0.0.1"
+        assert second == b"second"
+
+    def test_overflow_drops_oldest(self):
+        async def scenario():
+            client = _client()
+            client.QUEUE_MAXSIZE = 10
+            await client.connect()
+            try:
+                await _send_and_settle(client, [bytes([i]) for i in range(25)])
+                return await client.receive_batch(100), client.dropped_count
+            finally:
+                client.close()
+
+        batch, dropped = asyncio.run(scenario())
+        assert [d[0] for d, _ in batch] == list(range(15, 25))
+        assert dropped == 15
+
+    def test_close_wakes_waiting_receiver(self):
+        async def scenario():
+            client = _client()
+            await client.connect()
+            waiter = asyncio.create_task(client.receive_batch())
+            await asyncio.sleep(0.01)
+            client.close()
+            return await asyncio.wait_for(waiter, 1)
+
+        assert asyncio.run(scenario()) == []
+
+
+class TestHeartbeat:
+
+    def test_heartbeat_is_sent_to_every_console(self):
+        async def scenario():
+            with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sink:
+                sink.bind(("127.0.0.1", 0))
+                sink.settimeout(1)
+                # 2台分の IP(ここでは同じループバック)へ1つずつ送られる
+                client = GT7TelemetryClient(["127.0.0.1", "127.0.0.1"], send_port=sink.getsockname()[1],
+                                            receive_port=0, heartbeat_type=b'A')
+                await client.connect()
+                try:
+                    await client.send_heartbeat()
+                finally:
+                    client.close()
+                return [sink.recvfrom(16)[0] for _ in range(2)]
+
+        assert asyncio.run(scenario()) == [b'A', b'A']
@@ -0,0 +1,328 @@
+"""
+クライアントごとの送信タスク(writer.ClientWriter)の回帰テスト
+
+送信前に来たフレームは最新のみが送られ、制御メッセージはフレームより先に順序どおり
+届くこと、送信が止まったクライアントが他のクライアントの配信を遅らせないこと、
+遅れたクライアントの rate の上限を段階的に下げてから切断すること、遅れが解消すれば
+上限を戻すこと、制御メッセージの溢れ・送信タイムアウトで切断すること、送信後の
+コールバックが失敗しても送信タスクが止まらないこと、バッチのクライアントにはフレームを
+溜めて間隔ごとに1メッセージで送ること、遅い差分配信のクライアントが delta を失わずに
+keyframe で受け直すこと(seq が欠けない)、permessage-deflate を ?compress=1 の接続だけで
+使うことを検証する。
+
+実行:
+    pytest tests/ -v
+"""
+
+import asyncio
+import json
+import os
+
+import aiohttp
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+import main
+from decoder import CourseEstimator, GT7Decoder
+from fanout import FULL_RATE
+from writer import WRITER_BATCH_MAX, WRITER_BUFFER_HIGH, WRITER_CONTROL_MAX, ClientWriter, parse_batch_ms
+
+from test_console_pipeline import _packet
+from test_fanout import _DeltaClient
+
+
+class _FakeWs:
+    """送った順に記録する WebSocket の代わり。stall を立てると送信が返らない"""
+
+    def __init__(self, delay=0):
+        self.sent = []
+        self.stall = None
+        self.delay = delay
+        self.closed = False
+
+    async def send_str(self, message):
+        if self.stall is not None:
+            await self.stall.wait()
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        self.sent.append(message)
+
+    async def send_bytes(self, message):
+        await self.send_str(message)
+
+    async def close(self):
+        self.closed = True
+
+
+class _FakeTransport:
+
+    def __init__(self):
+        self.buffered = 0
+
+    def is_closing(self):
+        return False
+
+    def get_write_buffer_size(self):
+        return self.buffered
+
+
+def _fast_review(monkeypatch, review=0.02, recover=0.1):
+    monkeypatch.setattr(ClientWriter, "REVIEW_SEC", review)
+    monkeypatch.setattr(ClientWriter, "RECOVER_SEC", recover)
+
+
+class TestClientWriter:
+
+    def test_latest_frame_wins_and_control_goes_first(self):
+        async def scenario():
+            ws = _FakeWs()
+            writer = ClientWriter(ws)
+            for i in range(3):
+                writer.offer(f"frame{i}")
+            writer.put("course")
+            writer.put("engineer")
+            writer.start()
+            await asyncio.sleep(0.01)
+            writer.offer(b"record")
+            await asyncio.sleep(0.01)
+            writer.close()
+            return ws.sent, writer
+
+        sent, writer = asyncio.run(scenario())
+        assert sent == ["course", "engineer", "frame2", b"record"]
+        assert writer.overwritten == 2 and writer.sent == 4
+
+    def test_failing_on_sent_does_not_stop_the_writer(self):
+        async def scenario():
+            ws = _FakeWs()
+            writer = ClientWriter(ws)
+            writer.start()
+            writer.offer("frame1", on_sent=lambda ws: None.last_ns)
+            await asyncio.sleep(0.01)
+            writer.offer("frame2")
+            await asyncio.sleep(0.01)
+            alive = not writer._task.done()
+            writer.close()
+            return ws.sent, alive
+
+        sent, alive = asyncio.run(scenario())
+        assert sent == ["frame1", "frame2"] and alive
+
+    def test_buffer_backpressure_lowers_then_restores_the_rate(self, monkeypatch):
+        _fast_review(monkeypatch)
+        caps = []
+
+        transport = _FakeTransport()
+
+        def on_rate_cap(ws, cap):
+            caps.append(cap)
+            if cap == 5:
+                transport.buffered = 0      # 最下段まで下げたところで遅れが解消する
+
+        async def scenario():
+            writer = ClientWriter(_FakeWs(), transport, on_rate_cap=on_rate_cap)
+            writer.requested_rate = 20
+            writer.start()
+            transport.buffered = WRITER_BUFFER_HIGH + 1
+            while len(caps) < 4 and not writer.closed:
+                writer.offer("frame")
+                await asyncio.sleep(0.005)
+            writer.close()
+
+        asyncio.run(scenario())
+        # 購読した 20Hz より下の段から下げ、戻す時は購読レートより上なら上限なしに戻る
+        assert caps == [15, 5, 15, FULL_RATE]
+
+    def test_control_overflow_and_send_timeout_close_the_client(self, monkeypatch):
+        monkeypatch.setattr(ClientWriter, "SEND_TIMEOUT_SEC", 0.05)
+        closed = []
+
+        async def scenario():
+            ws = _FakeWs()
+            writer = ClientWriter(ws, on_close=lambda ws, reason: closed.append(reason))
+            for i in range(WRITER_CONTROL_MAX + 1):
+                writer.put(str(i))
+            ws2 = _FakeWs()
+            ws2.stall = asyncio.Event()
+            writer2 = ClientWriter(ws2, on_close=lambda ws, reason: closed.append(reason))
+            writer2.start()
+            writer2.put("hello")
+            await asyncio.sleep(0.2)
+            return writer, writer2
+
+        writer, writer2 = asyncio.run(scenario())
+        assert closed == ["control queue full", "send timeout"]
+        assert writer.closed and writer2.closed
+
+
+class TestBatching:
+
+    def test_frames_are_joined_per_interval_and_control_is_not_held(self):
+        traced = []
+
+        async def scenario():
+            ws = _FakeWs()
+            writer = ClientWriter(ws)
+            writer.batch_ms = 50
+            writer.start()
+            for i in range(6):
+                writer.offer(json.dumps({"package_id": i}), on_sent=lambda ws, i=i: traced.append(i))
+                await asyncio.sleep(0.002)
+            writer.put("engineer")
+            await asyncio.sleep(0.01)
+            # 期限前: 制御メッセージだけが先に届き、フレームは溜まっている
+            before = list(ws.sent)
+            await asyncio.sleep(0.08)
+            writer.offer(b"ab")
+            writer.offer(b"cd")
+            await asyncio.sleep(0.08)
+            writer.close()
+            return before, ws.sent
+
+        before, sent = asyncio.run(scenario())
+        assert before == ["engineer"]
+        batch = json.loads(sent[1])
+        assert batch["type"] == "batch" and [f["package_id"] for f in batch["frames"]] == list(range(6))
+        assert sent[2:] == [b"abcd"]
+        assert traced == list(range(6))
+
+    def test_full_batch_drops_incoming_deltas_and_keeps_the_chain(self):
+        lost = []
+
+        async def scenario():
+            writer = ClientWriter(_FakeWs(), on_delta_lost=lost.append)
+            writer.batch_ms = 1000
+            writer.offer('{"type": "keyframe", "seq": 1}')
+            for seq in range(2, WRITER_BATCH_MAX + 5):
+                writer.offer('{"type": "delta", "seq": %d}' % seq)
+            chain = [json.loads(m)["seq"] for m, _ in writer._batch]
+            # 満杯で keyframe が来たら、基準を失う先頭の delta ごと捨てる
+            writer.offer('{"type": "keyframe", "seq": 200}')
+            return chain, [m for m, _ in writer._batch]
+
+        chain, after = asyncio.run(scenario())
+        assert chain == list(range(1, WRITER_BATCH_MAX + 1)) and len(lost) == 1
+        assert after == ['{"type": "keyframe", "seq": 200}']
+
+    def test_parse_batch_ms(self):
+        assert [parse_batch_ms(v) for v in (100, 0, -5, 5000, 12.7, "100", True, None)] == [
+            100, 0, 0, 1000, 12, None, None, None,
+        ]
+
+    def test_batch_and_compress_subscription_over_websocket(self, tmp_path, monkeypatch):
+        rig = main.ConsolePipeline("default", "192.168.1.31", str(tmp_path / "laps"), str(tmp_path / "failed"))
+        monkeypatch.setattr(main, "CONSOLES", {"default": rig})
+        monkeypatch.setitem(main.CONFIG, "recording_enabled", False)
+        app = web.Application()
+        app.router.add_get('/ws', main.websocket_handler)
+        decoder = GT7Decoder()
+        estimator = CourseEstimator(os.path.join(os.path.dirname(main.__file__), 'course_database.json'))
+
+        async def scenario():
+            async with TestServer(app) as server, aiohttp.ClientSession() as session:
+                # ブラウザと同じく、どちらの接続も permessage-deflate を申し出る
+                local = await session.ws_connect(server.make_url('/ws'), compress=15)
+                remote = await session.ws_connect(server.make_url('/ws?compress=1'), compress=15)
+                await remote.send_str(json.dumps({"type": "subscribe", "batch_ms": 100}))
+                while not any(w.batch_ms for w in rig.writers.values()):
+                    await asyncio.sleep(0.01)
+                consumer = asyncio.create_task(main.broadcast_consumer_task(rig))
+                await asyncio.sleep(0)
+                base = rig.last_arrival_ns
+                for pid in range(1, 19):
+                    rig.handle(_packet(pid, 1), decoder, estimator, arrival_ns=base + pid * 16_683_350)
+                    await asyncio.sleep(1 / 60)
+                await asyncio.sleep(0.15)
+                got = {}
+                for name, ws in (("local", local), ("remote", remote)):
+                    got[name] = []
+                    while True:
+                        try:
+                            got[name].append(json.loads((await asyncio.wait_for(ws.receive(), 0.1)).data))
+                        except asyncio.TimeoutError:
+                            break
+                compress = (local.compress, remote.compress)
+                for ws in (local, remote):
+                    await ws.close()
+                consumer.cancel()
+                return got, compress
+
+        got, compress = asyncio.run(scenario())
+        assert compress == (0, 15)
+        assert [f["package_id"] for f in got["local"]] == list(range(1, 19))
+        # 約100ms(6フレーム)ごとに1メッセージ。フレームは欠けず順序どおり
+        assert all(m["type"] == "batch" for m in got["remote"]) and len(got["remote"]) <= 5
+        assert [f["package_id"] for m in got["remote"] for f in m["frames"]] == list(range(1, 19))
+
+
+class TestPipelineWriters:
+
+    def test_stalled_client_is_throttled_then_dropped_without_delaying_others(self, monkeypatch):
+        monkeypatch.setitem(main.CONFIG, "recording_enabled", False)
+        _fast_review(monkeypatch)
+        caps = []
+
+        async def scenario():
+            rig = main.ConsolePipeline("rig1", "192.168.1.31")
+            fast, stalled = _FakeWs(), _FakeWs()
+            stalled.stall = asyncio.Event()
+            rig.add_client(fast)
+            rig.add_client(stalled)
+            rig.client_ids[stalled] = "rig1/phone#1"
+            real_cap = rig.set_rate_cap
+            monkeypatch.setattr(rig, "set_rate_cap", lambda ws, cap: caps.append(cap) or real_cap(ws, cap))
+            rig.writers[stalled].on_rate_cap = rig.set_rate_cap
+            offered = 0
+            while stalled in rig.clients and offered < 500:
+                offered += 1
+                rig.offer(f"frame{offered}")
+                await asyncio.sleep(0.002)
+                # 止まったクライアントがいても、速いクライアントには毎回すぐ届く
+                assert fast.sent[-1] == f"frame{offered}"
+            rig.send("engineer")
+            await asyncio.sleep(0.01)
+            return rig, fast, stalled
+
+        rig, fast, stalled = asyncio.run(scenario())
+        assert caps == [30, 15, 5]
+        assert stalled not in rig.clients and stalled not in rig.writers and stalled.closed
+        assert rig.client_rates == {} and rig.rate_caps == {} and len(rig.rate_tiers) == 0
+        assert fast.sent[-1] == "engineer"
+
+    def test_slow_delta_client_gets_a_keyframe_instead_of_a_seq_gap(self, monkeypatch):
+        monkeypatch.setitem(main.CONFIG, "recording_enabled", False)
+        decoder = GT7Decoder()
+        estimator = CourseEstimator(os.path.join(os.path.dirname(main.__file__), 'course_database.json'))
+
+        async def scenario():
+            rig = main.ConsolePipeline("rig1", "192.168.1.31")
+            fast, slow = _FakeWs(), _FakeWs(delay=0.012)
+            for ws in (fast, slow):
+                rig.add_client(ws)
+                rig.set_delta(ws, True)
+            base = rig.last_arrival_ns
+            for pid in range(1, 61):
+                rig.handle(_packet(pid, 1), decoder, estimator, arrival_ns=base + pid * 16_683_350)
+                # 配信タスクと同じく、送る直前に差分を作って送信タスクへ書き込む
+                if rig.broadcast.seq:
+                    for message, targets in rig.take_sends(rig.broadcast.latest):
+                        rig.offer(message, None, targets)
+                await asyncio.sleep(0.004)
+            await asyncio.sleep(0.05)
+            rig.forget_client(fast)
+            rig.forget_client(slow)
+            return fast.sent, slow.sent
+
+        fast, slow = asyncio.run(scenario())
+        received = {}
+        for name, sent in (("fast", fast), ("slow", slow)):
+            client = _DeltaClient()
+            frames = [client.apply(json.loads(m)) for m in sent]
+            assert client.resyncs == 0 and None not in frames, name
+            received[name] = [json.loads(m)["type"] for m in sent], frames
+        # 遅いクライアントは delta を捨てた分を keyframe で受け直し、速いクライアントは delta のまま
+        assert received["fast"][0].count("keyframe") == 1
+        assert received["slow"][0].count("keyframe") > 1 and len(slow) < len(fast)
+        # 遅いクライアントが組み立てたフレームは、どれも同じフレームの全体と一致する
+        by_pid = {frame["package_id"]: frame for frame in received["fast"][1]}
+        assert all(frame == by_pid[frame["package_id"]] for frame in received["slow"][1])
@@ -39,7 +39,15 @@ const wsState = {
     /** 前回回転更新時刻 */
     lastRotationTs: 0,
     /** JSONパースエラー連続回数 */
-    parseErrorCount: 0
+    parseErrorCount: 0,
+    /** 差分配信（?delta=1）で組み立て中のフレーム（keyframe 待ちは null） */
+    deltaFrame: null,
+    /** 差分配信で最後に適用した seq */
+    deltaSeq: 0,
+    /** バイナリ形式（?format=binary）のスキーマ（{id, readers}。受け取るまでは null） */
+    binarySchema: null,
+    /** バイナリ形式で最後に受け取った course（レコードには含まれない） */
+    binaryCourse: null
 };
 
 /* ================================================================
@@ -565,9 +573,11 @@ function handleTelemetryMessage(data, nowTs) {
  */
 function connectWebSocket() {
     const wsProtocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
-    const wsUrl = wsProtocol + '//' + window.location.host + '/ws';
+    const wsUrl = withConsole(wsProtocol + '//' + window.location.host + '/ws' +
+        (WS_COMPRESS ? '?compress=1' : ''));
 
     wsState.ws = new WebSocket(wsUrl);
+    wsState.ws.binaryType = 'arraybuffer';
 
     wsState.ws.onopen = function() {
         console.log('Connected to GT7 Bridge');
@@ -579,6 +589,20 @@ function connectWebSocket() {
             elements.connectionStatus.className = 'connected';
         }
         wsState.reconnectDelay = WEBSOCKET_CONFIG.reconnectDelayInitial;
+        // ?rate=<Hz> / ?profile=<名前> / ?delta=1 / ?format=binary / ?batch=<ms> 指定時は
+        // 更新レート・フィールド・差分配信・バイナリ形式・バッチを購読する
+        wsState.deltaFrame = null;
+        wsState.binarySchema = null;
+        wsState.binaryCourse = null;
+        if (WS_RATE !== null || WS_PROFILE || WS_DELTA || WS_BINARY || WS_BATCH_MS !== null) {
+            const subscribe = { type: 'subscribe' };
+            if (WS_RATE !== null) subscribe.rate = WS_RATE;
+            if (WS_PROFILE) subscribe.profile = WS_PROFILE;
+            if (WS_DELTA) subscribe.delta = true;
+            if (WS_BINARY) subscribe.format = 'binary';
+            if (WS_BATCH_MS !== null) subscribe.batch_ms = WS_BATCH_MS;
+            wsState.ws.send(JSON.stringify(subscribe));
+        }
         initCharts();
         initSteerResponse();
         initCar3D();
@@ -602,11 +626,171 @@ function connectWebSocket() {
 
     wsState.ws.onmessage = function(event) {
         wsState.packetCount++;
-        wsState.latestMessage = event.data;
+        if (WS_BINARY) {
+            // レコード（ArrayBuffer）は描画時に読む。スキーマ・course はここで取り込む
+            if (typeof event.data === 'string' && applyBinaryControl(event.data)) {
+                return;
+            }
+            wsState.latestMessage = event.data;
+        } else if (WS_DELTA) {
+            // 差分は1件も飛ばせないので、描画を待たずに受信ごとに適用する
+            const frame = applyDeltaMessage(event.data);
+            if (frame === null) {
+                return;
+            }
+            wsState.latestMessage = frame;
+        } else {
+            wsState.latestMessage = event.data;
+        }
         scheduleTelemetryProcessing();
     };
 }
 
+/**
+ * 差分配信のメッセージを適用し、組み立てたフレーム（新しいオブジェクト）を返す。
+ * バッチ（?batch=<ms>）は中の keyframe / delta を順に適用し、最後のフレームを返す。
+ * keyframe / delta 以外（engineer_message 等）はそのまま文字列で返す。
+ * seq の欠けを見つけたら resync を要求し、次の keyframe まで null を返す
+ * @param {string} raw
+ * @returns {Object|string|null}
+ */
+function applyDeltaMessage(raw) {
+    let msg;
+    try {
+        msg = JSON.parse(raw);
+    } catch (e) {
+        return raw;  // processTelemetryFrame のパースエラー処理に任せる
+    }
+    if (msg && msg.type === 'batch') {
+        let frame = null;
+        msg.frames.forEach(function(item) { frame = applyDelta(item); });
+        return frame;
+    }
+    if (!msg || (msg.type !== 'keyframe' && msg.type !== 'delta')) {
+        return raw;
+    }
+    return applyDelta(msg);
+}
+
+/**
+ * keyframe / delta を1件適用する（applyDeltaMessage の本体）
+ * @param {Object} msg
+ * @returns {Object|null}
+ */
+function applyDelta(msg) {
+    if (msg.type === 'keyframe') {
+        wsState.deltaFrame = Object.assign({}, msg.frame);
+    } else if (wsState.deltaFrame === null) {
+        return null;  // resync 済み・keyframe 待ち
+    } else if (msg.seq !== wsState.deltaSeq + 1) {
+        wsState.deltaFrame = null;
+        if (wsState.ws && wsState.ws.readyState === WebSocket.OPEN) {
+            wsState.ws.send(JSON.stringify({ type: 'resync' }));
+        }
+        return null;
+    } else {
+        Object.assign(wsState.deltaFrame, msg.frame);
+        (msg.removed || []).forEach(function(name) { delete wsState.deltaFrame[name]; });
+    }
+    wsState.deltaSeq = msg.seq;
+    return Object.assign({}, wsState.deltaFrame);
+}
+
+/**
+ * バイナリ形式のスキーマ・course のメッセージを取り込む（取り込んだら true）。
+ * それ以外（engineer_message 等）は false を返し、通常のメッセージとして処理させる
+ * @param {string} raw
+ * @returns {boolean}
+ */
+function applyBinaryControl(raw) {
+    let msg;
+    try {
+        msg = JSON.parse(raw);
+    } catch (e) {
+        return false;
+    }
+    if (msg && msg.type === 'schema') {
+        wsState.binarySchema = compileBinarySchema(msg);
+        return true;
+    }
+    if (msg && msg.type === 'course') {
+        wsState.binaryCourse = msg.course;
+        return true;
+    }
+    return false;
+}
+
+/**
+ * スキーマのフィールドごとに DataView の読み出し関数を作る
+ * @param {Object} schema - {id, size, fields: [{name, dtype, offset, count?, null?, bits?}]}
+ * @returns {{id: number, size: number, readers: Function[]}}
+ */
+function compileBinarySchema(schema) {
+    const GETTERS = {
+        u8: [1, function(v, o) { return v.getUint8(o); }],
+        i16: [2, function(v, o) { return v.getInt16(o, true); }],
+        u16: [2, function(v, o) { return v.getUint16(o, true); }],
+        i32: [4, function(v, o) { return v.getInt32(o, true); }],
+        i64: [8, function(v, o) { return Number(v.getBigInt64(o, true)); }],
+        f32: [4, function(v, o) { return v.getFloat32(o, true); }]
+    };
+    const readers = schema.fields.map(function(field) {
+        const width = GETTERS[field.dtype][0];
+        const get = GETTERS[field.dtype][1];
+        const name = field.name;
+        const offset = field.offset;
+        if (field.bits) {
+            return function(view, frame) {
+                const bits = view.getUint16(offset, true);
+                const flags = {};
+                field.bits.forEach(function(bit) { flags[bit[0]] = (bits & bit[1]) !== 0; });
+                frame[name] = flags;
+            };
+        }
+        if (field.count) {
+            return function(view, frame) {
+                const values = new Array(field.count);
+                for (let i = 0; i < field.count; i++) {
+                    values[i] = get(view, offset + i * width);
+                }
+                if (!isNaN(values[0])) frame[name] = values;
+            };
+        }
+        const nullValue = field.null;
+        return function(view, frame) {
+            // 値が無い(None)フィールドはフレームに含めない（f32 は NaN、整数はスキーマの null 値）
+            const value = get(view, offset);
+            if (value !== nullValue && !Number.isNaN(value)) frame[name] = value;
+        };
+    });
+    return { id: schema.id, size: schema.size, readers: readers };
+}
+
+/**
+ * バイナリ形式のレコードをフレームに読む。スキーマがまだ無い・違う（購読を変えた直後）なら null。
+ * バッチ（レコードの連結）は最後のレコードだけを読む
+ * @param {ArrayBuffer} buffer
+ * @returns {Object|null}
+ */
+function decodeBinaryFrame(buffer) {
+    const schema = wsState.binarySchema;
+    if (!schema || buffer.byteLength === 0 || buffer.byteLength % schema.size !== 0) {
+        return null;
+    }
+    const view = new DataView(buffer, buffer.byteLength - schema.size, schema.size);
+    if (view.getUint16(0, true) !== schema.id) {
+        return null;
+    }
+    const frame = {};
+    for (let i = 0; i < schema.readers.length; i++) {
+        schema.readers[i](view, frame);
+    }
+    if (wsState.binaryCourse) {
+        frame.course = wsState.binaryCourse;
+    }
+    return frame;
+}
+
 /**
  * テレメトリ処理をスケジュール
  */
@@ -644,8 +828,16 @@ function processTelemetryFrame(now) {
     wsState.latestMessage = null;
 
     try {
-        const data = JSON.parse(raw);
+        let data = typeof raw === 'string' ? JSON.parse(raw) :
+            raw instanceof ArrayBuffer ? decodeBinaryFrame(raw) : raw;
         wsState.parseErrorCount = 0;  // 成功時はリセット
+        // バッチ（?batch=<ms>）は最新のフレームだけを描画する
+        if (data && data.type === 'batch') {
+            data = data.frames.length ? data.frames[data.frames.length - 1] : null;
+        }
+        if (data === null) {
+            return;  // スキーマ待ちのレコード・空のバッチ
+        }
 
         // バーチャルピットウォール(#434 P4): エンジニア役端末からのメッセージは
         // テレメトリとは別経路で処理する(handleTelemetryMessageへは渡さない。
@@ -656,6 +848,10 @@ function processTelemetryFrame(now) {
             }
             return;
         }
+        // その他の type 付きメッセージ(driver_response 等)はテレメトリではない
+        if (data && data.type) {
+            return;
+        }
 
         // 接続ピルの段階表示: 最初のテレメトリ処理時に一度だけ 'Connected' へ昇格
         if (!wsState.liveDataSeen) {
@@ -0,0 +1,317 @@
+"""
+WebSocket クライアントごとの送信タスク(最新のみのフレーム枠と、欠落させない制御メッセージの列)
+
+配信タスクがクライアントへ順に await して送ると、Wi-Fi の遅いスマートフォンが1台あるだけで
+他の全クライアントへの送信がフレームごとに最大1秒(送信タイムアウト)遅れていた。
+ClientWriter はクライアントごとに1本の送信タスクを持ち、配信タスクは書き込むだけで待たない:
+
+  - フレーム枠(offer): テレメトリ用。送信前に次のフレームが来たら上書きする(最新のみ)。
+  - 制御メッセージ(put): エンジニアメッセージ・スキーマ・course 等。上限付きの FIFO で、
+    フレームより先に送る。溢れたら停滞とみなして切断する。
+
+送信の遅れ(バックプレッシャー)は、トランスポートの書き込みバッファの大きさ・1回の送信に
+かかった時間・送る前に上書きされたフレームの割合で見る。REVIEW_SEC ごとに判定し、遅れて
+いればクライアントの rate の上限(rate_cap)を WRITER_RATE_STEPS の次の段へ下げる。最下段でも
+遅れているか、1回の送信が SEND_TIMEOUT_SEC を超えたら切断する。RECOVER_SEC 続けて遅れが
+無ければ上限を1段戻す。上限は購読レート(requested_rate)との小さい方として配信に効く。
+
+遠隔(別室・VPN)の閲覧端末は、60Hz の小さなメッセージを1件ずつ受けるとパケットと
+CPU を無駄にする。batch_ms を設定したクライアントには、フレームを上書きせずに溜め、
+最初のフレームから batch_ms 後に1つのメッセージにまとめて送る(バッチ):
+
+    {"type": "batch", "frames": [<各メッセージの JSON>, ...]}    # テキスト(JSON・差分配信)
+    <レコード><レコード>...                                     # バイナリ形式は連結するだけ
+
+バッチのフレームは書き込んだ順で、差分配信の delta もそのまま並ぶ。バッチ中も制御
+メッセージは待たずに送る。WRITER_BATCH_MAX 件を超えたら古いフレームから捨てる。
+
+差分配信の delta は直前に送ったフレームが基準なので、上書き・破棄すると seq が欠ける。
+未送信のフレームがある(バッチが満杯の)時に来た delta は、未送信の方を上書きせずに来た
+delta の方を捨て、on_delta_lost を呼ぶ。呼び出し側はそのクライアントにだけ次のフレームを
+keyframe で送り、それまでの delta は捨て続ける(クライアントは seq の欠けを見ない)。
+
+API(main.py からの使用順序):
+    writer = ClientWriter(ws, transport, on_rate_cap=..., on_close=..., on_delta_lost=...)
+    writer.start()                          # 送信タスクを起動
+    writer.requested_rate = rate            # 購読レートの変更時(上限の段の起点)
+    writer.batch_ms = parse_batch_ms(value) # バッチの間隔(0 はバッチしない)
+    writer.offer(message, on_sent)          # テレメトリ(最新のみ。bytes はバイナリメッセージ)
+    writer.put(message)                     # 制御メッセージ(順序どおり・欠落なし)
+    writer.close()                          # 切断時(送信タスクを止める)
+    # on_rate_cap(ws, cap): 上限が変わった(FULL_RATE は上限なし)
+    # on_close(ws, reason): 停滞・送信失敗で送れなくなった(呼び出し側が切断する)
+    # on_delta_lost(ws): delta を捨てた(次のフレームを keyframe にする)
+"""
+
+import asyncio
+import collections
+import logging
+import time
+
+from fanout import FULL_RATE, is_delta_message
+
+logger = logging.getLogger(__name__)
+
+# 遅れたクライアントの rate の上限の段(Hz)。先頭は上限なし
+WRITER_RATE_STEPS = (FULL_RATE, 30, 15, 5)
+# 制御メッセージの列の上限(溢れたら停滞とみなして切断)
+WRITER_CONTROL_MAX = 64
+# トランスポートの書き込みバッファがこれを超えたら遅れている(バイト)
+WRITER_BUFFER_HIGH = 64 * 1024
+# 1回の送信がこれを超えたら遅れている(ミリ秒)
+WRITER_SLOW_SEND_MS = 50
+# バッチの間隔の上限(ミリ秒)と、1バッチに溜めるフレーム数の上限
+BATCH_MS_MAX = 1000
+WRITER_BATCH_MAX = 120
+
+
+def parse_batch_ms(value):
+    """購読メッセージの batch_ms を 0..BATCH_MS_MAX の整数ミリ秒にする(不正なら None)"""
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return None
+    if value != value:   # NaN
+        return None
+    return max(0, min(BATCH_MS_MAX, int(value)))
+
+
+class ClientWriter:
+    """1クライアント分の送信タスクとバックプレッシャーの判定。
+
+    イベントループ上の単一スレッドから使う前提(ロックなし)。offer / put は同期メソッドで、
+    送信タスクは asyncio.Event で起こす。
+    """
+
+    REVIEW_SEC = 1.0
+    RECOVER_SEC = 5.0
+    SEND_TIMEOUT_SEC = 5.0
+
+    def __init__(self, ws, transport=None, on_rate_cap=None, on_close=None, on_delta_lost=None):
+        self.ws = ws
+        self.transport = transport
+        self.on_rate_cap = on_rate_cap
+        self.on_close = on_close
+        self.on_delta_lost = on_delta_lost
+        self.requested_rate = FULL_RATE
+        self.rate_cap = FULL_RATE
+        self.batch_ms = 0
+        self._control = collections.deque()
+        self._frame = None
+        # delta を捨てた後、keyframe(delta 以外)が来るまで delta を捨て続ける
+        self._delta_lost = False
+        # バッチ中のフレーム [(message, on_sent), ...] と、その最初のフレームを書き込んだ時刻
+        self._batch = []
+        self._batch_start_ns = 0
+        self._event = asyncio.Event()
+        self._task = None
+        self._closed = False
+        # 送信中の送信を始めた時刻(送信していなければ None)
+        self._sending_since_ns = None
+        # 累計: 送信したメッセージ数、送る前に上書きされたフレーム数、上限を下げた回数
+        self.sent = 0
+        self.overwritten = 0
+        self.rate_downs = 0
+        # 判定の窓: 書き込んだフレーム数、上書きされたフレーム数、最長の送信時間、最大のバッファ
+        now_ns = time.monotonic_ns()
+        self._window_start_ns = now_ns
+        self._window = [0, 0, 0, 0]
+        self._healthy_since_ns = now_ns
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def start(self):
+        self._task = asyncio.create_task(self.run())
+        return self._task
+
+    def offer(self, message, on_sent=None):
+        """テレメトリのフレームを書き込む(未送信のフレームがあれば上書きする。バッチ中は溜める)"""
+        if self._closed:
+            return
+        window = self._window
+        window[0] += 1
+        now_ns = time.monotonic_ns()
+        delta = is_delta_message(message)
+        if not delta:
+            self._delta_lost = False
+        # バッチをやめた直後は、溜まっている分の後ろに並べて順序を保つ
+        if self.batch_ms or self._batch:
+            batch = self._batch
+            if delta and (self._delta_lost or len(batch) >= WRITER_BATCH_MAX):
+                self._lose_delta()
+            else:
+                if not batch:
+                    self._batch_start_ns = now_ns
+                elif len(batch) >= WRITER_BATCH_MAX:
+                    del batch[0]
+                    self.overwritten += 1
+                    window[1] += 1
+                    # 先頭の delta は基準を失ったので、次の delta 以外まで捨てる
+                    while batch and is_delta_message(batch[0][0]):
+                        del batch[0]
+                        self.overwritten += 1
+                        window[1] += 1
+                batch.append((message, on_sent))
+        elif delta and (self._delta_lost or self._frame is not None):
+            # 未送信のフレームは上書きしない(送る delta の seq を欠けさせない)
+            self._lose_delta()
+        else:
+            if self._frame is not None:
+                self.overwritten += 1
+                window[1] += 1
+            self._frame = (message, on_sent)
+        self._event.set()
+        self._review(now_ns)
+
+    def _lose_delta(self):
+        """書き込まれた delta を捨て、次のフレームを keyframe にするよう呼び出し側へ伝える"""
+        self.overwritten += 1
+        self._window[1] += 1
+        if self._delta_lost:
+            return
+        self._delta_lost = True
+        if self.on_delta_lost is not None:
+            self.on_delta_lost(self.ws)
+
+    def put(self, message):
+        """制御メッセージを書き込む(フレームより先に、書き込んだ順に送る)"""
+        if self._closed:
+            return
+        if len(self._control) >= WRITER_CONTROL_MAX:
+            self._fail("control queue full")
+            return
+        self._control.append(message)
+        self._event.set()
+
+    def buffer_size(self):
+        """トランスポートの書き込みバッファに溜まっているバイト数"""
+        transport = self.transport
+        if transport is None or transport.is_closing():
+            return 0
+        return transport.get_write_buffer_size()
+
+    async def run(self):
+        """送信タスク本体: 制御メッセージ → 最新のフレーム(バッチ中は期限が来たバッチ)の順に送る"""
+        ws = self.ws
+        while not self._closed:
+            sent_frames = None
+            if self._control:
+                message = self._control.popleft()
+            elif self._frame is not None:
+                message, on_sent = self._frame
+                self._frame = None
+                sent_frames = ((message, on_sent),)
+            elif self._batch:
+                wait_ns = self._batch_start_ns + self.batch_ms * 1_000_000 - time.monotonic_ns()
+                if wait_ns > 0 and self.batch_ms:
+                    # 期限まで待つ(制御メッセージが来たら先に送る)
+                    self._event.clear()
+                    try:
+                        await asyncio.wait_for(self._event.wait(), wait_ns / 1e9)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                sent_frames = self._take_batch()
+                message = _join_batch([m for m, _ in sent_frames])
+            else:
+                self._event.clear()
+                await self._event.wait()
+                continue
+            start_ns = self._sending_since_ns = time.monotonic_ns()
+            try:
+                send = ws.send_bytes(message) if isinstance(message, bytes) else ws.send_str(message)
+                await asyncio.wait_for(send, timeout=self.SEND_TIMEOUT_SEC)
+            except asyncio.TimeoutError:
+                self._fail("send timeout")
+                return
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._fail(f"send failed: {e}")
+                return
+            finally:
+                self._sending_since_ns = None
+            window = self._window
+            window[2] = max(window[2], time.monotonic_ns() - start_ns)
+            window[3] = max(window[3], self.buffer_size())
+            self.sent += 1
+            for _, on_sent in sent_frames or ():
+                if on_sent is None:
+                    continue
+                # コールバックの失敗で送信タスクを止めない(止まるとクライアントが固まる)
+                try:
+                    on_sent(ws)
+                except Exception as e:
+                    logger.error(f"on_sent callback error: {e}", exc_info=True)
+
+    def _take_batch(self):
+        """バッチの先頭から、同じ種類(テキスト / バイナリ)が続く分を取り出す
+
+        購読の形式を変えた直後だけ種類が混ざる。残りは次のメッセージにする。
+        """
+        batch = self._batch
+        binary = isinstance(batch[0][0], bytes)
+        n = 1
+        while n < len(batch) and isinstance(batch[n][0], bytes) == binary:
+            n += 1
+        taken = batch[:n]
+        del batch[:n]
+        return taken
+
+    def close(self):
+        """送信タスクを止める(送信タスク自身から呼ばれた時は、ループを抜けさせるだけ)"""
+        self._closed = True
+        self._event.set()
+        task = self._task
+        if task is not None and not task.done() and task is not asyncio.current_task():
+            task.cancel()
+
+    def _fail(self, reason):
+        if self._closed:
+            return
+        self.close()
+        if self.on_close is not None:
+            self.on_close(self.ws, reason)
+
+    def _review(self, now_ns):
+        """REVIEW_SEC ごとに遅れを判定し、rate の上限を上げ下げする(遅れたまま最下段なら切断)"""
+        if now_ns - self._window_start_ns < self.REVIEW_SEC * 1e9:
+            return
+        offered, overwritten, max_send_ns, max_buffer = self._window
+        # 送信が返ってこないまま止まっている時間も送信時間として数える
+        if self._sending_since_ns is not None:
+            max_send_ns = max(max_send_ns, now_ns - self._sending_since_ns)
+        max_buffer = max(max_buffer, self.buffer_size())
+        self._window_start_ns = now_ns
+        self._window = [0, 0, 0, 0]
+        lagging = (
+            overwritten * 10 > offered
+            or max_send_ns > WRITER_SLOW_SEND_MS * 1_000_000
+            or max_buffer > WRITER_BUFFER_HIGH
+        )
+        if lagging:
+            self._healthy_since_ns = now_ns
+            current = min(self.rate_cap, self.requested_rate)
+            lower = [step for step in WRITER_RATE_STEPS if step < current]
+            if not lower:
+                self._fail(f"lagging at {current}Hz (overwritten {overwritten}/{offered}, "
+                           f"send {max_send_ns / 1e6:.0f}ms, buffer {max_buffer}B)")
+                return
+            self.rate_downs += 1
+            self._set_cap(lower[0])
+        elif self.rate_cap < FULL_RATE and now_ns - self._healthy_since_ns >= self.RECOVER_SEC * 1e9:
+            self._healthy_since_ns = now_ns
+            higher = [step for step in WRITER_RATE_STEPS if step > self.rate_cap]
+            self._set_cap(FULL_RATE if higher[-1] >= self.requested_rate else higher[-1])
+
+    def _set_cap(self, cap):
+        self.rate_cap = cap
+        if self.on_rate_cap is not None:
+            self.on_rate_cap(self.ws, cap)
+
+
+def _join_batch(messages):
+    """バッチのメッセージを1つにする(バイナリは連結、テキストは {"type": "batch"} の JSON)"""
+    if isinstance(messages[0], bytes):
+        return b"".join(messages)
+    return '{"type": "batch", "frames": [' + ", ".join(messages) + "]}"